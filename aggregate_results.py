@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Streaming project x project aggregation of SourcererCC results.
+
+Instead of building clone classes and HTML pages (`prettify_results.py`) only per-project-pair statistics are computed:
+* n_pairs[p, q] - number of clone pairs between projects p and q (symmetric);
+* cloned_blocks[p, q] - number of distinct blocks of project p that have at least one clone in project q;
+* cloned_sloc[p, q] - SLOC of these blocks;
+* cloned_share[p, q] - cloned_blocks[p, q] / number of blocks in project p.
+Matrices are saved as sparse CSR matrices in `.npz` files that can be opened with `scipy.sparse.load_npz`
+(or `load_csr` from this module if scipy is not installed), rows and columns are described by `projects.csv`.
+
+Raw node outputs contain both (a, b) and (b, a) and duplicates from resumed runs, so pairs are first normalized,
+sorted and deduplicated with `sort_pairs` into a plain file (skipped for `sort_pairs` output with `sorted_input`).
+Pairs files are split into shards (byte ranges of plain files, whole gzip files) that are processed in parallel.
+Every shard is read once in chunks, (block, other project) keys are spilled to disk partitioned by block,
+partitions are deduplicated and reduced independently - memory is bounded by chunk and partition size,
+not by the number of pairs.
+"""
+import argparse
+from collections import namedtuple
+import csv
+import multiprocessing
+import os
+import shutil
+import tempfile
+from typing import Dict, Iterator, List, Tuple, Union
+
+import numpy as np
+from tabulate import tabulate
+
+from prettify_results import _get_project_ids, filter_by_similarity, get_line_iterator
+from results_index import iter_bookkeeping, iter_stats
+from sort_pairs import expand_inputs, sort_pairs
+
+CHUNK_SIZE = 1000000
+N_PARTITIONS = 16
+
+# blocks sorted by block id: block id -> project index & SLOC
+BlockTable = namedtuple("BlockTable", ["block_ids", "proj_idx", "sloc"])
+# byte range [start, end) of pairs file, end is None for the whole file
+Shard = namedtuple("Shard", ["path", "start", "end"])
+CsrMatrix = namedtuple("CsrMatrix", ["data", "indices", "indptr", "shape"])
+ShardResult = namedtuple("ShardResult", ["n_pairs", "n_kept", "pair_codes", "pair_counts"])
+PartitionResult = namedtuple("PartitionResult", ["codes", "blocks", "sloc", "proj_blocks", "proj_sloc"])
+
+# per-process state of workers, set by `_init_worker`
+_WORKER = {}  # type: Dict
+
+
+def load_blocks(stats_files: str) -> Tuple[BlockTable, List[str]]:
+    """
+    Load block -> (project, SLOC) mapping from stats files into compact arrays.
+    :param stats_files: file or folder with stats files.
+    :return: table of blocks and list of project ids (project index -> project id).
+    """
+    proj2idx = {}  # type: Dict[str, int]
+    block_ids, proj_idx, sloc = [], [], []
+    for kind, parts in iter_stats(stats_files):
+        if kind != "b":
+            continue
+        # project_id, block_id, hash, lines, LOC, SLOC, start_line, end_line
+        if parts[0] not in proj2idx:
+            proj2idx[parts[0]] = len(proj2idx)
+        block_ids.append(int(parts[1]))
+        proj_idx.append(proj2idx[parts[0]])
+        sloc.append(int(parts[5]))
+    block_ids = np.array(block_ids, dtype=np.int64)
+    order = np.argsort(block_ids, kind="stable")
+    table = BlockTable(block_ids=block_ids[order], proj_idx=np.array(proj_idx, dtype=np.int64)[order],
+                       sloc=np.array(sloc, dtype=np.int64)[order])
+    proj_ids = [None] * len(proj2idx)
+    for proj_id, idx in proj2idx.items():
+        proj_ids[idx] = proj_id
+    return table, proj_ids
+
+
+def plan_shards(inputs: List[str], n_shards: int) -> List[Shard]:
+    """
+    Split pairs files into shards of similar size.
+    Plain files are split into byte ranges, gzip-compressed files can only be read as a whole.
+    :param inputs: paths or glob patterns of pairs files.
+    :param n_shards: desired number of shards.
+    :return: list of shards.
+    """
+    paths = expand_inputs(inputs)
+    total_size = sum(os.path.getsize(path) for path in paths)
+    shard_size = max(1, total_size // max(1, n_shards))
+    shards = []
+    for path in paths:
+        size = os.path.getsize(path)
+        if path.endswith(".gz") or size <= shard_size:
+            shards.append(Shard(path=path, start=0, end=None))
+            continue
+        for start in range(0, size, shard_size):
+            shards.append(Shard(path=path, start=start, end=min(start + shard_size, size)))
+    return shards
+
+
+def iter_shard_lines(shard: Shard) -> Iterator[str]:
+    """
+    Iterate over lines of shard - a line belongs to the shard where it starts.
+    :param shard: shard to read.
+    :return: iterator of non-empty lines.
+    """
+    if shard.end is None:
+        lines = get_line_iterator(shard.path)
+    else:
+        lines = _iter_byte_range(shard)
+    for line in lines:
+        if line:
+            yield line
+
+
+def _iter_byte_range(shard: Shard) -> Iterator[str]:
+    with open(shard.path, "rb") as f:
+        if shard.start > 0:
+            # skip the line that started in the previous shard
+            f.seek(shard.start - 1)
+            f.readline()
+        while f.tell() < shard.end:
+            line = f.readline()
+            if not line:
+                break
+            yield line.decode("utf-8").rstrip("\n")
+
+
+def _chunks(lines: Iterator[str], size: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    ids1, ids2 = [], []
+    for line in lines:
+        parts = line.split(",", 4)
+        ids1.append(int(parts[1]))
+        ids2.append(int(parts[3]))
+        if len(ids1) >= size:
+            yield np.array(ids1, dtype=np.int64), np.array(ids2, dtype=np.int64)
+            ids1, ids2 = [], []
+    if ids1:
+        yield np.array(ids1, dtype=np.int64), np.array(ids2, dtype=np.int64)
+
+
+def _lookup(block_ids: np.ndarray, blocks: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Positions of blocks in sorted block ids and mask of found blocks """
+    idx = np.searchsorted(block_ids, blocks)
+    if not len(block_ids):
+        return idx, np.zeros(len(blocks), dtype=bool)
+    idx[idx == len(block_ids)] = 0
+    return idx, block_ids[idx] == blocks
+
+
+def _coalesce(codes: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Sum values with the same code, codes in result are sorted """
+    uniq, inverse = np.unique(codes, return_inverse=True)
+    return uniq, np.bincount(inverse.ravel(), weights=values, minlength=len(uniq)).astype(values.dtype)
+
+
+def _init_worker(blocks: BlockTable, n_projects: int, versus_mask: Union[np.ndarray, None], work_dir: str,
+                 n_partitions: int, chunk_size: int, threshold: Union[float, None] = None) -> None:
+    _WORKER.update(blocks=blocks, n_projects=n_projects, versus_mask=versus_mask, work_dir=work_dir,
+                   n_partitions=n_partitions, chunk_size=chunk_size, threshold=threshold)
+
+
+def _aggregate_shard(shard_id: int, shard: Shard) -> ShardResult:
+    """
+    Map step: count pairs per project pair and spill (block, other project) keys partitioned by block.
+    """
+    blocks, n_projects = _WORKER["blocks"], _WORKER["n_projects"]
+    n_partitions, versus_mask = _WORKER["n_partitions"], _WORKER["versus_mask"]
+    part_files = [open(os.path.join(_WORKER["work_dir"], "part_%s" % part, "shard_%s.bin" % shard_id), "wb")
+                  for part in range(n_partitions)]
+    pair_codes, pair_counts = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    n_pairs, n_kept = 0, 0
+    try:
+        lines = filter_by_similarity(iter_shard_lines(shard), _WORKER["threshold"])
+        for ids1, ids2 in _chunks(lines, _WORKER["chunk_size"]):
+            n_pairs += len(ids1)
+            idx1, found1 = _lookup(blocks.block_ids, ids1)
+            idx2, found2 = _lookup(blocks.block_ids, ids2)
+            keep = found1 & found2
+            idx1, idx2 = idx1[keep], idx2[keep]
+            proj1, proj2 = blocks.proj_idx[idx1], blocks.proj_idx[idx2]
+            if versus_mask is not None:
+                # only one project should be in filtered repositories
+                keep = versus_mask[proj1] != versus_mask[proj2]
+                idx1, idx2, proj1, proj2 = idx1[keep], idx2[keep], proj1[keep], proj2[keep]
+            n_kept += len(idx1)
+
+            codes = np.minimum(proj1, proj2) * n_projects + np.maximum(proj1, proj2)
+            pair_codes, pair_counts = _coalesce(np.concatenate([pair_codes, codes]),
+                                                np.concatenate([pair_counts, np.ones(len(codes), dtype=np.int64)]))
+
+            block_idx = np.concatenate([idx1, idx2])
+            keys = np.unique(block_idx * n_projects + np.concatenate([proj2, proj1]))
+            partition = (keys // n_projects) % n_partitions
+            for part in range(n_partitions):
+                keys[partition == part].tofile(part_files[part])
+    finally:
+        for part_file in part_files:
+            part_file.close()
+    return ShardResult(n_pairs=n_pairs, n_kept=n_kept, pair_codes=pair_codes, pair_counts=pair_counts)
+
+
+def _reduce_partition(part: int) -> PartitionResult:
+    """
+    Reduce step: deduplicate (block, other project) keys of one partition and sum them per project pair.
+    """
+    blocks, n_projects = _WORKER["blocks"], _WORKER["n_projects"]
+    part_dir = os.path.join(_WORKER["work_dir"], "part_%s" % part)
+    keys = [np.fromfile(os.path.join(part_dir, name), dtype=np.int64) for name in sorted(os.listdir(part_dir))]
+    keys = np.unique(np.concatenate(keys)) if keys else np.zeros(0, dtype=np.int64)
+    shutil.rmtree(part_dir, ignore_errors=True)
+
+    block_idx, other_proj = keys // n_projects, keys % n_projects
+    proj, sloc = blocks.proj_idx[block_idx], blocks.sloc[block_idx]
+    codes, n_blocks = _coalesce(proj * n_projects + other_proj, np.ones(len(keys), dtype=np.int64))
+    _, sloc = _coalesce(proj * n_projects + other_proj, sloc)
+    cloned = np.unique(block_idx)
+    return PartitionResult(codes=codes, blocks=n_blocks, sloc=sloc,
+                           proj_blocks=np.bincount(blocks.proj_idx[cloned], minlength=n_projects),
+                           proj_sloc=np.bincount(blocks.proj_idx[cloned], weights=blocks.sloc[cloned],
+                                                 minlength=n_projects).astype(np.int64))
+
+
+def save_csr(path: str, rows: np.ndarray, cols: np.ndarray, data: np.ndarray, n: int) -> None:
+    """
+    Save square sparse matrix in CSR format compatible with `scipy.sparse.load_npz`.
+    :param path: path to `.npz` file.
+    :param rows: row indices, sorted.
+    :param cols: column indices, sorted within each row.
+    :param data: values.
+    :param n: number of rows and columns.
+    :return: None.
+    """
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n))]).astype(np.int64)
+    np.savez_compressed(path, format=np.array(b"csr"), shape=np.array([n, n]), data=data,
+                        indices=cols.astype(np.int64), indptr=indptr)
+
+
+def load_csr(path: str) -> CsrMatrix:
+    """
+    Load sparse matrix saved with `save_csr` (or `scipy.sparse.save_npz`).
+    :param path: path to `.npz` file.
+    :return: CSR matrix components.
+    """
+    with np.load(path) as loaded:
+        return CsrMatrix(data=loaded["data"], indices=loaded["indices"], indptr=loaded["indptr"],
+                         shape=tuple(loaded["shape"]))
+
+
+def aggregate(results_files: List[str], stats_files: str, output: str, bookkeeping_folder: str = None,
+              filter_repos: Union[List[str], None] = None, n_jobs: int = None, n_partitions: int = N_PARTITIONS,
+              chunk_size: int = CHUNK_SIZE, top: int = 10, threshold: Union[float, None] = None,
+              sorted_input: bool = False) -> None:
+    """
+    Aggregate clone pairs into project x project sparse matrices.
+    :param results_files: paths or glob patterns of pairs files (`result.pairs.gz` or raw node outputs).
+    :param stats_files: meta information for blocks from SourcererCC.
+    :param output: directory to store matrices and `projects.csv`.
+    :param bookkeeping_folder: mapping {project_id: archive_path}, optional if no filtering is used.
+    :param filter_repos: repositories for `versus` mode filtering. If None - no filtering will be applied.
+    :param n_jobs: number of worker processes. If None - number of CPUs.
+    :param n_partitions: number of block partitions reduced independently (more partitions - less memory).
+    :param chunk_size: number of pairs processed at once by each worker.
+    :param top: number of biggest project pairs to print.
+    :param threshold: pairs with lower similarity are skipped (results searched with similarity reporting at a lower
+                      threshold), if None - all pairs are used.
+    :param sorted_input: pairs files are output of `sort_pairs` (normalized & deduplicated, e.g. `result.pairs.gz`
+                         of `main.py`), so they are aggregated as is.
+    :return: None.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    os.makedirs(output, exist_ok=True)
+    blocks, proj_ids = load_blocks(stats_files)
+    n_projects = max(1, len(proj_ids))
+    print("Loaded %s blocks from %s projects" % (format(len(blocks.block_ids), ","), format(len(proj_ids), ",")))
+
+    archives = dict(iter_bookkeeping(bookkeeping_folder)) if bookkeeping_folder else {}
+    versus_mask = None
+    if filter_repos:
+        filtered = _get_project_ids(project_names=set(filter_repos), bookkeeping_folder=bookkeeping_folder)
+        versus_mask = np.array([proj_id in filtered for proj_id in proj_ids] or [False])
+
+    work_dir = tempfile.mkdtemp(prefix="aggregate_", dir=output)
+    for part in range(n_partitions):
+        os.makedirs(os.path.join(work_dir, "part_%s" % part))
+    init_args = (blocks, n_projects, versus_mask, work_dir, n_partitions, chunk_size, threshold)
+    try:
+        if not sorted_input:
+            # every pair is counted once whatever its orientation & number of copies in the inputs
+            sorted_loc = os.path.join(work_dir, "pairs.sorted")
+            sort_pairs(inputs=results_files, output=sorted_loc, max_pairs_in_memory=chunk_size, tmp_dir=work_dir)
+            results_files = [sorted_loc]
+        shards = plan_shards(results_files, n_jobs)
+        if n_jobs == 1:
+            _init_worker(*init_args)
+            shard_results = [_aggregate_shard(i, shard) for i, shard in enumerate(shards)]
+            part_results = [_reduce_partition(part) for part in range(n_partitions)]
+        else:
+            with multiprocessing.Pool(n_jobs, initializer=_init_worker, initargs=init_args) as pool:
+                shard_results = pool.starmap(_aggregate_shard, enumerate(shards))
+                part_results = pool.map(_reduce_partition, range(n_partitions))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    n_pairs = sum(res.n_pairs for res in shard_results)
+    n_kept = sum(res.n_kept for res in shard_results)
+    print("Number of pairs in results %s and number of pairs after filtering %s" % (format(n_pairs, ","),
+                                                                                  format(n_kept, ",")))
+
+    # pairs: symmetric matrix from upper triangle
+    codes, counts = _coalesce(np.concatenate([np.zeros(0, dtype=np.int64)] + [r.pair_codes for r in shard_results]),
+                              np.concatenate([np.zeros(0, dtype=np.int64)] + [r.pair_counts for r in shard_results]))
+    rows, cols = codes // n_projects, codes % n_projects
+    off_diag = rows != cols
+    codes, counts = _coalesce(np.concatenate([codes, cols[off_diag] * n_projects + rows[off_diag]]),
+                              np.concatenate([counts, counts[off_diag]]))
+    save_csr(os.path.join(output, "n_pairs.npz"), codes // n_projects, codes % n_projects, counts, n_projects)
+
+    # blocks & SLOC: partitions contain different blocks, so partial sums are added
+    codes, n_blocks = _coalesce(np.concatenate([r.codes for r in part_results]),
+                                np.concatenate([r.blocks for r in part_results]))
+    _, sloc = _coalesce(np.concatenate([r.codes for r in part_results]),
+                        np.concatenate([r.sloc for r in part_results]))
+    rows, cols = codes // n_projects, codes % n_projects
+    proj_total_blocks = np.bincount(blocks.proj_idx, minlength=n_projects)
+    proj_total_sloc = np.bincount(blocks.proj_idx, weights=blocks.sloc, minlength=n_projects).astype(np.int64)
+    save_csr(os.path.join(output, "cloned_blocks.npz"), rows, cols, n_blocks, n_projects)
+    save_csr(os.path.join(output, "cloned_sloc.npz"), rows, cols, sloc, n_projects)
+    save_csr(os.path.join(output, "cloned_share.npz"), rows, cols,
+             (n_blocks / np.maximum(proj_total_blocks[rows], 1)).astype(np.float32), n_projects)
+
+    proj_cloned_blocks = sum(r.proj_blocks for r in part_results)
+    proj_cloned_sloc = sum(r.proj_sloc for r in part_results)
+    with open(os.path.join(output, "projects.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["idx", "proj_id", "archive", "n_blocks", "sloc", "cloned_blocks", "cloned_sloc",
+                         "cloned_share"])
+        for idx, proj_id in enumerate(proj_ids):
+            writer.writerow([idx, proj_id, archives.get(proj_id, ""), proj_total_blocks[idx], proj_total_sloc[idx],
+                             proj_cloned_blocks[idx], proj_cloned_sloc[idx],
+                             "%.4f" % (proj_cloned_blocks[idx] / max(proj_total_blocks[idx], 1))])
+
+    order = np.argsort(-n_blocks, kind="stable")[:top]
+    table = [[proj_ids[rows[i]], proj_ids[cols[i]], n_blocks[i], sloc[i],
+              "%.2f%%" % (100 * n_blocks[i] / max(proj_total_blocks[rows[i]], 1))] for i in order]
+    print(tabulate(table, headers=["project", "cloned in", "blocks", "SLOC", "share"]))
+    print("Aggregated results saved to %s" % output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--results-file", required=True, nargs="+",
+                        help="File(s) or glob patterns with results of SourcererCC (results.pairs or node outputs), "
+                             "pairs are normalized & deduplicated first.")
+    parser.add_argument("-s", "--stats-files", required=True, help="File or folder with stats files (*.stats).")
+    parser.add_argument("-b", "--bookkeeping-folder", default=None, help="File or folder with bookkeeping files "
+                                                                         "(proj_id to archive path mapping).")
+    parser.add_argument("-o", "--output", required=True, help="Directory to store matrices and projects.csv.")
+    parser.add_argument("-f", "--filter", nargs="*", help="List of repositories (archive names without path) "
+                                                          "for `versus` mode filtering.")
+    parser.add_argument("--sorted-input", action="store_true",
+                        help="Results are output of sort_pairs.py (e.g. result.pairs.gz of main.py), skip "
+                             "normalization & deduplication.")
+    parser.add_argument("-j", "--n-jobs", type=int, default=None, help="Number of worker processes.")
+    parser.add_argument("--partitions", type=int, default=N_PARTITIONS,
+                        help="Number of block partitions, more partitions - less memory per reduce step.")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Pairs processed at once by a worker.")
+    parser.add_argument("-t", "--threshold", type=float, default=None,
+                        help="Keep only pairs with at least this similarity, results must be searched with similarity "
+                             "reporting (`main.py --report-similarity`) at a lower threshold.")
+    args = parser.parse_args()
+    if args.filter and not args.bookkeeping_folder:
+        parser.error("--filter requires --bookkeeping-folder")
+    aggregate(results_files=args.results_file, stats_files=args.stats_files, output=args.output,
+              bookkeeping_folder=args.bookkeeping_folder, filter_repos=args.filter, n_jobs=args.n_jobs,
+              n_partitions=args.partitions, chunk_size=args.chunk_size, threshold=args.threshold,
+              sorted_input=args.sorted_input)
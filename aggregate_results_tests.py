@@ -0,0 +1,94 @@
+import csv
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from aggregate_results import Shard, aggregate, iter_shard_lines, load_csr, plan_shards
+
+
+def to_dict(matrix):
+    res = {}
+    for row in range(matrix.shape[0]):
+        for pos in range(matrix.indptr[row], matrix.indptr[row + 1]):
+            res[(row, int(matrix.indices[pos]))] = matrix.data[pos]
+    return res
+
+
+class TestAggregateResults(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(1)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        tmp = self.tmp_dir.name
+        # 4 projects, 30 blocks each
+        self.blocks = {}
+        with open(os.path.join(tmp, "files.stats"), "w") as f:
+            for proj in range(4):
+                for i in range(30):
+                    block_id = 100000 + proj * 1000 + i
+                    sloc = rnd.randint(5, 50)
+                    self.blocks[block_id] = (proj, sloc)
+                    f.write('b,%s,%s,"hash",%s,%s,%s,1,%s\n' % (10 + proj, block_id, sloc, sloc, sloc, sloc))
+        self.pairs = []
+        with open(os.path.join(tmp, "results.pairs"), "w") as f:
+            for _ in range(400):
+                block1, block2 = rnd.sample(sorted(self.blocks), 2)
+                self.pairs.append((block1, block2))
+                f.write("%s,%s,%s,%s\n" % (10 + self.blocks[block1][0], block1, 10 + self.blocks[block2][0], block2))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_byte_range_shards(self):
+        results = os.path.join(self.tmp_dir.name, "results.pairs")
+        shards = plan_shards([results], 7)
+        self.assertGreater(len(shards), 1)
+        lines = [line for shard in shards for line in iter_shard_lines(shard)]
+        self.assertEqual(lines, list(iter_shard_lines(Shard(path=results, start=0, end=None))))
+
+    def test_matches_brute_force(self):
+        # project index follows order of appearance in stats: proj_id 10 + idx
+        n_pairs, cloned = {}, {}
+        for block1, block2 in {tuple(sorted(pair)) for pair in self.pairs}:
+            proj1, proj2 = self.blocks[block1][0], self.blocks[block2][0]
+            for key in {(proj1, proj2), (proj2, proj1)}:
+                n_pairs[key] = n_pairs.get(key, 0) + 1
+            cloned.setdefault((proj1, proj2), set()).add(block1)
+            cloned.setdefault((proj2, proj1), set()).add(block2)
+
+        for n_jobs in (1, 3):
+            output = os.path.join(self.tmp_dir.name, "aggregate_%s" % n_jobs)
+            aggregate([os.path.join(self.tmp_dir.name, "results.pairs")], self.tmp_dir.name, output,
+                      n_jobs=n_jobs, n_partitions=3, chunk_size=50)
+            self.assertEqual(to_dict(load_csr(os.path.join(output, "n_pairs.npz"))), n_pairs)
+            self.assertEqual(to_dict(load_csr(os.path.join(output, "cloned_blocks.npz"))),
+                             {key: len(blocks) for key, blocks in cloned.items()})
+            self.assertEqual(to_dict(load_csr(os.path.join(output, "cloned_sloc.npz"))),
+                             {key: sum(self.blocks[b][1] for b in blocks) for key, blocks in cloned.items()})
+            with open(os.path.join(output, "projects.csv")) as f:
+                rows = list(csv.DictReader(f))
+            for row in rows:
+                proj = int(row["idx"])
+                cloned_blocks = set().union(*[blocks for key, blocks in cloned.items() if key[0] == proj])
+                self.assertEqual(int(row["cloned_blocks"]), len(cloned_blocks))
+                self.assertEqual(int(row["n_blocks"]), 30)
+            share = load_csr(os.path.join(output, "cloned_share.npz"))
+            self.assertTrue(np.all(share.data <= 1))
+
+    def test_both_orientations_counted_once(self):
+        block1, block2 = 100000, 101000
+        results = os.path.join(self.tmp_dir.name, "raw.pairs")
+        with open(results, "w") as f:
+            f.write("10,%s,11,%s\n11,%s,10,%s\n10,%s,11,%s\n" % (block1, block2, block2, block1, block1, block2))
+        output = os.path.join(self.tmp_dir.name, "aggregate_raw")
+        aggregate([results], self.tmp_dir.name, output, n_jobs=1, n_partitions=2)
+        self.assertEqual(to_dict(load_csr(os.path.join(output, "n_pairs.npz"))), {(0, 1): 1, (1, 0): 1})
+        self.assertEqual(to_dict(load_csr(os.path.join(output, "cloned_blocks.npz"))), {(0, 1): 1, (1, 0): 1})
+        # sorted pairs are removed with the work directory
+        self.assertFalse([name for name in os.listdir(output) if name.startswith("aggregate_")])
+
+
+if __name__ == '__main__':
+    unittest.main()
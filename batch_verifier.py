@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Batch verification of clone candidates.
+
+Bags of tokens are stored as sparse CSR matrices of token counts (one row per block, columns are token ids,
+indices are sorted within rows). Min-count overlaps of thousands of (query, candidate) pairs are computed at once:
+rows of both sides are gathered with keys `pair * n_tokens + token`, after a stable sort a token common to both
+blocks of a pair gives two adjacent equal keys, minimums of their counts are summed per pair. The threshold test
+(`overlap >= ceil(threshold * max(size1, size2))`) is applied to the whole batch.
+
+Used by `python_engine.py` and as a post-filter over pairs of `clone-detector` (e.g. re-check results at a higher
+threshold): `python batch_verifier.py filter <pairs> --tokens <tokens folder> -t 0.9`.
+`python batch_verifier.py benchmark` compares batch verification with pair-by-pair verification.
+"""
+import argparse
+import random
+import sys
+import time
+from collections import namedtuple
+from typing import Dict, Hashable, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from prettify_results import get_files, get_line_iterator
+
+# number of (pair, token) entries gathered at once, bounds memory of a batch
+MAX_EXPANDED = 1 << 22
+# threshold is applied in thousandths like in SourcererCC (`th * MUL_FACTOR`)
+THRESHOLD_SCALE = 1000
+
+CSR = namedtuple("CSR", ["indptr", "indices", "data"])
+
+
+def csr_from_bags(bags: Iterable[Dict[Hashable, int]], vocabulary: Dict[Hashable, int]) -> CSR:
+    """
+    Build CSR matrix of token counts.
+    :param bags: {token: count} of every row.
+    :param vocabulary: token ids, new tokens are added.
+    :return: CSR matrix with sorted indices.
+    """
+    indptr, indices, data = [0], [], []
+    for bag in bags:
+        row = sorted((vocabulary.setdefault(token, len(vocabulary)), count) for token, count in bag.items())
+        indices.extend(token_id for token_id, _ in row)
+        data.extend(count for _, count in row)
+        indptr.append(len(indices))
+    return CSR(indptr=np.array(indptr, dtype=np.int64), indices=np.array(indices, dtype=np.int64),
+               data=np.array(data, dtype=np.int64))
+
+
+def strip_token(token: str) -> str:
+    """ Same normalization as `CloneHelper.strip` of clone-detector """
+    return token.replace("'", "").replace('"', "").replace("\\", "").strip()
+
+
+def min_overlap(sizes: np.ndarray, threshold: float) -> np.ndarray:
+    """ `ceil(threshold * size)` in integers """
+    scaled = int(round(threshold * THRESHOLD_SCALE))
+    return -(-np.asarray(sizes, dtype=np.int64) * scaled // THRESHOLD_SCALE)
+
+
+def _gather(matrix: CSR, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Positions of entries of rows in `matrix.indices` & the index of their row in `rows` """
+    starts = matrix.indptr[rows]
+    lengths = matrix.indptr[rows + 1] - starts
+    owners = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(len(owners)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, owners
+
+
+def min_overlaps(queries: CSR, candidates: CSR, query_idx: np.ndarray, candidate_idx: np.ndarray) -> np.ndarray:
+    """
+    Sum of minimal counts of common tokens for every pair.
+    :param queries: CSR matrix of query bags.
+    :param candidates: CSR matrix of candidate bags (can be the same matrix).
+    :param query_idx: query row of every pair.
+    :param candidate_idx: candidate row of every pair.
+    :return: overlap of every pair.
+    """
+    query_idx, candidate_idx = np.asarray(query_idx, dtype=np.int64), np.asarray(candidate_idx, dtype=np.int64)
+    n_tokens = int(max(queries.indices.max(initial=0), candidates.indices.max(initial=0))) + 1
+    row_lengths = (queries.indptr[query_idx + 1] - queries.indptr[query_idx]) + \
+        (candidates.indptr[candidate_idx + 1] - candidates.indptr[candidate_idx])
+    cumulative = np.cumsum(row_lengths)
+    overlaps = np.zeros(len(query_idx), dtype=np.int64)
+    start = 0
+    while start < len(query_idx):
+        # pairs whose rows fit into MAX_EXPANDED entries, at least one pair
+        expanded_before = cumulative[start - 1] if start else 0
+        end = max(start + 1, int(np.searchsorted(cumulative, expanded_before + MAX_EXPANDED, side="right")))
+        query_positions, query_pairs = _gather(queries, query_idx[start:end])
+        candidate_positions, candidate_pairs = _gather(candidates, candidate_idx[start:end])
+        keys = np.concatenate([query_pairs * n_tokens + queries.indices[query_positions],
+                               candidate_pairs * n_tokens + candidates.indices[candidate_positions]])
+        counts = np.concatenate([queries.data[query_positions], candidates.data[candidate_positions]])
+        order = np.argsort(keys, kind="stable")
+        keys, counts = keys[order], counts[order]
+        # tokens are unique within a row: equal keys come in pairs, one from each side
+        common = np.flatnonzero(keys[1:] == keys[:-1])
+        overlaps[start:end] = np.bincount(keys[common] // n_tokens, minlength=end - start,
+                                          weights=np.minimum(counts[common], counts[common + 1]))
+        start = end
+    return overlaps
+
+
+def verify(queries: CSR, candidates: CSR, query_idx: np.ndarray, candidate_idx: np.ndarray,
+           query_sizes: np.ndarray, candidate_sizes: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    Threshold test for a batch of candidate pairs.
+    :param queries: CSR matrix of query bags.
+    :param candidates: CSR matrix of candidate bags.
+    :param query_idx: query row of every pair.
+    :param candidate_idx: candidate row of every pair.
+    :param query_sizes: size (number of tokens) of every query row.
+    :param candidate_sizes: size of every candidate row.
+    :param threshold: similarity threshold.
+    :return: boolean mask of pairs that are clones.
+    """
+    sizes = np.maximum(np.asarray(query_sizes)[query_idx], np.asarray(candidate_sizes)[candidate_idx])
+    return min_overlaps(queries, candidates, query_idx, candidate_idx) >= min_overlap(sizes, threshold)
+
+
+def verify_pair(query: Dict[Hashable, int], candidate: Dict[Hashable, int], threshold: float) -> bool:
+    """ Pair-by-pair reference: overlap of two bags against the threshold """
+    overlap = sum(min(count, candidate.get(token, 0)) for token, count in query.items())
+    size = max(sum(query.values()), sum(candidate.values()))
+    return overlap >= int(min_overlap(np.array([size]), threshold)[0])
+
+
+def read_bags(tokens_locs: Iterable[str], block_ids: set = None) -> Dict[str, Dict[str, int]]:
+    """
+    Read bags of tokens files.
+    :param tokens_locs: tokens files or folders with them.
+    :param block_ids: read only these blocks, all if None.
+    :return: {block_id: {token: count}}.
+    """
+    bags = {}
+    for tokens_loc in tokens_locs:
+        for tokens_file in sorted(get_files(path=tokens_loc, extension=".tokens")):
+            for line in get_line_iterator(tokens_file):
+                header, _, body = line.partition("@#@")
+                metadata = header.split(",", 3)
+                if len(metadata) < 4 or not body or (block_ids is not None and metadata[1] not in block_ids):
+                    continue
+                bag = {}
+                for token_count in body.split(","):
+                    token, _, count = token_count.rpartition("@@::@@")
+                    token = strip_token(token)
+                    if token and token not in bag:
+                        bag[token] = int(count)
+                bags[metadata[1]] = bag
+    return bags
+
+
+def filter_pairs(pair_lines: Iterable[str], tokens_locs: List[str], threshold: float,
+                 batch_size: int = 100000) -> Iterator[str]:
+    """
+    Keep only pairs that pass the threshold, e.g. results of `clone-detector` re-checked at a higher threshold.
+    :param pair_lines: lines `proj_id1,block_id1,proj_id2,block_id2`.
+    :param tokens_locs: tokens files or folders with them.
+    :param threshold: similarity threshold.
+    :param batch_size: number of pairs verified at once.
+    :return: iterator of lines of pairs that pass.
+    """
+    pair_lines = [line for line in pair_lines if line]
+    bags = read_bags(tokens_locs, {part for line in pair_lines for part in line.split(",")[1::2]})
+    block_ids = sorted(bags)
+    rows = {block_id: row for row, block_id in enumerate(block_ids)}
+    matrix = csr_from_bags((bags[block_id] for block_id in block_ids), {})
+    sizes = np.array([sum(bags[block_id].values()) for block_id in block_ids], dtype=np.int64)
+    for batch_start in range(0, len(pair_lines), batch_size):
+        batch = [line for line in pair_lines[batch_start:batch_start + batch_size]
+                 if line.split(",")[1] in rows and line.split(",")[3] in rows]
+        query_idx = np.array([rows[line.split(",")[1]] for line in batch], dtype=np.int64)
+        candidate_idx = np.array([rows[line.split(",")[3]] for line in batch], dtype=np.int64)
+        mask = verify(matrix, matrix, query_idx, candidate_idx, sizes, sizes, threshold)
+        for line, passed in zip(batch, mask.tolist()):
+            if passed:
+                yield line
+
+
+def benchmark(n_blocks: int = 20000, n_pairs: int = 200000, n_tokens: int = 20000, threshold: float = 0.8,
+              seed: int = 0) -> Dict[str, float]:
+    """
+    Compare batch verification with pair-by-pair verification on random near-duplicate bags.
+    :param n_blocks: number of bags.
+    :param n_pairs: number of candidate pairs.
+    :param n_tokens: vocabulary size.
+    :param threshold: similarity threshold.
+    :param seed: random seed.
+    :return: timings in seconds & pairs per second.
+    """
+    rnd = random.Random(seed)
+    templates = [{rnd.randrange(n_tokens): rnd.randint(1, 4) for _ in range(rnd.randint(20, 120))}
+                 for _ in range(max(1, n_blocks // 10))]
+    bags = []
+    for block in range(n_blocks):
+        bag = dict(templates[block % len(templates)])
+        for _ in range(rnd.randint(0, 15)):
+            bag[rnd.randrange(n_tokens)] = rnd.randint(1, 4)
+        bags.append(bag)
+    # half of the pairs are mutations of the same template, like candidates that share prefix tokens
+    pairs = [(query, rnd.randrange(query % len(templates), n_blocks, len(templates)) if rnd.random() < 0.5
+              else rnd.randrange(n_blocks)) for query in (rnd.randrange(n_blocks) for _ in range(n_pairs))]
+
+    started = time.perf_counter()
+    expected = [verify_pair(bags[query], bags[candidate], threshold) for query, candidate in pairs]
+    pairwise_time = time.perf_counter() - started
+
+    matrix = csr_from_bags(bags, {})
+    sizes = np.array([sum(bag.values()) for bag in bags], dtype=np.int64)
+    query_idx = np.array([query for query, _ in pairs], dtype=np.int64)
+    candidate_idx = np.array([candidate for _, candidate in pairs], dtype=np.int64)
+    started = time.perf_counter()
+    mask = verify(matrix, matrix, query_idx, candidate_idx, sizes, sizes, threshold)
+    batch_time = time.perf_counter() - started
+    if mask.tolist() != expected:
+        raise AssertionError("batch verification differs from pair-by-pair verification")
+    return {"pairs": n_pairs, "clones": int(mask.sum()), "pairwise_seconds": pairwise_time,
+            "batch_seconds": batch_time, "pairwise_pairs_per_sec": n_pairs / pairwise_time,
+            "batch_pairs_per_sec": n_pairs / batch_time, "speedup": pairwise_time / batch_time}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command")
+    filter_parser = subparsers.add_parser("filter", help="Keep pairs that pass the threshold.")
+    filter_parser.add_argument("pairs", help="Pairs file (`proj_id1,block_id1,proj_id2,block_id2`), may be gzipped.")
+    filter_parser.add_argument("--tokens", required=True, nargs="+", help="Tokens files or folders with them.")
+    filter_parser.add_argument("-t", "--threshold", type=float, required=True, help="Similarity threshold.")
+    benchmark_parser = subparsers.add_parser("benchmark", help="Batch vs pair-by-pair verification.")
+    benchmark_parser.add_argument("--blocks", type=int, default=20000, help="Number of random bags.")
+    benchmark_parser.add_argument("--pairs", type=int, default=200000, help="Number of candidate pairs.")
+    benchmark_parser.add_argument("-t", "--threshold", type=float, default=0.8, help="Similarity threshold.")
+    args = parser.parse_args()
+
+    if args.command == "filter":
+        for pair in filter_pairs(get_line_iterator(args.pairs), args.tokens, args.threshold):
+            print(pair)
+    elif args.command == "benchmark":
+        for name, value in benchmark(args.blocks, args.pairs, threshold=args.threshold).items():
+            print("{}: {}".format(name, round(value, 3) if isinstance(value, float) else value))
+    else:
+        parser.print_help()
+        sys.exit(1)
@@ -0,0 +1,68 @@
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+import batch_verifier
+from batch_verifier import csr_from_bags, filter_pairs, min_overlaps, verify, verify_pair
+
+
+class TestBatchVerifier(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(3)
+        base = [{"t%s" % rnd.randrange(30): rnd.randint(1, 3) for _ in range(rnd.randint(3, 20))} for _ in range(5)]
+        self.bags = []
+        for block in range(120):
+            bag = dict(base[block % len(base)])
+            for _ in range(rnd.randint(0, 5)):
+                bag["t%s" % rnd.randrange(40)] = rnd.randint(1, 3)
+            self.bags.append(bag)
+        self.pairs = [(rnd.randrange(len(self.bags)), rnd.randrange(len(self.bags))) for _ in range(3000)]
+
+    def _batch(self, threshold):
+        vocabulary = {}
+        queries = csr_from_bags(self.bags[:60], vocabulary)
+        candidates = csr_from_bags(self.bags[60:], vocabulary)
+        query_idx = np.array([query % 60 for query, _ in self.pairs])
+        candidate_idx = np.array([candidate % 60 for _, candidate in self.pairs])
+        sizes = np.array([sum(bag.values()) for bag in self.bags])
+        return verify(queries, candidates, query_idx, candidate_idx, sizes[:60], sizes[60:], threshold)
+
+    def test_overlaps(self):
+        matrix = csr_from_bags(self.bags, {})
+        overlaps = min_overlaps(matrix, matrix, np.array([q for q, _ in self.pairs]),
+                                np.array([c for _, c in self.pairs]))
+        expected = [sum(min(count, self.bags[c].get(token, 0)) for token, count in self.bags[q].items())
+                    for q, c in self.pairs]
+        self.assertEqual(overlaps.tolist(), expected)
+
+    def test_verify(self):
+        for threshold in [0.5, 0.7, 0.8, 1.0]:
+            expected = [verify_pair(self.bags[q % 60], self.bags[60 + c % 60], threshold) for q, c in self.pairs]
+            self.assertEqual(self._batch(threshold).tolist(), expected)
+
+    def test_chunks(self):
+        expected = self._batch(0.7).tolist()
+        max_expanded = batch_verifier.MAX_EXPANDED
+        batch_verifier.MAX_EXPANDED = 16
+        try:
+            self.assertEqual(self._batch(0.7).tolist(), expected)
+        finally:
+            batch_verifier.MAX_EXPANDED = max_expanded
+
+    def test_filter_pairs(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "blocks.tokens"), "w") as f:
+                for block, bag in enumerate(self.bags):
+                    tokens = ",".join("{}@@::@@{}".format(token, count) for token, count in bag.items())
+                    f.write("1,{},{},{},0,hash@#@{}\n".format(block, sum(bag.values()), len(bag), tokens))
+            lines = ["1,{},1,{}".format(q, c) for q, c in self.pairs] + ["1,0,1,100000"]
+            result = list(filter_pairs(lines, [tmp], 0.8, batch_size=500))
+        expected = ["1,{},1,{}".format(q, c) for q, c in self.pairs if verify_pair(self.bags[q], self.bags[c], 0.8)]
+        self.assertEqual(result, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import copy
+import os
+import tempfile
+import unittest
+import zipfile
+
+from .evaluate import FunctionLocator, detected_pairs, expected_pairs, score
+from .generate_corpus import DEFAULT_CONFIG, INPUT_DIR_NAME, generate_corpus
+from .run_benchmark import compare
+
+
+class TestBenchmarks(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        config = DEFAULT_CONFIG._replace(repos=8, files_per_repo=4, functions_per_file=3, duplication_rate=0.2,
+                                         clone_rate=0.3, seed=1)
+        self.truth = generate_corpus(self.tmp.name, config)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _archive(self, function):
+        return os.path.join(self.tmp.name, INPUT_DIR_NAME, function["language"], function["archive"])
+
+    def test_corpus(self):
+        functions = self.truth["functions"]
+        self.assertEqual(len(functions), 8 * 4 * 3)
+        self.assertEqual(sorted(self.truth["extensions"]), ["c", "cpp", "csharp", "java"])
+        self.assertEqual({function["type"] for function in functions}, {0, 1, 2, 3})
+        by_id = {function["id"]: function for function in functions}
+        for function in functions:
+            self.assertEqual(by_id[function["class"]]["language"], function["language"])
+            with zipfile.ZipFile(self._archive(function)) as archive:
+                lines = archive.read(function["path"]).decode("utf-8").split("\n")
+            body = lines[function["start_line"] - 1:function["end_line"]]
+            self.assertIn(" int ", " " + body[0])
+            self.assertTrue(body[0].endswith("{"))
+            self.assertEqual(body[-1].strip(), "}")
+        # the same config gives the same corpus
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.assertEqual(generate_corpus(tmp_dir, DEFAULT_CONFIG._replace(**self.truth["config"])), self.truth)
+
+    def test_evaluate(self):
+        functions = [function for function in self.truth["functions"] if function["language"] == "java"]
+        expected = expected_pairs(functions)
+        self.assertTrue(expected)
+        stats_dir = os.path.join(self.tmp.name, "stats_folder")
+        os.makedirs(stats_dir)
+        block_ids, file_ids = {}, {}
+        # stats & pairs as written by the tokenizer & clone detector: lines of blocks start from 0
+        with open(os.path.join(stats_dir, "files-stats-0.stats"), "w") as f:
+            for function in functions:
+                key = (function["archive"], function["path"])
+                proj_id = function["archive"][5:10]
+                if key not in file_ids:
+                    file_ids[key] = str(len(file_ids) + 1)
+                    f.write('f,{},{},"{}/{}","","hash",100,10,10,10\n'.format(
+                        proj_id, file_ids[key], self._archive(function), function["path"]))
+                block_ids[function["id"]] = (proj_id, "{}{}".format(10000 + function["id"], file_ids[key]))
+                f.write('b,{},{},"hash",5,5,5,{},{}\n'.format(proj_id, block_ids[function["id"]][1],
+                                                              function["start_line"] - 1, function["end_line"] - 1))
+        type1 = sorted(pair for pair, clone_type in expected.items() if clone_type == 1)
+        unrelated = next((first, second) for first in block_ids for second in block_ids
+                         if first < second and (first, second) not in expected)
+        pairs = ["{},{},{},{}".format(*block_ids[second], *block_ids[first]) for first, second in type1 + [unrelated]]
+        detected, unmapped = detected_pairs(pairs + ["1,99999,1,99998"], stats_dir, FunctionLocator(functions))
+        self.assertEqual(detected, set(type1 + [unrelated]))
+        self.assertEqual(unmapped, 1)
+        quality = score(detected, expected, unmapped)
+        self.assertEqual((quality.true_positives, quality.detected), (len(type1), len(type1) + 1))
+        self.assertAlmostEqual(quality.precision, len(type1) / (len(type1) + 1))
+        self.assertAlmostEqual(quality.recall, len(type1) / len(expected))
+        self.assertEqual(quality.recall_by_type["1"], 1.0)
+        self.assertTrue(all(recall == 0 for clone_type, recall in quality.recall_by_type.items() if clone_type != "1"))
+
+    def test_compare(self):
+        usage = {"wall_s": 10.0, "cpu_s": 20.0, "max_rss_mb": 100.0, "bytes_written": 1 << 24}
+        baseline = {"corpus": self.truth["config"], "main_args": ["--engine", "python"],
+                    "quality": {"precision": 0.99, "recall": 0.8, "f1": 0.88},
+                    "runs": {"java": {"total": dict(usage), "stages": {"tokenize": dict(usage), "search": dict(usage)},
+                                      "quality": {"precision": 0.99, "recall": 0.8, "f1": 0.88}}}}
+        results = copy.deepcopy(baseline)
+        regressions, rows = compare(results, baseline)
+        self.assertEqual(regressions, [])
+        self.assertEqual(len(rows), 3 + 3 + 3 * len(usage))
+        results["runs"]["java"]["stages"]["search"]["wall_s"] = 15.0
+        results["runs"]["java"]["stages"]["tokenize"]["cpu_s"] = 20.5
+        results["quality"]["recall"] = 0.7
+        regressions, _ = compare(results, baseline)
+        self.assertEqual([regression.metric for regression in regressions], ["java.search.wall_s", "quality.recall"])
+        results["main_args"] = []
+        with self.assertRaises(ValueError):
+            compare(results, baseline)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+"""
+Precision & recall of detected clone pairs against the ground truth of a synthetic corpus.
+
+Detected pairs of blocks are mapped to generated functions by file and lines (`stats_folder` of the tokenizer):
+a block belongs to the function that contains its middle line. A pair of functions is a true positive if both are in
+the same clone class. Recall is also reported by clone type of expected pairs: Type-1 for the same text (up to layout),
+otherwise the larger type of the two functions.
+"""
+import argparse
+from collections import namedtuple
+import json
+from bisect import bisect_right
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from prettify_results import get_line_iterator, get_raw_metainfo, split_sourcerercc_path
+
+Quality = namedtuple("Quality", ["precision", "recall", "f1", "detected", "expected", "true_positives", "unmapped",
+                                 "recall_by_type"])
+
+
+def load_truth(truth_loc: str) -> Dict:
+    """
+    Read ground truth written by `generate_corpus`.
+    :param truth_loc: path to `ground_truth.json`.
+    :return: ground truth.
+    """
+    with open(truth_loc, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class FunctionLocator:
+    """
+    Find generated function by location of block.
+    """
+
+    def __init__(self, functions: Iterable[Dict]):
+        self.files = {}
+        for function in functions:
+            self.files.setdefault((function["archive"], function["path"]), []).append(
+                (function["start_line"], function["end_line"], function["id"]))
+        for positions in self.files.values():
+            positions.sort()
+
+    def locate(self, archive: str, path: str, start_line: int, end_line: int) -> Optional[int]:
+        """
+        :param archive: archive name.
+        :param path: path to file in archive.
+        :param start_line: start line of block (tokenizer may count from 0 or 1, the middle line is robust to it).
+        :param end_line: end line of block.
+        :return: id of function, None if block is not inside a generated function.
+        """
+        positions = self.files.get((archive, path), [])
+        middle = (start_line + end_line) / 2
+        i = bisect_right(positions, (middle, float("inf"))) - 1
+        if i >= 0 and positions[i][0] <= middle <= positions[i][1]:
+            return positions[i][2]
+        return None
+
+
+def pair_type(function1: Dict, function2: Dict) -> int:
+    """
+    Clone type of two functions of the same class.
+    """
+    if function1["variant"] == function2["variant"]:
+        return 1
+    return max(function1["type"], function2["type"], 1)
+
+
+def expected_pairs(functions: List[Dict]) -> Dict[Tuple[int, int], int]:
+    """
+    All pairs of functions of the same clone class.
+    :param functions: functions of ground truth.
+    :return: mapping {(smaller function id, larger function id): clone type}.
+    """
+    classes = {}
+    for function in functions:
+        classes.setdefault(function["class"], []).append(function)
+    pairs = {}
+    for members in classes.values():
+        for function1, function2 in combinations(members, 2):
+            key = tuple(sorted((function1["id"], function2["id"])))
+            pairs[key] = pair_type(function1, function2)
+    return pairs
+
+
+def detected_pairs(pairs: Iterable[str], stats_folder: str, locator: FunctionLocator) -> Tuple[set, int]:
+    """
+    Map detected pairs of blocks to pairs of generated functions.
+    :param pairs: lines `proj_id1,block_id1,proj_id2,block_id2[,...]`.
+    :param stats_folder: stats of the tokenizer.
+    :param locator: locator of generated functions.
+    :return: set of (smaller function id, larger function id) & number of pairs with a block outside of functions.
+    """
+    block_pairs = []
+    ids = set()
+    for line in pairs:
+        if line:
+            proj_id1, block_id1, proj_id2, block_id2 = line.split(",")[:4]
+            block_pairs.append((block_id1, block_id2))
+            ids.update([proj_id1, block_id1, proj_id2, block_id2])
+    metainfo = get_raw_metainfo(stats_folder, filter_ids=ids)
+    functions = {}
+
+    def function_of(block_id):
+        if block_id not in functions:
+            block = metainfo.get(block_id)
+            file = metainfo.get(block["file_id"]) if block is not None else None
+            functions[block_id] = None
+            if file is not None:
+                archive_loc, path = split_sourcerercc_path(file["file_path"].strip('"'))
+                functions[block_id] = locator.locate(archive_loc.rsplit("/", 1)[-1], path, block["start_line"],
+                                                     block["end_line"])
+        return functions[block_id]
+
+    detected, unmapped = set(), 0
+    for block_id1, block_id2 in block_pairs:
+        function1, function2 = function_of(block_id1), function_of(block_id2)
+        if function1 is None or function2 is None:
+            unmapped += 1
+        elif function1 != function2:
+            detected.add((min(function1, function2), max(function1, function2)))
+    return detected, unmapped
+
+
+def score(detected: set, expected: Dict[Tuple[int, int], int], unmapped: int = 0) -> Quality:
+    """
+    Precision & recall of detected pairs of functions.
+    :param detected: detected pairs of function ids.
+    :param expected: expected pairs with their clone types.
+    :param unmapped: number of detected pairs that were not mapped to functions (reported as is).
+    :return: quality, metrics of empty sets are None.
+    """
+    true_positives = sum(pair in expected for pair in detected)
+    precision = true_positives / len(detected) if detected else None
+    recall = true_positives / len(expected) if expected else None
+    f1 = 2 * precision * recall / (precision + recall) if precision and recall else None
+    by_type = {}
+    for pair, clone_type in expected.items():
+        found, total = by_type.get(clone_type, (0, 0))
+        by_type[clone_type] = (found + (pair in detected), total + 1)
+    return Quality(precision=precision, recall=recall, f1=f1, detected=len(detected), expected=len(expected),
+                   true_positives=true_positives, unmapped=unmapped,
+                   recall_by_type={str(clone_type): found / total for clone_type, (found, total)
+                                   in sorted(by_type.items())})
+
+
+def evaluate(results_file: str, stats_folder: str, functions: List[Dict]) -> Quality:
+    """
+    Precision & recall of results of a pipeline run.
+    :param results_file: detected pairs (`tokens/result.pairs.gz` in output directory of `main.py --save-pairs`).
+    :param stats_folder: stats of the tokenizer (`tokens/stats_folder`).
+    :param functions: functions of ground truth that were given to the pipeline.
+    :return: quality.
+    """
+    detected, unmapped = detected_pairs(get_line_iterator(results_file), stats_folder, FunctionLocator(functions))
+    return score(detected, expected_pairs(functions), unmapped)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--results-file", required=True, help="Detected pairs.")
+    parser.add_argument("-s", "--stats-files", required=True, help="Stats folder of the tokenizer.")
+    parser.add_argument("-g", "--ground-truth", required=True, help="Ground truth written by `generate_corpus`.")
+    parser.add_argument("-l", "--language", default=None, help="Language of the run, if the corpus has several.")
+    args = parser.parse_args()
+    truth_functions = [function for function in load_truth(args.ground_truth)["functions"]
+                       if args.language is None or function["language"] == args.language]
+    print(json.dumps(evaluate(args.results_file, args.stats_files, truth_functions)._asdict(), indent=2))
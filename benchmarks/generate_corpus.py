@@ -0,0 +1,270 @@
+"""
+Synthetic corpus of zipped repositories with known clones for benchmarks.
+
+Every repository is written in one language (Java, C, C++ or C#) and consists of files with generated functions.
+Functions use random identifiers, so unrelated functions share few tokens. Clones are injected with known types:
+* Type-1 - the same code with different layout & comments;
+* Type-2 - identifiers & literals are renamed;
+* Type-3 - statements are inserted, deleted or changed.
+On top of that a share of files are verbatim copies of files from other repositories (vendored code), all their
+functions are Type-1 clones of the originals.
+Tokenizer handles one language per run, so archives of every language are saved to their own folder
+(`input/<language>`) and clones never cross languages.
+Ground truth (`ground_truth.json`) lists every function with its location and clone class: all functions of a class
+are clones of each other.
+"""
+import argparse
+from collections import namedtuple
+import io
+import json
+import os
+import random
+import re
+import zipfile
+from typing import Dict, List, Tuple
+
+INPUT_DIR_NAME = "input"
+GROUND_TRUTH_FILE_NAME = "ground_truth.json"
+CLONE_TYPES = (1, 2, 3)
+IDENTIFIER_RE = re.compile(r"\b[A-Za-z_][A-Za-z0-9_]*\b")
+NUMBER_RE = re.compile(r"\b\d+\b")
+SYLLABLES = ["ba", "co", "da", "fe", "gi", "ho", "ju", "ka", "le", "mi", "no", "pa", "qu", "ro", "si", "tu", "ve",
+             "wo", "xi", "ya", "ze", "bre", "cla", "dro", "fli", "gro", "pla", "sta", "tri", "vo"]
+
+# `{name}` in header & footer is the name of the file, `indent` is the nesting level of functions
+Language = namedtuple("Language", ["name", "extensions", "header", "footer", "signature", "print", "indent"])
+LANGUAGES = {
+    "java": Language(name="java", extensions=[".java"],
+                     header=["package bench;", "", "public class {name} {{"], footer=["}}"],
+                     signature="public static int {name}({params}) {{", print="System.out.println({var});",
+                     indent=1),
+    "c": Language(name="c", extensions=[".c"], header=["#include <stdio.h>", ""], footer=[],
+                  signature="static int {name}({params}) {{", print="printf(\"%d\\n\", {var});", indent=0),
+    "cpp": Language(name="cpp", extensions=[".cpp"], header=["#include <iostream>", "", "namespace bench {{"],
+                    footer=["}}"], signature="int {name}({params}) {{", print="std::cout << {var} << std::endl;",
+                    indent=0),
+    "csharp": Language(name="csharp", extensions=[".cs"],
+                       header=["using System;", "", "namespace Bench {{", "    public static class {name} {{"],
+                       footer=["    }}", "}}"], signature="public static int {name}({params}) {{",
+                       print="Console.WriteLine({var});", indent=2),
+}
+
+CorpusConfig = namedtuple("CorpusConfig", ["repos", "files_per_repo", "functions_per_file", "min_statements",
+                                           "max_statements", "languages", "duplication_rate", "clone_rate",
+                                           "clone_types", "rename_ratio", "edit_ratio", "seed"])
+DEFAULT_CONFIG = CorpusConfig(repos=20, files_per_repo=10, functions_per_file=5, min_statements=6, max_statements=20,
+                              languages=sorted(LANGUAGES), duplication_rate=0.05, clone_rate=0.2,
+                              clone_types=list(CLONE_TYPES), rename_ratio=0.25, edit_ratio=0.15, seed=0)
+# statements are lists of lines, nested lines start with a tab that is replaced by indentation while rendering
+Function = namedtuple("Function", ["name", "params", "statements", "result"])
+
+
+class _Generator:
+    """
+    Random functions & their clones.
+    """
+
+    def __init__(self, rnd: random.Random):
+        self.rnd = rnd
+        self.used_names = set()
+
+    def identifier(self) -> str:
+        while True:
+            name = "".join(self.rnd.choice(SYLLABLES) for _ in range(self.rnd.randint(2, 4)))
+            name += self.rnd.choice(["", "Count", "Value", "Index", "Size", "Total", "Offset",
+                                     str(self.rnd.randint(0, 99))])
+            if name not in self.used_names:
+                self.used_names.add(name)
+                return name
+
+    def statement(self, variables: List[str], print_template: str) -> List[str]:
+        rnd = self.rnd
+        var, other = rnd.choice(variables), rnd.choice(variables)
+        kind = rnd.randrange(6)
+        if kind == 0:
+            return ["{} = {} {} {} * {};".format(var, other, rnd.choice("+-"), rnd.choice(variables),
+                                                 rnd.randint(2, 99))]
+        if kind == 1:
+            return ["if ({} > {}) {{".format(var, rnd.randint(0, 999)),
+                    "\t{} = {} - {};".format(other, other, rnd.choice(variables)), "}"]
+        if kind == 2:
+            return ["for (int i = 0; i < {}; i++) {{".format(rnd.randint(2, 50)),
+                    "\t{} += i * {};".format(var, other), "}"]
+        if kind == 3:
+            return ["{} = {}({}, {});".format(var, self.identifier(), other, rnd.randint(0, 999))]
+        if kind == 4:
+            return ["while ({} < {}) {{".format(var, rnd.randint(100, 9999)),
+                    "\t{} = {} * 2 + {};".format(var, var, rnd.randint(1, 9)), "}"]
+        return [print_template.format(var=var)]
+
+    def function(self, language: Language, n_statements: int) -> Function:
+        params = [self.identifier() for _ in range(self.rnd.randint(1, 3))]
+        variables = params + [self.identifier() for _ in range(self.rnd.randint(2, 5))]
+        statements = [["int {} = {};".format(var, self.rnd.randint(0, 99))] for var in variables[len(params):]]
+        statements += [self.statement(variables, language.print) for _ in range(n_statements)]
+        return Function(name=self.identifier(), params=params, statements=statements, result=variables[-1])
+
+    def rename(self, function: Function, ratio: float) -> Function:
+        """
+        Type-2 clone: rename the function, a share of its variables and of its literals.
+        """
+        variables = set(function.params) | {name for statement in function.statements for line in statement
+                                            for name in IDENTIFIER_RE.findall(line) if name in self.used_names}
+        renames = {name: self.identifier() for name in sorted(variables) if self.rnd.random() < ratio}
+
+        def rename_line(line):
+            line = IDENTIFIER_RE.sub(lambda match: renames.get(match.group(), match.group()), line)
+            return NUMBER_RE.sub(lambda match: str(self.rnd.randint(0, 999)) if self.rnd.random() < ratio
+                                 else match.group(), line)
+
+        return Function(name=self.identifier(), params=[renames.get(name, name) for name in function.params],
+                        statements=[[rename_line(line) for line in statement] for statement in function.statements],
+                        result=renames.get(function.result, function.result))
+
+    def edit(self, function: Function, ratio: float, language: Language) -> Function:
+        """
+        Type-3 clone: insert, delete or replace a share of statements (at least one).
+        """
+        variables = list(function.params) + [statement[0].split()[1] for statement in function.statements
+                                             if statement[0].startswith("int ")]
+        statements = list(function.statements)
+        for _ in range(max(1, round(len(statements) * ratio))):
+            operation, position = self.rnd.randrange(3), self.rnd.randrange(len(statements))
+            if operation == 0:
+                statements.insert(position, self.statement(variables, language.print))
+            elif operation == 1 and len(statements) > 1 and not statements[position][0].startswith("int "):
+                del statements[position]
+            elif not statements[position][0].startswith("int "):
+                statements[position] = self.statement(variables, language.print)
+        return function._replace(name=self.identifier(), statements=statements)
+
+
+def _render_function(function: Function, language: Language, indent: str, comment: bool) -> List[str]:
+    outer = indent * language.indent
+    lines = ["{}// {}".format(outer, function.name)] if comment else []
+    lines.append(outer + language.signature.format(name=function.name,
+                                                   params=", ".join("int " + param for param in function.params)))
+    for statement in function.statements:
+        lines += [outer + indent + line.replace("\t", indent) for line in statement]
+    lines += [outer + indent + "return {};".format(function.result), outer + "}", ""]
+    return lines
+
+
+def _render_file(name: str, functions: List[Tuple[Function, bool]], language: Language) -> Tuple[str, List]:
+    """
+    Render file, functions are (function, layout variant) pairs.
+    :return: content & (start line, end line) of every function, lines start from 1.
+    """
+    lines = [line.format(name=name) for line in language.header]
+    positions = []
+    for function, variant_layout in functions:
+        rendered = _render_function(function, language, "  " if variant_layout else "    ", variant_layout)
+        start = len(lines) + 1 + int(variant_layout)
+        lines += rendered
+        positions.append((start, len(lines) - 1))
+    lines += [line.format(name=name) for line in language.footer]
+    return "\n".join(lines) + "\n", positions
+
+
+def generate_corpus(output_dir: str, config: CorpusConfig = DEFAULT_CONFIG) -> Dict:
+    """
+    Generate zipped repositories & their ground truth.
+    :param output_dir: folder to store archives (in `input/<language>`) and `ground_truth.json`.
+    :param config: size, languages, duplication & clone parameters.
+    :return: ground truth: config, file extensions of languages and functions with location, clone class & variant.
+    """
+    rnd = random.Random(config.seed)
+    generator = _Generator(rnd)
+    for language in config.languages:
+        os.makedirs(os.path.join(output_dir, INPUT_DIR_NAME, language), exist_ok=True)
+    functions = []
+    # originals that can be cloned & files that can be copied, by language
+    originals = {language: [] for language in config.languages}
+    files = {language: [] for language in config.languages}
+    for repo in range(config.repos):
+        language = LANGUAGES[config.languages[repo % len(config.languages)]]
+        repo_name = "repo_{:05d}".format(repo)
+        archive_name = repo_name + ".zip"
+        buffer = io.BytesIO()
+        # files are copied only from the previous repositories
+        n_copyable = len(files[language.name])
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for file_index in range(config.files_per_repo):
+                if n_copyable and rnd.random() < config.duplication_rate:
+                    # vendored file: the same text & clone classes as the original
+                    path, text, entries = files[language.name][rnd.randrange(n_copyable)]
+                    archive.writestr("{}/{}".format(repo_name, path), text)
+                    for entry in entries:
+                        functions.append(dict(entry, id=len(functions), language=language.name, archive=archive_name,
+                                              path="{}/{}".format(repo_name, path)))
+                    continue
+                file_name = "{}{}".format(generator.identifier().capitalize(), file_index)
+                path = "src/{}{}".format(file_name, language.extensions[0])
+                body, entries = [], []
+                for _ in range(config.functions_per_file):
+                    n_statements = rnd.randint(config.min_statements, config.max_statements)
+                    function_id = len(functions) + len(entries)
+                    if originals[language.name] and rnd.random() < config.clone_rate:
+                        clone_class, source = rnd.choice(originals[language.name])
+                        clone_type = rnd.choice(config.clone_types)
+                        if clone_type == 2:
+                            source = generator.rename(source, config.rename_ratio)
+                        elif clone_type == 3:
+                            source = generator.edit(source, config.edit_ratio, language)
+                        body.append((source, clone_type == 1))
+                        entries.append({"class": clone_class, "variant": function_id, "type": clone_type})
+                    else:
+                        function = generator.function(language, n_statements)
+                        originals[language.name].append((function_id, function))
+                        body.append((function, False))
+                        entries.append({"class": function_id, "variant": function_id, "type": 0})
+                text, positions = _render_file(file_name, body, language)
+                archive.writestr("{}/{}".format(repo_name, path), text)
+                for entry, (start, end) in zip(entries, positions):
+                    entry.update(start_line=start, end_line=end)
+                    functions.append(dict(entry, id=len(functions), language=language.name, archive=archive_name,
+                                          path="{}/{}".format(repo_name, path)))
+                files[language.name].append((path, text, entries))
+        with open(os.path.join(output_dir, INPUT_DIR_NAME, language.name, archive_name), "wb") as f:
+            f.write(buffer.getvalue())
+    truth = {"config": config._asdict(),
+             "extensions": {name: LANGUAGES[name].extensions for name in config.languages},
+             "functions": functions}
+    with open(os.path.join(output_dir, GROUND_TRUTH_FILE_NAME), "w", encoding="utf-8") as f:
+        json.dump(truth, f)
+    return truth
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", required=True, help="Folder to store archives (`input/<language>`) and "
+                                                                  "ground truth.")
+    parser.add_argument("--repos", type=int, default=DEFAULT_CONFIG.repos, help="Number of repositories.")
+    parser.add_argument("--files", type=int, default=DEFAULT_CONFIG.files_per_repo, help="Files per repository.")
+    parser.add_argument("--functions", type=int, default=DEFAULT_CONFIG.functions_per_file,
+                        help="Functions per file.")
+    parser.add_argument("--statements", type=int, nargs=2, default=[DEFAULT_CONFIG.min_statements,
+                                                                    DEFAULT_CONFIG.max_statements],
+                        help="Minimum & maximum number of statements in function.")
+    parser.add_argument("-l", "--languages", nargs="+", choices=sorted(LANGUAGES), default=DEFAULT_CONFIG.languages,
+                        help="Languages of repositories, assigned round-robin.")
+    parser.add_argument("--duplication-rate", type=float, default=DEFAULT_CONFIG.duplication_rate,
+                        help="Share of files copied verbatim from other repositories.")
+    parser.add_argument("--clone-rate", type=float, default=DEFAULT_CONFIG.clone_rate,
+                        help="Share of functions that are injected clones of earlier functions.")
+    parser.add_argument("--clone-types", type=int, nargs="+", choices=CLONE_TYPES, default=DEFAULT_CONFIG.clone_types,
+                        help="Types of injected clones, chosen uniformly.")
+    parser.add_argument("--rename-ratio", type=float, default=DEFAULT_CONFIG.rename_ratio,
+                        help="Share of identifiers & literals renamed in Type-2 clones.")
+    parser.add_argument("--edit-ratio", type=float, default=DEFAULT_CONFIG.edit_ratio,
+                        help="Share of statements edited in Type-3 clones.")
+    parser.add_argument("--seed", type=int, default=DEFAULT_CONFIG.seed, help="Random seed.")
+    args = parser.parse_args()
+    corpus_config = CorpusConfig(repos=args.repos, files_per_repo=args.files, functions_per_file=args.functions,
+                                 min_statements=args.statements[0], max_statements=args.statements[1],
+                                 languages=args.languages, duplication_rate=args.duplication_rate,
+                                 clone_rate=args.clone_rate, clone_types=args.clone_types,
+                                 rename_ratio=args.rename_ratio, edit_ratio=args.edit_ratio, seed=args.seed)
+    ground_truth = generate_corpus(args.output, corpus_config)
+    print("{} repositories with {} functions saved to {}".format(corpus_config.repos, len(ground_truth["functions"]),
+                                                                 args.output))
@@ -0,0 +1,175 @@
+"""
+End-to-end benchmark of `main.py` on a synthetic corpus written by `generate_corpus`.
+
+The pipeline is run once per language of the corpus (tokenizer handles one language per run) with `--force` and
+`--save-pairs`, extra arguments are passed to `main.py` as is. Results are saved as JSON:
+* resource usage of every stage (wall & CPU time, peak RSS, bytes written) recorded by the pipeline itself in
+  `pipeline_state.json`, and of the whole run;
+* precision & recall of detected pairs against the injected clones, for every run and for the whole corpus.
+Results can be compared to a stored baseline: resource metrics that grew by more than the tolerance and quality that
+dropped by more than the quality tolerance are reported as regressions (exit code 1).
+"""
+import argparse
+from collections import namedtuple
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from tabulate import tabulate
+
+from pipeline_state import STATE_FILE_NAME, resource_usage, usage_delta
+from prettify_results import get_line_iterator
+from .evaluate import FunctionLocator, detected_pairs, expected_pairs, load_truth, score
+from .generate_corpus import GROUND_TRUTH_FILE_NAME, INPUT_DIR_NAME
+
+MAIN_LOC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+USAGE_METRICS = ["wall_s", "cpu_s", "max_rss_mb", "bytes_written"]
+QUALITY_METRICS = ["precision", "recall", "f1"]
+# smaller changes are noise whatever the relative change is
+MIN_USAGE_DELTAS = {"wall_s": 1.0, "cpu_s": 1.0, "max_rss_mb": 32, "bytes_written": 1 << 20}
+DEFAULT_TOLERANCE = 0.2
+DEFAULT_QUALITY_TOLERANCE = 0.01
+
+Regression = namedtuple("Regression", ["metric", "baseline", "current"])
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def run_language(corpus_dir: str, work_dir: str, language: str, truth: Dict,
+                 main_args: List[str]) -> Tuple[Dict, set, int]:
+    """
+    Run the pipeline on archives of one language and evaluate its results.
+    :param corpus_dir: folder written by `generate_corpus`.
+    :param work_dir: output directory of the pipeline.
+    :param language: language of archives.
+    :param truth: ground truth of the corpus.
+    :param main_args: extra arguments of `main.py`.
+    :return: results of the run (command, usage of the run & of its stages, size of input & output, quality),
+             detected pairs of functions & number of pairs that were not mapped to functions.
+    """
+    input_dir = os.path.join(corpus_dir, INPUT_DIR_NAME, language)
+    command = [sys.executable, MAIN_LOC, "-i", input_dir, "-o", work_dir, "-e"] + truth["extensions"][language] + \
+        ["--force", "--save-pairs"] + main_args
+    start = resource_usage()
+    subprocess.check_call(command)
+    total = usage_delta(start, resource_usage())
+    with open(os.path.join(work_dir, STATE_FILE_NAME), encoding="utf-8") as f:
+        stages = {name: stage["usage"] for name, stage in json.load(f)["stages"].items()}
+    functions = [function for function in truth["functions"] if function["language"] == language]
+    detected, unmapped = detected_pairs(get_line_iterator(os.path.join(work_dir, "tokens", "result.pairs.gz")),
+                                        os.path.join(work_dir, "tokens", "stats_folder"), FunctionLocator(functions))
+    run = {"command": command[1:], "input_bytes": _dir_size(input_dir), "output_bytes": _dir_size(work_dir),
+           "total": total, "stages": stages, "quality": score(detected, expected_pairs(functions), unmapped)._asdict()}
+    return run, detected, unmapped
+
+
+def run_benchmark(corpus_dir: str, work_dir: str, main_args: List[str]) -> Dict:
+    """
+    Run the pipeline on every language of the corpus.
+    :param corpus_dir: folder written by `generate_corpus`.
+    :param work_dir: folder for outputs of the pipeline (`<language>` subfolders).
+    :param main_args: extra arguments of `main.py`.
+    :return: results: corpus config, runs by language & quality over the whole corpus.
+    """
+    truth = load_truth(os.path.join(corpus_dir, GROUND_TRUTH_FILE_NAME))
+    runs, detected, unmapped = {}, set(), 0
+    for language in sorted(truth["extensions"]):
+        runs[language], run_detected, run_unmapped = run_language(corpus_dir, os.path.join(work_dir, language),
+                                                                  language, truth, main_args)
+        # function ids are unique in the corpus & clone classes never cross languages
+        detected |= run_detected
+        unmapped += run_unmapped
+    quality = score(detected, expected_pairs(truth["functions"]), unmapped)
+    return {"corpus": truth["config"], "main_args": main_args, "runs": runs, "quality": quality._asdict()}
+
+
+def _metrics(results: Dict) -> Dict[str, float]:
+    metrics = {"quality." + name: results["quality"][name] for name in QUALITY_METRICS}
+    for language, run in sorted(results["runs"].items()):
+        for name in QUALITY_METRICS:
+            metrics["{}.quality.{}".format(language, name)] = run["quality"][name]
+        for name in USAGE_METRICS:
+            metrics["{}.total.{}".format(language, name)] = run["total"][name]
+        for stage, usage in run["stages"].items():
+            for name in USAGE_METRICS:
+                metrics["{}.{}.{}".format(language, stage, name)] = usage[name]
+    return metrics
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float = DEFAULT_TOLERANCE,
+            quality_tolerance: float = DEFAULT_QUALITY_TOLERANCE) -> Tuple[List[Regression], List[Tuple]]:
+    """
+    Compare results with baseline.
+    :param results: results of `run_benchmark`.
+    :param baseline: results of `run_benchmark` stored as baseline.
+    :param tolerance: allowed relative growth of resource metrics.
+    :param quality_tolerance: allowed absolute drop of precision, recall & F1.
+    :return: regressions & rows (metric, baseline, current, relative change) of all metrics present in both.
+    """
+    if results["corpus"] != baseline["corpus"] or results["main_args"] != baseline["main_args"]:
+        raise ValueError("Baseline was measured on another corpus or with other arguments of main.py")
+    current, previous = _metrics(results), _metrics(baseline)
+    regressions, rows = [], []
+    for metric in sorted(set(current) & set(previous)):
+        value, base = current[metric], previous[metric]
+        if value is None or base is None:
+            continue
+        rows.append((metric, base, value, (value - base) / base if base else None))
+        name = metric.rsplit(".", 1)[-1]
+        if name in QUALITY_METRICS:
+            regressed = value < base - quality_tolerance
+        else:
+            regressed = value > base * (1 + tolerance) and value - base > MIN_USAGE_DELTAS[name]
+        if regressed:
+            regressions.append(Regression(metric=metric, baseline=base, current=value))
+    return regressions, rows
+
+
+def format_comparison(rows: List[Tuple], regressions: List[Regression]) -> str:
+    """
+    Table of compared metrics, regressions are marked.
+    :param rows: rows returned by `compare`.
+    :param regressions: regressions returned by `compare`.
+    :return: table.
+    """
+    regressed = {regression.metric for regression in regressions}
+    return tabulate([(metric, base, value, "{:+.1%}".format(change) if change is not None else "-",
+                      "REGRESSION" if metric in regressed else "") for metric, base, value, change in rows],
+                    headers=["metric", "baseline", "current", "change", ""])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--corpus", required=True, help="Folder written by `generate_corpus`.")
+    parser.add_argument("-w", "--work-dir", required=True, help="Folder for outputs of the pipeline.")
+    parser.add_argument("-o", "--output", required=True, help="JSON file to save results.")
+    parser.add_argument("-b", "--baseline", default=None, help="JSON file with baseline results.")
+    parser.add_argument("--save-baseline", action="store_true", help="Save results as the new baseline instead of "
+                                                                     "comparing with it.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative growth of time, memory & bytes written.")
+    parser.add_argument("--quality-tolerance", type=float, default=DEFAULT_QUALITY_TOLERANCE,
+                        help="Allowed absolute drop of precision, recall & F1.")
+    parser.add_argument("main_args", nargs=argparse.REMAINDER, help="Extra arguments of main.py after `--`.")
+    args = parser.parse_args()
+    extra_args = args.main_args[1:] if args.main_args[:1] == ["--"] else args.main_args
+
+    benchmark_results = run_benchmark(args.corpus, args.work_dir, extra_args)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(benchmark_results, f, indent=2)
+    print(json.dumps(benchmark_results["quality"], indent=2))
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(benchmark_results, f, indent=2)
+        print("Baseline saved to {}".format(args.baseline))
+    elif args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found, compared = compare(benchmark_results, json.load(f), args.tolerance, args.quality_tolerance)
+        print(format_comparison(compared, found))
+        if found:
+            print("{} regressions against {}".format(len(found), args.baseline))
+            sys.exit(1)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Capacity estimate of a pipeline run without running it (`main.py --dry-run`).
+
+Input is measured from zip central directories only: number of archives, source files with the given extensions
+and their uncompressed size. Everything else is scaled from a profile of 1 MB of source code:
+* by default the profile holds rough rates of Java-like code (DEFAULT_PROFILE);
+* with `--dry-run-sample N` N random archives are tokenized with the real tokenizer and searched in-process
+  (`python_engine`), the profile is measured on them.
+Files, blocks and tokens grow linearly with the source size. Pairs don't: pairs inside an archive grow linearly,
+pairs between archives grow with the number of block pairs from different archives, so the sample gives
+a density of such pairs. Runtime of every stage is derived from throughput rates and the resource plan.
+All numbers are estimates for sizing & scheduling jobs, they can be off by a factor of a few.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import tempfile
+import time
+import zipfile
+from collections import OrderedDict, namedtuple
+from typing import Dict, List, Optional
+
+from prettify_results import get_files, get_line_iterator
+from resource_plan import MB, ResourcePlan, TOKENIZER_PROCESS_MB, available_cores, available_memory_mb, \
+    plan_resources
+
+InputScan = namedtuple("InputScan", ["n_archives", "n_files", "source_bytes"])
+# measured on `archives` sampled archives, `cross_block_pairs` - pairs of searched blocks from different archives
+Profile = namedtuple("Profile", ["archives", "source_bytes", "files", "blocks", "searched_blocks", "tokens",
+                                 "tokens_bytes", "stats_bytes", "intra_pairs", "cross_pairs", "cross_block_pairs",
+                                 "tokenize_seconds", "search_seconds"])
+CapacityEstimate = namedtuple("CapacityEstimate", ["scan", "sampled", "files", "blocks", "searched_blocks", "tokens",
+                                                   "pairs", "disk_mb", "memory_mb", "stage_seconds"])
+
+# rough rates per 1 MB of Java-like source: ~6 KB files, ~8 methods per file, tokenizer output ~1/2 of the source
+DEFAULT_PROFILE = Profile(archives=0, source_bytes=MB, files=170, blocks=1400, searched_blocks=700, tokens=90000,
+                          tokens_bytes=600000, stats_bytes=160000, intra_pairs=350, cross_pairs=0,
+                          cross_block_pairs=0, tokenize_seconds=None, search_seconds=None)
+# pairs of blocks from different archives that are clones (DEFAULT_PROFILE has no sample to measure it)
+DEFAULT_CROSS_PAIR_DENSITY = 1e-7
+# throughput rates of stages that are not measured on a sample
+TOKENIZE_MB_PER_SECOND = 0.5
+PREPARE_MB_PER_SECOND = 20
+INDEX_TOKENS_PER_SECOND = 1000000
+JAVA_SEARCH_BLOCKS_PER_SECOND = 2000
+PYTHON_SEARCH_BLOCKS_PER_SECOND = 1500
+VERIFY_PAIRS_PER_SECOND = 50000
+SORT_PAIRS_PER_SECOND = 300000
+PRETTIFY_PAIRS_PER_SECOND = 50000
+# sizes of intermediate files
+PAIR_BYTES = 40
+COMPRESSED_PAIR_BYTES = 10
+INDEX_BYTES_PER_TOKEN = 6
+# memory of the python engine per token entry of a block (CSR arrays, prefix index, candidates)
+PYTHON_BYTES_PER_TOKEN = 48
+
+
+def scan_archives(archives: List[str], extensions: List[str]) -> InputScan:
+    """
+    Count source files & their uncompressed size from zip central directories, archives are not extracted.
+    :param archives: paths to zip archives.
+    :param extensions: file extensions processed by tokenizer.
+    :return: input scan.
+    """
+    n_files, source_bytes = 0, 0
+    for archive in archives:
+        try:
+            with zipfile.ZipFile(archive) as zip_file:
+                for info in zip_file.infolist():
+                    if os.path.splitext(info.filename)[1] in extensions:
+                        n_files += 1
+                        source_bytes += info.file_size
+        except (OSError, zipfile.BadZipFile):
+            # tokenizer skips broken archives
+            continue
+    return InputScan(n_archives=len(archives), n_files=n_files, source_bytes=source_bytes)
+
+
+def sample_profile(archives: List[str], extensions: List[str], n_samples: int, threshold: float, min_tokens: int,
+                   max_tokens: int, seed: int = 0) -> Profile:
+    """
+    Tokenize & search a random sample of archives.
+    :param archives: paths to zip archives.
+    :param extensions: file extensions processed by tokenizer.
+    :param n_samples: number of sampled archives.
+    :param threshold: similarity threshold.
+    :param min_tokens: blocks with fewer tokens are not searched.
+    :param max_tokens: blocks with more tokens are not searched.
+    :param seed: seed of the sample.
+    :return: profile measured on the sample.
+    """
+    # the tokenizer needs tree-sitter parsers, estimates without a sample don't
+    from tokenizers.block_tokenizer import Tokenizer  # pylint: disable=import-outside-toplevel
+    from tokenizers.generate_config import main as generate_config_main  # pylint: disable=import-outside-toplevel
+    from incremental import DEFAULT_INIT_FILE_ID  # pylint: disable=import-outside-toplevel
+    from python_engine import read_blocks, search  # pylint: disable=import-outside-toplevel
+
+    sample = random.Random(seed).sample(sorted(archives), min(n_samples, len(archives)))
+    with tempfile.TemporaryDirectory(prefix="dry_run_") as tmp_dir:
+        # tokenizer output is written to files opened here, the folders of the config are not used
+        config = argparse.Namespace(repo_loc=os.path.join(tmp_dir, "repos.txt"),
+                                    output=os.path.join(tmp_dir, "config.ini"), stats_loc=tmp_dir,
+                                    bookkeeping_loc=tmp_dir, tokens_loc=tmp_dir, extensions=extensions)
+        with open(config.repo_loc, "w") as f:
+            f.write("\n".join(sample))
+        generate_config_main(config)
+        tokenizer = Tokenizer(config.output)
+        tokens_loc = os.path.join(tmp_dir, "sample.tokens")
+        stats_loc = os.path.join(tmp_dir, "sample.stats")
+        started = time.time()
+        with open(tokens_loc, "w") as tokens_file, open(os.path.join(tmp_dir, "sample.bookkeeping"), "w") as \
+                bookkeeping_file, open(stats_loc, "w") as stats_file:
+            for proj_id, archive in enumerate(sample, 1):
+                tokenizer.process_one_project(0, proj_id, archive, DEFAULT_INIT_FILE_ID,
+                                              (tokens_file, bookkeeping_file, stats_file))
+        tokenize_seconds = time.time() - started
+
+        files = sum(1 for line in get_line_iterator(stats_loc) if line.startswith("f,"))
+        blocks, tokens = 0, 0
+        for line in get_line_iterator(tokens_loc):
+            if line:
+                blocks += 1
+                tokens += int(line.split(",", 3)[2])
+        started = time.time()
+        dataset, _ = read_blocks([tokens_loc], min_tokens, max_tokens)
+        intra_pairs, cross_pairs = 0, 0
+        for pair in search(dataset, None, threshold):
+            proj_id1, _, proj_id2, _ = pair.split(",", 3)
+            if proj_id1 == proj_id2:
+                intra_pairs += 1
+            else:
+                cross_pairs += 1
+        search_seconds = time.time() - started
+        per_archive = {}
+        for proj_id in dataset.proj_ids:
+            per_archive[proj_id] = per_archive.get(proj_id, 0) + 1
+        searched = len(dataset.sizes)
+        cross_block_pairs = (searched * searched - sum(n * n for n in per_archive.values())) // 2
+        return Profile(archives=len(sample), source_bytes=scan_archives(sample, extensions).source_bytes,
+                       files=files, blocks=blocks, searched_blocks=searched, tokens=tokens,
+                       tokens_bytes=os.path.getsize(tokens_loc), stats_bytes=os.path.getsize(stats_loc),
+                       intra_pairs=intra_pairs, cross_pairs=cross_pairs, cross_block_pairs=cross_block_pairs,
+                       tokenize_seconds=tokenize_seconds, search_seconds=search_seconds)
+
+
+def estimate_capacity(scan: InputScan, plan: ResourcePlan, engine: str = "java", mode: str = "all-to-all",
+                      save_pairs: bool = False, profile: Optional[Profile] = None) -> CapacityEstimate:
+    """
+    Scale profile to the whole input.
+    :param scan: input scan.
+    :param plan: resource plan of the run.
+    :param engine: search engine (`java`, `python` or `minhash`).
+    :param mode: `all-to-all` or `versus`.
+    :param save_pairs: sorted pairs are saved (`--report-index`, `--aggregate`).
+    :param profile: measured profile, if None - DEFAULT_PROFILE.
+    :return: estimate.
+    """
+    sampled = profile is not None and profile.source_bytes > 0
+    profile = profile if sampled else DEFAULT_PROFILE
+    scale = scan.source_bytes / profile.source_bytes
+    files, blocks, tokens = profile.files * scale, profile.blocks * scale, profile.tokens * scale
+    searched = profile.searched_blocks * scale
+    # pairs of blocks from different archives, archives of equal size
+    cross_block_pairs = searched * searched * (1 - 1 / max(scan.n_archives, 1)) / 2
+    density = profile.cross_pairs / profile.cross_block_pairs if profile.cross_block_pairs \
+        else DEFAULT_CROSS_PAIR_DENSITY
+    pairs = profile.intra_pairs * scale + density * cross_block_pairs
+
+    tokens_mb = profile.tokens_bytes * scale / MB
+    disk_mb = OrderedDict()
+    disk_mb["tokens"] = tokens_mb
+    disk_mb["stats"] = profile.stats_bytes * scale / MB
+    if engine == "java":
+        # versus mode copies tokens to the dataset & query files, node query files are copies of all queries
+        disk_mb["blocks.file"] = tokens_mb * (2 if mode == "versus" else 1)
+        disk_mb["index"] = searched / max(blocks, 1) * tokens * INDEX_BYTES_PER_TOKEN / MB
+    disk_mb["pairs"] = pairs * PAIR_BYTES / MB
+    if save_pairs:
+        disk_mb["result.pairs.gz"] = pairs * COMPRESSED_PAIR_BYTES / MB
+
+    memory_mb = OrderedDict()
+    memory_mb["tokenize"] = plan.tokenizer_processes * TOKENIZER_PROCESS_MB
+    if engine == "java":
+        memory_mb["search"] = plan.nodes * plan.heap_mb
+    else:
+        memory_mb["search"] = tokens * PYTHON_BYTES_PER_TOKEN / MB
+
+    seconds = OrderedDict()
+    if profile.tokenize_seconds is not None:
+        seconds["tokenize"] = profile.tokenize_seconds * scale / plan.tokenizer_processes
+    else:
+        seconds["tokenize"] = scan.source_bytes / MB / (TOKENIZE_MB_PER_SECOND * plan.tokenizer_processes)
+    seconds["prepare"] = tokens_mb / PREPARE_MB_PER_SECOND
+    if engine == "java":
+        seconds["index"] = tokens / (INDEX_TOKENS_PER_SECOND * plan.cores)
+        seconds["search"] = (searched / JAVA_SEARCH_BLOCKS_PER_SECOND + pairs / VERIFY_PAIRS_PER_SECOND) / plan.cores
+    elif profile.search_seconds is not None:
+        # in-process search of the sample, a single process
+        work = profile.searched_blocks + profile.intra_pairs + profile.cross_pairs
+        seconds["search"] = profile.search_seconds * (searched + pairs) / max(work, 1)
+    else:
+        seconds["search"] = searched / PYTHON_SEARCH_BLOCKS_PER_SECOND + pairs / VERIFY_PAIRS_PER_SECOND
+    if save_pairs:
+        seconds["merge"] = pairs / SORT_PAIRS_PER_SECOND
+    seconds["prettify"] = pairs / PRETTIFY_PAIRS_PER_SECOND
+    return CapacityEstimate(scan=scan, sampled=profile.archives if sampled else 0, files=int(files),
+                            blocks=int(blocks), searched_blocks=int(searched), tokens=int(tokens), pairs=int(pairs),
+                            disk_mb=disk_mb, memory_mb=memory_mb, stage_seconds=seconds)
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    return "{}d {:02d}:{:02d}:{:02d}".format(days, hours, minutes, seconds) if days \
+        else "{:02d}:{:02d}:{:02d}".format(hours, minutes, seconds)
+
+
+def format_report(estimate: CapacityEstimate) -> str:
+    """
+    Human-readable estimate.
+    :param estimate: estimate.
+    :return: report.
+    """
+    lines = ["input: {} archives, {} source files, {:.1f} MB of source code".format(
+        estimate.scan.n_archives, format(estimate.scan.n_files, ","), estimate.scan.source_bytes / MB),
+        "profile: {}".format("measured on {} sampled archives".format(estimate.sampled) if estimate.sampled
+                             else "default rates, add --dry-run-sample N to measure them"),
+        "blocks: {} ({} searched), tokens: {}, clone pairs: ~{}".format(
+            format(estimate.blocks, ","), format(estimate.searched_blocks, ","), format(estimate.tokens, ","),
+            format(estimate.pairs, ",")),
+        "{:<16} {:>12}".format("disk", "MB")]
+    lines += ["{:<16} {:>12.1f}".format(name, size) for name, size in estimate.disk_mb.items()]
+    lines.append("{:<16} {:>12.1f}".format("total", sum(estimate.disk_mb.values())))
+    lines.append("{:<16} {:>12}".format("peak memory", "MB"))
+    lines += ["{:<16} {:>12.0f}".format(name, size) for name, size in estimate.memory_mb.items()]
+    lines.append("{:<16} {:>12}".format("stage", "wall time"))
+    lines += ["{:<16} {:>12}".format(name, _format_duration(seconds))
+              for name, seconds in estimate.stage_seconds.items()]
+    lines.append("{:<16} {:>12}".format("total", _format_duration(sum(estimate.stage_seconds.values()))))
+    return "\n".join(lines)
+
+
+def to_json(estimate: CapacityEstimate) -> Dict:
+    """ Estimate as a JSON-serializable dictionary """
+    result = estimate._asdict()
+    result["scan"] = estimate.scan._asdict()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help="Directory with zip archives.")
+    parser.add_argument("-e", "--extensions", required=True, nargs="+", help="File extensions to use.")
+    parser.add_argument("-t", "--threshold", type=float, default=0.8, help="Similarity threshold.")
+    parser.add_argument("--min-tokens", type=int, default=40, help="Minimum number of tokens in block.")
+    parser.add_argument("--max-tokens", type=int, default=50000000, help="Maximum number of tokens in block.")
+    parser.add_argument("--engine", default="java", choices=["java", "python", "minhash"], help="Search engine.")
+    parser.add_argument("-m", "--mode", default="all-to-all", choices=["all-to-all", "versus"], help="Search mode.")
+    parser.add_argument("--sample", type=int, default=0, help="Number of archives tokenized & searched to measure "
+                                                              "the profile, default rates if 0.")
+    parser.add_argument("--json", action="store_true", help="Print estimate as JSON.")
+    args = parser.parse_args()
+
+    input_archives = sorted(get_files(args.input, ".zip"))
+    input_scan = scan_archives(input_archives, args.extensions)
+    resource_plan = plan_resources(available_cores(), available_memory_mb(), input_scan.n_archives,
+                                   math.ceil(input_scan.source_bytes / MB))
+    sample_stats = sample_profile(input_archives, args.extensions, args.sample, args.threshold, args.min_tokens,
+                                  args.max_tokens) if args.sample else None
+    result = estimate_capacity(input_scan, resource_plan, args.engine, args.mode, profile=sample_stats)
+    print(json.dumps(to_json(result), indent=2) if args.json else format_report(result))
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+import zipfile
+
+from capacity_estimate import DEFAULT_PROFILE, Profile, estimate_capacity, format_report, scan_archives
+from resource_plan import MB, plan_resources
+
+
+class TestCapacityEstimate(unittest.TestCase):
+    def setUp(self):
+        self.plan = plan_resources(cores=8, memory_mb=32 * 1024, n_archives=100, input_mb=100)
+
+    def test_scan_archives(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive = os.path.join(tmp_dir, "a.zip")
+            with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+                zip_file.writestr("src/A.java", "a" * 1000)
+                zip_file.writestr("src/B.java", "b" * 500)
+                zip_file.writestr("README.md", "c" * 300)
+            broken = os.path.join(tmp_dir, "b.zip")
+            with open(broken, "w") as f:
+                f.write("not a zip")
+            self.assertEqual(tuple(scan_archives([archive, broken], [".java"])), (2, 2, 1500))
+
+    def test_default_profile_scales_linearly(self):
+        small = estimate_capacity(scan_archives([], [".java"])._replace(n_archives=100, source_bytes=100 * MB),
+                                  self.plan)
+        large = estimate_capacity(scan_archives([], [".java"])._replace(n_archives=100, source_bytes=200 * MB),
+                                  self.plan)
+        self.assertEqual(small.sampled, 0)
+        self.assertEqual(small.blocks, 100 * DEFAULT_PROFILE.blocks)
+        self.assertEqual(large.tokens, 2 * small.tokens)
+        self.assertAlmostEqual(large.disk_mb["tokens"], 2 * small.disk_mb["tokens"])
+        self.assertEqual(list(small.stage_seconds), ["tokenize", "prepare", "index", "search", "prettify"])
+        self.assertIn("clone pairs", format_report(small))
+
+    def test_sampled_pairs(self):
+        # 2 archives of 1 MB with 100 searched blocks each: 10 pairs inside archives, 100 of 100 * 100 across
+        profile = Profile(archives=2, source_bytes=2 * MB, files=20, blocks=300, searched_blocks=200, tokens=10000,
+                          tokens_bytes=MB, stats_bytes=MB // 2, intra_pairs=10, cross_pairs=100,
+                          cross_block_pairs=10000, tokenize_seconds=4.0, search_seconds=1.0)
+        scan = scan_archives([], [".java"])._replace(n_archives=20, source_bytes=20 * MB)
+        estimate = estimate_capacity(scan, self.plan, engine="python", save_pairs=True, profile=profile)
+        self.assertEqual(estimate.sampled, 2)
+        self.assertEqual(estimate.searched_blocks, 2000)
+        # 100 intra pairs & 1% of 2000 * 2000 * (1 - 1 / 20) / 2 block pairs across archives
+        self.assertEqual(estimate.pairs, 100 + 19000)
+        self.assertNotIn("index", estimate.stage_seconds)
+        self.assertAlmostEqual(estimate.stage_seconds["tokenize"], 40.0 / self.plan.tokenizer_processes)
+        self.assertIn("result.pairs.gz", estimate.disk_mb)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,30 +1,54 @@
 #!/usr/bin/env python3
+"""
+Run all SourcererCC steps with a single command.
 
+Steps form a DAG of tasks: build -> split_init -> init -> index -> move_index -> split -> search NODE_1..NODE_N.
+Search nodes are independent tasks: they are launched through a pool of workers with configurable concurrency,
+their output is streamed with a node prefix (and saved to SCC_LOGS/controller/<task>.log),
+a failed node is retried on its own without touching the other nodes.
+State is saved as JSON (controller_state.json) after every change. When the controller is restarted,
+finished tasks are skipped and unfinished search nodes are relaunched - SourcererCC skips query lines
+saved in the node's recovery.txt checkpoint, so only the rest of its query partition is searched.
+With `--serve` the index is built (or reused) and a resident search service is started instead of search nodes:
+it keeps the index loaded and answers query batches over a local socket (see `search_client.py`).
+During the search `search_monitor.py` tracks progress of the nodes (saved to search_status.json),
+a node that stops making progress for `--stall-timeout` seconds is restarted from its checkpoint.
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import shutil
 import subprocess
 import sys
-import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from search_client import PORT_FILE_NAME, SearchClient, read_port, wait_for_port
+from search_monitor import STALL_SECONDS, STALLED, SearchMonitor, write_json
 
 # exit codes
 EXIT_SUCCESS = 0
 EXIT_FAILURE = 1
-# states
-STATE_EXECUTE_1 = 0
-STATE_INIT = 1
-STATE_INDEX = 2
-STATE_MOVE_INDEX = 3
-STATE_EXECUTE_2 = 4
-STATE_SEARCH = 5
+# task states
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
 
+STATE_FILE_NAME = "controller_state.json"
+STATUS_FILE_NAME = "search_status.json"
+MONITOR_INTERVAL = 30
+# state of the previous controller version: a single step number
+LEGACY_STATE_FILE_NAME = "scriptinator_metadata.scc"
+LEGACY_STEPS = ["split_init", "init", "index", "move_index", "split"]
 
-class ScriptControllerException(Exception):
-    pass
+_PRINT_LOCK = threading.Lock()
 
 
-def run_command(cmd):
-    print("running command {}".format(" ".join(cmd)))
-    p = subprocess.Popen(cmd, universal_newlines=True)
-    p.communicate()
-    return p.returncode
+class ScriptControllerException(Exception):
+    pass
 
 
 def full_file_path(string):
@@ -38,75 +62,473 @@ def full_script_path(string, param=""):
     return res
 
 
-def run_command_wrapper(cmd, params):
-    command = full_script_path(cmd, params)
-    return_code = run_command(command.split())
-    if return_code != EXIT_SUCCESS:
-        raise ScriptControllerException("error during executing {}".format(command))
+def run_command(cmd, prefix="", log_loc=None, on_start=None):
+    """
+    Run command, stream its output with prefix and save it to log file.
+    :param cmd: command as list of arguments.
+    :param prefix: prefix for every output line.
+    :param log_loc: path to log file, if None - output is not saved.
+    :param on_start: function called with the started process.
+    :return: return code.
+    """
+    with _PRINT_LOCK:
+        print("{}running command {}".format(prefix, " ".join(cmd)), flush=True)
+    log_file = open(log_loc, "a", encoding="utf-8") if log_loc else None
+    try:
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True,
+                             errors="replace", cwd=full_file_path(""))
+        if on_start is not None:
+            on_start(p)
+        for line in p.stdout:
+            with _PRINT_LOCK:
+                sys.stdout.write(prefix + line)
+                sys.stdout.flush()
+            if log_file:
+                log_file.write(line)
+        return p.wait()
+    finally:
+        if log_file:
+            log_file.close()
+
+
+def count_lines(path):
+    res = 0
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            res += count_lines(os.path.join(path, name))
+    elif os.path.isfile(path):
+        with open(path, "rb") as f:
+            for _ in f:
+                res += 1
+    return res
+
+
+def output_dir_name(threshold):
+    """ SourcererCC writes results of a node to NODE_<i>/output<threshold as float> """
+    return "output{}".format(float(threshold))
+
+
+def read_checkpoint(node, threshold):
+    """
+    Number of query lines processed by node according to its recovery.txt.
+    :param node: node number.
+    :param threshold: threshold passed to SourcererCC (8 for 0.8).
+    :return: number of processed lines, 0 if there is no checkpoint.
+    """
+    recovery_loc = full_file_path(os.path.join("NODE_{}".format(node), output_dir_name(threshold), "recovery.txt"))
+    processed = 0
+    if os.path.isfile(recovery_loc):
+        with open(recovery_loc, encoding="utf-8") as f:
+            for line in f:
+                if line.strip().isdigit():
+                    processed = int(line.strip())
+    return processed
+
+
+class Task(object):
+    """
+    Step of the pipeline: either command (list of arguments) or python function.
+    """
+
+    def __init__(self, name, cmd=None, func=None, deps=(), retries=0, before=None, node=None, after_started=()):
+        self.name = name
+        self.cmd = cmd
+        self.func = func
+        self.deps = list(deps)
+        # tasks that must be running or done before this one is launched
+        self.after_started = list(after_started)
+        self.retries = retries
+        # called before every launch with `True` if the previous launch of the task failed
+        self.before = before
+        self.node = node
 
 
 # Aim of this class is to run the scripts for SourcererCC with a single command
 class ScriptController(object):
-    def __init__(self, num_nodes):
+    def __init__(self, num_nodes, threshold="8", jobs=None, retries=2, heap="6g", reset=False, stall_timeout=None,
+                 query_files=None, until=None, incremental=False, serve=False, port=0):
         self.num_nodes_search = num_nodes
-        self.script_meta_file_name = full_file_path("scriptinator_metadata.scc")
-        self.current_state = STATE_EXECUTE_1  # default state
-        self.previous_run_state = self.load_previous_state()
+        self.threshold = threshold
+        # queries that are not part of the indexed dataset (versus mode), if empty - the dataset is searched
+        # against itself
+        self.query_files = [os.path.abspath(path) for path in query_files or []]
+        # index only new blocks of `input/dataset` and append them to the installed index, global token
+        # frequencies (gtpm) are kept so that token order of old and new blocks is the same
+        self.incremental = incremental
+        # start the search service on top of the index instead of searching query partitions
+        self.serve = serve
+        self.port = port
+        self.jobs = jobs or num_nodes
+        self.retries = retries
+        self.heap = heap
+        self.stall_timeout = stall_timeout
+        self.monitor = SearchMonitor(full_file_path(""), num_nodes,
+                                     stall_seconds=stall_timeout or STALL_SECONDS)
+        # running processes of search nodes and their start time
+        self.processes = {}
+        self.state_file_name = full_file_path(STATE_FILE_NAME)
+        self.log_dir = full_file_path(os.path.join("SCC_LOGS", "controller"))
+        self.tasks = self.build_tasks()
+        # run only this task and its dependencies (e.g. `move_index` to build the index without searching)
+        self.targets = self.dependencies(until) if until else {task.name for task in self.tasks}
+        if serve:
+            self.targets = self.dependencies("serve")
+        self.state = self.load_previous_state(reset)
 
-    def execute(self):
-        print(f"previous run state {self.previous_run_state}")
-        if self.previous_run_state <= STATE_EXECUTE_1:
-            run_command_wrapper("execute.sh", "1")
-        self.current_state += 1
-        self.flush_state()
-        # execute the init command
-        if self.previous_run_state <= STATE_INIT:
-            if self.previous_run_state == STATE_INIT:
-                # last time the execution failed at init step. We need to replace the existing gtpm index from the backup
-                run_command_wrapper("restore-gtpm.sh", "")
+    def java_cmd(self, mode, node):
+        node_dir = full_file_path("NODE_{}".format(node))
+        return ["java", "-Dproperties.rootDir=" + full_file_path(""),
+                "-Dproperties.location=" + os.path.join(node_dir, "sourcerer-cc.properties"),
+                "-Dlog4j.configurationFile=" + os.path.join(node_dir, "log4j2.xml"),
+                "-Xms" + self.heap, "-Xmx" + self.heap, "-XX:+UseCompressedOops",
+                "-jar", full_file_path(os.path.join("dist", "indexbased.SearchManager.jar")),
+                mode, str(self.threshold)]
+
+    def build_tasks(self):
+        tasks = [Task("build", cmd=["ant", "-buildfile", full_file_path("build.xml"), "clean", "cdi"])]
+        if self.incremental:
+            tasks += [
+                Task("split_init", cmd=[full_file_path("execute.sh"), "1", str(self.threshold)], deps=["build"]),
+                Task("index", cmd=self.java_cmd("index", 1), deps=["split_init"]),
+                Task("move_index", func=self.append_index, deps=["index"]),
+            ]
+        else:
+            tasks += [
+                # global token frequencies are computed from NODE_1 queries - all blocks of the dataset,
+                # query files are a subset of it
+                Task("split_init", cmd=[full_file_path("execute.sh"), "1", str(self.threshold)], deps=["build"]),
+                Task("init", cmd=self.java_cmd("init", 1), deps=["split_init"], before=self.before_init),
+                Task("index", cmd=self.java_cmd("index", 1), deps=["init"]),
+                Task("move_index", cmd=[full_file_path("move-index.sh")], deps=["index"]),
+            ]
+        tasks += [
+            Task("split", cmd=[full_file_path("execute.sh"), str(self.num_nodes_search), str(self.threshold)] +
+                 self.query_files, deps=["move_index"], before=self.before_split),
+            Task("prepare_search", func=self.prepare_search, deps=["split"]),
+        ]
+        # NODE_1 waits until all other nodes sign off, it is launched only when they are all running or done -
+        # otherwise it could hold the last free worker while a (retried) node waits for it
+        other_nodes = ["search_NODE_{}".format(node) for node in range(2, self.num_nodes_search + 1)]
+        for node in list(range(2, self.num_nodes_search + 1)) + [1]:
+            tasks.append(Task("search_NODE_{}".format(node), cmd=self.java_cmd("search", node),
+                              deps=["prepare_search"], retries=self.retries, node=node,
+                              after_started=other_nodes if node == 1 else ()))
+        if self.serve:
+            tasks.append(Task("serve", func=self.start_service, deps=["move_index"]))
+        return tasks
+
+    def start_service(self):
+        """ Start the search service in background and wait until it loads the index """
+        if read_port() is not None:
+            # the index could be rebuilt, the running service is replaced
+            try:
+                with SearchClient(timeout=10) as client:
+                    client.shutdown()
+                print("stopped the running search service")
+            except OSError:
+                pass
+            for _ in range(60):
+                if read_port() is None:
+                    break
+                time.sleep(1)
             else:
-                # take backup of existing gtpmindex before starting init
-                run_command_wrapper("backup-gtpm.sh", "")
-            # run the init step
-            run_command_wrapper("runnodes.sh", "init 1")
-        self.current_state += 1
-
-        # execute index
-        self.perform_step(STATE_INDEX, "runnodes.sh", "index 1")
-        # execute move indexes
-        self.perform_step(STATE_MOVE_INDEX, "move-index.sh", "")
-        # execute command to create the dir structure
-        self.perform_step(STATE_EXECUTE_2, "execute.sh", f"{self.num_nodes_search}")
-        self.perform_step(STATE_SEARCH, "runnodes.sh", f"search {self.num_nodes_search}")
+                os.remove(full_file_path(PORT_FILE_NAME))
+        log_file = open(os.path.join(self.log_dir, "serve.log"), "a", encoding="utf-8")
+        cmd = self.java_cmd("serve", 1) + [str(self.port)]
+        print("[serve] running command {}".format(" ".join(cmd)), flush=True)
+        # the service outlives the controller
+        p = subprocess.Popen(cmd, stdout=log_file, stderr=subprocess.STDOUT, cwd=full_file_path(""),
+                             start_new_session=True)
+        log_file.close()
+        try:
+            port = wait_for_port(is_alive=lambda: p.poll() is None)
+        except (RuntimeError, TimeoutError) as e:
+            print("[ERROR] {}, see {}".format(e, os.path.join(self.log_dir, "serve.log")))
+            if p.poll() is None:
+                p.terminate()
+            return EXIT_FAILURE
+        self.state["tasks"]["serve"].update(pid=p.pid, port=port)
+        print("search service (pid {}) is listening on 127.0.0.1:{}, query it with search_client.py".format(p.pid,
+                                                                                                        port))
+        return EXIT_SUCCESS
+
+    def append_index(self):
+        node_dir = full_file_path("NODE_1")
+        cmd = ["java", "-Dproperties.rootDir=" + full_file_path(""),
+               "-Dproperties.location=" + os.path.join(node_dir, "sourcerer-cc.properties"),
+               "-Dlog4j.configurationFile=" + os.path.join(node_dir, "log4j2.xml"), "-DindexMerger.append=true",
+               "-Xms" + self.heap, "-Xmx" + self.heap,
+               "-cp", full_file_path(os.path.join("dist", "indexbased.SearchManager.jar")),
+               "com.mondego.indexbased.IndexMerger"]
+        return_code = run_command(cmd, prefix="[move_index] ", log_loc=os.path.join(self.log_dir, "move_index.log"))
+        if return_code == EXIT_SUCCESS:
+            # appended shards must not be appended again
+            for index_dir in ["index", "fwdindex"]:
+                shutil.rmtree(os.path.join(node_dir, index_dir, "shards"), ignore_errors=True)
+        return return_code
+
+    def dependencies(self, name):
+        by_name = {task.name: task for task in self.tasks}
+        if name not in by_name:
+            raise ScriptControllerException("unknown task {}, expected one of: {}".format(name, ", ".join(by_name)))
+        names, stack = set(), [name]
+        while stack:
+            current = stack.pop()
+            if current not in names:
+                names.add(current)
+                stack.extend(by_name[current].deps)
+        return names
+
+    @staticmethod
+    def before_init(failed_before):
+        if failed_before:
+            # last time the execution failed at init step. We need to replace the existing gtpm index from the backup
+            run_command_wrapper("restore-gtpm.sh", "")
+        else:
+            # take backup of existing gtpmindex before starting init
+            run_command_wrapper("backup-gtpm.sh", "")
+
+    def before_split(self, _):
+        # query partitions change - outputs & checkpoints of the previous split are not valid anymore
+        for node in range(1, self.num_nodes_search + 1):
+            output_dir = full_file_path(os.path.join("NODE_{}".format(node), output_dir_name(self.threshold)))
+            if os.path.isdir(output_dir):
+                shutil.rmtree(output_dir)
+
+    def prepare_search(self):
+        # number of nodes & nodes that already finished - NODE_1 waits for the rest using these files
+        with open(full_file_path("search_metadata.txt"), "w", encoding="utf-8") as f:
+            f.write("{}\n".format(self.num_nodes_search))
+        with open(full_file_path("nodes_completed.txt"), "w", encoding="utf-8") as f:
+            for task in self.tasks:
+                if task.node is not None and self.state["tasks"][task.name]["status"] == DONE:
+                    f.write("NODE_{}\n".format(task.node))
+        for task in self.tasks:
+            if task.node is not None:
+                self.state["tasks"][task.name]["total_lines"] = count_lines(
+                    full_file_path(os.path.join("NODE_{}".format(task.node), "query")))
+        return EXIT_SUCCESS
+
+    def execute(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+        pending = [task for task in self.tasks if self.status(task) != DONE and task.name in self.targets]
+        for task in pending:
+            self.state["tasks"][task.name]["status"] = PENDING
+        if not pending:
+            print("nothing to do: all steps are completed")
+            return
+        print("tasks to run: {}".format(", ".join(task.name for task in pending)))
+        attempts = {task.name: 0 for task in pending}
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as pool:
+            while pending or running:
+                ready = [task for task in pending if all(self.status_by_name(dep) == DONE for dep in task.deps) and
+                         all(self.status_by_name(name) in (RUNNING, DONE) for name in task.after_started
+                             if name in self.targets)]
+                for task in ready[:max(0, self.jobs - len(running))]:
+                    pending.remove(task)
+                    attempts[task.name] += 1
+                    self.start_task(task)
+                    running[pool.submit(self.run_task, task)] = task
+                if not running:
+                    break  # remaining tasks depend on failed ones (NODE_1 on a node that failed all attempts)
+                finished, _ = wait(running, timeout=MONITOR_INTERVAL, return_when=FIRST_COMPLETED)
+                if self.status_by_name("prepare_search") == DONE:
+                    self.check_search(running.values())
+                for future in finished:
+                    task = running.pop(future)
+                    try:
+                        return_code = future.result()
+                    except Exception as e:  # pylint: disable=broad-except
+                        print("[ERROR] task {} raised {}".format(task.name, e))
+                        return_code = EXIT_FAILURE
+                    self.finish_task(task, return_code)
+                    if return_code != EXIT_SUCCESS and attempts[task.name] <= task.retries:
+                        print("retrying {} (attempt {} of {})".format(task.name, attempts[task.name] + 1,
+                                                                      task.retries + 1))
+                        pending.append(task)
+                    elif return_code != EXIT_SUCCESS and task.node not in (None, 1):
+                        self.stop_node_1(task)
+                self.report_progress()
+
+        failed = [task.name for task in self.tasks if self.status(task) != DONE and task.name in self.targets]
+        if failed:
+            raise ScriptControllerException("not completed: {}, rerun controller to resume".format(", ".join(failed)))
+        if len(self.targets) < len(self.tasks):
+            print("SUCCESS: {} completed".format(", ".join(task.name for task in self.tasks
+                                                          if task.name in self.targets)))
+        else:
+            print("SUCCESS: Search Completed on all nodes")
+
+    def run_task(self, task):
+        if task.before is not None:
+            task.before(self.state["tasks"][task.name]["attempts"] > 1 or
+                        self.state["tasks"][task.name].get("last_failed", False))
+        if task.func is not None:
+            return task.func()
+        if task.node is not None:
+            processed = read_checkpoint(task.node, self.threshold)
+            if processed:
+                print("{} resumes after line {} of {}".format(task.name, processed,
+                                                              self.state["tasks"][task.name].get("total_lines")))
+        return run_command(task.cmd, prefix="[{}] ".format(task.name),
+                           log_loc=os.path.join(self.log_dir, task.name + ".log"),
+                           on_start=lambda p: self.processes.__setitem__(task.name, (p, time.time())))
+
+    def stop_node_1(self, failed_task):
+        """ NODE_1 waits for every other node to sign off, it never finishes if one of them failed all attempts """
+        process, _ = self.processes.get("search_NODE_1", (None, None))
+        if process is not None and process.poll() is None:
+            print("[WARNING] {} failed, stopping search_NODE_1 that waits for it".format(failed_task.name))
+            process.terminate()
 
+    def check_search(self, running_tasks):
+        """ Save search progress and restart running nodes that stopped making progress """
+        snapshot = self.monitor.refresh()
+        write_json(snapshot, full_file_path(STATUS_FILE_NAME))
+        total = snapshot["total"]
+        print("search progress: {}/{} queries ({:.1%}), {:.1f} queries/s, {:.1f} pairs/s".format(
+            total["processed"], total["total"], total["progress"], total["queries_per_sec"], total["pairs_per_sec"]))
+        if not self.stall_timeout:
+            return
+        running_names = {task.name for task in running_tasks}
+        for node in snapshot["nodes"]:
+            name = "search_" + node["node"]
+            process, started = self.processes.get(name, (None, None))
+            # a restarted node gets `stall_timeout` seconds to load the index and continue from its checkpoint
+            if node["status"] == STALLED and name in running_names and process is not None and \
+                    process.poll() is None and time.time() - started > self.stall_timeout:
+                print("[WARNING] {} made no progress for {} seconds, restarting it".format(node["node"],
+                                                                                         self.stall_timeout))
+                process.terminate()
+
+    def start_task(self, task):
+        task_state = self.state["tasks"][task.name]
+        task_state.update(status=RUNNING, started=dt.datetime.now().isoformat(timespec="seconds"),
+                          attempts=task_state.get("attempts", 0) + 1)
         self.flush_state()
-        self.current_state = STATE_EXECUTE_1  # go back to EXE 1 state
-        print("SUCCESS: Search Completed on all nodes")
 
-    def perform_step(self, state, cmd, params):
+    def finish_task(self, task, return_code):
+        task_state = self.state["tasks"][task.name]
+        task_state.update(status=DONE if return_code == EXIT_SUCCESS else FAILED, return_code=return_code,
+                          finished=dt.datetime.now().isoformat(timespec="seconds"),
+                          last_failed=return_code != EXIT_SUCCESS)
+        if task.node is not None:
+            task_state["processed_lines"] = read_checkpoint(task.node, self.threshold)
+        print("{} {} with return code {}".format(task.name, task_state["status"], return_code))
         self.flush_state()
-        if self.previous_run_state <= state:
-            run_command_wrapper(cmd, params)
-        self.current_state += 1
+
+    def report_progress(self):
+        nodes = [self.state["tasks"][task.name] for task in self.tasks if task.node is not None]
+        done = sum(1 for node in nodes if node["status"] == DONE)
+        if any(node["status"] != PENDING for node in nodes):
+            print("search: {} of {} nodes completed".format(done, len(nodes)))
+
+    def status(self, task):
+        return self.status_by_name(task.name)
+
+    def status_by_name(self, name):
+        return self.state["tasks"][name]["status"]
 
     def flush_state(self):
-        print("flushing current state {}".format(self.current_state))
-        with open(self.script_meta_file_name, "w", encoding="utf-8") as f:
-            f.write("{}\n".format(self.current_state))
+        tmp_loc = self.state_file_name + ".tmp"
+        with open(tmp_loc, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_loc, self.state_file_name)
 
-    def load_previous_state(self):
+    def new_state(self):
+        return {"num_nodes": self.num_nodes_search, "threshold": str(self.threshold), "query_files": self.query_files,
+                "incremental": self.incremental,
+                "tasks": {task.name: {"status": PENDING, "attempts": 0} for task in self.tasks}}
+
+    def load_previous_state(self, reset):
         print("loading previous run state")
-        if os.path.isfile(self.script_meta_file_name):
-            with open(self.script_meta_file_name, "r", encoding="utf-8") as f:
-                return int(f.readline())
+        state = self.new_state()
+        if reset:
+            return state
+        if os.path.isfile(self.state_file_name):
+            with open(self.state_file_name, encoding="utf-8") as f:
+                previous = json.load(f)
+            changed = previous.get("num_nodes") != self.num_nodes_search or \
+                previous.get("threshold") != str(self.threshold) or \
+                previous.get("query_files", []) != self.query_files or \
+                previous.get("incremental", False) != self.incremental
+            # the service reuses the index of a completed run
+            if all(task["status"] == DONE for task in previous["tasks"].values()) and not changed and \
+                    not self.serve:
+                print("previous run was completed, starting a new one")
+                return state
+            for name, task_state in previous["tasks"].items():
+                if name in state["tasks"]:
+                    state["tasks"][name] = task_state
+            if changed:
+                # query files have to be split again
+                print("number of nodes, threshold or queries changed, query files will be split again")
+                state["tasks"]["split"]["status"] = PENDING
+        elif os.path.isfile(full_file_path(LEGACY_STATE_FILE_NAME)):
+            with open(full_file_path(LEGACY_STATE_FILE_NAME), encoding="utf-8") as f:
+                step = int(f.readline())
+            print("migrating {} (step {})".format(LEGACY_STATE_FILE_NAME, step))
+            for name in ["build"] + LEGACY_STEPS[:step]:
+                if name in state["tasks"]:
+                    state["tasks"][name]["status"] = DONE
+            if step == 1 and "init" in state["tasks"]:
+                state["tasks"]["init"]["last_failed"] = True
         else:
-            print("{} doesn't exist, creating one with state EXECUTE_1".format(self.script_meta_file_name))
-            return STATE_EXECUTE_1
+            print("{} doesn't exist, starting from the first step".format(self.state_file_name))
+
+        if not os.path.isfile(full_file_path(os.path.join("dist", "indexbased.SearchManager.jar"))):
+            state["tasks"]["build"]["status"] = PENDING
+        # task is rerun if any of its dependencies is rerun
+        for task in self.tasks:
+            if any(state["tasks"][dep]["status"] != DONE for dep in task.deps):
+                state["tasks"][task.name]["status"] = PENDING
+        # metadata for NODE_1 is rewritten before every search, finished nodes are not rerun
+        state["tasks"]["prepare_search"]["status"] = PENDING
+        if self.serve:
+            state["tasks"]["serve"]["status"] = PENDING
+        return state
+
+
+def run_command_wrapper(cmd, params):
+    command = full_script_path(cmd, params)
+    return_code = run_command(command.split())
+    if return_code != EXIT_SUCCESS:
+        raise ScriptControllerException("error during executing {}".format(command))
 
 
 if __name__ == '__main__':
-    numnodes = int(sys.argv[1]) if len(sys.argv) >= 2 else 2
-    print(f"search will be carried out with {numnodes} nodes")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("num_nodes", nargs="?", type=int, default=2, help="Number of search nodes.")
+    parser.add_argument("threshold", nargs="?", default="8", help="Similarity threshold, 8 means 80%%.")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Number of nodes running at the same time, all nodes by default.")
+    parser.add_argument("-r", "--retries", type=int, default=2, help="Number of retries of a failed search node.")
+    parser.add_argument("--heap", default="6g", help="JVM heap size of every node.")
+    parser.add_argument("--reset", action="store_true", help="Ignore saved state and run all steps.")
+    parser.add_argument("-q", "--query-file", action="append", default=None,
+                        help="Search these blocks against the dataset instead of the dataset against itself "
+                             "(versus mode), they must be blocks of input/dataset too, can be repeated.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Index only blocks of input/dataset, append them to the existing index & keep global "
+                             "token frequencies, queries are the same new blocks.")
+    parser.add_argument("--serve", action="store_true",
+                        help="Build the index if needed and start a resident search service on it instead of "
+                             "searching, query it with search_client.py.")
+    parser.add_argument("--port", type=int, default=0, help="Port of the search service, any free port by default.")
+    parser.add_argument("--until", default=None,
+                        help="Run only this task and its dependencies, e.g. `move_index` to build the index.")
+    parser.add_argument("--stall-timeout", type=float, default=None,
+                        help="Restart a search node if it makes no progress for this number of seconds.")
+    args = parser.parse_args()
+    print(f"search will be carried out with {args.num_nodes} nodes")
 
-    controller = ScriptController(numnodes)
-    controller.execute()
+    try:
+        controller = ScriptController(args.num_nodes, args.threshold, jobs=args.jobs, retries=args.retries,
+                                      heap=args.heap, reset=args.reset, stall_timeout=args.stall_timeout,
+                                      query_files=args.query_file, until=args.until,
+                                      incremental=args.incremental, serve=args.serve, port=args.port)
+        controller.execute()
+    except ScriptControllerException as e:
+        print("[ERROR] {}".format(e))
+        sys.exit(EXIT_FAILURE)
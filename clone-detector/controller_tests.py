@@ -0,0 +1,122 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import controller
+from controller import DONE, EXIT_FAILURE, EXIT_SUCCESS, FAILED, LEGACY_STATE_FILE_NAME, PENDING, STATE_FILE_NAME, \
+    ScriptController, ScriptControllerException
+
+
+class _Controller(ScriptController):
+    """ Commands are not run: every launch is recorded and return codes of search nodes are scripted """
+
+    def __init__(self, *args, failures=None, **kwargs):
+        self.launched = []
+        # task name -> number of failed launches before success
+        self.failures = dict(failures or {})
+        super().__init__(*args, **kwargs)
+
+    def run_task(self, task):
+        if task.cmd is None:
+            return super().run_task(task)
+        self.launched.append(task.name)
+        if task.name == "search_NODE_1" and \
+                any(self.state["tasks"][other]["status"] != DONE for other in task.after_started):
+            # NODE_1 waits for the other nodes, with a single worker it would never finish
+            return EXIT_FAILURE
+        if self.failures.get(task.name, 0) > 0:
+            self.failures[task.name] -= 1
+            return EXIT_FAILURE
+        return EXIT_SUCCESS
+
+
+class TestController(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        root = self.tmp_dir.name
+        patcher = mock.patch.object(controller, "full_file_path", lambda string: os.path.join(root, string))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # progress of tasks is printed, tests keep the output clean
+        stdout_patcher = mock.patch("sys.stdout", new_callable=io.StringIO)
+        stdout_patcher.start()
+        self.addCleanup(stdout_patcher.stop)
+        self.addCleanup(self.tmp_dir.cleanup)
+        os.makedirs(os.path.join(root, "dist"))
+        open(os.path.join(root, "dist", "indexbased.SearchManager.jar"), "w").close()
+
+    def _state(self):
+        with open(os.path.join(self.tmp_dir.name, STATE_FILE_NAME)) as f:
+            return json.load(f)
+
+    def test_order(self):
+        scc = _Controller(3, jobs=1, reset=True)
+        scc.execute()
+        self.assertEqual(scc.launched, ["build", "split_init", "init", "index", "move_index", "split",
+                                        "search_NODE_2", "search_NODE_3", "search_NODE_1"])
+        self.assertTrue(all(task["status"] == DONE for task in self._state()["tasks"].values()))
+
+    def test_retried_node_runs_before_node_1(self):
+        scc = _Controller(3, jobs=1, retries=1, reset=True, failures={"search_NODE_2": 1})
+        scc.execute()
+        self.assertEqual(scc.launched[6:], ["search_NODE_2", "search_NODE_3", "search_NODE_2", "search_NODE_1"])
+        self.assertEqual(self._state()["tasks"]["search_NODE_2"]["attempts"], 2)
+
+    def test_node_1_is_not_started_after_failed_node(self):
+        scc = _Controller(3, jobs=1, retries=0, reset=True, failures={"search_NODE_3": 1})
+        with self.assertRaises(ScriptControllerException):
+            scc.execute()
+        self.assertNotIn("search_NODE_1", scc.launched)
+        tasks = self._state()["tasks"]
+        self.assertEqual((tasks["search_NODE_2"]["status"], tasks["search_NODE_3"]["status"],
+                          tasks["search_NODE_1"]["status"]), (DONE, FAILED, PENDING))
+
+    def test_resume(self):
+        scc = _Controller(3, jobs=3, retries=0, reset=True, failures={"search_NODE_3": 1})
+        with self.assertRaises(ScriptControllerException):
+            scc.execute()
+        scc = _Controller(3, jobs=3)
+        scc.execute()
+        self.assertEqual(scc.launched, ["search_NODE_3", "search_NODE_1"])
+        with open(os.path.join(self.tmp_dir.name, "nodes_completed.txt")) as f:
+            self.assertEqual(f.read(), "NODE_2\n")
+
+        # query files are split again for another number of nodes
+        scc = _Controller(2, jobs=2)
+        scc.execute()
+        self.assertEqual(scc.launched, ["split", "search_NODE_2", "search_NODE_1"])
+
+        # a completed run is not resumed
+        scc = _Controller(2, jobs=2)
+        scc.execute()
+        self.assertEqual(scc.launched[0], "build")
+
+    def test_until(self):
+        scc = _Controller(2, reset=True, until="move_index")
+        scc.execute()
+        self.assertEqual(scc.launched, ["build", "split_init", "init", "index", "move_index"])
+
+    def test_legacy_state(self):
+        with open(os.path.join(self.tmp_dir.name, LEGACY_STATE_FILE_NAME), "w") as f:
+            f.write("3\n")
+        scc = _Controller(2)
+        self.assertEqual({name for name, task in scc.state["tasks"].items() if task["status"] == DONE},
+                         {"build", "split_init", "init", "index"})
+        scc.execute()
+        self.assertEqual(scc.launched, ["move_index", "split", "search_NODE_2", "search_NODE_1"])
+
+        # the previous controller failed at init - gtpm backup has to be restored
+        os.remove(os.path.join(self.tmp_dir.name, STATE_FILE_NAME))
+        with open(os.path.join(self.tmp_dir.name, LEGACY_STATE_FILE_NAME), "w") as f:
+            f.write("1\n")
+        scc = _Controller(2)
+        self.assertEqual(scc.state["tasks"]["split_init"]["status"], DONE)
+        self.assertEqual(scc.state["tasks"]["init"]["status"], PENDING)
+        self.assertTrue(scc.state["tasks"]["init"]["last_failed"])
+
+
+if __name__ == "__main__":
+    unittest.main()
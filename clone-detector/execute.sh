@@ -8,11 +8,12 @@ rootPATH=$(dirname $scriptPATH)
 printf "\e[32m[execute.sh] \e[0m$rootPATH\n"
 num_nodes="${1:-2}"
 th="${2:-8}"
-queryfile="$rootPATH/input/dataset/blocks.file"
-printf "\e[32m[execute.sh] \e[0mspliting query file $queryfile into $num_nodes parts\n"
-$rootPATH/unevensplit.py $queryfile $num_nodes
+# query files (or folders) to split, the whole dataset by default
+shift $(( $# < 2 ? $# : 2 ))
+queryfiles="${@:-$rootPATH/input/dataset}"
+printf "\e[32m[execute.sh] \e[0mspliting query files $queryfiles into $num_nodes parts\n"
+$rootPATH/partition_queries.py $queryfiles $num_nodes --threshold $th --properties $rootPATH/sourcerer-cc.properties --output-dir $rootPATH
 printf "\e[32m[execute.sh] \e[0mmoving files\n"
 $rootPATH/preparequery.sh $num_nodes
 printf "\e[32m[execute.sh] \e[0mdone!\n"
 $rootPATH/replacenodeprefix.sh $num_nodes
-
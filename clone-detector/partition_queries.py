@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Split query files (`blocks.file`) between search nodes by estimated search cost.
+
+Search time of a query block depends on the number of candidates it produces, not on its position in the file:
+* a query of size s (total tokens) is sent to the shard that covers s, only blocks indexed in this shard are candidates;
+* candidates are found through the prefix tokens (the rarest `s + 1 - ceil(th * s)` token occurrences),
+  each prefix token contributes its posting list - roughly the number of blocks containing this token;
+* every candidate is verified with a cost that grows with s.
+So estimated cost of a query is
+    s + candidates * (1 + VERIFY_COST * s), candidates = shard_fraction * sum(df(t) for t in prefix)
+Blocks are read in one streaming pass. Token document frequencies and the size histogram are accumulated while reading,
+blocks are buffered in windows and every window is assigned to nodes with LPT (longest processing time first):
+the most expensive block goes to the least loaded node. Output files are `query_<node>.file` as expected by `preparequery.sh`,
+predicted per-node load is printed and saved to `partition_report.json`.
+
+With `--order` (ORDER_QUERIES=true) every node file is then reordered by (shard, size band, rarest prefix token)
+with an external sort: consecutive queries of a node read the same shard and the same posting lists, instead of jumping
+between unrelated index regions in tokenizer order. `--measure-locality` simulates an LRU cache of posting lists
+over the prefix tokens of every node file before and after ordering and adds hit rates to the report.
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict, namedtuple
+from typing import Dict, Iterator, List, Tuple
+
+WINDOW_SIZE = 100000
+VERIFY_COST = 0.05
+DEFAULT_SHARDS = [65, 100, 300, 500000]
+DEFAULT_MIN_TOKENS = 16
+DEFAULT_MAX_TOKENS = 50000000
+# blocks sorted in memory before spilling a sorted run to disk
+ORDER_RUN_SIZE = 200000
+# posting lists kept by the simulated cache of `--measure-locality`
+LOCALITY_CACHE_SIZE = 10000
+
+QueryBlock = namedtuple("QueryBlock", ["line", "size", "tokens"])
+NodeLoad = namedtuple("NodeLoad", ["node", "blocks", "tokens", "cost"])
+
+
+def read_properties(properties_loc: str) -> Dict[str, str]:
+    """
+    Read `key=value` pairs from SourcererCC properties file.
+    :param properties_loc: path to properties file.
+    :return: dictionary of properties.
+    """
+    properties = {}
+    with open(properties_loc, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                key, value = line.split("=", 1)
+                properties[key.strip()] = value.strip()
+    return properties
+
+
+def normalize_threshold(threshold: float) -> float:
+    """ SourcererCC scripts pass threshold multiplied by 10 (`8` for 0.8) """
+    return threshold / 10 if threshold > 1 else threshold
+
+
+def expand_query_files(input_locs: List[str]) -> List[str]:
+    """
+    Replace folders with the files they contain, so tokenizer output can be split without concatenating it.
+    :param input_locs: query files or folders with query files.
+    :return: list of files.
+    """
+    paths = []
+    for input_loc in input_locs:
+        if os.path.isdir(input_loc):
+            paths.extend(path for path in (os.path.join(input_loc, name) for name in sorted(os.listdir(input_loc))
+                                           if not name.startswith("."))
+                         if os.path.isfile(path))
+        else:
+            paths.append(input_loc)
+    return paths
+
+
+def parse_block(line: str) -> QueryBlock:
+    """
+    Parse line of query file: `proj_id,block_id,total_tokens,unique_tokens,...,hash@#@token@@::@@count,...`.
+    :param line: line of query file.
+    :return: query block with token counts.
+    """
+    header, _, body = line.partition("@#@")
+    size = int(header.split(",")[2])
+    tokens = {}
+    for token_count in body.rstrip("\n").split(","):
+        token, _, count = token_count.rpartition("@@::@@")
+        if token:
+            tokens[token] = int(count)
+    return QueryBlock(line=line, size=size, tokens=tokens)
+
+
+class CostModel:
+    """
+    Running statistics of the corpus (token document frequencies, size histogram) and query cost estimation.
+    """
+
+    def __init__(self, threshold: float, shards: List[int], min_tokens: int, max_tokens: int,
+                 verify_cost: float = VERIFY_COST):
+        self.threshold = normalize_threshold(threshold)
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.verify_cost = verify_cost
+        # query size ranges of shards as in `SearchManager.createShards`
+        self.shard_ranges = []  # type: List[Tuple[int, int]]
+        low = min_tokens
+        for high in sorted(shards):
+            self.shard_ranges.append((low, high))
+            low = high + 1
+        self.shard_ranges.append((low, max_tokens))
+        self.df = {}  # type: Dict[str, int]
+        self.size_hist = {}  # type: Dict[int, int]
+        self.n_blocks = 0
+        self.shard_fractions = [1.0] * len(self.shard_ranges)
+
+    def add(self, block: QueryBlock) -> None:
+        """
+        Update statistics with new block.
+        :param block: query block.
+        :return: None.
+        """
+        self.n_blocks += 1
+        self.size_hist[block.size] = self.size_hist.get(block.size, 0) + 1
+        for token in block.tokens:
+            self.df[token] = self.df.get(token, 0) + 1
+
+    def update_shard_fractions(self) -> None:
+        """
+        Recompute fraction of blocks indexed in each shard - a shard indexes blocks that can be clones of its queries.
+        :return: None.
+        """
+        for i, (low, high) in enumerate(self.shard_ranges):
+            index_low = math.ceil(self.threshold * low)
+            index_high = math.floor(high / self.threshold)
+            indexed = sum(count for size, count in self.size_hist.items() if index_low <= size <= index_high)
+            self.shard_fractions[i] = indexed / max(self.n_blocks, 1)
+
+    def shard(self, size: int) -> int:
+        """
+        Index of shard that receives query of given size, -1 if query is ignored by SourcererCC.
+        :param size: number of tokens in query.
+        :return: shard index.
+        """
+        for i, (low, high) in enumerate(self.shard_ranges):
+            if low <= size <= high:
+                return i
+        return -1
+
+    def cost(self, block: QueryBlock) -> float:
+        """
+        Estimated search cost of block.
+        :param block: query block.
+        :return: cost in arbitrary units.
+        """
+        shard = self.shard(block.size)
+        if shard < 0:
+            return 1.0
+        prefix_size = block.size + 1 - math.ceil(self.threshold * block.size)
+        postings = 0
+        covered = 0
+        # prefix consists of the rarest tokens
+        for token in sorted(block.tokens, key=lambda t: (self.df.get(t, 0), t)):
+            if covered >= prefix_size:
+                break
+            covered += block.tokens[token]
+            postings += self.df.get(token, 0)
+        candidates = self.shard_fractions[shard] * postings
+        return block.size + candidates * (1 + self.verify_cost * block.size)
+
+    def prefix(self, block: QueryBlock) -> List[str]:
+        """
+        Prefix tokens of block, the rarest first - their posting lists are read to find candidates.
+        :param block: query block.
+        :return: list of tokens.
+        """
+        prefix_size = block.size + 1 - math.ceil(self.threshold * block.size)
+        tokens = []
+        covered = 0
+        for token in sorted(block.tokens, key=lambda t: (self.df.get(t, 0), t)):
+            if covered >= prefix_size:
+                break
+            covered += block.tokens[token]
+            tokens.append(token)
+        return tokens
+
+    def order_key(self, block: QueryBlock) -> Tuple[int, int, int, str, int]:
+        """
+        Sorting key of queries that puts queries reading the same index regions next to each other.
+        Sizes are grouped in bands of ratio 1 / threshold - the range of candidate sizes of a query, so the rarest
+        token groups queries across nearby sizes that share candidates.
+        :param block: query block.
+        :return: (shard, size band, document frequency of the rarest token, the rarest token, size).
+        """
+        rarest = min(block.tokens, key=lambda t: (self.df.get(t, 0), t), default="")
+        size_band = int(math.log(max(block.size, 1)) / -math.log(self.threshold)) if self.threshold < 1 else 0
+        return self.shard(block.size), size_band, self.df.get(rarest, 0), rarest, block.size
+
+
+def assign_window(window: List[QueryBlock], model: CostModel, loads: List[List[float]], outputs: List) -> None:
+    """
+    Assign window of blocks to nodes with LPT and write them to node files.
+    :param window: query blocks.
+    :param model: cost model, already updated with blocks of the window.
+    :param loads: per-node [blocks, tokens, cost], updated in place.
+    :param outputs: per-node output files.
+    :return: None.
+    """
+    model.update_shard_fractions()
+    costs = [model.cost(block) for block in window]
+    heap = [(load[2], node) for node, load in enumerate(loads)]
+    heapq.heapify(heap)
+    for i in sorted(range(len(window)), key=lambda i: -costs[i]):
+        cost, node = heapq.heappop(heap)
+        outputs[node].write(window[i].line)
+        loads[node][0] += 1
+        loads[node][1] += window[i].size
+        loads[node][2] += costs[i]
+        heapq.heappush(heap, (cost + costs[i], node))
+
+
+def _iter_lines(query_loc: str) -> Iterator[str]:
+    with open(query_loc, encoding="utf-8") as f:
+        yield from f
+
+
+def order_queries(query_loc: str, model: CostModel, run_size: int = ORDER_RUN_SIZE) -> int:
+    """
+    Reorder query file in place by `CostModel.order_key` with an external sort: sorted runs of `run_size` blocks
+    are spilled next to the file and merged.
+    :param query_loc: query file of a node.
+    :param model: cost model updated with all blocks.
+    :param run_size: number of blocks sorted in memory.
+    :return: number of sorted runs.
+    """
+    work_dir = tempfile.mkdtemp(prefix="order_", dir=os.path.dirname(os.path.abspath(query_loc)))
+    try:
+        runs = []
+        chunk = []
+        for line in _iter_lines(query_loc):
+            chunk.append(line)
+            if len(chunk) >= run_size:
+                runs.append(_write_run(chunk, model, work_dir, len(runs)))
+                chunk = []
+        if chunk or not runs:
+            runs.append(_write_run(chunk, model, work_dir, len(runs)))
+        ordered_loc = os.path.join(work_dir, "ordered.file")
+        with open(ordered_loc, "w", encoding="utf-8") as f:
+            f.writelines(heapq.merge(*[_iter_lines(run) for run in runs],
+                                     key=lambda line: model.order_key(parse_block(line))))
+        os.replace(ordered_loc, query_loc)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return len(runs)
+
+
+def _write_run(lines: List[str], model: CostModel, work_dir: str, run_id: int) -> str:
+    lines.sort(key=lambda line: model.order_key(parse_block(line)))
+    run_loc = os.path.join(work_dir, "run_{}.file".format(run_id))
+    with open(run_loc, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    return run_loc
+
+
+def posting_cache_hit_rate(query_loc: str, model: CostModel, cache_size: int = LOCALITY_CACHE_SIZE) -> float:
+    """
+    Share of posting list reads served by an LRU cache of `cache_size` lists when queries are searched in file order.
+    :param query_loc: query file of a node.
+    :param model: cost model updated with all blocks.
+    :param cache_size: number of cached posting lists.
+    :return: hit rate.
+    """
+    cache = OrderedDict()
+    hits, reads = 0, 0
+    for line in _iter_lines(query_loc):
+        block = parse_block(line)
+        shard = model.shard(block.size)
+        if shard < 0:
+            continue
+        for token in model.prefix(block):
+            key = (shard, token)
+            reads += 1
+            if key in cache:
+                hits += 1
+                cache.move_to_end(key)
+            else:
+                cache[key] = True
+                if len(cache) > cache_size:
+                    cache.popitem(last=False)
+    return hits / reads if reads else 0.0
+
+
+def partition(input_locs: List[str], n_nodes: int, threshold: float, shards: List[int] = None,
+              min_tokens: int = DEFAULT_MIN_TOKENS, max_tokens: int = DEFAULT_MAX_TOKENS, output_dir: str = ".",
+              window_size: int = WINDOW_SIZE, order: bool = False, measure_locality: bool = False,
+              cache_size: int = LOCALITY_CACHE_SIZE) -> List[NodeLoad]:
+    """
+    Split query files into `query_<node>.file` files with balanced estimated cost.
+    :param input_locs: query files (`blocks.file`) or folders with them (tokenizer output).
+    :param n_nodes: number of search nodes.
+    :param threshold: similarity threshold (0.8 or 8 - scaled as in SourcererCC scripts).
+    :param shards: shard boundaries (SHARD_MAX_NUM_TOKENS), if None - default boundaries.
+    :param min_tokens: MIN_TOKENS - smaller blocks are ignored by search.
+    :param max_tokens: MAX_TOKENS - bigger blocks are ignored by search.
+    :param output_dir: directory to store query files & report.
+    :param window_size: number of blocks assigned at once, bigger window - better balance & more memory.
+    :param order: reorder every node file by shard, size band & rarest prefix token.
+    :param measure_locality: add simulated posting list cache hit rates (before & after ordering) to the report.
+    :param cache_size: posting lists kept by the simulated cache.
+    :return: predicted load of every node.
+    """
+    model = CostModel(threshold=threshold, shards=DEFAULT_SHARDS if shards is None else shards, min_tokens=min_tokens,
+                      max_tokens=max_tokens)
+    loads = [[0, 0, 0.0] for _ in range(n_nodes)]
+    outputs = [open(os.path.join(output_dir, "query_{part}.file".format(part=node + 1)), "w", encoding="utf-8")
+               for node in range(n_nodes)]
+    try:
+        window = []
+        for input_loc in expand_query_files(input_locs):
+            with open(input_loc, "r", encoding="utf-8") as input_file:
+                for line in input_file:
+                    if not line.strip():
+                        continue
+                    if not line.endswith("\n"):
+                        line += "\n"
+                    block = parse_block(line)
+                    model.add(block)
+                    window.append(block)
+                    if len(window) >= window_size:
+                        assign_window(window, model, loads, outputs)
+                        window = []
+        if window:
+            assign_window(window, model, loads, outputs)
+    finally:
+        for output in outputs:
+            output.close()
+
+    locality = {}
+    if order or measure_locality:
+        model.update_shard_fractions()
+        for node in range(n_nodes):
+            query_loc = os.path.join(output_dir, "query_{part}.file".format(part=node + 1))
+            if measure_locality:
+                locality.setdefault("before", []).append(posting_cache_hit_rate(query_loc, model, cache_size))
+            if order:
+                order_queries(query_loc, model)
+                if measure_locality:
+                    locality.setdefault("after", []).append(posting_cache_hit_rate(query_loc, model, cache_size))
+
+    node_loads = [NodeLoad(node=node + 1, blocks=load[0], tokens=load[1], cost=load[2])
+                  for node, load in enumerate(loads)]
+    save_report(node_loads, os.path.join(output_dir, "partition_report.json"), locality)
+    return node_loads
+
+
+def save_report(node_loads: List[NodeLoad], report_loc: str, locality: Dict[str, List[float]] = None) -> None:
+    """
+    Print predicted per-node load and save it as JSON.
+    :param node_loads: predicted load of every node.
+    :param report_loc: path to JSON report.
+    :param locality: simulated posting list cache hit rates of every node `before` & `after` ordering.
+    :return: None.
+    """
+    total_cost = sum(load.cost for load in node_loads) or 1.0
+    mean_cost = total_cost / max(len(node_loads), 1)
+    print("{:>6} {:>10} {:>14} {:>16} {:>8}".format("node", "blocks", "tokens", "predicted cost", "share"))
+    for load in node_loads:
+        print("{:>6} {:>10} {:>14} {:>16.0f} {:>7.2f}%".format(load.node, load.blocks, load.tokens, load.cost,
+                                                               100 * load.cost / total_cost))
+    imbalance = max(load.cost for load in node_loads) / mean_cost if node_loads else 1.0
+    print("predicted imbalance (max / mean cost): {:.3f}".format(imbalance))
+    for name, hit_rates in sorted((locality or {}).items()):
+        print("posting list cache hit rate {}: {}".format(
+            name, " ".join("{:.2f}%".format(100 * hit_rate) for hit_rate in hit_rates)))
+    report = {"imbalance": imbalance, "nodes": [load._asdict() for load in node_loads]}
+    if locality:
+        report["locality"] = locality
+    with open(report_loc, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", nargs="+", help="Query file(s) (blocks.file) or folder(s) with them.")
+    parser.add_argument("nodes", type=int, help="Number of search nodes.")
+    parser.add_argument("-t", "--threshold", type=float, default=8,
+                        help="Similarity threshold, 0.8 or 8 as passed to SourcererCC scripts.")
+    parser.add_argument("-p", "--properties", default=None,
+                        help="sourcerer-cc.properties to read SHARD_MAX_NUM_TOKENS, MIN_TOKENS & MAX_TOKENS from.")
+    parser.add_argument("-o", "--output-dir", default=".", help="Directory to store query_<node>.file files.")
+    parser.add_argument("-w", "--window-size", type=int, default=WINDOW_SIZE,
+                        help="Number of blocks assigned to nodes at once.")
+    parser.add_argument("--order", action="store_true", default=None,
+                        help="Reorder node files by shard, size band & rarest prefix token (ORDER_QUERIES).")
+    parser.add_argument("--measure-locality", action="store_true",
+                        help="Report simulated posting list cache hit rates of node files before & after ordering.")
+    parser.add_argument("--cache-size", type=int, default=LOCALITY_CACHE_SIZE,
+                        help="Posting lists kept by the simulated cache of --measure-locality.")
+    args = parser.parse_args()
+
+    shard_boundaries = DEFAULT_SHARDS
+    min_tokens_arg, max_tokens_arg = DEFAULT_MIN_TOKENS, DEFAULT_MAX_TOKENS
+    if args.properties:
+        props = read_properties(args.properties)
+        if props.get("IS_SHARDING", "true").lower() == "true":
+            shard_boundaries = [int(x) for x in props.get("SHARD_MAX_NUM_TOKENS", "").split(",") if x.strip()]
+        else:
+            shard_boundaries = []
+        min_tokens_arg = int(props.get("MIN_TOKENS", min_tokens_arg))
+        max_tokens_arg = int(props.get("MAX_TOKENS", max_tokens_arg))
+        if args.order is None:
+            args.order = props.get("ORDER_QUERIES", "false").lower() == "true"
+    print("splitting {inputfile} in {count} chunks".format(inputfile=" ".join(args.input), count=args.nodes))
+    try:
+        partition(args.input, args.nodes, args.threshold, shards=shard_boundaries, min_tokens=min_tokens_arg,
+                  max_tokens=max_tokens_arg, output_dir=args.output_dir, window_size=args.window_size,
+                  order=bool(args.order), measure_locality=args.measure_locality, cache_size=args.cache_size)
+    except IOError as e:
+        print("Error: {error}".format(error=e))
+        sys.exit(1)
+    print("splitting done!")
@@ -0,0 +1,135 @@
+from collections import Counter
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from partition_queries import CostModel, order_queries, parse_block, partition as _partition
+
+
+def partition(*args, **kwargs):
+    # the report table of nodes is printed, tests keep the output clean
+    with redirect_stdout(io.StringIO()):
+        return _partition(*args, **kwargs)
+
+
+def _line(block_id, tokens):
+    body = ",".join("{}@@::@@{}".format(token, count) for token, count in sorted(tokens.items()))
+    return "1,{},{},{},hash@#@{}\n".format(block_id, sum(tokens.values()), len(tokens), body)
+
+
+class TestPartitionQueries(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(3)
+        self.lines = []
+        for block_id in range(400):
+            size = rnd.choice([20, 40, 80, 200, 600])
+            tokens = {}
+            for _ in range(size):
+                token = "t%s" % int(rnd.paretovariate(1.2))
+                tokens[token] = tokens.get(token, 0) + 1
+            self.lines.append(_line(block_id, tokens))
+
+    def test_cost_model(self):
+        model = CostModel(threshold=8, shards=[65, 100], min_tokens=10, max_tokens=1000)
+        self.assertEqual(model.threshold, 0.8)
+        self.assertEqual(model.shard_ranges, [(10, 65), (66, 100), (101, 1000)])
+        self.assertEqual([model.shard(size) for size in [5, 10, 65, 66, 1000, 1001]], [-1, 0, 0, 1, 2, -1])
+        for line in [_line(1, {"common": 5, "rare": 5}), _line(2, {"common": 5, "other": 5}),
+                     _line(3, {"common": 10})]:
+            model.add(parse_block(line))
+        model.update_shard_fractions()
+        self.assertEqual(model.df, {"common": 3, "rare": 1, "other": 1})
+        self.assertEqual(model.shard_fractions, [1.0, 0.0, 0.0])
+        # the prefix of the rarest tokens decides the number of candidates
+        rare, common = parse_block(_line(4, {"rare": 10})), parse_block(_line(5, {"common": 10}))
+        self.assertEqual(model.prefix(parse_block(_line(6, {"common": 8, "rare": 2}))), ["rare", "common"])
+        self.assertLess(model.cost(rare), model.cost(common))
+        self.assertEqual(model.cost(parse_block(_line(7, {"x": 5}))), 1.0)
+
+    def test_partition(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_loc = os.path.join(tmp_dir, "blocks.file")
+            with open(input_loc, "w") as f:
+                f.writelines(self.lines)
+            loads = partition([input_loc], 3, 0.8, min_tokens=1, max_tokens=10000, output_dir=tmp_dir,
+                              window_size=150)
+            written = []
+            for node in range(1, 4):
+                with open(os.path.join(tmp_dir, "query_%s.file" % node)) as f:
+                    node_lines = f.readlines()
+                self.assertEqual(len(node_lines), loads[node - 1].blocks)
+                written += node_lines
+            # every block is assigned once
+            self.assertEqual(sorted(written), sorted(self.lines))
+            # LPT keeps predicted costs close: a node gets at most one window's most expensive block more
+            costs = [load.cost for load in loads]
+            self.assertLess(max(costs) / (sum(costs) / len(costs)), 1.1)
+            with open(os.path.join(tmp_dir, "partition_report.json")) as f:
+                report = json.load(f)
+            self.assertEqual([node["blocks"] for node in report["nodes"]], [load.blocks for load in loads])
+            self.assertNotIn("locality", report)
+
+    def _model(self):
+        model = CostModel(threshold=0.8, shards=[65, 100], min_tokens=1, max_tokens=10000)
+        for line in self.lines:
+            model.add(parse_block(line))
+        return model
+
+    def test_order_key(self):
+        model = CostModel(threshold=0.8, shards=[65, 100], min_tokens=1, max_tokens=10000)
+        blocks = {name: parse_block(_line(i, tokens)) for i, (name, tokens) in enumerate([
+            ("small_rare", {"rare": 10, "common": 10}), ("small_common", {"common": 20}),
+            ("small_bigger", {"common": 12, "rare": 12}), ("medium", {"rare": 80}), ("large", {"common": 200})])}
+        for block in blocks.values():
+            model.add(block)
+        keys = {name: model.order_key(block) for name, block in blocks.items()}
+        self.assertEqual([keys[name][0] for name in ["small_rare", "medium", "large"]], [0, 1, 2])
+        # sizes 20 and 24 are in neighbouring bands of ratio 1 / 0.8
+        self.assertEqual((keys["small_rare"][1], keys["small_bigger"][1]), (13, 14))
+        # in the same shard & band queries are grouped by their rarest token, the rarest first
+        self.assertEqual(keys["small_rare"][2:4], (3, "rare"))
+        self.assertEqual(keys["small_common"][2:4], (4, "common"))
+        self.assertEqual(sorted(blocks, key=keys.get), ["small_rare", "small_common", "small_bigger", "medium",
+                                                        "large"])
+
+    def test_external_order(self):
+        model = self._model()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            query_loc = os.path.join(tmp_dir, "query_1.file")
+            with open(query_loc, "w") as f:
+                f.writelines(self.lines)
+            # many runs merged at once give the same order as a stable sort in memory
+            self.assertEqual(order_queries(query_loc, model, run_size=7), -(-len(self.lines) // 7))
+            with open(query_loc) as f:
+                ordered = f.readlines()
+            self.assertEqual(ordered, sorted(self.lines, key=lambda line: model.order_key(parse_block(line))))
+            self.assertEqual(os.listdir(tmp_dir), ["query_1.file"])
+
+    def test_ordered_partition(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_loc = os.path.join(tmp_dir, "blocks.file")
+            with open(input_loc, "w") as f:
+                f.writelines(self.lines)
+            os.makedirs(os.path.join(tmp_dir, "plain"))
+            os.makedirs(os.path.join(tmp_dir, "ordered"))
+            partition([input_loc], 2, 0.8, min_tokens=1, max_tokens=10000, output_dir=os.path.join(tmp_dir, "plain"))
+            partition([input_loc], 2, 0.8, min_tokens=1, max_tokens=10000, output_dir=os.path.join(tmp_dir, "ordered"),
+                      order=True, measure_locality=True)
+            for node in [1, 2]:
+                with open(os.path.join(tmp_dir, "plain", "query_%s.file" % node)) as f:
+                    plain = f.readlines()
+                with open(os.path.join(tmp_dir, "ordered", "query_%s.file" % node)) as f:
+                    ordered = f.readlines()
+                # ordering changes only the order of lines of a node
+                self.assertEqual(Counter(ordered), Counter(plain))
+                self.assertNotEqual(ordered, plain)
+            with open(os.path.join(tmp_dir, "ordered", "partition_report.json")) as f:
+                self.assertIn("locality", json.load(f))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Client of the resident search service (`SearchManager serve`, started by `controller.py --serve`).
+
+The service loads the installed index once and listens on a local port written to `search_service.port`.
+Query blocks (lines of tokens files) are sent in batches, an empty line ends a batch; clone pairs of the batch
+(`proj_id1,block_id1,proj_id2,block_id2`) are streamed back while the batch is searched, `#end <queries>` closes them.
+Every query is searched against the whole index and only the indexed block with the query's own id is skipped:
+an indexed block sent as a query gets all its clones except itself, a new block must have an id that is not in the
+index (otherwise it is never paired with that block).
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+
+PORT_FILE_NAME = "search_service.port"
+END_OF_BATCH = "#end"
+SHUTDOWN_COMMAND = "#shutdown"
+
+
+def full_file_path(string):
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), string)
+
+
+def read_port(root: Optional[str] = None) -> Optional[int]:
+    """
+    Port of the running service.
+    :param root: clone-detector directory, directory of this script by default.
+    :return: port, None if the service is not started (or is still loading the index).
+    """
+    port_loc = os.path.join(root or full_file_path(""), PORT_FILE_NAME)
+    if not os.path.isfile(port_loc):
+        return None
+    with open(port_loc, encoding="utf-8") as f:
+        content = f.read().strip()
+    return int(content) if content.isdigit() else None
+
+
+def wait_for_port(root: Optional[str] = None, timeout: float = 600, is_alive=lambda: True) -> int:
+    """
+    Wait until the service loads the index and starts listening.
+    :param root: clone-detector directory, directory of this script by default.
+    :param timeout: seconds to wait.
+    :param is_alive: function that returns False if the service process exited.
+    :return: port.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        port = read_port(root)
+        if port is not None:
+            return port
+        if not is_alive():
+            raise RuntimeError("search service exited before it started listening")
+        time.sleep(0.5)
+    raise TimeoutError("search service didn't start in {} seconds".format(timeout))
+
+
+class SearchClient:
+    """
+    Connection to the search service, batches are searched one after another over the same connection.
+    """
+
+    def __init__(self, port: Optional[int] = None, root: Optional[str] = None, timeout: Optional[float] = None):
+        port = port or read_port(root)
+        if port is None:
+            raise ConnectionError("search service is not running, start it with `controller.py --serve`")
+        self.sock = socket.create_connection(("127.0.0.1", port), timeout=timeout)
+        self.reader = self.sock.makefile("r", encoding="utf-8", newline="\n")
+        self.writer = self.sock.makefile("w", encoding="utf-8", newline="\n")
+
+    def search(self, query_lines: Iterable[str]) -> Iterator[str]:
+        """
+        Search a batch of query blocks.
+        :param query_lines: lines of tokens files.
+        :return: iterator of clone pairs, pairs are yielded as soon as the service finds them.
+        """
+        errors = []
+
+        # pairs are read while queries are sent, otherwise both sides can block on full socket buffers
+        def send():
+            try:
+                for line in query_lines:
+                    line = line.rstrip("\n")
+                    if line.strip():
+                        self.writer.write(line + "\n")
+                self.writer.write("\n")
+                self.writer.flush()
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append(e)
+                self.sock.shutdown(socket.SHUT_RDWR)
+
+        sender = threading.Thread(target=send, daemon=True)
+        sender.start()
+        for line in self.reader:
+            line = line.rstrip("\n")
+            if line.startswith(END_OF_BATCH):
+                break
+            if line:
+                yield line
+        else:
+            sender.join()
+            raise ConnectionError("search service closed the connection: {}".format(errors[0] if errors else ""))
+        sender.join()
+
+    def shutdown(self) -> None:
+        """ Stop the service """
+        self.writer.write(SHUTDOWN_COMMAND + "\n")
+        self.writer.flush()
+        self.close()
+
+    def close(self) -> None:
+        for stream in [self.writer, self.reader]:
+            try:
+                stream.close()
+            except OSError:
+                pass
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("query_files", nargs="*", help="Tokens files to search, stdin if not given.")
+    parser.add_argument("--root", default=None, help="clone-detector directory, directory of this script by default.")
+    parser.add_argument("-p", "--port", type=int, default=None, help="Service port, read from search_service.port "
+                                                                      "by default.")
+    parser.add_argument("--shutdown", action="store_true", help="Stop the service.")
+    args = parser.parse_args()
+
+    with SearchClient(args.port, args.root) as client:
+        if args.shutdown:
+            client.shutdown()
+            sys.exit(0)
+        started = time.time()
+        n_pairs = 0
+        for query_file in args.query_files or ["-"]:
+            with (open(query_file, encoding="utf-8") if query_file != "-" else sys.stdin) as f:
+                for pair in client.search(f):
+                    print(pair)
+                    n_pairs += 1
+        print("{} pairs in {:.3f} s".format(n_pairs, time.time() - started), file=sys.stderr)
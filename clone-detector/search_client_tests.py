@@ -0,0 +1,113 @@
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+from search_client import END_OF_BATCH, PORT_FILE_NAME, SHUTDOWN_COMMAND, SearchClient, read_port, wait_for_port
+
+PAIRS_PER_QUERY = 3
+
+
+class _StubService:
+    """
+    Single-threaded service with the protocol of `SearchService`: every query gets PAIRS_PER_QUERY pairs, written
+    before the next query is read - like the service, it blocks if the client doesn't read while sending.
+    """
+
+    def __init__(self, root):
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(1)
+        self.port_loc = os.path.join(root, PORT_FILE_NAME)
+        self.batches = []
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        with open(self.port_loc, "w") as f:
+            f.write("%s\n" % self.sock.getsockname()[1])
+
+    def serve(self):
+        running = True
+        while running:
+            conn, _ = self.sock.accept()
+            reader, writer = conn.makefile("r", encoding="utf-8"), conn.makefile("w", encoding="utf-8")
+            queries = 0
+            for line in reader:
+                line = line.rstrip("\n")
+                if line == SHUTDOWN_COMMAND:
+                    running = False
+                    break
+                if not line:
+                    writer.write("%s %s\n" % (END_OF_BATCH, queries))
+                    writer.flush()
+                    self.batches.append(queries)
+                    queries = 0
+                    continue
+                if line == "disconnect":
+                    break
+                queries += 1
+                proj_id, block_id = line.split(",")[:2]
+                for i in range(PAIRS_PER_QUERY):
+                    writer.write("%s,%s,9,%s\n" % (proj_id, block_id, i))
+                writer.flush()
+            # the socket is closed when its files are closed too
+            reader.close()
+            writer.close()
+            conn.close()
+        self.sock.close()
+        os.remove(self.port_loc)
+
+
+class TestSearchClient(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.root = self.tmp_dir.name
+
+    def _start(self):
+        service = _StubService(self.root)
+        service.start()
+        return service
+
+    def test_port(self):
+        self.assertIsNone(read_port(self.root))
+        with self.assertRaises(RuntimeError):
+            wait_for_port(self.root, timeout=5, is_alive=lambda: False)
+        with self.assertRaises(TimeoutError):
+            wait_for_port(self.root, timeout=0.1)
+        with self.assertRaises(ConnectionError):
+            SearchClient(root=self.root)
+        service = self._start()
+        self.assertEqual(wait_for_port(self.root, timeout=5), service.sock.getsockname()[1])
+        SearchClient(root=self.root).shutdown()
+        service.thread.join(5)
+        self.assertIsNone(read_port(self.root))
+
+    def test_batches(self):
+        service = self._start()
+        with SearchClient(root=self.root, timeout=30) as client:
+            # empty lines are not sent - they would end the batch
+            pairs = list(client.search(["1,10,5,2,h@#@a@@::@@5\n", "\n", "1,11,5,2,h@#@a@@::@@5"]))
+            self.assertEqual(pairs, ["1,10,9,0", "1,10,9,1", "1,10,9,2", "1,11,9,0", "1,11,9,1", "1,11,9,2"])
+            self.assertEqual(list(client.search([])), [])
+            # pairs are read while queries are sent: the batch is bigger than socket buffers in both directions
+            n_queries = 50000
+            queries = ("1,%s,5,2,h@#@%s@@::@@5" % (i, "x" * 100) for i in range(n_queries))
+            self.assertEqual(sum(1 for _ in client.search(queries)), n_queries * PAIRS_PER_QUERY)
+            client.shutdown()
+        service.thread.join(5)
+        self.assertEqual(service.batches, [2, 0, n_queries])
+
+    def test_closed_connection(self):
+        service = self._start()
+        with SearchClient(root=self.root, timeout=30) as client:
+            with self.assertRaises(ConnectionError):
+                list(client.search(["1,10,5,2,h@#@a@@::@@5", "disconnect"]))
+        SearchClient(root=self.root).shutdown()
+        service.thread.join(5)
+
+
+if __name__ == "__main__":
+    unittest.main()
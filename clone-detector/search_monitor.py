@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Live progress of SourcererCC search nodes.
+
+Node logs (SCC_LOGS/NODE_<i>/scc.log) are tailed incrementally, only new bytes are read on every refresh:
+* `NODE_<i> RL <line>, file <id>, <n> tokens in <t> micros` - query line processed;
+* `NODE_<i>, num candidates: <n>, ...` - candidates of a query;
+* `NODE_<i> CloneReporter, ClonePair ...` - reported clone pair.
+Rates (queries/s, candidates/s, pairs/s) are computed over a sliding window of log timestamps, ETA of a node is
+the remaining query cost (tokens of unprocessed query lines) divided by the current token rate.
+A node that has not logged progress for `--stall` seconds is flagged as stalled.
+The snapshot is shown as a refreshing terminal view and can be saved as JSON (read by `controller.py`)
+and as a Prometheus textfile (node_exporter textfile collector).
+"""
+import argparse
+import collections
+import datetime as dt
+import json
+import os
+import re
+import sys
+import time
+
+WINDOW_SECONDS = 60
+STALL_SECONDS = 300
+READ_SIZE = 1 << 20
+
+RL_RE = re.compile(r" RL (\d+), file [^,]*, (\d+) tokens")
+CANDIDATES_RE = re.compile(r", num candidates: (\d+)")
+PAIR_MARKER = " CloneReporter, ClonePair "
+# log4j pattern `%d ...` - `2020-01-31 12:34:56,789`
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# node states
+NOT_STARTED = "not started"
+RUNNING = "running"
+STALLED = "stalled"
+DONE = "done"
+
+
+def root_path(string=""):
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), string)
+
+
+def scan_query_files(query_dir):
+    """
+    Count lines and tokens (cost of a query) in node's query files.
+    :param query_dir: NODE_<i>/query directory.
+    :return: number of lines and total number of tokens.
+    """
+    lines, tokens = 0, 0
+    if not os.path.isdir(query_dir):
+        return lines, tokens
+    for name in sorted(os.listdir(query_dir)):
+        with open(os.path.join(query_dir, name), "rb") as f:
+            for line in f:
+                lines += 1
+                parts = line[:64].split(b",", 3)
+                if len(parts) > 2 and parts[2].isdigit():
+                    tokens += int(parts[2])
+    return lines, tokens
+
+
+class LogTail(object):
+    """
+    Incremental reader of a growing log file, rotation (file replaced or truncated) restarts from the beginning.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.inode = None
+        self.rest = b""
+
+    def read_lines(self):
+        """ Iterate over complete lines appended since the previous call """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.inode, self.offset, self.rest = stat.st_ino, 0, b""
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            while self.offset < stat.st_size:
+                data = f.read(min(READ_SIZE, stat.st_size - self.offset))
+                if not data:
+                    break
+                self.offset += len(data)
+                lines = (self.rest + data).split(b"\n")
+                self.rest = lines.pop()
+                for line in lines:
+                    yield line.decode("utf-8", errors="replace")
+
+
+class NodeProgress(object):
+    """
+    Counters of a single node and a sliding window of samples for rates.
+    """
+
+    def __init__(self, node, root_dir, window=WINDOW_SECONDS):
+        self.node = node
+        self.name = "NODE_{}".format(node)
+        self.root_dir = root_dir
+        self.window = window
+        self.tail = LogTail(os.path.join(root_dir, "SCC_LOGS", self.name, "scc.log"))
+        self.query_dir = os.path.join(root_dir, self.name, "query")
+        self.query_mtime = None
+        self.total_lines, self.total_tokens = 0, 0
+        self.processed = 0
+        self.queries = 0
+        self.tokens = 0
+        self.candidates = 0
+        self.pairs = 0
+        self.last_log_time = None
+        self.last_progress = None  # wall clock time of the last new progress
+        # (log time, queries, tokens, candidates, pairs)
+        self.samples = collections.deque()
+        self._time_cache = (None, None)
+
+    def _parse_time(self, line):
+        stamp = line[:19]
+        if stamp != self._time_cache[0]:
+            try:
+                self._time_cache = (stamp, dt.datetime.strptime(stamp, TIMESTAMP_FORMAT).timestamp())
+            except ValueError:
+                return None
+        return self._time_cache[1]
+
+    def update(self, now):
+        try:
+            mtime = os.path.getmtime(self.query_dir)
+        except OSError:
+            mtime = None
+        if mtime != self.query_mtime:
+            self.query_mtime = mtime
+            self.total_lines, self.total_tokens = scan_query_files(self.query_dir)
+
+        updated = False
+        for line in self.tail.read_lines():
+            if " RL " in line:
+                match = RL_RE.search(line)
+                if not match:
+                    continue
+                self.processed = max(self.processed, int(match.group(1)) + 1)
+                self.queries += 1
+                self.tokens += int(match.group(2))
+            elif PAIR_MARKER in line:
+                self.pairs += 1
+            elif "num candidates: " in line:
+                match = CANDIDATES_RE.search(line)
+                if not match:
+                    continue
+                self.candidates += int(match.group(1))
+            else:
+                continue
+            updated = True
+            log_time = self._parse_time(line)
+            if log_time is not None:
+                self.last_log_time = log_time
+                self._add_sample(log_time)
+        if updated:
+            self.last_progress = now
+        self.processed = max(self.processed, self._checkpoint())
+
+    def _checkpoint(self):
+        processed = 0
+        output_dirs = [name for name in os.listdir(os.path.join(self.root_dir, self.name))
+                       if name.startswith("output")] if os.path.isdir(os.path.join(self.root_dir, self.name)) else []
+        for name in output_dirs:
+            recovery_loc = os.path.join(self.root_dir, self.name, name, "recovery.txt")
+            if os.path.isfile(recovery_loc):
+                with open(recovery_loc, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip().isdigit():
+                            processed = max(processed, int(line.strip()))
+        return processed
+
+    def _add_sample(self, log_time):
+        sample = (log_time, self.queries, self.tokens, self.candidates, self.pairs)
+        if self.samples and self.samples[-1][0] == log_time:
+            self.samples[-1] = sample
+        else:
+            self.samples.append(sample)
+        while len(self.samples) > 2 and self.samples[0][0] < log_time - self.window:
+            self.samples.popleft()
+
+    def rates(self):
+        """ queries/s, tokens/s, candidates/s, pairs/s over the window """
+        if len(self.samples) < 2:
+            return 0.0, 0.0, 0.0, 0.0
+        first, last = self.samples[0], self.samples[-1]
+        elapsed = max(last[0] - first[0], 1e-9)
+        return tuple((last[i] - first[i]) / elapsed for i in range(1, 5))
+
+    def snapshot(self, now, completed, stall_seconds):
+        queries_rate, tokens_rate, candidates_rate, pairs_rate = self.rates()
+        remaining_lines = max(self.total_lines - self.processed, 0)
+        remaining_tokens = self.total_tokens * remaining_lines / self.total_lines if self.total_lines else 0
+        if completed or (self.total_lines and remaining_lines == 0):
+            status, eta = DONE, 0.0
+        elif self.last_progress is None and not self.processed:
+            status, eta = NOT_STARTED, None
+        else:
+            last_activity = self.last_log_time if self.last_log_time is not None else self.last_progress
+            idle = now - last_activity if last_activity is not None else None
+            status = STALLED if idle is None or idle > stall_seconds else RUNNING
+            eta = remaining_tokens / tokens_rate if tokens_rate > 0 else None
+        return collections.OrderedDict([
+            ("node", self.name), ("status", status), ("processed", self.processed), ("total", self.total_lines),
+            ("progress", self.processed / self.total_lines if self.total_lines else 0.0),
+            ("candidates", self.candidates), ("pairs", self.pairs),
+            ("queries_per_sec", queries_rate), ("candidates_per_sec", candidates_rate), ("pairs_per_sec", pairs_rate),
+            ("tokens_per_sec", tokens_rate), ("remaining_tokens", remaining_tokens), ("eta_seconds", eta),
+            ("last_log_time", self.last_log_time),
+        ])
+
+
+class SearchMonitor(object):
+    def __init__(self, root_dir=None, num_nodes=None, window=WINDOW_SECONDS, stall_seconds=STALL_SECONDS):
+        self.root_dir = root_dir or root_path()
+        self.num_nodes = num_nodes
+        self.window = window
+        self.stall_seconds = stall_seconds
+        self.nodes = {}
+
+    def _num_nodes(self):
+        if self.num_nodes:
+            return self.num_nodes
+        try:
+            with open(os.path.join(self.root_dir, "search_metadata.txt"), encoding="utf-8") as f:
+                return int(f.readline())
+        except (OSError, ValueError):
+            return 0
+
+    def _completed_nodes(self):
+        try:
+            with open(os.path.join(self.root_dir, "nodes_completed.txt"), encoding="utf-8") as f:
+                return {line.strip() for line in f if line.strip()}
+        except OSError:
+            return set()
+
+    def refresh(self):
+        """
+        Read new log lines of all nodes.
+        :return: snapshot - per-node and aggregate progress as a dictionary.
+        """
+        now = time.time()
+        completed = self._completed_nodes()
+        for node in range(1, self._num_nodes() + 1):
+            if node not in self.nodes:
+                self.nodes[node] = NodeProgress(node, self.root_dir, self.window)
+            self.nodes[node].update(now)
+        nodes = [self.nodes[node].snapshot(now, "NODE_{}".format(node) in completed, self.stall_seconds)
+                 for node in sorted(self.nodes)]
+        etas = [node["eta_seconds"] for node in nodes if node["status"] != DONE]
+        total = collections.OrderedDict([
+            ("processed", sum(node["processed"] for node in nodes)), ("total", sum(node["total"] for node in nodes)),
+            ("candidates", sum(node["candidates"] for node in nodes)), ("pairs", sum(node["pairs"] for node in nodes)),
+            ("queries_per_sec", sum(node["queries_per_sec"] for node in nodes)),
+            ("candidates_per_sec", sum(node["candidates_per_sec"] for node in nodes)),
+            ("pairs_per_sec", sum(node["pairs_per_sec"] for node in nodes)),
+            # nodes work in parallel - search ends with the slowest node
+            ("eta_seconds", None if None in etas else max(etas, default=0.0)),
+            ("nodes_done", sum(1 for node in nodes if node["status"] == DONE)),
+            ("stalled", [node["node"] for node in nodes if node["status"] == STALLED]),
+        ])
+        total["progress"] = total["processed"] / total["total"] if total["total"] else 0.0
+        return collections.OrderedDict([("time", now), ("nodes", nodes), ("total", total)])
+
+
+def _format_eta(seconds):
+    if seconds is None:
+        return "?"
+    return str(dt.timedelta(seconds=int(seconds)))
+
+
+def render(snapshot):
+    """
+    Format snapshot as a text table.
+    :param snapshot: result of `SearchMonitor.refresh`.
+    :return: text.
+    """
+    row = "{:<9} {:<12} {:>23} {:>9} {:>12} {:>10} {:>12}"
+    lines = [row.format("node", "status", "processed", "queries/s", "candidates/s", "pairs/s", "ETA")]
+    total = dict(snapshot["total"], node="total", status="{} done".format(snapshot["total"]["nodes_done"]))
+    for node in snapshot["nodes"] + [total]:
+        lines.append(row.format(node["node"], node["status"],
+                                "{}/{} ({:.1%})".format(node["processed"], node["total"], node["progress"]),
+                                "{:.1f}".format(node["queries_per_sec"]), "{:.1f}".format(node["candidates_per_sec"]),
+                                "{:.1f}".format(node["pairs_per_sec"]), _format_eta(node["eta_seconds"])))
+    if snapshot["total"]["stalled"]:
+        lines.append("stalled nodes: " + ", ".join(snapshot["total"]["stalled"]))
+    return "\n".join(lines)
+
+
+def _write_atomic(path, content):
+    tmp_loc = path + ".tmp"
+    with open(tmp_loc, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_loc, path)
+
+
+def write_json(snapshot, path):
+    _write_atomic(path, json.dumps(snapshot, indent=2))
+
+
+def write_prometheus(snapshot, path):
+    """
+    Save snapshot in Prometheus text exposition format.
+    :param snapshot: result of `SearchMonitor.refresh`.
+    :param path: path to `.prom` file.
+    :return: None.
+    """
+    metrics = [
+        ("scc_queries_processed", "processed", "Query lines processed by node."),
+        ("scc_queries_total", "total", "Query lines assigned to node."),
+        ("scc_candidates", "candidates", "Candidates found by node."),
+        ("scc_pairs", "pairs", "Clone pairs reported by node."),
+        ("scc_queries_per_second", "queries_per_sec", "Queries processed per second."),
+        ("scc_candidates_per_second", "candidates_per_sec", "Candidates found per second."),
+        ("scc_pairs_per_second", "pairs_per_sec", "Clone pairs reported per second."),
+        ("scc_eta_seconds", "eta_seconds", "Estimated time to finish the node, -1 if unknown."),
+    ]
+    lines = []
+    for metric, key, description in metrics:
+        lines.append("# HELP {} {}".format(metric, description))
+        lines.append("# TYPE {} gauge".format(metric))
+        for node in snapshot["nodes"]:
+            value = node[key]
+            lines.append('{}{{node="{}"}} {}'.format(metric, node["node"], -1 if value is None else value))
+    lines.append("# HELP scc_node_stalled 1 if node has not logged progress for too long.")
+    lines.append("# TYPE scc_node_stalled gauge")
+    for node in snapshot["nodes"]:
+        lines.append('scc_node_stalled{{node="{}"}} {}'.format(node["node"], int(node["status"] == STALLED)))
+    _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def load_status(path):
+    """
+    Read snapshot saved with `--json`.
+    :param path: path to JSON file.
+    :return: snapshot or None if there is no snapshot yet.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", default=None, help="clone-detector directory, directory of this script by default.")
+    parser.add_argument("-n", "--nodes", type=int, default=None,
+                        help="Number of nodes, read from search_metadata.txt by default.")
+    parser.add_argument("-i", "--interval", type=float, default=5, help="Refresh interval in seconds.")
+    parser.add_argument("--window", type=float, default=WINDOW_SECONDS, help="Window for rates in seconds.")
+    parser.add_argument("--stall", type=float, default=STALL_SECONDS,
+                        help="Node is stalled if there is no progress for this number of seconds.")
+    parser.add_argument("--json", default=None, help="Save snapshot as JSON to this file.")
+    parser.add_argument("--prom", default=None, help="Save snapshot as Prometheus textfile to this file.")
+    parser.add_argument("--once", action="store_true", help="Print a single snapshot and exit.")
+    args = parser.parse_args()
+
+    monitor = SearchMonitor(args.root, args.nodes, window=args.window, stall_seconds=args.stall)
+    try:
+        while True:
+            status = monitor.refresh()
+            if args.json:
+                write_json(status, args.json)
+            if args.prom:
+                write_prometheus(status, args.prom)
+            if args.once:
+                print(render(status))
+                break
+            # clear terminal & move cursor home
+            sys.stdout.write("\033[2J\033[H" + time.strftime("%H:%M:%S") + "\n" + render(status) + "\n")
+            sys.stdout.flush()
+            if status["nodes"] and status["total"]["nodes_done"] == len(status["nodes"]):
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,110 @@
+import datetime as dt
+import os
+import tempfile
+import unittest
+
+from search_monitor import DONE, NOT_STARTED, RUNNING, STALLED, LogTail, NodeProgress, SearchMonitor, \
+    TIMESTAMP_FORMAT, render, scan_query_files, write_prometheus
+
+START = dt.datetime(2020, 1, 31, 12, 0, 0)
+
+
+def _log_line(seconds, message):
+    stamp = (START + dt.timedelta(seconds=seconds)).strftime(TIMESTAMP_FORMAT)
+    return "{},123 [main] INFO  {}\n".format(stamp, message)
+
+
+def _query(line_id, tokens):
+    return "1,{},{},1,hash@#@a@@::@@{}\n".format(line_id, tokens, tokens)
+
+
+class TestSearchMonitor(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+        for node in [1, 2]:
+            os.makedirs(os.path.join(self.root, "NODE_%s" % node, "query"))
+            os.makedirs(os.path.join(self.root, "SCC_LOGS", "NODE_%s" % node))
+            with open(os.path.join(self.root, "NODE_%s" % node, "query", "query_%s.file" % node), "w") as f:
+                f.writelines(_query(i, 100) for i in range(10))
+        with open(os.path.join(self.root, "search_metadata.txt"), "w") as f:
+            f.write("2\n")
+        self.log_loc = os.path.join(self.root, "SCC_LOGS", "NODE_1", "scc.log")
+        # NODE_1 processes a query of 100 tokens every 2 seconds
+        with open(self.log_loc, "w") as f:
+            for i in range(4):
+                f.write(_log_line(2 * i, "NODE_1, num candidates: 7, map: 1"))
+                f.write(_log_line(2 * i, "NODE_1 CloneReporter, ClonePair 1,2,1,3"))
+                f.write(_log_line(2 * i, "NODE_1 RL {}, file 1, 100 tokens in 5 micros".format(i)))
+        self.last_log_time = (START + dt.timedelta(seconds=6)).timestamp()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_scan_query_files(self):
+        self.assertEqual(scan_query_files(os.path.join(self.root, "NODE_1", "query")), (10, 1000))
+        self.assertEqual(scan_query_files(os.path.join(self.root, "missing")), (0, 0))
+
+    def test_log_tail(self):
+        tail = LogTail(self.log_loc)
+        self.assertEqual(len(list(tail.read_lines())), 12)
+        self.assertEqual(list(tail.read_lines()), [])
+        with open(self.log_loc, "a") as f:
+            f.write("complete\npartial")
+        self.assertEqual(list(tail.read_lines()), ["complete"])
+        with open(self.log_loc, "a") as f:
+            f.write(" line\n")
+        self.assertEqual(list(tail.read_lines()), ["partial line"])
+        # truncated log is read from the beginning
+        with open(self.log_loc, "w") as f:
+            f.write("new\n")
+        self.assertEqual(list(tail.read_lines()), ["new"])
+
+    def test_progress_and_eta(self):
+        node = NodeProgress(1, self.root)
+        node.update(self.last_log_time)
+        self.assertEqual((node.processed, node.queries, node.tokens, node.candidates, node.pairs), (4, 4, 400, 28, 4))
+        queries_rate, tokens_rate, candidates_rate, pairs_rate = node.rates()
+        self.assertAlmostEqual(queries_rate, 0.5)
+        self.assertAlmostEqual(tokens_rate, 50.0)
+        snapshot = node.snapshot(self.last_log_time + 1, completed=False, stall_seconds=60)
+        self.assertEqual(snapshot["status"], RUNNING)
+        self.assertEqual((snapshot["processed"], snapshot["total"]), (4, 10))
+        # 6 query lines of 100 tokens left at 50 tokens per second
+        self.assertAlmostEqual(snapshot["remaining_tokens"], 600)
+        self.assertAlmostEqual(snapshot["eta_seconds"], 12)
+
+    def test_stall_and_done(self):
+        node = NodeProgress(1, self.root)
+        node.update(self.last_log_time)
+        self.assertEqual(node.snapshot(self.last_log_time + 61, completed=False, stall_seconds=60)["status"], STALLED)
+        self.assertEqual(node.snapshot(self.last_log_time + 61, completed=True, stall_seconds=60)["status"], DONE)
+        # recovery checkpoint of the node counts as processed
+        os.makedirs(os.path.join(self.root, "NODE_1", "output8.0"))
+        with open(os.path.join(self.root, "NODE_1", "output8.0", "recovery.txt"), "w") as f:
+            f.write("10\n")
+        node.update(self.last_log_time)
+        snapshot = node.snapshot(self.last_log_time + 61, completed=False, stall_seconds=60)
+        self.assertEqual((snapshot["status"], snapshot["eta_seconds"]), (DONE, 0.0))
+
+    def test_monitor(self):
+        with open(os.path.join(self.root, "nodes_completed.txt"), "w") as f:
+            f.write("NODE_1\n")
+        snapshot = SearchMonitor(self.root, stall_seconds=60).refresh()
+        self.assertEqual([node["status"] for node in snapshot["nodes"]], [DONE, NOT_STARTED])
+        self.assertEqual(snapshot["total"]["nodes_done"], 1)
+        self.assertEqual((snapshot["total"]["processed"], snapshot["total"]["total"]), (4, 20))
+        # a node that has not started has no ETA
+        self.assertIsNone(snapshot["total"]["eta_seconds"])
+        self.assertIn("NODE_2", render(snapshot))
+        prom_loc = os.path.join(self.root, "scc.prom")
+        write_prometheus(snapshot, prom_loc)
+        with open(prom_loc) as f:
+            metrics = f.read()
+        self.assertIn('scc_queries_processed{node="NODE_1"} 4\n', metrics)
+        self.assertIn('scc_eta_seconds{node="NODE_2"} -1\n', metrics)
+        self.assertIn('scc_node_stalled{node="NODE_1"} 0\n', metrics)
+
+
+if __name__ == "__main__":
+    unittest.main()
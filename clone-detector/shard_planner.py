@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Choose SHARD_MAX_NUM_TOKENS for the corpus instead of hard-coded boundaries.
+
+A shard receives queries of size [low, high] (size - total number of tokens) and indexes every block that can be
+their clone - sizes [ceil(th * low), floor(high / th)], so neighbouring shards index overlapping blocks.
+For every shard two costs are estimated from the histogram of block sizes:
+* index size - number of tokens indexed in the shard (relative to the whole corpus);
+* candidate work - every query of the shard is searched in the shard index: queries * indexed blocks
+  (relative to searching all queries in a single index).
+Boundaries are selected with dynamic programming so that the most expensive shard (index size + candidate work)
+is as cheap as possible, so blocks are spread between shards even if the corpus is dominated by one size range.
+The histogram is read from tokenizer output (`total_tokens` field of every block) or from a `size,count` CSV.
+"""
+import argparse
+import bisect
+import math
+import os
+import re
+from typing import Dict, List, Tuple
+
+# SourcererCC default - used when there is no data
+DEFAULT_BOUNDARIES = [65, 100, 300, 500000]
+DEFAULT_N_SHARDS = 5
+MAX_CUT_POINTS = 256
+
+
+def read_token_histogram(tokens_loc: str, min_tokens: int = 0, max_tokens: int = None) -> Dict[int, int]:
+    """
+    Count blocks of every size in tokenizer output.
+    :param tokens_loc: tokens file or folder with tokens files (`proj_id,block_id,total_tokens,...@#@tokens`).
+    :param min_tokens: smaller blocks are ignored by SourcererCC.
+    :param max_tokens: bigger blocks are ignored by SourcererCC, if None - no upper bound.
+    :return: histogram {size: number of blocks}.
+    """
+    paths = [tokens_loc]
+    if os.path.isdir(tokens_loc):
+        paths = [os.path.join(tokens_loc, name) for name in sorted(os.listdir(tokens_loc))
+                 if os.path.isfile(os.path.join(tokens_loc, name))]
+    histogram = {}
+    for path in paths:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                header = line.split("@#@", 1)[0].split(",", 3)
+                if len(header) < 3:
+                    continue
+                size = int(header[2])
+                if size >= min_tokens and (max_tokens is None or size <= max_tokens):
+                    histogram[size] = histogram.get(size, 0) + 1
+    return histogram
+
+
+def read_histogram_csv(histogram_loc: str) -> Dict[int, int]:
+    """
+    Read histogram saved as `size,count` lines (header is optional).
+    :param histogram_loc: path to CSV file.
+    :return: histogram {size: number of blocks}.
+    """
+    histogram = {}
+    with open(histogram_loc, encoding="utf-8") as f:
+        for line in f:
+            parts = line.strip().split(",")
+            if len(parts) == 2 and parts[0].isdigit():
+                histogram[int(parts[0])] = histogram.get(int(parts[0]), 0) + int(parts[1])
+    return histogram
+
+
+class _Histogram:
+    """ Prefix sums over sorted sizes to count blocks & tokens in a size range in O(log n) """
+
+    def __init__(self, histogram: Dict[int, int]):
+        self.sizes = sorted(histogram)
+        self.blocks = [0]
+        self.tokens = [0]
+        for size in self.sizes:
+            self.blocks.append(self.blocks[-1] + histogram[size])
+            self.tokens.append(self.tokens[-1] + histogram[size] * size)
+
+    def range(self, low: float, high: float) -> Tuple[int, int]:
+        """ Number of blocks and tokens with size in [low, high] """
+        start = bisect.bisect_left(self.sizes, low)
+        end = bisect.bisect_right(self.sizes, high)
+        return self.blocks[end] - self.blocks[start], self.tokens[end] - self.tokens[start]
+
+
+def shard_costs(histogram: Dict[int, int], boundaries: List[int], threshold: float) -> List[float]:
+    """
+    Estimated cost of every shard for given boundaries.
+    :param histogram: {size: number of blocks}.
+    :param boundaries: SHARD_MAX_NUM_TOKENS values.
+    :param threshold: similarity threshold in range 0~1.
+    :return: list of shard costs (the last shard covers sizes above the last boundary).
+    """
+    hist = _Histogram(histogram)
+    if not hist.sizes:
+        return []
+    ranges = []
+    low = hist.sizes[0]
+    for high in boundaries:
+        ranges.append((low, high))
+        low = high + 1
+    ranges.append((low, hist.sizes[-1]))
+    return [_shard_cost(hist, low, high, threshold) for low, high in ranges]
+
+
+def _shard_cost(hist: _Histogram, low: int, high: int, threshold: float, query_hist: _Histogram = None) -> float:
+    # queries come from a separate set in versus mode, the dataset is searched against itself otherwise
+    query_hist = query_hist or hist
+    total_blocks, total_tokens = hist.blocks[-1], hist.tokens[-1]
+    queries, _ = query_hist.range(low, high)
+    indexed_blocks, indexed_tokens = hist.range(math.ceil(threshold * low), math.floor(high / threshold))
+    return indexed_tokens / max(total_tokens, 1) + \
+        queries * indexed_blocks / (max(query_hist.blocks[-1], 1) * max(total_blocks, 1))
+
+
+def plan_shard_boundaries(histogram: Dict[int, int], threshold: float, n_shards: int = DEFAULT_N_SHARDS,
+                          query_histogram: Dict[int, int] = None) -> List[int]:
+    """
+    Select shard boundaries that minimize the cost of the most expensive shard.
+    :param histogram: {size: number of blocks}.
+    :param threshold: similarity threshold, 0.8 or 8 as passed to SourcererCC scripts.
+    :param n_shards: number of shards, SourcererCC creates one shard more than the number of boundaries.
+    :param query_histogram: {size: number of queries} if queries are not the indexed blocks (versus mode).
+    :return: SHARD_MAX_NUM_TOKENS values (increasing), default boundaries if histogram is empty.
+    """
+    threshold = threshold / 10 if threshold > 1 else threshold
+    query_hist = None
+    if query_histogram is not None:
+        # cut points should cover sizes of both sets
+        query_hist = _Histogram(query_histogram)
+        histogram = dict(histogram)
+        for size in query_histogram:
+            histogram.setdefault(size, 0)
+    hist = _Histogram(histogram)
+    if not hist.sizes:
+        return list(DEFAULT_BOUNDARIES)
+    if len(hist.sizes) == 1:
+        return [hist.sizes[0]]
+
+    # candidate cut points: shard i ends at sizes[cuts[j]], quantiles are used for big histograms
+    n_sizes = len(hist.sizes)
+    if n_sizes <= MAX_CUT_POINTS:
+        cuts = list(range(n_sizes))
+    else:
+        total = hist.blocks[-1]
+        cuts = sorted({bisect.bisect_left(hist.blocks, total * q / MAX_CUT_POINTS, 1) - 1
+                       for q in range(1, MAX_CUT_POINTS + 1)} | {n_sizes - 1})
+    n_shards = max(1, min(n_shards, len(cuts)))
+
+    def cost(start_cut: int, end_cut: int) -> float:
+        # shard with sizes (sizes[cuts[start_cut]], sizes[cuts[end_cut]]], start_cut == -1 - from the smallest size
+        low = hist.sizes[0] if start_cut < 0 else hist.sizes[cuts[start_cut]] + 1
+        return _shard_cost(hist, low, hist.sizes[cuts[end_cut]], threshold, query_hist)
+
+    # best[k][j] - minimal max cost of k + 1 shards covering sizes up to cuts[j]
+    n_cuts = len(cuts)
+    best = [[cost(-1, j) for j in range(n_cuts)]]
+    prev = [[-1] * n_cuts]
+    for k in range(1, n_shards):
+        row, row_prev = [math.inf] * n_cuts, [-1] * n_cuts
+        for j in range(k, n_cuts):
+            for i in range(k - 1, j):
+                value = max(best[k - 1][i], cost(i, j))
+                if value < row[j]:
+                    row[j], row_prev[j] = value, i
+        best.append(row)
+        prev.append(row_prev)
+
+    # last shard always ends at the biggest size, boundaries are the ends of the other shards
+    k = min(range(n_shards), key=lambda k: (best[k][n_cuts - 1], k))
+    boundaries = []
+    j = n_cuts - 1
+    while k > 0:
+        j = prev[k][j]
+        boundaries.append(hist.sizes[cuts[j]])
+        k -= 1
+    boundaries.reverse()
+    # SourcererCC needs at least one boundary
+    return boundaries or [hist.sizes[-1]]
+
+
+def write_shard_boundaries(properties_loc: str, boundaries: List[int]) -> None:
+    """
+    Replace SHARD_MAX_NUM_TOKENS (or `{SHARD_MAX_NUM_TOKENS}` placeholder) in properties file.
+    :param properties_loc: path to sourcerer-cc.properties.
+    :param boundaries: shard boundaries.
+    :return: None.
+    """
+    with open(properties_loc, encoding="utf-8") as f:
+        content = f.read()
+    value = ",".join(str(boundary) for boundary in boundaries)
+    content = content.replace("{SHARD_MAX_NUM_TOKENS}", value)
+    content = re.sub(r"^SHARD_MAX_NUM_TOKENS=.*$", "SHARD_MAX_NUM_TOKENS=" + value, content, flags=re.MULTILINE)
+    with open(properties_loc, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--tokens", help="Tokens file or folder (tokenizer output / blocks.file).")
+    source.add_argument("--histogram", help="CSV with `size,count` lines.")
+    parser.add_argument("-t", "--threshold", type=float, default=8,
+                        help="Similarity threshold, 0.8 or 8 as passed to SourcererCC scripts.")
+    parser.add_argument("-n", "--shards", type=int, default=DEFAULT_N_SHARDS, help="Maximum number of shards.")
+    parser.add_argument("--min-tokens", type=int, default=0, help="MIN_TOKENS of SourcererCC.")
+    parser.add_argument("--max-tokens", type=int, default=None, help="MAX_TOKENS of SourcererCC.")
+    parser.add_argument("-p", "--properties", default=None, help="sourcerer-cc.properties to update.")
+    args = parser.parse_args()
+
+    if args.tokens:
+        size_histogram = read_token_histogram(args.tokens, args.min_tokens, args.max_tokens)
+    else:
+        size_histogram = read_histogram_csv(args.histogram)
+    th = args.threshold / 10 if args.threshold > 1 else args.threshold
+    shard_boundaries = plan_shard_boundaries(size_histogram, args.threshold, args.shards)
+    print("SHARD_MAX_NUM_TOKENS={}".format(",".join(map(str, shard_boundaries))))
+    print("estimated shard costs: planned {}, default {}".format(
+        ", ".join("{:.3f}".format(c) for c in shard_costs(size_histogram, shard_boundaries, th)),
+        ", ".join("{:.3f}".format(c) for c in shard_costs(size_histogram, DEFAULT_BOUNDARIES, th))))
+    if args.properties:
+        write_shard_boundaries(args.properties, shard_boundaries)
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+from itertools import combinations
+
+from shard_planner import DEFAULT_BOUNDARIES, plan_shard_boundaries, read_histogram_csv, read_token_histogram, \
+    shard_costs, write_shard_boundaries
+
+
+class TestShardPlanner(unittest.TestCase):
+    histogram = {20: 500, 25: 300, 40: 200, 70: 120, 100: 60, 160: 30, 300: 10, 900: 3, 2000: 1}
+
+    def _brute_force(self, n_shards, threshold):
+        sizes = sorted(self.histogram)
+        best = min(max(shard_costs(self.histogram, list(boundaries) or [sizes[-1]], threshold))
+                   for k in range(n_shards) for boundaries in combinations(sizes[:-1], k))
+        return best
+
+    def test_plan_is_optimal(self):
+        for n_shards in [1, 2, 3, 5]:
+            boundaries = plan_shard_boundaries(self.histogram, 8, n_shards)
+            self.assertEqual(boundaries, sorted(boundaries))
+            self.assertLessEqual(len(boundaries), max(n_shards - 1, 1))
+            self.assertAlmostEqual(max(shard_costs(self.histogram, boundaries, 0.8)), self._brute_force(n_shards, 0.8))
+
+    def test_plan_beats_default(self):
+        boundaries = plan_shard_boundaries(self.histogram, 0.8, len(DEFAULT_BOUNDARIES) + 1)
+        self.assertLessEqual(max(shard_costs(self.histogram, boundaries, 0.8)),
+                             max(shard_costs(self.histogram, DEFAULT_BOUNDARIES, 0.8)))
+
+    def test_degenerate_histograms(self):
+        self.assertEqual(plan_shard_boundaries({}, 0.8), DEFAULT_BOUNDARIES)
+        self.assertEqual(plan_shard_boundaries({50: 10}, 0.8), [50])
+        self.assertEqual(shard_costs({}, [10], 0.8), [])
+
+    def test_shard_costs(self):
+        costs = shard_costs(self.histogram, [40, 300], 0.8)
+        self.assertEqual(len(costs), 3)
+        # a single shard indexes all tokens and compares every query with every block
+        self.assertEqual(shard_costs(self.histogram, [], 0.8), [2.0])
+        # more shards index some blocks twice but compare fewer pairs
+        self.assertLess(max(costs), 2.0)
+
+    def test_read_and_write(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tokens_dir = os.path.join(tmp_dir, "tokens")
+            os.mkdir(tokens_dir)
+            with open(os.path.join(tokens_dir, "1.tokens"), "w") as f:
+                f.write("1,10,5,2,h@#@a@@::@@3,b@@::@@2\n1,11,70,1,h@#@a@@::@@70\n")
+            with open(os.path.join(tokens_dir, "2.tokens"), "w") as f:
+                f.write("2,12,70,1,h@#@c@@::@@70\n")
+            self.assertEqual(read_token_histogram(tokens_dir), {5: 1, 70: 2})
+            self.assertEqual(read_token_histogram(tokens_dir, min_tokens=10), {70: 2})
+            self.assertEqual(read_token_histogram(tokens_dir, max_tokens=10), {5: 1})
+
+            csv_loc = os.path.join(tmp_dir, "histogram.csv")
+            with open(csv_loc, "w") as f:
+                f.write("size,count\n5,1\n70,2\n70,1\n")
+            self.assertEqual(read_histogram_csv(csv_loc), {5: 1, 70: 3})
+
+            properties_loc = os.path.join(tmp_dir, "sourcerer-cc.properties")
+            with open(properties_loc, "w") as f:
+                f.write("MIN_TOKENS=65\nSHARD_MAX_NUM_TOKENS={SHARD_MAX_NUM_TOKENS}\n")
+            write_shard_boundaries(properties_loc, [70, 200])
+            write_shard_boundaries(properties_loc, [80, 300])
+            with open(properties_loc) as f:
+                self.assertEqual(f.read(), "MIN_TOKENS=65\nSHARD_MAX_NUM_TOKENS=80,300\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -28,6 +28,9 @@ public class IndexMerger {
     private List<FSDirectory> forwardIndexDirectories;
     public static String SHARD_STRING = "shards";
     public static File[] nodeDirs;
+    // append node indexes to the installed index instead of replacing it
+    // (incremental runs index only new blocks)
+    public static boolean APPEND = false;
     private static final Logger logger = LogManager.getLogger(IndexMerger.class);
     public IndexMerger() {
         super();
@@ -76,7 +79,7 @@ public class IndexMerger {
                 Version.LUCENE_46);
         IndexWriterConfig indexWriterConfig = new IndexWriterConfig(
                 Version.LUCENE_46, whitespaceAnalyzer);
-        indexWriterConfig.setOpenMode(OpenMode.CREATE);
+        indexWriterConfig.setOpenMode(IndexMerger.APPEND ? OpenMode.CREATE_OR_APPEND : OpenMode.CREATE);
         TieredMergePolicy mergePolicy = (TieredMergePolicy) indexWriterConfig
                 .getMergePolicy();
 
@@ -90,7 +93,10 @@ public class IndexMerger {
                     .toArray(new FSDirectory[this.invertedIndexDirectories
                             .size()]);
             indexWriter.addIndexes(dirs);
-            indexWriter.forceMerge(1);
+            // merging appended segments into one would rewrite the whole index
+            if (!IndexMerger.APPEND) {
+                indexWriter.forceMerge(1);
+            }
         } catch (Exception e) {
             e.printStackTrace();
         } finally {
@@ -104,7 +110,7 @@ public class IndexMerger {
         KeywordAnalyzer keywordAnalyzer = new KeywordAnalyzer();
         IndexWriterConfig fwdIndexWriterConfig = new IndexWriterConfig(
                 Version.LUCENE_46, keywordAnalyzer);
-        fwdIndexWriterConfig.setOpenMode(OpenMode.CREATE);
+        fwdIndexWriterConfig.setOpenMode(IndexMerger.APPEND ? OpenMode.CREATE_OR_APPEND : OpenMode.CREATE);
         TieredMergePolicy fwdmergePolicy = (TieredMergePolicy) fwdIndexWriterConfig
                 .getMergePolicy();
 
@@ -119,7 +125,9 @@ public class IndexMerger {
                     .toArray(new FSDirectory[this.forwardIndexDirectories
                             .size()]);
             indexWriter.addIndexes(dirs);
-            indexWriter.forceMerge(1);
+            if (!IndexMerger.APPEND) {
+                indexWriter.forceMerge(1);
+            }
 
         } catch (Exception e) {
             e.printStackTrace();
@@ -133,7 +141,8 @@ public class IndexMerger {
     }
 
     public static void populateNodeDirs() {
-        File currentDir = new File(System.getProperty("user.dir"));
+        File currentDir = new File(SearchManager.ROOT_DIR.isEmpty() ? System.getProperty("user.dir")
+                : SearchManager.ROOT_DIR);
         IndexMerger.nodeDirs = currentDir.listFiles(new FileFilter() {
             @Override
             public boolean accept(File pathname) {
@@ -148,6 +157,9 @@ public class IndexMerger {
         IndexMerger indexMerger = new IndexMerger();
         EProperties properties = new EProperties();
         FileInputStream fis = null;
+        // index directories in Util are resolved against the root dir
+        SearchManager.ROOT_DIR = System.getProperty("properties.rootDir", "");
+        IndexMerger.APPEND = Boolean.parseBoolean(System.getProperty("indexMerger.append", "false"));
         IndexMerger.populateNodeDirs();
         logger.info("reading Q values from properties file");
         String propertiesPath = System.getProperty("properties.location");
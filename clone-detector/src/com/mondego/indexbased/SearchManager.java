@@ -66,6 +66,8 @@ public class SearchManager {
     private static final String ACTION_INIT = "init";
     public final static String ACTION_INDEX = "index";
     public final static String ACTION_SEARCH = "search";
+    // search queries received over a local socket, see SearchService
+    public final static String ACTION_SERVE = "serve";
 
     private long timeSpentInProcessResult = 0;
     public static long timeSpentInSearchingCandidates = 0;
@@ -106,6 +108,11 @@ public class SearchManager {
     public static String NODE_PREFIX;
     public static String OUTPUT_DIR;
     public static int LOG_PROCESSED_LINENUMBER_AFTER_X_LINES;
+    // all-to-all search keeps only candidates with smaller ids to report every pair once,
+    // disabled when queries and indexed blocks are disjoint sets (versus mode)
+    public static boolean FILTER_CANDIDATES_BY_ID = true;
+    // add similarity of every pair (overlap / size of the larger block) as the 5th field of results
+    public static boolean REPORT_SIMILARITY = false;
     public static Map<String, Long> globalWordFreqMap = new HashMap<String, Long>();
     public static List<Shard> shards;
     public Set<Long> completedQueries;
@@ -146,7 +153,7 @@ public class SearchManager {
             e.printStackTrace();
             System.exit(1);
         }
-        if (SearchManager.ACTION.equals(ACTION_SEARCH)) {
+        if (SearchManager.ACTION.equals(ACTION_SEARCH) || SearchManager.ACTION.equals(ACTION_SERVE)) {
             SearchManager.completedNodes = SearchManager.ROOT_DIR + "nodes_completed.txt";
             this.completedQueries = new HashSet<Long>();
 
@@ -268,6 +275,8 @@ public class SearchManager {
         SearchManager.QUERY_DIR_PATH = SearchManager.ROOT_DIR + getProperty("QUERY_DIR_PATH");
         System.out.println("[DEBUG] " + "Query path:" + SearchManager.QUERY_DIR_PATH);
         SearchManager.LOG_PROCESSED_LINENUMBER_AFTER_X_LINES = Integer.parseInt(getProperty("LOG_PROCESSED_LINENUMBER_AFTER_X_LINES", "1000"));
+        SearchManager.FILTER_CANDIDATES_BY_ID = Boolean.parseBoolean(getProperty("FILTER_CANDIDATES_BY_ID", "true"));
+        SearchManager.REPORT_SIMILARITY = Boolean.parseBoolean(getProperty("REPORT_SIMILARITY", "false"));
         theInstance = new SearchManager(params);
 
         System.out.println("[DEBUG] " + SearchManager.NODE_PREFIX + " MAX_TOKENS=" + max_tokens + " MIN_TOKENS=" + min_tokens);
@@ -330,6 +339,19 @@ public class SearchManager {
                     }
                 }
             }
+        } else if (SearchManager.ACTION.equalsIgnoreCase(ACTION_SERVE)) {
+            theInstance.initSearchEnv();
+            // queries are not read from files, nothing to recover
+            theInstance.appendToExistingFile = false;
+            // queries are looked up in the whole index, an indexed query gets all its clones except itself
+            SearchManager.FILTER_CANDIDATES_BY_ID = false;
+            int port = args.length > 2 ? Integer.parseInt(args[2]) : 0;
+            new SearchService(port).serve();
+            SearchManager.queryLineQueue.shutdown();
+            SearchManager.queryBlockQueue.shutdown();
+            SearchManager.queryCandidatesQueue.shutdown();
+            SearchManager.verifyCandidateQueue.shutdown();
+            SearchManager.reportCloneQueue.shutdown();
         } else if (SearchManager.ACTION.equalsIgnoreCase(ACTION_INIT)) {
             WordFrequencyStore wfs = new WordFrequencyStore();
             wfs.populateLocalWordFreqMap();
@@ -698,7 +720,7 @@ public class SearchManager {
             SearchManager.searcher.add(new CodeSearcher(Util.INDEX_DIR + "/" + shard.getId(), "tokens"));
         }
         SearchManager.gtpmSearcher = new CodeSearcher(Util.GTPM_INDEX_DIR, "key");
-        if ("NODE_1".equals(SearchManager.NODE_PREFIX)) {
+        if ("NODE_1".equals(SearchManager.NODE_PREFIX) && SearchManager.ACTION.equals(ACTION_SEARCH)) {
             theInstance.readAndUpdateRunMetadata();
         }
     }
@@ -0,0 +1,141 @@
+package com.mondego.indexbased;
+
+import java.io.BufferedReader;
+import java.io.BufferedWriter;
+import java.io.File;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.OutputStreamWriter;
+import java.io.Writer;
+import java.net.InetAddress;
+import java.net.ServerSocket;
+import java.net.Socket;
+
+import org.apache.logging.log4j.LogManager;
+import org.apache.logging.log4j.Logger;
+
+import com.mondego.models.QueryFileProcessor;
+import com.mondego.utility.Util;
+
+/**
+ * Long-lived search over the installed index: shards and global token
+ * frequencies are loaded once, query blocks are received over a local socket.
+ *
+ * Protocol (UTF-8 lines): the client sends query blocks in the tokens file
+ * format, an empty line ends a batch. The service writes clone pairs of the
+ * batch as soon as they are validated (same format as the search output)
+ * followed by END_OF_BATCH. A connection can send any number of batches,
+ * closing the connection ends the last batch. SHUTDOWN_COMMAND stops the
+ * service. Connections are served one at a time.
+ */
+public class SearchService {
+    public static final String PORT_FILE_NAME = "search_service.port";
+    public static final String END_OF_BATCH = "#end";
+    public static final String SHUTDOWN_COMMAND = "#shutdown";
+    private static final Logger logger = LogManager.getLogger(SearchService.class);
+
+    private int port;
+    private boolean running = true;
+    private QueryFileProcessor queryFileProcessor = new QueryFileProcessor();
+
+    /**
+     * @param port port to listen on, 0 - any free port
+     */
+    public SearchService(int port) {
+        this.port = port;
+    }
+
+    public void serve() throws IOException {
+        ServerSocket serverSocket = new ServerSocket(this.port, 50, InetAddress.getLoopbackAddress());
+        try {
+            this.writePortFile(serverSocket.getLocalPort());
+            System.out.println("search service is listening on " + serverSocket.getLocalSocketAddress());
+            while (this.running) {
+                Socket socket = serverSocket.accept();
+                try {
+                    this.handle(socket);
+                } catch (IOException e) {
+                    System.out.println("[ERROR] " + "connection failed: " + e.getMessage());
+                } finally {
+                    socket.close();
+                }
+            }
+        } finally {
+            serverSocket.close();
+            new File(SearchManager.ROOT_DIR + PORT_FILE_NAME).delete();
+        }
+        System.out.println("search service stopped");
+    }
+
+    // clients find the service by this file, it appears once the index is loaded
+    private void writePortFile(int localPort) throws IOException {
+        File tmpFile = new File(SearchManager.ROOT_DIR + PORT_FILE_NAME + ".tmp");
+        Writer writer = Util.openFile(tmpFile, false);
+        Util.writeToFile(writer, localPort + "", true);
+        Util.closeOutputFile(writer);
+        if (!tmpFile.renameTo(new File(SearchManager.ROOT_DIR + PORT_FILE_NAME))) {
+            throw new IOException("can't write " + PORT_FILE_NAME);
+        }
+    }
+
+    private void handle(Socket socket) throws IOException {
+        BufferedReader reader = new BufferedReader(new InputStreamReader(socket.getInputStream(), "UTF-8"));
+        Writer writer = new BufferedWriter(new OutputStreamWriter(socket.getOutputStream(), "UTF-8"));
+        // CloneReporter writes (and flushes) every pair to this writer
+        SearchManager.clonesWriter = writer;
+        long queries = 0;
+        String line;
+        try {
+            while ((line = reader.readLine()) != null) {
+                if (line.equals(SHUTDOWN_COMMAND)) {
+                    this.running = false;
+                    break;
+                }
+                if (line.trim().isEmpty()) {
+                    this.endBatch(writer, queries);
+                    queries = 0;
+                } else if (this.search(line)) {
+                    queries++;
+                }
+            }
+            if (queries > 0) {
+                this.endBatch(writer, queries);
+            }
+        } finally {
+            // pairs of an aborted batch must not be written to the next connection
+            this.drain();
+            SearchManager.clonesWriter = null;
+        }
+    }
+
+    private boolean search(String line) {
+        String[] parts = line.split(",", 4);
+        int ntokens;
+        try {
+            ntokens = Integer.parseInt(parts[2]);
+        } catch (ArrayIndexOutOfBoundsException | NumberFormatException e) {
+            logger.error("ignoring malformed query line: " + line.substring(0, Math.min(40, line.length())));
+            return false;
+        }
+        if (ntokens > SearchManager.max_tokens) {
+            logger.debug("query " + parts[1] + " is too big, ignoring");
+            return false;
+        }
+        this.queryFileProcessor.processLine(line);
+        return true;
+    }
+
+    private void endBatch(Writer writer, long queries) {
+        this.drain();
+        Util.writeToFile(writer, END_OF_BATCH + " " + queries, true);
+        logger.debug("batch of " + queries + " queries completed");
+    }
+
+    private void drain() {
+        SearchManager.queryLineQueue.awaitIdle();
+        SearchManager.queryBlockQueue.awaitIdle();
+        SearchManager.queryCandidatesQueue.awaitIdle();
+        SearchManager.verifyCandidateQueue.awaitIdle();
+        SearchManager.reportCloneQueue.awaitIdle();
+    }
+}
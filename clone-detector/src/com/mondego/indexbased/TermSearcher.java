@@ -75,7 +75,11 @@ public class TermSearcher {
                                         // Get rid of these early -- we're only
                                         // looking for candidates
                                         // whose ids are smaller than the query
-                                        if (candidateId >= this.queryId) {
+                                        // without the id filter (versus & incremental search) the
+                                        // query can still be indexed itself
+                                        if (SearchManager.FILTER_CANDIDATES_BY_ID
+                                                ? candidateId >= this.queryId
+                                                : candidateId == this.queryId) {
                                             // System.out.println("Query " +
                                             // this.queryId +
                                             // ", getting rid of " +
@@ -5,6 +5,7 @@ public class ClonePair {
     public long cid;
     public long q_pid; // parent id of query
     public long c_pid; // parent id of candidate
+    public String similarity; // reported only if REPORT_SIMILARITY is set
 
     public ClonePair(long q_pid, long qid, long candidate_pid, long candidateId) {
         super();
@@ -16,6 +17,7 @@ public class ClonePair {
 
     @Override
     public String toString() {
-        return q_pid+","+qid+","+c_pid+","+cid;
+        String pair = q_pid+","+qid+","+c_pid+","+cid;
+        return this.similarity == null ? pair : pair+","+this.similarity;
     }
 }
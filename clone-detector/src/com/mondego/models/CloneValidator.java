@@ -46,6 +46,9 @@ public class CloneValidator implements IListener, Runnable {
             int similarity = this.updateSimilarity(candidatePair.queryBlock, candidatePair.candidateTokens, candidatePair.computedThreshold, candidatePair.candidateSize, candidatePair.simInfo);
             if (similarity > 0) {
                 com.mondego.models.ClonePair cp = new ClonePair(candidatePair.queryBlock.getFunctionId(), candidatePair.queryBlock.getId(), candidatePair.functionIdCandidate, candidatePair.candidateId);
+                if (SearchManager.REPORT_SIMILARITY) {
+                    cp.similarity = Util.formatSimilarity(similarity, Math.max(candidatePair.queryBlock.getSize(), candidatePair.candidateSize));
+                }
                 long estimatedTime = System.nanoTime() - startTime;
                 logger.debug(SearchManager.NODE_PREFIX + " CloneValidator, QueryBlock " + candidatePair + " in " + estimatedTime/1000 + " micros");
                 SearchManager.reportCloneQueue.send(cp);
@@ -58,6 +61,7 @@ public class CloneValidator implements IListener, Runnable {
     private int updateSimilarity(QueryBlock queryBlock, String tokens, int computedThreshold, int candidateSize, CandidateSimInfo simInfo) {
         int tokensSeenInCandidate = 0;
         int similarity = simInfo.similarity;
+        boolean reached = false;
         Scanner scanner = new Scanner(tokens);
         try {
             scanner.useDelimiter("::");
@@ -87,7 +91,11 @@ public class CloneValidator implements IListener, Runnable {
                             similarity = updateSimilarityHelper(simInfo, tokenInfo, similarity, candidatesTokenFreq);
                         }
                         if (similarity >= computedThreshold) {
-                            return similarity;
+                            // the full overlap is needed to report similarity, otherwise the pair is already a clone
+                            if (!SearchManager.REPORT_SIMILARITY) {
+                                return similarity;
+                            }
+                            reached = true;
                         }
                     }
                 } else {
@@ -101,7 +109,7 @@ public class CloneValidator implements IListener, Runnable {
         } finally {
             scanner.close();
         }
-        return -1;
+        return reached ? similarity : -1;
     }
 
     private int updateSimilarityHelper(CandidateSimInfo simInfo, TokenInfo tokenInfo, int similarity, int candidatesTokenFreq) {
@@ -6,6 +6,7 @@ import java.util.concurrent.Executors;
 import java.util.concurrent.TimeUnit;
 import java.util.concurrent.Semaphore;
 import java.util.concurrent.RejectedExecutionException;
+import java.util.concurrent.atomic.AtomicLong;
 
 import org.apache.logging.log4j.LogManager;
 import org.apache.logging.log4j.Logger;
@@ -14,6 +15,8 @@ public class ThreadedChannel<E> {
     private ExecutorService executor;
     private Class<Runnable> workerType;
     private Semaphore semaphore;
+    // messages sent to the channel and not processed yet
+    private final AtomicLong pending = new AtomicLong();
     private static final Logger logger = LogManager.getLogger(ThreadedChannel.class);
 
     public ThreadedChannel(int nThreads, Class clazz) {
@@ -33,6 +36,7 @@ public class ThreadedChannel<E> {
             logger.error("Caught interrupted exception " + ex);
         }
 
+        pending.incrementAndGet();
         try {
             executor.execute(new Runnable() {
                 public void run() {
@@ -40,11 +44,40 @@ public class ThreadedChannel<E> {
                         o.run();
                     } finally {
                         semaphore.release();
+                        done();
                     }
                 }
             });
         } catch (RejectedExecutionException ex) {
             semaphore.release();
+            done();
+        }
+    }
+
+    private void done() {
+        if (pending.decrementAndGet() == 0) {
+            synchronized (pending) {
+                pending.notifyAll();
+            }
+        }
+    }
+
+    /**
+     * waits until all messages sent so far are processed, the channel stays open.
+     * Workers send to the next channel before they finish, so awaiting channels
+     * in pipeline order drains the whole pipeline.
+     */
+    public void awaitIdle() {
+        synchronized (pending) {
+            while (pending.get() > 0) {
+                try {
+                    pending.wait();
+                } catch (InterruptedException e) {
+                    logger.error("Caught interrupted exception " + e);
+                    Thread.currentThread().interrupt();
+                    return;
+                }
+            }
         }
     }
 
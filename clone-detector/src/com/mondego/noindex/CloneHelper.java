@@ -234,6 +234,16 @@ public class CloneHelper {
                         logger.error("blocks found in fwdIndex while parsing query: " + blocks.size());
                     }
                 } else {
+                    // queries that are not indexed (versus mode, search service) carry their own tokens
+                    Bag bag = this.deserialise(s);
+                    if (null != bag && !bag.isEmpty()) {
+                        Util.sortBag(bag);
+                        for (TokenFrequency tokenFrequency : bag) {
+                            listOfTokens.add(new AbstractMap.SimpleEntry<String, TokenInfo>(
+                                    tokenFrequency.getToken().getValue(), new TokenInfo(tokenFrequency.getFrequency())));
+                        }
+                        return queryBlock;
+                    }
                     logger.warn("warning! " + bagId + " not in fwdindex, cant get query string");
                 }
             }
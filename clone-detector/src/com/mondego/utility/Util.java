@@ -19,6 +19,7 @@ import java.util.Comparator;
 import java.util.HashMap;
 import java.util.LinkedHashMap;
 import java.util.List;
+import java.util.Locale;
 import java.util.Map;
 import java.util.Map.Entry;
 import java.util.Random;
@@ -181,6 +182,17 @@ public class Util {
         return computedThreshold <= similarity + Math.min(querySize - termsSeenInQueryBlock, candidateSize - termsSeenInCandidate);
     }
 
+    /**
+     * Similarity of a clone pair with 4 digits, rounded down so that it never exceeds the real one.
+     * @param overlap number of shared tokens
+     * @param size size of the larger block
+     */
+    public static String formatSimilarity(int overlap, int size) {
+        long scaled = overlap * 10000L / size;
+        // digits must not depend on the default locale, results are parsed as plain decimals
+        return String.format(Locale.ROOT, "%d.%04d", scaled / 10000, scaled % 10000);
+    }
+
     public static void writeJsonStream(String filename, Map<String, Integer> gtpm) {
         Writer writer = null;
         try {
@@ -11,6 +11,7 @@ ant -buildfile $rootPATH/build.xml clean cdi
 mode="${1:-search}"
 num_nodes="${2:-50}"
 threshold="{THRESHOLD_ARGUMENTS}"
+heap="{HEAP}"
 printf "\e[32m[runnodes.sh] \e[0m*****************************************************\n"
 printf "\e[32m[runnodes.sh] \e[0mrunning this script in $mode mode\n"
 printf "\e[32m[runnodes.sh] \e[0m*****************************************************\n"
@@ -23,7 +24,7 @@ rm -f "$rootPATH/nodes_completed.txt"
 
 for i in $(seq 1 1 $num_nodes)
 do
-    java -Dproperties.rootDir="$rootPATH/" -Dproperties.location="$rootPATH/NODE_$i/sourcerer-cc.properties" -Dlog4j.configurationFile="$rootPATH/NODE_$i/log4j2.xml" -Xms6g -Xmx6g -XX:+UseCompressedOops -jar $rootPATH/dist/indexbased.SearchManager.jar $mode $threshold &
+    java -Dproperties.rootDir="$rootPATH/" -Dproperties.location="$rootPATH/NODE_$i/sourcerer-cc.properties" -Dlog4j.configurationFile="$rootPATH/NODE_$i/log4j2.xml" -Xms$heap -Xmx$heap -XX:+UseCompressedOops -jar $rootPATH/dist/indexbased.SearchManager.jar $mode $threshold &
     PIDS+="$! "
 done
 printf "\e[32m[runnodes.sh] \e[0m$PIDS\n"
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Share of cloned blocks estimated from a sample of blocks, without searching the whole corpus.
+
+A block is cloned if at least one other block of the corpus is its clone at the threshold.
+Blocks are stratified by size (search cost & clone rate both depend on it, strata are size quantiles),
+every stratum gets a share of the sample proportional to its number of blocks (at least MIN_PER_STRATUM).
+Sampled blocks are searched against an in-process index of all blocks (`python_engine`), so the search time is
+proportional to the sample size; reading the tokens files is a single pass over the corpus.
+Clone rates of the corpus and of every project are stratified (domain) estimates with design weights.
+Confidence intervals are Wilson score intervals at the effective sample size: the rate's variance over its
+linearized variance (with finite population correction), capped by the Kish sample size of the domain - so a project
+whose few sampled blocks are all cloned gets a wide interval instead of a zero-width one.
+"""
+import argparse
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from tabulate import tabulate
+
+from python_engine import Blocks, read_blocks, search, select_blocks
+
+DEFAULT_SAMPLE_SIZE = 2000
+DEFAULT_STRATA = 8
+# variance of a stratum needs 2 sampled blocks
+MIN_PER_STRATUM = 2
+# two-sided normal quantiles of supported confidence levels
+Z_SCORES = {0.9: 1.6449, 0.95: 1.96, 0.99: 2.5758}
+
+DensityEstimate = namedtuple("DensityEstimate", ["rate", "low", "high", "blocks", "sampled"])
+DensitySample = namedtuple("DensitySample", ["rows", "strata", "cloned"])
+
+
+def stratify(sizes: np.ndarray, n_strata: int) -> np.ndarray:
+    """
+    Size strata of blocks: quantiles of sizes, blocks of the same size are in the same stratum.
+    :param sizes: sizes of blocks.
+    :param n_strata: maximum number of strata.
+    :return: stratum of every block, strata are numbered from 0 without gaps.
+    """
+    if len(sizes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ordered = np.sort(sizes)
+    positions = np.ceil(np.linspace(0, 1, n_strata + 1)[1:-1] * (len(ordered) - 1)).astype(np.int64)
+    edges = np.unique(ordered[positions])
+    _, strata = np.unique(np.searchsorted(edges, sizes, side="right"), return_inverse=True)
+    return strata.reshape(-1)
+
+
+def allocate(stratum_sizes: np.ndarray, sample_size: int, min_per_stratum: int = MIN_PER_STRATUM) -> np.ndarray:
+    """
+    Proportional allocation of the sample to strata.
+    :param stratum_sizes: number of blocks in every stratum.
+    :param sample_size: total sample size.
+    :param min_per_stratum: minimum sample of a stratum (smaller strata are sampled completely), it is taken
+                            before the proportional share if the sample is too small for both.
+    :return: sample size of every stratum.
+    """
+    if sample_size >= int(stratum_sizes.sum()):
+        return stratum_sizes.copy()
+    allocation = np.minimum(stratum_sizes, min_per_stratum)
+    spare = sample_size - int(allocation.sum())
+    if spare <= 0:
+        return allocation
+    # the rest of the sample is proportional to the blocks left in strata, the largest remainders get the blocks
+    # lost by rounding
+    shares = (stratum_sizes - allocation) * spare / int((stratum_sizes - allocation).sum())
+    extra = np.floor(shares).astype(np.int64)
+    for stratum in np.argsort(extra - shares, kind="stable")[:spare - int(extra.sum())]:
+        extra[stratum] += 1
+    return allocation + extra
+
+
+def sample_cloned(blocks: Blocks, threshold: float, sample_size: int, n_strata: int = DEFAULT_STRATA,
+                  seed: int = 0) -> DensitySample:
+    """
+    Search a stratified sample of blocks against all blocks.
+    :param blocks: all blocks.
+    :param threshold: similarity threshold.
+    :param sample_size: number of sampled blocks.
+    :param n_strata: number of size strata.
+    :param seed: seed of the sample.
+    :return: sampled rows, strata of all blocks & whether every sampled block is cloned.
+    """
+    strata = stratify(blocks.sizes, n_strata)
+    stratum_sizes = np.bincount(strata)
+    allocation = allocate(stratum_sizes, sample_size)
+    rnd = np.random.RandomState(seed)
+    rows = np.concatenate([np.zeros(0, dtype=np.int64)] +
+                          [rnd.choice(np.flatnonzero(strata == stratum), size=n, replace=False)
+                           for stratum, n in enumerate(allocation)])
+    cloned_ids = set()
+    for pair in search(blocks, select_blocks(blocks, rows), threshold):
+        _, block_id1, _, block_id2 = pair.split(",", 3)
+        # every sampled block finds itself
+        if block_id1 != block_id2:
+            cloned_ids.add(int(block_id1))
+    cloned = np.array([block_id in cloned_ids for block_id in blocks.block_ids[rows].tolist()], dtype=bool)
+    return DensitySample(rows=rows, strata=strata, cloned=cloned)
+
+
+def estimate_rate(sample: DensitySample, domain: np.ndarray, confidence: float = 0.95) -> DensityEstimate:
+    """
+    Stratified estimate of the share of cloned blocks in a domain (all blocks or blocks of a project).
+    :param sample: sample searched by `sample_cloned`.
+    :param domain: boolean mask over all blocks.
+    :param confidence: confidence level of the interval, one of Z_SCORES.
+    :return: estimate with confidence interval.
+    """
+    stratum_sizes = np.bincount(sample.strata)
+    sampled_strata = sample.strata[sample.rows]
+    sampled_sizes = np.bincount(sampled_strata, minlength=len(stratum_sizes))
+    weights = stratum_sizes[sampled_strata] / sampled_sizes[sampled_strata]
+    in_domain = domain[sample.rows]
+    blocks, sampled = int(domain.sum()), int(in_domain.sum())
+    if sampled == 0:
+        return DensityEstimate(rate=None, low=None, high=None, blocks=blocks, sampled=0)
+    domain_weight = float((weights * in_domain).sum())
+    rate = float((weights * in_domain * sample.cloned).sum()) / domain_weight
+    # linearized variance of the ratio, strata are sampled without replacement
+    residuals = weights * in_domain * (sample.cloned - rate)
+    variance = 0.0
+    for stratum in np.flatnonzero(sampled_sizes > 1):
+        values = residuals[sampled_strata == stratum]
+        n = len(values)
+        fpc = 1 - n / stratum_sizes[stratum]
+        variance += fpc * n / (n - 1) * float(((values - values.mean()) ** 2).sum())
+    variance /= domain_weight ** 2
+    # Kish effective sample size: strata with one sampled block & domains where all sampled blocks have the same
+    # outcome give no variance, the design weights still bound the information in the sample
+    domain_weights = weights[in_domain]
+    n_effective = float(domain_weights.sum()) ** 2 / float((domain_weights ** 2).sum())
+    fpc = 1 - sampled / blocks
+    n_effective = n_effective / fpc if fpc > 0 else float("inf")
+    if variance > 0:
+        n_effective = min(n_effective, rate * (1 - rate) / variance)
+    low, high = wilson_interval(rate, n_effective, Z_SCORES[confidence])
+    return DensityEstimate(rate=rate, low=low, high=high, blocks=blocks, sampled=sampled)
+
+
+def wilson_interval(rate: float, n: float, z: float) -> Tuple[float, float]:
+    """
+    Wilson score interval of a proportion.
+    :param rate: estimated proportion.
+    :param n: (effective) sample size, infinite for a census.
+    :param z: normal quantile of the confidence level.
+    :return: lower & upper bound.
+    """
+    if n == float("inf"):
+        return rate, rate
+    denominator = 1 + z ** 2 / n
+    center = (rate + z ** 2 / (2 * n)) / denominator
+    margin = z / denominator * (rate * (1 - rate) / n + z ** 2 / (4 * n ** 2)) ** 0.5
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def estimate_density(tokens_locs: List[str], threshold: float, min_tokens: int, max_tokens: int,
+                     sample_size: int = DEFAULT_SAMPLE_SIZE, n_strata: int = DEFAULT_STRATA,
+                     confidence: float = 0.95, seed: int = 0) -> Tuple[DensityEstimate, Dict[int, DensityEstimate]]:
+    """
+    Estimate the share of cloned blocks of the corpus and of every project from a sample.
+    :param tokens_locs: tokens files or folders with them.
+    :param threshold: similarity threshold (0.8 means 80%).
+    :param min_tokens: blocks with fewer tokens are ignored.
+    :param max_tokens: blocks with more tokens are ignored.
+    :param sample_size: number of sampled blocks.
+    :param n_strata: number of size strata.
+    :param confidence: confidence level of intervals, one of Z_SCORES.
+    :param seed: seed of the sample.
+    :return: estimate of the corpus & estimates of projects by project id.
+    """
+    blocks, _ = read_blocks(tokens_locs, min_tokens, max_tokens)
+    sample = sample_cloned(blocks, threshold, sample_size, n_strata, seed)
+    overall = estimate_rate(sample, np.ones(len(blocks.sizes), dtype=bool), confidence)
+    projects = {int(proj_id): estimate_rate(sample, blocks.proj_ids == proj_id, confidence)
+                for proj_id in np.unique(blocks.proj_ids)}
+    return overall, projects
+
+
+def _row(name: str, estimate: DensityEstimate) -> List:
+    if estimate.rate is None:
+        return [name, estimate.blocks, 0, "-", "-"]
+    return [name, estimate.blocks, estimate.sampled, "{:.2%}".format(estimate.rate),
+            "{:.2%} - {:.2%}".format(estimate.low, estimate.high)]
+
+
+def format_estimates(overall: DensityEstimate, projects: Dict[int, DensityEstimate], top: Optional[int] = 20) -> str:
+    """
+    Table of estimates: the corpus first, then the biggest projects.
+    :param overall: estimate of the corpus.
+    :param projects: estimates of projects.
+    :param top: number of projects in the table, all if None.
+    :return: table.
+    """
+    biggest = sorted(projects.items(), key=lambda item: (-item[1].blocks, item[0]))[:top]
+    rows = [_row("all", overall)] + [_row(str(proj_id), estimate) for proj_id, estimate in biggest]
+    return tabulate(rows, headers=["project", "blocks", "sampled", "cloned", "confidence interval"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("tokens", nargs="+", help="Tokens files or folders with them.")
+    parser.add_argument("-t", "--threshold", type=float, default=0.8, help="Similarity threshold.")
+    parser.add_argument("--min-tokens", type=int, default=65, help="Minimum number of tokens in block.")
+    parser.add_argument("--max-tokens", type=int, default=500000, help="Maximum number of tokens in block.")
+    parser.add_argument("-n", "--sample", type=int, default=DEFAULT_SAMPLE_SIZE, help="Number of sampled blocks.")
+    parser.add_argument("--strata", type=int, default=DEFAULT_STRATA, help="Number of size strata.")
+    parser.add_argument("-c", "--confidence", type=float, default=0.95, choices=sorted(Z_SCORES),
+                        help="Confidence level of intervals.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the sample.")
+    parser.add_argument("--top", type=int, default=20, help="Number of the biggest projects to print.")
+    args = parser.parse_args()
+    overall_estimate, project_estimates = estimate_density(args.tokens, args.threshold, args.min_tokens,
+                                                           args.max_tokens, args.sample, args.strata,
+                                                           args.confidence, args.seed)
+    print(format_estimates(overall_estimate, project_estimates, args.top))
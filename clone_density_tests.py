@@ -0,0 +1,87 @@
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from clone_density import DensitySample, allocate, estimate_density, estimate_rate, stratify
+from python_engine import read_blocks, search
+
+
+class TestCloneDensity(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(11)
+        base = [{"t%s" % rnd.randrange(300): rnd.randint(1, 3) for _ in range(rnd.randint(5, 60))}
+                for _ in range(150)]
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tokens_loc = os.path.join(self.tmp.name, "files-tokens-0.tokens")
+        with open(self.tokens_loc, "w") as f:
+            for block in range(1200):
+                bag = dict(base[rnd.randrange(len(base))])
+                for _ in range(rnd.randint(0, 6)):
+                    bag["t%s" % rnd.randrange(400)] = rnd.randint(1, 3)
+                tokens = ",".join("{}@@::@@{}".format(token, count) for token, count in bag.items())
+                f.write("{},{},{},{},0,hash@#@{}\n".format(block % 7, block, sum(bag.values()), len(bag), tokens))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _true_rates(self, threshold):
+        blocks, _ = read_blocks([self.tokens_loc], 1, 500000)
+        cloned = set()
+        for pair in search(blocks, None, threshold):
+            _, block_id1, _, block_id2 = pair.split(",")
+            cloned.update([int(block_id1), int(block_id2)])
+        is_cloned = np.isin(blocks.block_ids, list(cloned))
+        return is_cloned.mean(), {proj_id: is_cloned[blocks.proj_ids == proj_id].mean() for proj_id in range(7)}
+
+    def test_strata(self):
+        sizes = np.array([5, 5, 5, 5, 6, 7, 8, 100, 100, 200])
+        strata = stratify(sizes, 4)
+        self.assertEqual(len(set(strata[:4])), 1)
+        self.assertEqual(sorted(set(strata)), list(range(strata.max() + 1)))
+        self.assertTrue(np.all(np.diff(strata[np.argsort(sizes, kind="stable")]) >= 0))
+        allocation = allocate(np.array([100, 50, 3, 1]), 20)
+        self.assertEqual(allocation.tolist(), [11, 6, 2, 1])
+        self.assertEqual(allocate(np.array([4, 2]), 10).tolist(), [4, 2])
+
+    def test_estimate(self):
+        true_rate, true_projects = self._true_rates(0.8)
+        overall, projects = estimate_density([self.tokens_loc], 0.8, 1, 500000, sample_size=400, seed=3)
+        self.assertEqual((overall.blocks, overall.sampled), (1200, 400))
+        self.assertLessEqual(overall.low, true_rate)
+        self.assertLessEqual(true_rate, overall.high)
+        self.assertLess(overall.high - overall.low, 0.2)
+        self.assertEqual(sorted(projects), list(range(7)))
+        covered = sum(estimate.low <= true_projects[proj_id] <= estimate.high for proj_id, estimate in projects.items())
+        self.assertGreaterEqual(covered, 6)
+
+    def test_full_sample(self):
+        true_rate, true_projects = self._true_rates(0.7)
+        overall, projects = estimate_density([self.tokens_loc], 0.7, 1, 500000, sample_size=5000)
+        self.assertAlmostEqual(overall.rate, true_rate)
+        self.assertAlmostEqual(overall.low, overall.high)
+        for proj_id, estimate in projects.items():
+            self.assertAlmostEqual(estimate.rate, true_projects[proj_id])
+
+    def test_all_sampled_cloned(self):
+        # 2 strata of 50 blocks, 10 sampled in each; the project has 3 sampled blocks, all of them cloned
+        strata = np.repeat([0, 1], 50)
+        rows = np.concatenate([np.arange(0, 10), np.arange(50, 60)])
+        sample = DensitySample(rows=rows, strata=strata, cloned=np.arange(20) % 2 == 0)
+        domain = np.zeros(100, dtype=bool)
+        domain[[0, 2, 50]] = True
+        domain[70:90] = True
+        estimate = estimate_rate(sample, domain)
+        self.assertEqual((estimate.rate, estimate.sampled), (1.0, 3))
+        self.assertEqual(estimate.high, 1.0)
+        self.assertGreater(estimate.low, 0.0)
+        self.assertLess(estimate.low, 0.6)
+        # a bigger sample with the same outcome narrows the interval
+        domain[4:10:2] = True
+        self.assertGreater(estimate_rate(sample, domain).low, estimate.low)
+
+
+if __name__ == "__main__":
+    unittest.main()
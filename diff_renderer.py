@@ -0,0 +1,404 @@
+"""
+Fast side-by-side HTML diff for clone reports.
+
+Drop-in replacement for `difflib.HtmlDiff` that stays close to linear on large, near-identical blocks:
+* lines are interned to integers so every comparison is a single integer check (line-hash fast path);
+* common prefix/suffix is trimmed before any alignment work;
+* patience diff anchors on lines that are unique in both sides and only the gaps between anchors
+  are aligned with a bounded Myers O(ND) search;
+* intra-line highlighting is token-aware and runs the same algorithm on tokens of changed lines.
+When a block is larger than `DiffLimits.max_lines` or the alignment does not finish in `DiffLimits.timeout`
+seconds the renderer falls back to a plain side-by-side view without intra-line highlighting. The same time budget
+covers intra-line highlighting: changed lines left when it runs out are rendered without highlighting.
+"""
+from collections import namedtuple
+import bisect
+import html
+import re
+import time
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+# caps applied while rendering one diff
+# max_lines - blocks with more lines are rendered side-by-side without alignment
+# max_edit_distance - biggest edit script searched by Myers in a gap without unique anchors
+# max_inline_tokens - lines with more tokens are not highlighted token by token
+# timeout - time budget (in seconds) for alignment & intra-line highlighting of one pair of blocks
+DiffLimits = namedtuple("DiffLimits", ["max_lines", "max_edit_distance", "max_inline_tokens", "timeout"])
+DEFAULT_LIMITS = DiffLimits(max_lines=5000, max_edit_distance=1000, max_inline_tokens=500, timeout=1.0)
+
+# opcode in the same format as `difflib.SequenceMatcher.get_opcodes()`: (tag, i1, i2, j1, j2)
+Opcode = Tuple[str, int, int, int, int]
+
+TOKEN_RE = re.compile(r"\w+|\s+|[^\w\s]")
+
+
+class DiffTimeout(Exception):
+    """Raised when alignment exceeds the time budget."""
+
+
+def intern_sequences(seq1: Sequence[Hashable], seq2: Sequence[Hashable]) -> Tuple[List[int], List[int]]:
+    """
+    Replace every element with an integer id so equal elements share the same id.
+    :param seq1: first sequence (lines or tokens).
+    :param seq2: second sequence.
+    :return: 2 lists with integer ids.
+    """
+    ids = {}  # type: Dict[Hashable, int]
+    res1 = [ids.setdefault(el, len(ids)) for el in seq1]
+    res2 = [ids.setdefault(el, len(ids)) for el in seq2]
+    return res1, res2
+
+
+def _check_deadline(deadline: float) -> None:
+    if deadline is not None and time.perf_counter() > deadline:
+        raise DiffTimeout()
+
+
+def _longest_increasing_subsequence(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Patience sorting: longest subsequence of pairs (sorted by first element) increasing in the second element.
+    :param pairs: list of (index in first sequence, index in second sequence) sorted by first index.
+    :return: longest chain of pairs increasing in both indexes.
+    """
+    tails = []  # second index of the last element of the best chain of each length
+    tails_idx = []  # index in `pairs` of the last element of the best chain of each length
+    prev = [-1] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, j)
+        if pos > 0:
+            prev[k] = tails_idx[pos - 1]
+        if pos == len(tails):
+            tails.append(j)
+            tails_idx.append(k)
+        else:
+            tails[pos] = j
+            tails_idx[pos] = k
+    res = []
+    k = tails_idx[-1] if tails_idx else -1
+    while k != -1:
+        res.append(pairs[k])
+        k = prev[k]
+    res.reverse()
+    return res
+
+
+def _unique_anchors(a: List[int], b: List[int], a_lo: int, a_hi: int, b_lo: int, b_hi: int) -> List[Tuple[int, int]]:
+    """
+    Find elements which occur exactly once in both ranges and align them with patience sorting.
+    """
+    count_a = {}
+    for i in range(a_lo, a_hi):
+        count_a[a[i]] = count_a.get(a[i], 0) + 1
+    count_b = {}
+    pos_b = {}
+    for j in range(b_lo, b_hi):
+        count_b[b[j]] = count_b.get(b[j], 0) + 1
+        pos_b[b[j]] = j
+    pairs = [(i, pos_b[a[i]]) for i in range(a_lo, a_hi)
+             if count_a[a[i]] == 1 and count_b.get(a[i], 0) == 1]
+    return _longest_increasing_subsequence(pairs)
+
+
+def _myers(a: List[int], b: List[int], a_lo: int, a_hi: int, b_lo: int, b_hi: int,
+           max_edit_distance: int, deadline: float) -> List[Opcode]:
+    """
+    Greedy Myers O(ND) diff of a[a_lo:a_hi] and b[b_lo:b_hi].
+    Falls back to one `replace` opcode if the edit script is longer than max_edit_distance.
+    """
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    max_d = min(n + m, max_edit_distance)
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)
+    trace = []
+    found = False
+    for d in range(max_d + 1):
+        if d % 64 == 0:
+            _check_deadline(deadline)
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                found = True
+                break
+        if found:
+            break
+    if not found:
+        return [("replace", a_lo, a_hi, b_lo, b_hi)]
+
+    # backtrack: collect matching diagonals from the end to the beginning
+    matches = []
+    x, y = n, m
+    for d in range(len(trace) - 1, 0, -1):
+        prev_v = trace[d]  # state before step d, covers diagonals -d-1..d+1
+        k = x - y
+        if k == -d or (k != d and prev_v[k - 1 + d + 1] < prev_v[k + 1 + d + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = prev_v[prev_k + d + 1]
+        prev_y = prev_x - prev_k
+        # snake after the edit
+        start_x = prev_x if prev_k == k + 1 else prev_x + 1
+        start_y = start_x - k
+        if x > start_x:
+            matches.append((start_x, start_y, x - start_x))
+        x, y = prev_x, prev_y
+    if x > 0:
+        matches.append((0, 0, x))
+    matches.reverse()
+    return _matches_to_opcodes(matches, a_lo, b_lo, n, m)
+
+
+def _matches_to_opcodes(matches: List[Tuple[int, int, int]], a_lo: int, b_lo: int, n: int, m: int) -> List[Opcode]:
+    """
+    Convert list of matching runs (relative i, relative j, length) into opcodes.
+    """
+    opcodes = []
+    i = j = 0
+    for mi, mj, size in matches + [(n, m, 0)]:
+        if i < mi or j < mj:
+            opcodes.append(_change_opcode(a_lo + i, a_lo + mi, b_lo + j, b_lo + mj))
+        if size:
+            opcodes.append(("equal", a_lo + mi, a_lo + mi + size, b_lo + mj, b_lo + mj + size))
+        i, j = mi + size, mj + size
+    return opcodes
+
+
+def _change_opcode(a_lo: int, a_hi: int, b_lo: int, b_hi: int) -> Opcode:
+    if a_lo < a_hi and b_lo < b_hi:
+        return "replace", a_lo, a_hi, b_lo, b_hi
+    return ("delete" if a_lo < a_hi else "insert"), a_lo, a_hi, b_lo, b_hi
+
+
+def _merge_opcodes(opcodes: List[Opcode]) -> List[Opcode]:
+    """
+    Merge neighbouring opcodes: equal+equal -> equal, any mix of changes -> replace/insert/delete.
+    """
+    merged = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if i1 == i2 and j1 == j2:
+            continue
+        if merged:
+            p_tag, p_i1, p_i2, p_j1, p_j2 = merged[-1]
+            if (tag == "equal") == (p_tag == "equal"):
+                merged[-1] = ("equal", p_i1, i2, p_j1, j2) if tag == "equal" else _change_opcode(p_i1, i2, p_j1, j2)
+                continue
+        merged.append((tag, i1, i2, j1, j2))
+    return merged
+
+
+def diff_opcodes(seq1: List[int], seq2: List[int], limits: DiffLimits = DEFAULT_LIMITS,
+                 deadline: float = None) -> List[Opcode]:
+    """
+    Diff 2 sequences of interned ids.
+    :param seq1: first sequence.
+    :param seq2: second sequence.
+    :param limits: caps for alignment.
+    :param deadline: `time.perf_counter()` value after which DiffTimeout is raised. If None - no deadline.
+    :return: opcodes in `difflib` format.
+    """
+    opcodes = []
+    # explicit stack instead of recursion: big files with many anchors should not hit recursion limit
+    stack = [(0, len(seq1), 0, len(seq2))]
+    while stack:
+        a_lo, a_hi, b_lo, b_hi = stack.pop()
+        _check_deadline(deadline)
+        # common prefix & suffix
+        prefix = 0
+        while a_lo + prefix < a_hi and b_lo + prefix < b_hi and seq1[a_lo + prefix] == seq2[b_lo + prefix]:
+            prefix += 1
+        if prefix:
+            opcodes.append(("equal", a_lo, a_lo + prefix, b_lo, b_lo + prefix))
+            a_lo += prefix
+            b_lo += prefix
+        suffix = 0
+        while a_hi - suffix > a_lo and b_hi - suffix > b_lo and seq1[a_hi - suffix - 1] == seq2[b_hi - suffix - 1]:
+            suffix += 1
+        if suffix:
+            opcodes.append(("equal", a_hi - suffix, a_hi, b_hi - suffix, b_hi))
+            a_hi -= suffix
+            b_hi -= suffix
+
+        if a_lo == a_hi or b_lo == b_hi:
+            opcodes.append(_change_opcode(a_lo, a_hi, b_lo, b_hi))
+            continue
+        anchors = _unique_anchors(seq1, seq2, a_lo, a_hi, b_lo, b_hi)
+        if anchors:
+            prev_i, prev_j = a_lo, b_lo
+            for i, j in anchors:
+                stack.append((prev_i, i, prev_j, j))
+                opcodes.append(("equal", i, i + 1, j, j + 1))
+                prev_i, prev_j = i + 1, j + 1
+            stack.append((prev_i, a_hi, prev_j, b_hi))
+        else:
+            opcodes.extend(_myers(seq1, seq2, a_lo, a_hi, b_lo, b_hi, limits.max_edit_distance, deadline))
+
+    opcodes.sort(key=lambda op: (op[1], op[3], op[2], op[4]))
+    return _merge_opcodes(opcodes)
+
+
+def tokenize_line(line: str) -> List[str]:
+    """
+    Split line into identifiers/numbers, whitespace runs and single punctuation characters.
+    :param line: line of code.
+    :return: list of tokens; "".join(tokens) == line.
+    """
+    return TOKEN_RE.findall(line)
+
+
+class FastHtmlDiff:
+    """
+    Side-by-side HTML diff with the same entry point as `difflib.HtmlDiff().make_file`.
+    """
+
+    STYLES = """
+        table.diff {font-family: Courier, monospace; border: medium; border-collapse: collapse}
+        .diff_header {background-color: #e0e0e0; text-align: right; padding-right: 4px}
+        td.diff_line {white-space: pre; padding-left: 4px; padding-right: 8px}
+        .diff_add {background-color: #aaffaa}
+        .diff_chg {background-color: #ffff77}
+        .diff_sub {background-color: #ffaaaa}
+        .diff_note {font-family: sans-serif; color: #a00000}"""
+
+    TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8" />
+<title>Clone diff</title>
+<style type="text/css">%(styles)s
+</style>
+</head>
+<body>
+%(table)s
+</body>
+</html>"""
+
+    def __init__(self, limits: DiffLimits = DEFAULT_LIMITS):
+        self.limits = limits
+
+    def make_file(self, fromlines: List[str], tolines: List[str]) -> str:
+        """
+        Full HTML page with side-by-side diff.
+        :param fromlines: lines of first block.
+        :param tolines: lines of second block.
+        :return: HTML document.
+        """
+        return self.TEMPLATE % {"styles": self.STYLES, "table": self.make_table(fromlines, tolines)}
+
+    def make_table(self, fromlines: List[str], tolines: List[str]) -> str:
+        """
+        HTML table with side-by-side diff (no surrounding document).
+        :param fromlines: lines of first block.
+        :param tolines: lines of second block.
+        :return: HTML table.
+        """
+        note = ""
+        opcodes = None
+        if max(len(fromlines), len(tolines)) > self.limits.max_lines:
+            note = "Blocks have more than %s lines: alignment is disabled." % self.limits.max_lines
+        else:
+            deadline = time.perf_counter() + self.limits.timeout
+            try:
+                seq1, seq2 = intern_sequences(fromlines, tolines)
+                opcodes = diff_opcodes(seq1, seq2, self.limits, deadline)
+            except DiffTimeout:
+                note = "Diff took more than %s s: alignment is disabled." % self.limits.timeout
+                opcodes = None
+
+        rows = []
+        if opcodes is None:
+            for i in range(max(len(fromlines), len(tolines))):
+                left = fromlines[i] if i < len(fromlines) else None
+                right = tolines[i] if i < len(tolines) else None
+                rows.append(self._row(i + 1 if left is not None else None, html.escape(left or ""), "",
+                                      i + 1 if right is not None else None, html.escape(right or ""), ""))
+        else:
+            for tag, i1, i2, j1, j2 in opcodes:
+                # once the deadline passes the rest of changed rows are rendered without highlighting
+                opcode_rows, timed_out = self._rows_for_opcode(tag, i1, i2, j1, j2, fromlines, tolines, deadline)
+                rows.extend(opcode_rows)
+                if timed_out:
+                    note = "Diff took more than %s s: intra-line highlighting is partial." % self.limits.timeout
+
+        table = ['<table class="diff" cellspacing="0" cellpadding="0" rules="groups">']
+        if note:
+            table.append('<caption class="diff_note">%s</caption>' % html.escape(note))
+        table.append("<tbody>")
+        table.extend(rows)
+        table.append("</tbody></table>")
+        return "\n".join(table)
+
+    def _rows_for_opcode(self, tag: str, i1: int, i2: int, j1: int, j2: int, fromlines: List[str],
+                         tolines: List[str], deadline: float = None) -> Tuple[List[str], bool]:
+        """
+        Rows of one opcode.
+        :param deadline: `time.perf_counter()` value after which changed lines are not highlighted. If None - no
+                         deadline.
+        :return: rows & whether intra-line highlighting was skipped for some changed lines because of the deadline.
+        """
+        rows = []
+        timed_out = False
+        if tag == "equal":
+            for i, j in zip(range(i1, i2), range(j1, j2)):
+                rows.append(self._row(i + 1, html.escape(fromlines[i]), "", j + 1, html.escape(tolines[j]), ""))
+            return rows, timed_out
+        n_rows = max(i2 - i1, j2 - j1)
+        for k in range(n_rows):
+            i = i1 + k if i1 + k < i2 else None
+            j = j1 + k if j1 + k < j2 else None
+            if i is not None and j is not None:
+                left, right = None, None
+                if not timed_out:
+                    try:
+                        left, right = self._inline_diff(fromlines[i], tolines[j], deadline)
+                    except DiffTimeout:
+                        timed_out = True
+                if timed_out:
+                    left, right = html.escape(fromlines[i]), html.escape(tolines[j])
+                rows.append(self._row(i + 1, left, "diff_chg", j + 1, right, "diff_chg"))
+            elif i is not None:
+                rows.append(self._row(i + 1, html.escape(fromlines[i]), "diff_sub", None, "", ""))
+            else:
+                rows.append(self._row(None, "", "", j + 1, html.escape(tolines[j]), "diff_add"))
+        return rows, timed_out
+
+    def _inline_diff(self, line1: str, line2: str, deadline: float = None) -> Tuple[str, str]:
+        """
+        Token-level highlighting of 2 changed lines.
+        :param deadline: `time.perf_counter()` value after which DiffTimeout is raised. If None - no deadline.
+        :return: escaped HTML for both lines.
+        """
+        _check_deadline(deadline)
+        tokens1 = tokenize_line(line1)
+        tokens2 = tokenize_line(line2)
+        if max(len(tokens1), len(tokens2)) > self.limits.max_inline_tokens:
+            return html.escape(line1), html.escape(line2)
+        seq1, seq2 = intern_sequences(tokens1, tokens2)
+        left, right = [], []
+        for tag, i1, i2, j1, j2 in diff_opcodes(seq1, seq2, self.limits, deadline):
+            chunk1 = html.escape("".join(tokens1[i1:i2]))
+            chunk2 = html.escape("".join(tokens2[j1:j2]))
+            if tag == "equal":
+                left.append(chunk1)
+                right.append(chunk2)
+                continue
+            if chunk1:
+                left.append('<span class="diff_sub">%s</span>' % chunk1)
+            if chunk2:
+                right.append('<span class="diff_add">%s</span>' % chunk2)
+        return "".join(left), "".join(right)
+
+    @staticmethod
+    def _row(lineno1: int, text1: str, class1: str, lineno2: int, text2: str, class2: str) -> str:
+        return ('<tr><td class="diff_header">%s</td><td class="diff_line %s">%s</td>'
+                '<td class="diff_header">%s</td><td class="diff_line %s">%s</td></tr>') % (
+                    lineno1 or "", class1, text1, lineno2 or "", class2, text2)
@@ -0,0 +1,77 @@
+import random
+import time
+import unittest
+
+from diff_renderer import DEFAULT_LIMITS, FastHtmlDiff, diff_opcodes, intern_sequences
+
+
+def apply_opcodes(seq1, seq2, opcodes):
+    """ Rebuild seq2 from seq1 and opcodes, checking that opcodes are contiguous """
+    result = []
+    pos1, pos2 = 0, 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (pos1, pos2)
+        if tag == "equal":
+            assert seq1[i1:i2] == seq2[j1:j2]
+        result.extend(seq2[j1:j2])
+        pos1, pos2 = i2, j2
+    assert (pos1, pos2) == (len(seq1), len(seq2))
+    return result
+
+
+class TestDiffRenderer(unittest.TestCase):
+    def assert_valid_diff(self, lines1, lines2):
+        seq1, seq2 = intern_sequences(lines1, lines2)
+        opcodes = diff_opcodes(seq1, seq2)
+        self.assertEqual(apply_opcodes(lines1, lines2, opcodes), lines2)
+        return opcodes
+
+    def test_identical(self):
+        lines = ["a", "b", "c"]
+        self.assertEqual(self.assert_valid_diff(lines, lines), [("equal", 0, 3, 0, 3)])
+
+    def test_empty(self):
+        self.assertEqual(self.assert_valid_diff([], ["a"]), [("insert", 0, 0, 0, 1)])
+        self.assertEqual(self.assert_valid_diff(["a"], []), [("delete", 0, 1, 0, 0)])
+
+    def test_random_sequences(self):
+        """ Repetitive alphabet forces the Myers path instead of unique anchors """
+        rnd = random.Random(42)
+        for _ in range(500):
+            lines1 = [rnd.choice("ab{}") for _ in range(rnd.randint(0, 40))]
+            lines2 = [rnd.choice("ab{}") for _ in range(rnd.randint(0, 40))]
+            self.assert_valid_diff(lines1, lines2)
+
+    def test_large_block_fast(self):
+        lines1 = ["    value%s = compute(%s);" % (i, i) for i in range(5000)]
+        lines2 = [line + " // changed" if i % 50 == 0 else line for i, line in enumerate(lines1)]
+        start = time.perf_counter()
+        page = FastHtmlDiff().make_file(lines1, lines2)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertIn("diff_chg", page)
+
+    def test_large_changed_block_bounded(self):
+        rnd = random.Random(7)
+        lines1 = [" ".join("v%s" % rnd.randint(0, 20) for _ in range(50)) for _ in range(5000)]
+        lines2 = [" ".join("v%s" % rnd.randint(0, 20) for _ in range(50)) for _ in range(5000)]
+        limits = DEFAULT_LIMITS._replace(timeout=0.2)
+        start = time.perf_counter()
+        page = FastHtmlDiff(limits).make_file(lines1, lines2)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertIn("intra-line highlighting is partial", page)
+        self.assertEqual(page.count("<tr>"), 5000)
+
+    def test_max_lines_fallback(self):
+        limits = DEFAULT_LIMITS._replace(max_lines=10)
+        page = FastHtmlDiff(limits).make_file(["a"] * 20, ["b"] * 20)
+        self.assertIn("alignment is disabled", page)
+        self.assertNotIn('<span class="diff_', page)
+
+    def test_inline_highlight_escaped(self):
+        left, right = FastHtmlDiff()._inline_diff("if (a < b) return x;", "if (a < c) return x;")
+        self.assertEqual(left, 'if (a &lt; <span class="diff_sub">b</span>) return x;')
+        self.assertEqual(right, 'if (a &lt; <span class="diff_add">c</span>) return x;')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Exact-duplicate pre-collapse of blocks before indexing (`main.py --collapse-duplicates`).
+
+Getters, setters and boilerplate give many blocks with identical bags of tokens, every copy is indexed and searched
+and they produce a quadratic number of pairs. Tokenizer already writes the hash of the tokens of every block
+(`proj_id,block_id,total_tokens,unique_tokens,...,token_hash@#@tokens`), so duplicates are grouped by it:
+* token lines are hash-partitioned into files on disk, every partition is grouped in memory;
+* the first block of every group is its representative, only representatives are written to the collapsed tokens
+  folder that is indexed & searched;
+* the other blocks are written to the groups file as `rep_proj_id,rep_block_id,proj_id,block_id`.
+All blocks of a group share the bag, so they are clones of each other and of every clone of the representative:
+`expand_pairs` turns pairs of representatives back into concrete pairs when it is asked for.
+Blocks outside of `[min_tokens, max_tokens]` are never searched and are copied as is.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import zlib
+from collections import namedtuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from prettify_results import get_files, get_line_iterator
+
+GROUPS_FILE_NAME = "duplicate_groups.csv"
+COLLAPSED_TOKENS_FILE_NAME = "files-tokens-0.tokens"
+N_PARTITIONS = 64
+
+CollapseStats = namedtuple("CollapseStats", ["blocks", "representatives", "groups", "duplicates"])
+# all members of a group by the block id of its representative, representative first
+Groups = Dict[str, List[Tuple[str, str]]]
+
+
+def _group_key(line: str, query_proj_ids: Optional[Set[str]]) -> str:
+    # total & unique tokens guard against collisions of the hash, in versus mode queries & dataset are grouped apart
+    proj_id, _, total, unique, rest = line.split(",", 4)
+    token_hash = rest.partition("@#@")[0].rsplit(",", 1)[-1]
+    side = "q" if query_proj_ids is not None and proj_id in query_proj_ids else ""
+    return "{}{},{},{}".format(side, token_hash, total, unique)
+
+
+def collapse_duplicates(tokens_loc: str, output_dir: str, groups_loc: str, min_tokens: int, max_tokens: int,
+                        query_proj_ids: Optional[Set[str]] = None, n_partitions: int = N_PARTITIONS) -> CollapseStats:
+    """
+    Keep one representative of every group of blocks with the same tokens.
+    :param tokens_loc: tokens file or folder with tokens files.
+    :param output_dir: folder to store collapsed tokens file.
+    :param groups_loc: file to store `rep_proj_id,rep_block_id,proj_id,block_id` of collapsed blocks.
+    :param min_tokens: blocks with fewer tokens are copied as is.
+    :param max_tokens: blocks with more tokens are copied as is.
+    :param query_proj_ids: projects searched against the rest (versus mode), their blocks are never grouped with
+                           blocks of the other projects. If None - all-to-all.
+    :param n_partitions: number of hash partitions, every partition is grouped in memory.
+    :return: statistics of collapsed blocks.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    n_blocks, n_groups, n_duplicates = 0, 0, 0
+    work_dir = tempfile.mkdtemp(prefix="collapse_", dir=output_dir)
+    try:
+        with open(os.path.join(output_dir, COLLAPSED_TOKENS_FILE_NAME), "w", encoding="utf-8") as output:
+            partitions = [open(os.path.join(work_dir, "part_%s.tokens" % i), "w", encoding="utf-8")
+                          for i in range(n_partitions)]
+            try:
+                for path in sorted(get_files(tokens_loc, ".tokens")):
+                    for line in get_line_iterator(path):
+                        if not line:
+                            continue
+                        n_blocks += 1
+                        if not min_tokens <= int(line.split(",", 3)[2]) <= max_tokens:
+                            output.write(line + "\n")
+                            continue
+                        key = _group_key(line, query_proj_ids)
+                        partitions[zlib.crc32(key.encode("utf-8")) % n_partitions].write(line + "\n")
+            finally:
+                for partition in partitions:
+                    partition.close()
+
+            with open(groups_loc, "w", encoding="utf-8") as groups:
+                for i in range(n_partitions):
+                    representatives = {}
+                    grouped = set()
+                    for line in get_line_iterator(os.path.join(work_dir, "part_%s.tokens" % i)):
+                        key = _group_key(line, query_proj_ids)
+                        if key not in representatives:
+                            representatives[key] = line.split(",", 2)[:2]
+                            output.write(line + "\n")
+                            continue
+                        rep_proj_id, rep_block_id = representatives[key]
+                        proj_id, block_id = line.split(",", 2)[:2]
+                        groups.write("{},{},{},{}\n".format(rep_proj_id, rep_block_id, proj_id, block_id))
+                        grouped.add(key)
+                        n_duplicates += 1
+                    n_groups += len(grouped)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return CollapseStats(blocks=n_blocks, representatives=n_blocks - n_duplicates, groups=n_groups,
+                         duplicates=n_duplicates)
+
+
+def load_groups(groups_loc: str) -> Groups:
+    """
+    Read groups file.
+    :param groups_loc: file with `rep_proj_id,rep_block_id,proj_id,block_id` lines.
+    :return: mapping {representative block id: [(proj_id, block_id) of all members, representative first]}.
+    """
+    groups = {}
+    for line in get_line_iterator(groups_loc):
+        if line:
+            rep_proj_id, rep_block_id, proj_id, block_id = line.split(",")
+            groups.setdefault(rep_block_id, [(rep_proj_id, rep_block_id)]).append((proj_id, block_id))
+    return groups
+
+
+def expand_pairs(lines: Iterable[str], groups: Groups, intra_group: bool = True) -> Iterator[str]:
+    """
+    Turn pairs of representatives into pairs of all members of their groups.
+    :param lines: lines of results file, fields after the 4 ids (similarity) are copied to every expanded pair.
+    :param groups: groups loaded by `load_groups`.
+    :param intra_group: also report pairs of blocks inside every group, they are identical and are reported without
+                        similarity field (kept by any threshold). Not needed in versus mode: a group never mixes
+                        blocks of both sides.
+    :return: iterator of lines `proj_id1,block_id1,proj_id2,block_id2[,...]`.
+    """
+    for line in lines:
+        if not line:
+            continue
+        proj_id1, block_id1, proj_id2, block_id2, *tail = line.split(",")
+        if block_id1 not in groups and block_id2 not in groups:
+            yield line
+            continue
+        tail = "".join("," + field for field in tail)
+        for member1 in groups.get(block_id1, [(proj_id1, block_id1)]):
+            for member2 in groups.get(block_id2, [(proj_id2, block_id2)]):
+                yield "{},{},{},{}{}".format(member1[0], member1[1], member2[0], member2[1], tail)
+    if intra_group:
+        for members in groups.values():
+            for i, member1 in enumerate(members):
+                for member2 in members[:i]:
+                    yield "{},{},{},{}".format(member1[0], member1[1], member2[0], member2[1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command")
+    collapse_parser = subparsers.add_parser("collapse", help="Keep one representative of every group of duplicates.")
+    collapse_parser.add_argument("tokens", help="Tokens file or folder with tokens files.")
+    collapse_parser.add_argument("-o", "--output", required=True, help="Folder to store collapsed tokens file.")
+    collapse_parser.add_argument("-g", "--groups", required=True, help="File to store groups of duplicates.")
+    collapse_parser.add_argument("--min-tokens", type=int, default=65, help="Minimum number of tokens in block.")
+    collapse_parser.add_argument("--max-tokens", type=int, default=500000, help="Maximum number of tokens in block.")
+    collapse_parser.add_argument("-q", "--query-projects", nargs="*", default=None,
+                                 help="Ids of projects searched against the other projects (versus mode).")
+    expand_parser = subparsers.add_parser("expand", help="Expand pairs of representatives into pairs of all blocks.")
+    expand_parser.add_argument("-r", "--results-file", required=True, help="Results of the collapsed search.")
+    expand_parser.add_argument("-g", "--groups", required=True, help="Groups file written by `collapse`.")
+    expand_parser.add_argument("-o", "--output", required=True, help="Expanded results file.")
+    expand_parser.add_argument("--versus", action="store_true", help="Results of versus mode, pairs inside groups "
+                                                                     "are not reported.")
+    args = parser.parse_args()
+
+    if args.command == "collapse":
+        stats = collapse_duplicates(args.tokens, args.output, args.groups, args.min_tokens, args.max_tokens,
+                                    set(args.query_projects) if args.query_projects is not None else None)
+        print("{} blocks collapsed to {}: {} duplicates in {} groups".format(stats.blocks, stats.representatives,
+                                                                             stats.duplicates, stats.groups))
+    elif args.command == "expand":
+        n_pairs = 0
+        with open(args.output, "w", encoding="utf-8") as f:
+            for pair in expand_pairs(get_line_iterator(args.results_file), load_groups(args.groups),
+                                     intra_group=not args.versus):
+                f.write(pair + "\n")
+                n_pairs += 1
+        print("{} pairs saved to {}".format(n_pairs, args.output))
+    else:
+        parser.print_help()
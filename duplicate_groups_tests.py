@@ -0,0 +1,74 @@
+import os
+import random
+import tempfile
+import unittest
+
+from duplicate_groups import COLLAPSED_TOKENS_FILE_NAME, collapse_duplicates, expand_pairs, load_groups
+from python_engine import detect_clones
+from sort_pairs import normalize_pair
+
+
+def _write_tokens(tokens_loc, blocks):
+    with open(tokens_loc, "w") as f:
+        for proj_id, block_id, bag in blocks:
+            size = sum(bag.values())
+            tokens = ",".join("{}@@::@@{}".format(token, count) for token, count in sorted(bag.items()))
+            f.write("{},{},{},{},0,{}@#@{}\n".format(proj_id, block_id, size, len(bag), hash(tokens), tokens))
+
+
+def _pairs(lines):
+    return {normalize_pair(line)[1] for line in lines}
+
+
+class TestDuplicateGroups(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(3)
+        base = [{"t%s" % rnd.randrange(40): rnd.randint(1, 3) for _ in range(rnd.randint(5, 25))} for _ in range(6)]
+        self.blocks = []
+        for block in range(150):
+            bag = dict(base[block % len(base)])
+            # a third of blocks are exact copies of base blocks
+            if block % 3:
+                for _ in range(rnd.randint(1, 4)):
+                    bag["t%s" % rnd.randrange(60)] = rnd.randint(1, 3)
+            self.blocks.append((block % 4 + 1, 1000 + block, bag))
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tokens_loc = os.path.join(self.tmp.name, "tokens")
+        os.makedirs(self.tokens_loc)
+        _write_tokens(os.path.join(self.tokens_loc, "files-tokens-0.tokens"), self.blocks)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _search(self, tokens_loc, name, query_proj_ids=None):
+        output = os.path.join(self.tmp.name, name)
+        detect_clones([tokens_loc], output, 0.7, 1, 1000, query_proj_ids)
+        with open(output) as f:
+            return f.read().split()
+
+    def test_expanded_pairs_match_full_search(self):
+        for query_proj_ids in [None, {"2"}]:
+            collapsed_loc = os.path.join(self.tmp.name, "collapsed")
+            groups_loc = os.path.join(self.tmp.name, "groups.csv")
+            stats = collapse_duplicates(self.tokens_loc, collapsed_loc, groups_loc, 1, 1000, query_proj_ids,
+                                        n_partitions=4)
+            self.assertEqual(stats.blocks, len(self.blocks))
+            self.assertGreater(stats.duplicates, 0)
+            with open(os.path.join(collapsed_loc, COLLAPSED_TOKENS_FILE_NAME)) as f:
+                self.assertEqual(len(f.read().split("\n")) - 1, stats.representatives)
+            self.assertEqual(os.listdir(collapsed_loc), [COLLAPSED_TOKENS_FILE_NAME])
+            collapsed = self._search(collapsed_loc, "collapsed.pairs", query_proj_ids)
+            expanded = list(expand_pairs(collapsed, load_groups(groups_loc), intra_group=query_proj_ids is None))
+            self.assertEqual(len(expanded), len(set(expanded)))
+            self.assertEqual(_pairs(expanded), _pairs(self._search(self.tokens_loc, "full.pairs", query_proj_ids)))
+
+    def test_small_blocks_are_not_collapsed(self):
+        groups_loc = os.path.join(self.tmp.name, "groups.csv")
+        stats = collapse_duplicates(self.tokens_loc, os.path.join(self.tmp.name, "collapsed"), groups_loc, 1000,
+                                    2000)
+        self.assertEqual((stats.representatives, stats.groups, stats.duplicates), (len(self.blocks), 0, 0))
+        self.assertEqual(load_groups(groups_loc), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
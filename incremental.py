@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Bookkeeping for incremental clone detection (`main.py --incremental`).
+
+The first run processes the whole corpus as usual. Every next run tokenizes only archives that were not seen before,
+appends their blocks to the existing index and searches only them, so it costs O(new blocks) instead of O(corpus):
+* `incremental_state.json` - ingested archives with their digests and the next free project & file ids, new
+  blocks get ids that don't collide with the indexed ones;
+* `components.csv` - `block_id,component_id` for every cloned block, connected components are updated with
+  new pairs only and the changed components are reported.
+"""
+import json
+import os
+from typing import Dict, Iterable, List, Set, Tuple
+
+from prettify_results import get_files, get_line_iterator
+
+STATE_FILE_NAME = "incremental_state.json"
+COMPONENTS_FILE_NAME = "components.csv"
+# tokenizer: file_id = process_num * MULTIPLIER + base_file_id + file_count
+FILE_ID_MULTIPLIER = 50000000
+DEFAULT_INIT_FILE_ID = 3000000
+
+
+class IncrementalState:
+    """
+    Archives ingested by previous runs and ids available for the next one.
+    """
+
+    def __init__(self, output_dir: str):
+        self.state_loc = os.path.join(output_dir, STATE_FILE_NAME)
+        self.state = None
+        if os.path.isfile(self.state_loc):
+            with open(self.state_loc, encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def exists(self) -> bool:
+        return self.state is not None
+
+    @property
+    def run_id(self) -> int:
+        """ Number of runs recorded so far, 0 - the initial full run """
+        return self.state["runs"]
+
+    @property
+    def next_proj_id(self) -> int:
+        return self.state["next_proj_id"]
+
+    @property
+    def next_file_id(self) -> int:
+        return self.state["next_file_id"]
+
+    def new_archives(self, archive_digests: List[Tuple[str, str, str]]) -> List[str]:
+        """
+        Select archives that were not ingested before.
+        :param archive_digests: (path, name, digest) of all archives in input directory.
+        :return: paths of new archives.
+        """
+        known = self.state["archives"]
+        changed = [name for _, name, digest in archive_digests if name in known and known[name] != digest]
+        if changed:
+            # blocks can't be removed from the index, the corpus has to be processed from scratch
+            raise ValueError("Archives changed since they were indexed: {}, rerun without `--incremental`".format(
+                ", ".join(changed)))
+        return [path for path, name, _ in archive_digests if name not in known]
+
+    def record(self, archive_digests: List[Tuple[str, str, str]], n_projects: int, next_file_id: int) -> None:
+        """
+        Save archives ingested by the current run and advance ids.
+        :param archive_digests: (path, name, digest) of ingested archives.
+        :param n_projects: number of projects passed to tokenizer in the current run.
+        :param next_file_id: first file id that is free after the current run.
+        :return: None.
+        """
+        if self.state is None:
+            self.state = {"runs": 0, "archives": {}, "next_proj_id": 1, "next_file_id": DEFAULT_INIT_FILE_ID}
+        else:
+            self.state["runs"] += 1
+        self.state["archives"].update({name: digest for _, name, digest in archive_digests})
+        self.state["next_proj_id"] += n_projects
+        self.state["next_file_id"] = max(self.state["next_file_id"], next_file_id)
+        tmp_loc = self.state_loc + ".tmp"
+        with open(tmp_loc, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_loc, self.state_loc)
+
+
+def next_file_id(stats_loc: str) -> int:
+    """
+    First file id (`init_file_id` of tokenizer) that doesn't collide with files tokenized before.
+    :param stats_loc: folder with stats files (`f,proj_id,file_id,...` lines).
+    :return: file id offset.
+    """
+    result = DEFAULT_INIT_FILE_ID
+    for stats_file in get_files(path=stats_loc, extension=".stats"):
+        for line in get_line_iterator(stats_file):
+            if line.startswith("f,"):
+                result = max(result, int(line.split(",", 3)[2]) % FILE_ID_MULTIPLIER + 1)
+    return result
+
+
+def link_files(src_dir: str, dst_dir: str, prefix: str) -> List[str]:
+    """
+    Symlink every file of a tokenizer output folder into the main folder under a unique name.
+    :param src_dir: folder with files of the current run.
+    :param dst_dir: folder with files of all runs.
+    :param prefix: prefix of link names, tokenizer file names repeat in every run.
+    :return: list of links.
+    """
+    os.makedirs(dst_dir, exist_ok=True)
+    links = []
+    for name in sorted(os.listdir(src_dir)):
+        link = os.path.join(dst_dir, prefix + name)
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.abspath(os.path.join(src_dir, name)), link)
+        links.append(link)
+    return links
+
+
+def load_components(components_loc: str) -> Dict[str, str]:
+    """
+    Read component of every cloned block.
+    :param components_loc: path to `components.csv`.
+    :return: {block_id: component_id}, component id is the id of one of its blocks.
+    """
+    components = {}
+    if os.path.isfile(components_loc):
+        for line in get_line_iterator(components_loc):
+            if line:
+                block_id, component_id = line.split(",")
+                components[block_id] = component_id
+    return components
+
+
+def update_components(components_loc: str, pairs: Iterable[str]) -> Set[str]:
+    """
+    Merge connected components with new pairs and save them.
+    :param components_loc: path to `components.csv`, created if it doesn't exist.
+    :param pairs: lines of results file (`proj_id1,block_id1,proj_id2,block_id2`).
+    :return: ids of components that got new pairs.
+    """
+    parent = load_components(components_loc)
+
+    def find(block_id: str) -> str:
+        root = parent.setdefault(block_id, block_id)
+        while root != parent[root]:
+            root = parent[root]
+        while block_id != root:
+            parent[block_id], block_id = root, parent[block_id]
+        return root
+
+    touched = set()
+    for line in pairs:
+        if not line:
+            continue
+        parts = line.split(",")
+        root1, root2 = find(parts[1]), find(parts[3])
+        if root1 != root2:
+            parent[root2] = root1
+        touched.add(parts[1])
+
+    tmp_loc = components_loc + ".tmp"
+    with open(tmp_loc, "w", encoding="utf-8") as f:
+        for block_id in parent:
+            f.write("%s,%s\n" % (block_id, find(block_id)))
+    os.replace(tmp_loc, components_loc)
+    return {find(block_id) for block_id in touched}
+
+
+def iter_component_pairs(results_files: Iterable[str], components: Dict[str, str],
+                         component_ids: Set[str]) -> Iterable[str]:
+    """
+    Pairs of selected components from results of all runs.
+    :param results_files: results files of all runs.
+    :param components: {block_id: component_id}.
+    :param component_ids: components to select.
+    :return: iterator of lines of results files.
+    """
+    for results_file in results_files:
+        for line in get_line_iterator(results_file):
+            if line and components.get(line.split(",", 2)[1]) in component_ids:
+                yield line
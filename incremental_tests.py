@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+
+from incremental import IncrementalState, iter_component_pairs, load_components, next_file_id, update_components
+
+
+class TestIncremental(unittest.TestCase):
+    def test_update_components(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            components_loc = os.path.join(tmp_dir, "components.csv")
+            changed = update_components(components_loc, ["1,10,1,11", "1,11,2,12", "2,20,3,30"])
+            self.assertEqual(len(changed), 2)
+            components = load_components(components_loc)
+            self.assertEqual(components["10"], components["12"])
+            self.assertNotEqual(components["10"], components["20"])
+
+            # new block connects two existing components, the third component didn't change
+            update_components(components_loc, ["4,40,4,41"])
+            changed = update_components(components_loc, ["5,50,1,10", "5,50,2,20"])
+            components = load_components(components_loc)
+            self.assertEqual(changed, {components["10"]})
+            self.assertEqual(components["10"], components["30"])
+            self.assertNotEqual(components["10"], components["40"])
+
+            results_loc = os.path.join(tmp_dir, "results.pairs")
+            with open(results_loc, "w") as f:
+                f.write("1,10,1,11\n4,40,4,41\n5,50,2,20\n")
+            self.assertEqual(list(iter_component_pairs([results_loc], components, changed)),
+                             ["1,10,1,11", "5,50,2,20"])
+
+    def test_ids_and_archives(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, "files-stats-0.stats"), "w") as f:
+                f.write('f,11,3000007,"a.zip/A.java","","h",10,1,1,1\n'
+                        'b,11,100003000007,"h",1,1,1,1,1\n'
+                        'f,12,53000002,"b.zip/B.java","","h",10,1,1,1\n')
+            self.assertEqual(next_file_id(tmp_dir), 3000008)
+
+            state = IncrementalState(tmp_dir)
+            self.assertFalse(state.exists())
+            state.record([("/in/a.zip", "a.zip", "1"), ("/in/b.zip", "b.zip", "2")], n_projects=2,
+                         next_file_id=3000008)
+            state = IncrementalState(tmp_dir)
+            self.assertEqual((state.run_id, state.next_proj_id, state.next_file_id), (0, 3, 3000008))
+            self.assertEqual(state.new_archives([("/in/a.zip", "a.zip", "1"), ("/in/c.zip", "c.zip", "3")]),
+                             ["/in/c.zip"])
+            with self.assertRaises(ValueError):
+                state.new_archives([("/in/a.zip", "a.zip", "changed")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,9 +17,10 @@ import glob
 import logging as log
 import os
 import re
+import shutil
 import subprocess
 import sys
-from typing import List
+from typing import List, Set
 
 from attrdict import AttrDict
 
@@ -29,11 +30,24 @@ sys.path.append(CURR_DIR)
 # add path to "tokenizers" directory
 TOKENIZERS_DIR = os.path.join(CURR_DIR, "tokenizers")
 sys.path.append(TOKENIZERS_DIR)
+# add path to "clone-detector" directory
+CLONE_DETECTOR_DIR = os.path.join(CURR_DIR, "clone-detector")
+sys.path.append(CLONE_DETECTOR_DIR)
 
 from tokenizers.generate_config import main as generate_config_main
-from prettify_results import pipeline as prettier_main
-
-CLONE_DETECTOR_DIR = os.path.join(CURR_DIR, "clone-detector")
+from aggregate_results import aggregate
+from capacity_estimate import estimate_capacity, format_report, sample_profile, scan_archives
+from duplicate_groups import GROUPS_FILE_NAME, collapse_duplicates, expand_pairs, load_groups
+from prettify_results import _get_project_ids, get_line_iterator, pipeline as prettier_main
+from incremental import COMPONENTS_FILE_NAME, STATE_FILE_NAME as INCREMENTAL_STATE_FILE_NAME, IncrementalState, \
+    iter_component_pairs, link_files, load_components, next_file_id, update_components
+from pipeline_state import PipelineState, fingerprint
+from minhash_lsh import DEFAULT_BANDS, DEFAULT_ROWS, MAX_BUCKET, detect_clones as detect_lsh_clones
+from python_engine import detect_clones
+from resource_plan import available_cores, available_memory_mb, input_size, plan_resources
+from results_index import build_index
+from shard_planner import plan_shard_boundaries, read_token_histogram
+from sort_pairs import iter_sorted_lines, iter_sorted_pairs, open_output, sort_pairs
 
 
 class AwesomeFormatter(log.Formatter):
@@ -79,20 +93,76 @@ def get_archives(dir_loc: str, archive_ext: str = ".zip") -> List[str]:
     return archive_locs
 
 
+def link_tokens(tokens_loc: str, dataset_dir: str) -> List[str]:
+    """
+    Make tokenizer output available to `clone-detector` without copying it: every tokens file is symlinked
+    into the dataset folder, index & query splitting read all files of the folder.
+    :param tokens_loc: folder with tokens files.
+    :param dataset_dir: `clone-detector/input/dataset`.
+    :return: list of links.
+    """
+    links = []
+    for name in sorted(os.listdir(tokens_loc)):
+        link = os.path.join(dataset_dir, name)
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.abspath(os.path.join(tokens_loc, name)), link)
+        links.append(link)
+    return links
+
+
+def write_query_blocks(tokens_loc: str, query_loc: str, query_proj_ids: Set[str]) -> int:
+    """
+    Save blocks of some projects as queries (`versus` mode). The whole tokenizer output is linked as the indexed
+    dataset, so only this small subset is copied.
+    :param tokens_loc: folder with tokens files (`proj_id,block_id,...@#@tokens`).
+    :param query_loc: file to store blocks of `query_proj_ids`, they are searched against the dataset.
+    :param query_proj_ids: ids of projects from filter list.
+    :return: number of query blocks.
+    """
+    n_query = 0
+    with open(query_loc, "w", encoding="utf-8") as query:
+        for name in sorted(os.listdir(tokens_loc)):
+            with open(os.path.join(tokens_loc, name), encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip() or line.split(",", 1)[0] not in query_proj_ids:
+                        continue
+                    if not line.endswith("\n"):
+                        line += "\n"
+                    query.write(line)
+                    n_query += 1
+    return n_query
+
+
+def reset_dir(dir_loc: str) -> None:
+    """
+    Remove directory left by a previous run and create it again.
+    :param dir_loc: directory location.
+    :return: None.
+    """
+    if os.path.islink(dir_loc) or os.path.isfile(dir_loc):
+        os.remove(dir_loc)
+    elif os.path.isdir(dir_loc):
+        shutil.rmtree(dir_loc)
+    os.makedirs(dir_loc)
+
+
 def main(args: argparse.Namespace) -> None:
     """
     Full SourcererCC pipeline in one call:
     * generate config for tokenizer
     * launch tokenizer
     * prepare input & configs for `clone-detector`
-    * launch `clone-detector`
+    * launch `clone-detector`: index & search
     * postprocess results
     * prettify
+    Every stage records a fingerprint of its inputs & parameters, stages with matching fingerprints are skipped
+    on rerun (`--force` reruns everything).
     :param args: arguments for pipeline.
     :return: None.
     """
-    # * generate config for tokenizer
-    log.info("Starting: generate config for tokenizer")
+    os.makedirs(args.output, exist_ok=True)
+    state = PipelineState(args.output, reset=args.force)
     tokenizer_output = os.path.join(args.output, "tokens")
     os.makedirs(tokenizer_output, exist_ok=True)
     tokenizer_attr = AttrDict()
@@ -104,82 +174,367 @@ def main(args: argparse.Namespace) -> None:
     tokenizer_attr.output = os.path.join(tokenizer_output, "config.ini")
     # `-e`: extensions
     tokenizer_attr.extensions = args.extensions
+    tokenizer_attr.n_processes = args.tokenizer_processes
+    tokenizer_attr.projects_batch = args.projects_batch
     # `-r`: repository list should be generated from shared volume
     tokenizer_attr.repo_loc = os.path.join(tokenizer_output, "repos.txt")
-    with open(tokenizer_attr.repo_loc, "w") as f:
-        f.write("\n".join(get_archives(args.input)))
-    generate_config_main(tokenizer_attr)
-    log.info("Finished: generate config for tokenizer")
+    archives = get_archives(args.input)
+    # blocks that are indexed & searched: all blocks or one representative of every group of duplicates
+    search_tokens_loc = os.path.join(tokenizer_output, "collapsed_folder") if args.collapse_duplicates \
+        else tokenizer_attr.tokens_loc
+    groups_loc = os.path.join(tokenizer_output, GROUPS_FILE_NAME)
+
+    clone_detector_input_dir = os.path.join(CLONE_DETECTOR_DIR, "input", "dataset")
+    query_input = os.path.join(CLONE_DETECTOR_DIR, "input", "query", "blocks.file")
+    query_files = [query_input] if args.mode == "versus" else []
+    clone_detector_cmd = ["python3", "controller.py", str(args.nodes), str(args.threshold * 10),
+                          "--heap", "{}m".format(args.heap_mb)]
+    for query_file in query_files:
+        clone_detector_cmd += ["--query-file", query_file]
+    clone_detector_output = os.path.join(CLONE_DETECTOR_DIR, "NODE_*", "output*", "query_*")
+    if args.engine in ["python", "minhash"]:
+        clone_detector_output = os.path.join(tokenizer_output, "{}_engine".format(args.engine), "results.pairs")
+    result_pairs = os.path.join(tokenizer_output, "result.pairs.gz")
+    save_pairs = bool(args.report_index or args.aggregate or args.save_pairs)
+
+    # * generate config for tokenizer
+    def config_stage():
+        with open(tokenizer_attr.repo_loc, "w") as f:
+            f.write("\n".join(archives))
+        generate_config_main(tokenizer_attr)
 
     # * launch tokenizer
-    log.info("Starting: tokenization")
-    tokenize_cmd = "python3 -m tokenizers.block_level_tokenizer -i {conf_loc}".format(conf_loc=tokenizer_attr.output)
-    tokenize_cmd = tokenize_cmd.split()
-    print(tokenize_cmd)  # debug
-    subprocess.check_call(args=tokenize_cmd, cwd=CURR_DIR)
-    log.info("Finished: tokenization")
+    def tokenize_stage():
+        # tokenizer refuses to overwrite output of a previous run, incremental runs are based on this output
+        for folder in [tokenizer_attr.stats_loc, tokenizer_attr.bookkeeping_loc, tokenizer_attr.tokens_loc,
+                       os.path.join(tokenizer_output, "increments")]:
+            if os.path.isdir(folder):
+                shutil.rmtree(folder)
+        for name in [INCREMENTAL_STATE_FILE_NAME, COMPONENTS_FILE_NAME]:
+            if os.path.isfile(os.path.join(args.output, name)):
+                os.remove(os.path.join(args.output, name))
+        tokenize_cmd = "python3 -m tokenizers.block_level_tokenizer -i {conf_loc}".format(
+            conf_loc=tokenizer_attr.output)
+        tokenize_cmd = tokenize_cmd.split()
+        print(tokenize_cmd)  # debug
+        subprocess.check_call(args=tokenize_cmd, cwd=CURR_DIR)
 
+    # * collapse exact duplicates: only one block of every group with the same tokens is indexed & searched
+    def collapse_stage():
+        reset_dir(search_tokens_loc)
+        query_proj_ids = _get_project_ids(set(args.filter), tokenizer_attr.bookkeeping_loc) \
+            if args.mode == "versus" else None
+        stats = collapse_duplicates(tokenizer_attr.tokens_loc, search_tokens_loc, groups_loc, args.min_tokens,
+                                    args.max_tokens, query_proj_ids)
+        log.info("Collapsed %s blocks to %s: %s duplicates in %s groups", stats.blocks, stats.representatives,
+                 stats.duplicates, stats.groups)
 
     # * prepare input & configs for `clone-detector`
-    log.info("Starting: prepare input & configs for `clone-detector`")
-    clone_detector_input = os.path.join(CLONE_DETECTOR_DIR, "input", "dataset", "blocks.file")
-    clone_detector_input_dir = os.path.join(CLONE_DETECTOR_DIR, "input", "dataset")
-    os.makedirs(clone_detector_input_dir)
+    def prepare_stage():
+        reset_dir(clone_detector_input_dir)
+        links = link_tokens(search_tokens_loc, clone_detector_input_dir)
+        log.info("Linked %s tokens files to %s", len(links), clone_detector_input_dir)
+        if args.mode == "versus":
+            # only blocks of filter repositories are searched against the index of all blocks, pairs inside
+            # filter repositories are dropped by the `versus` filter of postprocessing
+            reset_dir(os.path.dirname(query_input))
+            query_proj_ids = _get_project_ids(set(args.filter), tokenizer_attr.bookkeeping_loc)
+            n_query = write_query_blocks(search_tokens_loc, query_input, query_proj_ids)
+            log.info("Versus mode: %s query blocks", n_query)
 
-    prepare_cmd = "cat {tokens} > {clone_input}".format(tokens=os.path.join(tokenizer_attr.tokens_loc, "*"),
-                                                        clone_input=clone_detector_input)
+        runnodes_template = os.path.join(CLONE_DETECTOR_DIR, "templates", "runnodes.sh")
+        runnodes_loc = os.path.join(CLONE_DETECTOR_DIR, "runnodes.sh")
+        with open(runnodes_template) as f:
+            template = f.read()
+            thresh_arg = "{threshold}".format(threshold=str(args.threshold * 10))
+            runnodes_content = template.replace("{THRESHOLD_ARGUMENTS}", thresh_arg).replace(
+                "{HEAP}", "{}m".format(args.heap_mb))
+        with open(runnodes_loc, "w") as f:
+            f.write(runnodes_content)
 
-    subprocess.check_call(prepare_cmd, shell=True)
-    subprocess.check_call(["ls", clone_detector_input])
-    log.debug("HERE" * 20)
+        sourcerer_properties_template = os.path.join(CLONE_DETECTOR_DIR, "templates", "sourcerer-cc.properties")
+        sourcerer_properties_loc = os.path.join(CLONE_DETECTOR_DIR, "sourcerer-cc.properties")
+        with open(sourcerer_properties_template) as f:
+            template = f.read()
+            properties_content = template.replace("{MIN_TOKENS}", str(args.min_tokens)).replace("{MAX_TOKENS}",
+                                                                                                str(args.max_tokens))
+            # shard boundaries are chosen from the distribution of block sizes
+            histogram = read_token_histogram(clone_detector_input_dir, args.min_tokens, args.max_tokens)
+            query_histogram = None
+            if query_files:
+                query_histogram = {}
+                for query_file in query_files:
+                    for size, count in read_token_histogram(query_file, args.min_tokens, args.max_tokens).items():
+                        query_histogram[size] = query_histogram.get(size, 0) + count
+            shard_boundaries = plan_shard_boundaries(histogram, args.threshold, args.shards, query_histogram)
+            log.info("Shard boundaries: %s", shard_boundaries)
+            properties_content = properties_content.replace("{SHARD_MAX_NUM_TOKENS}",
+                                                            ",".join(map(str, shard_boundaries)))
+            # in versus mode only the queries are searched, so candidates are not filtered by id (a query skips itself)
+            properties_content = properties_content.replace("{FILTER_CANDIDATES_BY_ID}",
+                                                            "false" if query_files else "true")
+            properties_content = properties_content.replace("{REPORT_SIMILARITY}",
+                                                            "true" if args.report_similarity else "false")
+            # queue threads of the resource plan
+            for name, value in args.threads.items():
+                properties_content = properties_content.replace("{%s}" % name, str(value))
+            log.debug(properties_content)
+        with open(sourcerer_properties_loc, "w") as f:
+            f.write(properties_content)
 
-    runnodes_template = os.path.join(CLONE_DETECTOR_DIR, "templates", "runnodes.sh")
-    runnodes_loc = os.path.join(CLONE_DETECTOR_DIR, "runnodes.sh")
-    with open(runnodes_template) as f:
-        template = f.read()
-        thresh_arg = "{threshold}".format(threshold=str(args.threshold * 10))
-        runnodes_content = template.replace("{THRESHOLD_ARGUMENTS}", thresh_arg)
-    with open(runnodes_loc, "w") as f:
-        f.write(runnodes_content)
+    # * launch `clone-detector`: build the index, then search
+    def index_stage():
+        # controller keeps its own progress, it is reset only if the index has to be rebuilt from new input
+        subprocess.check_call(clone_detector_cmd + ["--until", "move_index"] +
+                              (["--reset"] if state.from_scratch else []), cwd=CLONE_DETECTOR_DIR)
 
-    sourcerer_properties_template = os.path.join(CLONE_DETECTOR_DIR, "templates", "sourcerer-cc.properties")
-    sourcerer_properties_loc = os.path.join(CLONE_DETECTOR_DIR, "sourcerer-cc.properties")
-    with open(sourcerer_properties_template) as f:
-        template = f.read()
-        properties_content = template.replace("{MIN_TOKENS}", str(args.min_tokens)).replace("{MAX_TOKENS}",
-                                                                                            str(args.max_tokens))
-        log.debug(properties_content)
-    with open(sourcerer_properties_loc, "w") as f:
-        f.write(properties_content)
-    log.info("Finished: prepare input & configs for `clone-detector`")
+    def search_stage():
+        subprocess.check_call(clone_detector_cmd, cwd=CLONE_DETECTOR_DIR)
 
-    # * launch `clone-detector`
-    log.info("Starting: `clone-detector`")
-    clone_detector_cmd = "python3 controller.py".split()
-    subprocess.check_call(clone_detector_cmd, cwd=CLONE_DETECTOR_DIR)
-    log.info("Finished: `clone-detector`")
+    # * in-process search without `clone-detector` (`--engine python`, approximate `--engine minhash`)
+    def engine_stage():
+        query_proj_ids = _get_project_ids(set(args.filter), tokenizer_attr.bookkeeping_loc) \
+            if args.mode == "versus" else None
+        if args.engine == "minhash":
+            n_pairs = detect_lsh_clones([search_tokens_loc], clone_detector_output, args.threshold,
+                                        args.min_tokens, args.max_tokens, query_proj_ids, args.lsh_bands,
+                                        args.lsh_rows, os.path.join(os.path.dirname(clone_detector_output), "tables"),
+                                        args.report_similarity, args.lsh_max_bucket)
+        else:
+            n_pairs = detect_clones([search_tokens_loc], clone_detector_output, args.threshold,
+                                    args.min_tokens, args.max_tokens, query_proj_ids, args.report_similarity)
+        log.info("%s engine found %s clone pairs", args.engine, n_pairs)
 
-    # * postprocess results
-    log.info("Starting: postprocess results")
-    clone_detector_output = os.path.join(CLONE_DETECTOR_DIR, "NODE_*", "output*", "query_*")
-    result_pairs = os.path.join(tokenizer_output, "result.pairs")
-    postprocess_cmd = "cat {output} > {pairs}".format(output=clone_detector_output, pairs=result_pairs)
-    subprocess.check_call(postprocess_cmd, shell=True)
-    log.info("Finished: postprocess results")
+    def iter_expanded_pairs(lines):
+        # pairs of representatives of duplicate groups -> pairs of all their blocks; expanded pairs are not oriented
+        # and pairs inside groups come last, so they are normalized, sorted & deduplicated like node outputs
+        return iter_sorted_lines(expand_pairs(lines, load_groups(groups_loc), intra_group=args.mode != "versus"),
+                                 tmp_dir=tokenizer_output)
+
+    def iter_merged_pairs():
+        pairs = iter_sorted_pairs(inputs=[clone_detector_output], tmp_dir=tokenizer_output)
+        if args.mode == "versus":
+            # query blocks are indexed too: pairs inside filter repositories are found and dropped here
+            query_proj_ids = _get_project_ids(set(args.filter), tokenizer_attr.bookkeeping_loc)
+            pairs = (line for line in pairs
+                     if (line.split(",", 1)[0] in query_proj_ids) != (line.split(",", 3)[2] in query_proj_ids))
+        return pairs
+
+    # * postprocess results: normalize, sort & deduplicate node outputs
+    def merge_stage():
+        if save_pairs and (args.expand_duplicates or args.mode == "versus"):
+            n_pairs = 0
+            pairs = iter_merged_pairs()
+            if args.expand_duplicates:
+                pairs = iter_expanded_pairs(pairs)
+            with open_output(result_pairs) as f:
+                for line in pairs:
+                    f.write(line + "\n")
+                    n_pairs += 1
+            log.info("Pairs saved to %s: %s pairs", result_pairs, n_pairs)
+        elif save_pairs:
+            # results index & aggregation read pairs several times, so they are saved once
+            sort_pairs(inputs=[clone_detector_output], output=result_pairs)
 
     # * prettify
-    log.info("Starting: prettify")
-    prettier_attr = AttrDict()
-    prettier_attr.results_file = result_pairs
-    prettier_attr.stats_files = tokenizer_attr.stats_loc
-    prettier_attr.output = os.path.join(args.output, "pretty")
-    prettier_attr.bookkeeping_folder = tokenizer_attr.bookkeeping_loc
-    prettier_attr.mode = args.mode
-    prettier_attr.filter = args.filter
+    def prettify_stage():
+        prettier_attr = AttrDict()
+        # without saved pairs node outputs are merged on the fly
+        prettier_attr.results_file = result_pairs if save_pairs else iter_merged_pairs()
+        if args.expand_duplicates and not save_pairs:
+            prettier_attr.results_file = iter_expanded_pairs(prettier_attr.results_file)
+        prettier_attr.stats_files = tokenizer_attr.stats_loc
+        prettier_attr.output = os.path.join(args.output, "pretty")
+        prettier_attr.bookkeeping_folder = tokenizer_attr.bookkeeping_loc
+        prettier_attr.mode = args.mode
+        prettier_attr.filter = args.filter
+        prettier_attr.threshold = args.output_threshold
+        prettier_main(prettier_attr)
 
-    prettier_main(prettier_attr)
+        if args.report_index:
+            # * index results for `report_server.py`
+            build_index(results_file=result_pairs, stats_files=tokenizer_attr.stats_loc,
+                        bookkeeping_folder=tokenizer_attr.bookkeeping_loc,
+                        index_loc=os.path.join(args.output, "results.sqlite"),
+                        filter_repos=args.filter if args.mode == "versus" else None, threshold=args.output_threshold)
 
-    log.info("Finished: prettify")
+        if args.aggregate:
+            # * per-project-pair statistics
+            aggregate(results_files=[result_pairs], stats_files=tokenizer_attr.stats_loc,
+                      output=os.path.join(args.output, "aggregate"), bookkeeping_folder=tokenizer_attr.bookkeeping_loc,
+                      filter_repos=args.filter if args.mode == "versus" else None, threshold=args.output_threshold,
+                      sorted_input=True)
+
+    stage_fingerprint = fingerprint("", {"archives": state.archive_digests(archives), "extensions": args.extensions})
+    stages = [("config", config_stage, {}, [tokenizer_attr.output, tokenizer_attr.repo_loc]),
+              ("tokenize", tokenize_stage, {}, [tokenizer_attr.tokens_loc, tokenizer_attr.stats_loc,
+                                                tokenizer_attr.bookkeeping_loc]),
+              ("prepare", prepare_stage, {"threshold": args.threshold, "min_tokens": args.min_tokens,
+                                          "max_tokens": args.max_tokens, "shards": args.shards, "mode": args.mode,
+                                          "filter": sorted(args.filter or []), "threads": args.threads,
+                                          "report_similarity": args.report_similarity},
+               [clone_detector_input_dir]),
+              ("index", index_stage, {}, []),
+              ("search", search_stage, {"nodes": args.nodes}, []),
+              ("merge", merge_stage, {"save_pairs": save_pairs, "expand_duplicates": args.expand_duplicates},
+               [result_pairs] if save_pairs else []),
+              ("prettify", prettify_stage, {"output": os.path.abspath(args.output),
+                                            "report_index": bool(args.report_index),
+                                            "aggregate": bool(args.aggregate),
+                                            "output_threshold": args.output_threshold,
+                                            "expand_duplicates": args.expand_duplicates}, [])]
+    if args.engine in ["python", "minhash"]:
+        engine_params = {"engine": args.engine, "threshold": args.threshold, "min_tokens": args.min_tokens,
+                         "max_tokens": args.max_tokens, "mode": args.mode, "filter": sorted(args.filter or []),
+                         "report_similarity": args.report_similarity}
+        if args.engine == "minhash":
+            engine_params.update({"bands": args.lsh_bands, "rows": args.lsh_rows, "max_bucket": args.lsh_max_bucket})
+        stages = stages[:2] + [("search", engine_stage, engine_params, [clone_detector_output])] + stages[5:]
+    elif args.serve:
+        # the index is queried by the resident service instead of searching the whole dataset
+        stages = stages[:4]
+    if args.collapse_duplicates:
+        stages.insert(2, ("collapse", collapse_stage, {"min_tokens": args.min_tokens, "max_tokens": args.max_tokens,
+                                                       "mode": args.mode, "filter": sorted(args.filter or [])},
+                          [search_tokens_loc, groups_loc]))
+    for name, func, params, outputs in stages:
+        stage_fingerprint = fingerprint(stage_fingerprint, params)
+        log.info("Starting: %s", name)
+        if state.run(name, stage_fingerprint, func, outputs):
+            log.info("Finished: %s", name)
+        else:
+            log.info("Skipped: %s (inputs & parameters didn't change)", name)
+    if args.serve:
+        subprocess.check_call(clone_detector_cmd + ["--serve", "--port", str(args.port)], cwd=CLONE_DETECTOR_DIR)
+
+
+def incremental_main(args: argparse.Namespace) -> None:
+    """
+    Incremental pipeline: the first run processes all archives with `main`, every next run tokenizes only new
+    archives, appends their blocks to the index (global token frequencies are kept), searches only new blocks,
+    saves new pairs and updates connected components. Only components that got new pairs are prettified
+    (`pretty/run_<n>` in output directory).
+    :param args: arguments for pipeline.
+    :return: None.
+    """
+    if args.mode == "versus":
+        raise ValueError("`--incremental` supports only `all-to-all` mode.")
+    os.makedirs(args.output, exist_ok=True)
+    state = IncrementalState(args.output)
+    tokenizer_output = os.path.join(args.output, "tokens")
+    stats_loc = os.path.join(tokenizer_output, "stats_folder")
+    bookkeeping_loc = os.path.join(tokenizer_output, "bookkeeping_folder")
+    tokens_loc = os.path.join(tokenizer_output, "tokens_folder")
+    components_loc = os.path.join(args.output, COMPONENTS_FILE_NAME)
+    clone_detector_output = os.path.join(CLONE_DETECTOR_DIR, "NODE_*", "output*", "query_*")
+    base_pairs = os.path.join(tokenizer_output, "result.pairs.gz")
+
+    archives = sorted(get_archives(args.input))
+    archive_digests = [(path, name, digest) for path, (name, digest) in
+                       zip(archives, PipelineState(args.output).archive_digests(archives))]
+    if not state.exists():
+        log.info("Starting: initial run on all archives")
+        main(args)
+        if not os.path.exists(base_pairs):
+            sort_pairs(inputs=[clone_detector_output], output=base_pairs)
+        update_components(components_loc, get_line_iterator(base_pairs))
+        state.record(archive_digests, n_projects=len(archives), next_file_id=next_file_id(stats_loc))
+        log.info("Finished: initial run on all archives")
+        return
+
+    new_archives = state.new_archives(archive_digests)
+    if not new_archives:
+        log.info("No new archives, nothing to do")
+        return
+    run_id = state.run_id + 1
+    log.info("Starting: incremental run %s with %s new archives", run_id, len(new_archives))
+    run_dir = os.path.join(tokenizer_output, "increments", "run_%s" % run_id)
+    reset_dir(run_dir)
+
+    # * tokenize new archives, ids continue after the previous runs
+    log.info("Starting: tokenization of new archives")
+    tokenizer_attr = AttrDict()
+    tokenizer_attr.stats_loc = os.path.join(run_dir, "stats_folder")
+    tokenizer_attr.bookkeeping_loc = os.path.join(run_dir, "bookkeeping_folder")
+    tokenizer_attr.tokens_loc = os.path.join(run_dir, "tokens_folder")
+    tokenizer_attr.output = os.path.join(run_dir, "config.ini")
+    tokenizer_attr.extensions = args.extensions
+    tokenizer_attr.repo_loc = os.path.join(run_dir, "repos.txt")
+    tokenizer_attr.init_proj_id = state.next_proj_id
+    tokenizer_attr.init_file_id = state.next_file_id
+    tokenizer_attr.n_processes = min(args.tokenizer_processes, len(new_archives))
+    tokenizer_attr.projects_batch = args.projects_batch
+    with open(tokenizer_attr.repo_loc, "w") as f:
+        f.write("\n".join(new_archives))
+    generate_config_main(tokenizer_attr)
+    subprocess.check_call(["python3", "-m", "tokenizers.block_level_tokenizer", "-i", tokenizer_attr.output],
+                          cwd=CURR_DIR)
+    # metadata of new blocks is available together with the previous runs
+    prefix = "run_%s-" % run_id
+    link_files(tokenizer_attr.stats_loc, stats_loc, prefix)
+    link_files(tokenizer_attr.bookkeeping_loc, bookkeeping_loc, prefix)
+    link_files(tokenizer_attr.tokens_loc, tokens_loc, prefix)
+    log.info("Finished: tokenization of new archives")
+
+    # * index & search new blocks, shard boundaries of the existing index are kept
+    log.info("Starting: `clone-detector` on new blocks")
+    clone_detector_input_dir = os.path.join(CLONE_DETECTOR_DIR, "input", "dataset")
+    reset_dir(clone_detector_input_dir)
+    link_tokens(tokenizer_attr.tokens_loc, clone_detector_input_dir)
+    sourcerer_properties_loc = os.path.join(CLONE_DETECTOR_DIR, "sourcerer-cc.properties")
+    with open(sourcerer_properties_loc) as f:
+        original_properties = f.read()
+    # new blocks are searched against old and new ones, pairs of two new blocks are deduplicated by `sort_pairs`;
+    # the override is for this run only - the next full run and the search service filter candidates as configured
+    with open(sourcerer_properties_loc, "w") as f:
+        f.write(re.sub(r"^FILTER_CANDIDATES_BY_ID=.*$", "FILTER_CANDIDATES_BY_ID=false", original_properties,
+                       flags=re.MULTILINE))
+    try:
+        subprocess.check_call(["python3", "controller.py", str(args.nodes), str(args.threshold * 10),
+                               "--incremental", "--reset", "--heap", "{}m".format(args.heap_mb)],
+                              cwd=CLONE_DETECTOR_DIR)
+    finally:
+        with open(sourcerer_properties_loc, "w") as f:
+            f.write(original_properties)
+    log.info("Finished: `clone-detector` on new blocks")
+
+    # * save new pairs & update connected components
+    log.info("Starting: update connected components")
+    run_pairs = os.path.join(run_dir, "result.pairs.gz")
+    sort_pairs(inputs=[clone_detector_output], output=run_pairs)
+    changed = update_components(components_loc, get_line_iterator(run_pairs))
+    log.info("Finished: update connected components, %s components changed", len(changed))
+    results_files = [base_pairs] + sorted(glob.glob(os.path.join(tokenizer_output, "increments", "run_*",
+                                                                 "result.pairs.gz")))
+
+    # * prettify changed components
+    if changed:
+        log.info("Starting: prettify changed components")
+        prettier_attr = AttrDict()
+        prettier_attr.results_file = iter_component_pairs(results_files, load_components(components_loc), changed)
+        prettier_attr.stats_files = stats_loc
+        prettier_attr.output = os.path.join(args.output, "pretty", "run_%s" % run_id)
+        prettier_attr.bookkeeping_folder = bookkeeping_loc
+        prettier_attr.mode = args.mode
+        prettier_attr.filter = args.filter
+        prettier_main(prettier_attr)
+        log.info("Finished: prettify changed components")
+
+    if args.report_index:
+        log.info("Starting: results index")
+        build_index(results_file=results_files, stats_files=stats_loc, bookkeeping_folder=bookkeeping_loc,
+                    index_loc=os.path.join(args.output, "results.sqlite"))
+        log.info("Finished: results index")
+    if args.aggregate:
+        log.info("Starting: aggregate results")
+        # every run pairs its new blocks, so sorted pair files of the runs never share a pair
+        aggregate(results_files=results_files, stats_files=stats_loc, output=os.path.join(args.output, "aggregate"),
+                  bookkeeping_folder=bookkeeping_loc, sorted_input=True)
+        log.info("Finished: aggregate results")
+
+    state.record([digest for digest in archive_digests if digest[0] in new_archives], n_projects=len(new_archives),
+                 next_file_id=next_file_id(tokenizer_attr.stats_loc))
+    log.info("Finished: incremental run %s", run_id)
 
 
 if __name__ == "__main__":
@@ -198,6 +553,15 @@ if __name__ == "__main__":
                                                                    "(if less - function will be skipped).")
     parser.add_argument("--max-tokens", type=int, default=50000000, help="Maximum number of tokens in function "
                                                                          "(if more - function will be skipped).")
+    parser.add_argument("--nodes", type=int, default=None, help="Number of search nodes, queries are split between "
+                                                                "nodes by estimated search cost. Chosen from cores, "
+                                                                "memory & input size by default.")
+    parser.add_argument("--heap-mb", type=int, default=None, help="JVM heap of every node in MB. Chosen from memory "
+                                                                  "& input size by default.")
+    parser.add_argument("--processes", type=int, default=None, help="Number of tokenizer processes. Chosen from "
+                                                                    "cores, memory & number of archives by default.")
+    parser.add_argument("--shards", type=int, default=5, help="Maximum number of index shards, boundaries are "
+                                                              "selected from the distribution of block sizes.")
     # prettier's arguments
     parser.add_argument("-m", "--mode", default="all-to-all", choices=["all-to-all", "versus"],
                         help="Mode - if `all-to-all` no filtering will be applied, "
@@ -206,7 +570,61 @@ if __name__ == "__main__":
     parser.add_argument("-f", "--filter", nargs="*", help="List of repositories (archive names without path) "
                                                           "that will be used for filtering "
                                                           "in case of selected mode `versus`")
-
+    parser.add_argument("--report-index", action="store_true", help="Build results index (`results.sqlite` in "
+                                                                    "output directory) to browse results with "
+                                                                    "`report_server.py`.")
+    parser.add_argument("--incremental", action="store_true", help="Process only archives that were not processed "
+                                                                   "by previous `--incremental` runs: new blocks "
+                                                                   "are added to the index and searched against "
+                                                                   "all blocks, connected components are updated.")
+    parser.add_argument("--engine", default="java", choices=["java", "python", "minhash"],
+                        help="`java` - SourcererCC `clone-detector` (index & search nodes), `python` - in-process "
+                             "NumPy search without JVM launches, faster for small & medium corpora, `minhash` - "
+                             "approximate search: MinHash/LSH candidates verified exactly, trades recall for speed "
+                             "(measure it with `minhash_lsh.py recall`).")
+    parser.add_argument("--lsh-bands", type=int, default=DEFAULT_BANDS, help="LSH bands of `--engine minhash`, "
+                                                                             "more bands - higher recall.")
+    parser.add_argument("--lsh-rows", type=int, default=DEFAULT_ROWS, help="Hashes per LSH band of `--engine "
+                                                                           "minhash`, more rows - fewer candidates.")
+    parser.add_argument("--lsh-max-bucket", type=int, default=MAX_BUCKET,
+                        help="LSH buckets of `--engine minhash` with more blocks are cut into chunks, pairs from "
+                             "different chunks are not compared (their number is printed), 0 - no limit.")
+    parser.add_argument("--serve", action="store_true", help="Build the index and start a resident search service "
+                                                             "on it instead of searching, query it with "
+                                                             "`clone-detector/search_client.py`.")
+    parser.add_argument("--port", type=int, default=0, help="Port of the search service, any free port by default.")
+    parser.add_argument("--force", action="store_true", help="Rerun all stages even if their inputs & parameters "
+                                                             "didn't change since the previous run.")
+    parser.add_argument("--aggregate", action="store_true", help="Save per-project-pair statistics (sparse "
+                                                                 "project x project matrices) to `aggregate` in "
+                                                                 "output directory.")
+    parser.add_argument("--save-pairs", action="store_true", help="Save sorted & deduplicated pairs to "
+                                                                  "`tokens/result.pairs.gz` in output directory "
+                                                                  "(always saved with `--report-index` or "
+                                                                  "`--aggregate`).")
+    parser.add_argument("--report-similarity", action="store_true", help="Add similarity of every pair as the 5th "
+                                                                         "field of results, so one search at the "
+                                                                         "lowest threshold of interest serves any "
+                                                                         "higher `--output-threshold`.")
+    parser.add_argument("--output-threshold", type=float, default=None, help="Keep only pairs with at least this "
+                                                                             "similarity in prettified results, "
+                                                                             "results index & aggregation, requires "
+                                                                             "`--report-similarity`.")
+    parser.add_argument("--collapse-duplicates", action="store_true", help="Index & search only one block of every "
+                                                                           "group of blocks with the same tokens, "
+                                                                           "groups are saved to `tokens/"
+                                                                           "duplicate_groups.csv` in output "
+                                                                           "directory.")
+    parser.add_argument("--expand-duplicates", action="store_true", help="Expand pairs of collapsed blocks into "
+                                                                         "pairs of all blocks of their groups (and "
+                                                                         "pairs inside groups) in prettified results, "
+                                                                         "results index & aggregation.")
+    parser.add_argument("--dry-run", action="store_true", help="Only estimate blocks, tokens, clone pairs, disk, "
+                                                               "memory and runtime of every stage from zip central "
+                                                               "directories and exit.")
+    parser.add_argument("--dry-run-sample", type=int, default=0, help="Number of archives tokenized & searched by "
+                                                                      "`--dry-run` to measure rates of the input, "
+                                                                      "default rates if 0.")
     args = parser.parse_args()
 
     if args.threshold < 0 or args.threshold > 1:
@@ -215,6 +633,20 @@ if __name__ == "__main__":
         raise ValueError("Please check arguments: min_tokens ({min_tokens}) and max_tokens ({max_tokens})".format(
             min_tokens=args.min_tokens, max_tokens=args.max_tokens))
 
+    if args.output_threshold is not None and not args.report_similarity:
+        raise ValueError("`--output-threshold` requires `--report-similarity`.")
+    if args.output_threshold is not None and args.output_threshold < args.threshold:
+        raise ValueError("`--output-threshold` ({}) can't be lower than the search threshold ({}).".format(
+            args.output_threshold, args.threshold))
+
+    if args.expand_duplicates and not args.collapse_duplicates:
+        raise ValueError("`--expand-duplicates` requires `--collapse-duplicates`.")
+    if args.collapse_duplicates and (args.serve or args.incremental):
+        raise ValueError("`--collapse-duplicates` can't be used with `--serve` and `--incremental`.")
+
+    if args.engine != "java" and (args.serve or args.incremental):
+        raise ValueError("`--serve` and `--incremental` require `--engine java`.")
+
     if args.mode == "versus" and not args.filter:
         print(args.filter)
         raise ValueError("In case of `versus` mode - args `--filter` required.")
@@ -223,4 +655,24 @@ if __name__ == "__main__":
     log.getLogger().setLevel("DEBUG")
     handler = log.getLogger().handlers[0]
     handler.setFormatter(AwesomeFormatter())
-    main(args)
+
+    # * resource plan: settings that are not given explicitly are chosen for this machine & input
+    n_archives, input_mb = input_size(get_archives(args.input))
+    plan = plan_resources(available_cores(), available_memory_mb(), n_archives, input_mb, nodes=args.nodes,
+                          heap_mb=args.heap_mb, tokenizer_processes=args.processes)
+    log.info("Resource plan: %s cores, %s MB memory, %s archives (%s MB uncompressed) -> %s tokenizer processes "
+             "(batch of %s projects), %s search nodes with %s MB heap, threads %s", plan.cores, plan.memory_mb,
+             plan.n_archives, plan.input_mb, plan.tokenizer_processes, plan.projects_batch, plan.nodes, plan.heap_mb,
+             " ".join("%s=%s" % item for item in sorted(plan.threads.items())))
+    args.nodes, args.heap_mb, args.tokenizer_processes = plan.nodes, plan.heap_mb, plan.tokenizer_processes
+    args.projects_batch, args.threads = plan.projects_batch, plan.threads
+    if args.dry_run:
+        archives = get_archives(args.input)
+        profile = sample_profile(archives, args.extensions, args.dry_run_sample, args.threshold, args.min_tokens,
+                                 args.max_tokens) if args.dry_run_sample else None
+        print(format_report(estimate_capacity(scan_archives(archives, args.extensions), plan, args.engine, args.mode,
+                                              bool(args.report_index or args.aggregate or args.save_pairs), profile)))
+    elif args.incremental:
+        incremental_main(args)
+    else:
+        main(args)
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Approximate clone detection for corpora too large for exact search (`main.py --engine minhash`).
+
+Candidates are generated by locality-sensitive hashing instead of prefix filtering, then verified exactly:
+* every block gets a weighted MinHash signature of `bands * rows` hashes: the i-th occurrence of a token is
+  a separate element, so signatures estimate the weighted Jaccard similarity `sum(min) / sum(max)` of bags;
+* signatures are cut into bands of `rows` hashes, blocks with equal band keys share a bucket, band tables
+  (band keys sorted with block rows) are written to disk as `.npy` files and read back memory-mapped one band
+  at a time;
+* blocks that share a bucket in at least one band are candidates, candidates are filtered by size, spilled to disk
+  in partitions by query (`candidates/part_<i>.bin` next to the tables), deduplicated one partition at a time and
+  verified at the configured threshold by `batch_verifier`, so all reported pairs are exact clones and only recall
+  is lost;
+* buckets bigger than `max_bucket` blocks (frequent boilerplate) are cut into chunks of blocks of similar size,
+  pairs of blocks from different chunks are not compared - their number is printed, `--max-bucket 0` compares
+  all of them.
+
+Memory: all blocks are held in RAM (CSR arrays: 16 bytes per distinct token of a block plus 24 bytes per block,
+as in `python_engine`), with 3 `int64` arrays of `n_blocks` for sizes & filters. Besides them a single window of
+a band table (TABLE_WINDOW entries, memory-mapped) with its bucket pairs - at most
+`TABLE_WINDOW * (max_bucket - 1) / 2` pairs, 8 bytes each in a few temporary arrays - and a single spilled
+partition of candidate keys (8 bytes per candidate and band it was found in, 1 / SPILL_PARTITIONS of all of them)
+are in memory at once. Without the bucket limit a bucket of `g` blocks puts `g * (g - 1) / 2` pairs in memory.
+
+A pair with similarity `overlap / max(size1, size2) >= threshold` has weighted Jaccard similarity at least
+`threshold / (2 - threshold)`, it becomes a candidate with probability `1 - (1 - J^rows)^bands`: more bands
+increase recall, more rows reduce candidates. `python minhash_lsh.py recall` measures recall against exact results
+on a sample of blocks.
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import sys
+from collections import namedtuple
+from typing import Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from batch_verifier import min_overlap
+from prettify_results import get_line_iterator
+from python_engine import Blocks, concat_blocks, format_pairs, max_candidate_size, pair_overlaps, read_blocks, \
+    search, select_blocks
+
+DEFAULT_BANDS = 32
+DEFAULT_ROWS = 4
+# (element, hash) values computed at once
+MAX_HASHED = 1 << 23
+# sorted band table entries processed at once
+TABLE_WINDOW = 1 << 20
+# buckets of frequent boilerplate are cut into chunks of blocks of similar size
+MAX_BUCKET = 1000
+# candidate keys are spilled to disk in partitions by query, a partition is deduplicated in memory
+SPILL_PARTITIONS = 64
+VERIFY_BATCH_SIZE = 1 << 22
+EMPTY_SIGNATURE = np.iinfo(np.uint64).max
+
+CandidateSpill = namedtuple("CandidateSpill", ["partitions", "skipped_pairs"])
+RecallReport = namedtuple("RecallReport", ["sample", "exact_pairs", "found_pairs", "recall", "lsh_pairs",
+                                           "lsh_seconds", "exact_seconds"])
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """ splitmix64 finalizer, arithmetic wraps around in uint64 """
+    values = values + np.uint64(0x9E3779B97F4A7C15)
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def collision_probability(similarity: float, bands: int, rows: int) -> float:
+    """ Probability that blocks with weighted Jaccard similarity `similarity` share a bucket """
+    return 1 - (1 - similarity ** rows) ** bands
+
+
+def jaccard_lower_bound(threshold: float) -> float:
+    """ Weighted Jaccard similarity of the least similar pair that is a clone at `threshold` """
+    return threshold / (2 - threshold)
+
+
+def signatures(blocks: Blocks, n_hashes: int, seed: int = 0) -> np.ndarray:
+    """
+    Weighted MinHash signatures.
+    :param blocks: blocks.
+    :param n_hashes: signature length.
+    :param seed: seed of hash functions.
+    :return: uint64 matrix `n_blocks x n_hashes`, rows of blocks without tokens are EMPTY_SIGNATURE.
+    """
+    seeds = _mix(np.arange(n_hashes, dtype=np.uint64) + np.uint64(seed * n_hashes))
+    result = np.full((len(blocks.sizes), n_hashes), EMPTY_SIGNATURE, dtype=np.uint64)
+    element_ptr = np.concatenate([[0], np.cumsum(blocks.counts)])[blocks.indptr]
+    start = 0
+    while start < len(blocks.sizes):
+        # blocks whose elements fit into MAX_HASHED values, at least one block
+        end = max(start + 1, int(np.searchsorted(element_ptr, element_ptr[start] + MAX_HASHED // n_hashes,
+                                                 side="right")) - 1)
+        end = min(end, len(blocks.sizes))
+        entries = slice(blocks.indptr[start], blocks.indptr[end])
+        counts = blocks.counts[entries]
+        tokens = np.repeat(blocks.tokens[entries], counts).astype(np.uint64)
+        occurrences = np.arange(len(tokens)) - np.repeat(np.cumsum(counts) - counts, counts)
+        elements = _mix((tokens << np.uint64(24)) ^ occurrences.astype(np.uint64))
+        block_starts = element_ptr[start:end] - element_ptr[start]
+        non_empty = element_ptr[start + 1:end + 1] > element_ptr[start:end]
+        if non_empty.any():
+            hashes = _mix(elements[:, None] ^ seeds[None, :])
+            result[start:end][non_empty] = np.minimum.reduceat(hashes, block_starts[non_empty], axis=0)
+        start = end
+    return result
+
+
+def build_tables(blocks: Blocks, bands: int, rows: int, table_dir: str, seed: int = 0) -> List[str]:
+    """
+    Compute signatures and write banded LSH tables.
+    :param blocks: blocks.
+    :param bands: number of bands.
+    :param rows: hashes per band.
+    :param table_dir: directory for tables.
+    :param seed: seed of hash functions.
+    :return: paths of tables, `<path>.keys.npy` - sorted band keys, `<path>.rows.npy` - block of every key.
+    """
+    os.makedirs(table_dir, exist_ok=True)
+    n_blocks = len(blocks.sizes)
+    raw_locs = [os.path.join(table_dir, "band_{}.raw.npy".format(band)) for band in range(bands)]
+    raw_keys = [np.lib.format.open_memmap(raw_loc, mode="w+", dtype=np.uint64, shape=(n_blocks,))
+                for raw_loc in raw_locs]
+    batch = max(1, MAX_HASHED // (bands * rows))
+    for start in range(0, n_blocks, batch):
+        signature = signatures(select_blocks(blocks, np.arange(start, min(start + batch, n_blocks))), bands * rows,
+                               seed)
+        # blocks without tokens never collide
+        empty = signature[:, 0] == EMPTY_SIGNATURE
+        for band in range(bands):
+            keys = np.zeros(len(signature), dtype=np.uint64)
+            for column in range(band * rows, (band + 1) * rows):
+                keys = _mix(keys ^ signature[:, column])
+            keys[empty] = EMPTY_SIGNATURE
+            raw_keys[band][start:start + len(signature)] = keys
+    for keys in raw_keys:
+        keys.flush()
+    del raw_keys
+
+    tables = []
+    for band, raw_loc in enumerate(raw_locs):
+        table = os.path.join(table_dir, "band_{}".format(band))
+        keys = np.load(raw_loc)
+        # blocks of similar size are neighbours within a bucket
+        order = np.lexsort((blocks.sizes, keys))
+        order = order[keys[order] != EMPTY_SIGNATURE]
+        np.save(table + ".keys.npy", keys[order])
+        np.save(table + ".rows.npy", order)
+        os.remove(raw_loc)
+        tables.append(table)
+    return tables
+
+
+def _expand(starts: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    owners = np.repeat(np.arange(len(lengths)), lengths)
+    offsets = np.arange(len(owners)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, owners
+
+
+def bucket_pairs(keys: np.ndarray, rows: np.ndarray, max_bucket: int = MAX_BUCKET) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs of blocks that share a bucket.
+    :param keys: sorted band keys.
+    :param rows: block of every key.
+    :param max_bucket: buckets are cut into chunks of this many blocks, 0 or None - buckets are not cut.
+    :return: first & second block of every pair.
+    """
+    n = len(keys)
+    max_bucket = max_bucket or max(n, 1)
+    positions = np.arange(n)
+    new_group = np.ones(n, dtype=bool)
+    new_group[1:] = keys[1:] != keys[:-1]
+    group_starts = np.flatnonzero(new_group)
+    group_of = np.cumsum(new_group) - 1
+    group_ends = np.append(group_starts[1:], n)[group_of]
+    group_start = group_starts[group_of]
+    chunk_start = group_start + (positions - group_start) // max_bucket * max_bucket
+    chunk_end = np.minimum(group_ends, chunk_start + max_bucket)
+    second, first = _expand(positions + 1, chunk_end - positions - 1)
+    return rows[first], rows[second]
+
+
+def skipped_bucket_pairs(keys: np.ndarray, max_bucket: int = MAX_BUCKET) -> int:
+    """
+    Number of pairs of blocks that share a bucket but are not compared because the bucket is cut into chunks.
+    :param keys: sorted band keys.
+    :param max_bucket: buckets are cut into chunks of this many blocks, 0 or None - buckets are not cut.
+    :return: number of pairs.
+    """
+    if not max_bucket or len(keys) == 0:
+        return 0
+    new_group = np.ones(len(keys), dtype=bool)
+    new_group[1:] = keys[1:] != keys[:-1]
+    sizes = np.diff(np.append(np.flatnonzero(new_group), len(keys)))
+    sizes = sizes[sizes > max_bucket]
+    full_chunks, rest = sizes // max_bucket, sizes % max_bucket
+    compared = full_chunks * (max_bucket * (max_bucket - 1) // 2) + rest * (rest - 1) // 2
+    return int((sizes * (sizes - 1) // 2 - compared).sum())
+
+
+def candidate_pairs(blocks: Blocks, tables: List[str], threshold: float, spill_dir: str,
+                    n_queries: Optional[int] = None, max_bucket: int = MAX_BUCKET) -> CandidateSpill:
+    """
+    Candidate pairs from band tables filtered by size, spilled to disk in partitions by query.
+    :param blocks: blocks.
+    :param tables: paths of band tables.
+    :param threshold: similarity threshold.
+    :param spill_dir: directory for partitions.
+    :param n_queries: if not None - the last `n_queries` blocks are queries searched against the other blocks.
+    :param max_bucket: buckets are cut into chunks of this many blocks, 0 or None - buckets are not cut.
+    :return: paths of partitions (read them with `read_partition`, keys of partition `i` are smaller than keys of
+             partition `i + 1`) & number of pairs in cut buckets that were not compared.
+    """
+    n_blocks = len(blocks.sizes)
+    is_query = np.zeros(n_blocks, dtype=bool)
+    if n_queries is not None:
+        is_query[n_blocks - n_queries:] = True
+    min_sizes, max_sizes = min_overlap(blocks.sizes, threshold), max_candidate_size(blocks.sizes, threshold)
+    os.makedirs(spill_dir, exist_ok=True)
+    partitions = [os.path.join(spill_dir, "part_{}.bin".format(part)) for part in range(SPILL_PARTITIONS)]
+    # the first key of every partition after the first one
+    bounds = -(-np.arange(1, SPILL_PARTITIONS, dtype=np.int64) * n_blocks // SPILL_PARTITIONS) * n_blocks
+    files = [open(partition, "wb") for partition in partitions]
+    skipped = 0
+    try:
+        for table in tables:
+            keys = np.load(table + ".keys.npy", mmap_mode="r")
+            rows = np.load(table + ".rows.npy", mmap_mode="r")
+            skipped += _spill_table(blocks, keys, rows, is_query, n_queries is None, min_sizes, max_sizes, max_bucket,
+                                    bounds, files)
+    finally:
+        for f in files:
+            f.close()
+    return CandidateSpill(partitions=partitions, skipped_pairs=skipped)
+
+
+def _spill_table(blocks: Blocks, keys: np.ndarray, rows: np.ndarray, is_query: np.ndarray, self_search: bool,
+                 min_sizes: np.ndarray, max_sizes: np.ndarray, max_bucket: int, bounds: np.ndarray,
+                 files: List) -> int:
+    n_blocks = len(blocks.sizes)
+    skipped = 0
+    start = 0
+    while start < len(keys):
+        # windows end at bucket boundaries
+        end = int(np.searchsorted(keys, keys[min(start + TABLE_WINDOW, len(keys)) - 1], side="right"))
+        window_keys = np.asarray(keys[start:end])
+        skipped += skipped_bucket_pairs(window_keys, max_bucket)
+        first, second = bucket_pairs(window_keys, np.asarray(rows[start:end]), max_bucket)
+        if self_search:
+            # every pair is reported once, by the block with the larger id
+            swap = blocks.block_ids[first] < blocks.block_ids[second]
+            query, candidate = np.where(swap, second, first), np.where(swap, first, second)
+            keep = blocks.block_ids[query] != blocks.block_ids[candidate]
+        else:
+            swap = is_query[second]
+            query, candidate = np.where(swap, second, first), np.where(swap, first, second)
+            keep = is_query[query] & ~is_query[candidate]
+        keep &= (blocks.sizes[candidate] >= min_sizes[query]) & (blocks.sizes[candidate] <= max_sizes[query])
+        pair_keys = np.unique(query[keep] * n_blocks + candidate[keep])
+        splits = np.searchsorted(pair_keys, bounds)
+        for f, part_keys in zip(files, np.split(pair_keys, splits)):
+            part_keys.tofile(f)
+        start = end
+    return skipped
+
+
+def read_partition(partition: str) -> np.ndarray:
+    """ Sorted unique pair keys `query * n_blocks + candidate` of a spilled partition """
+    return np.unique(np.fromfile(partition, dtype=np.int64))
+
+
+def lsh_search(dataset: Blocks, queries: Optional[Blocks], threshold: float, bands: int = DEFAULT_BANDS,
+               rows: int = DEFAULT_ROWS, table_dir: Optional[str] = None, seed: int = 0,
+               report_similarity: bool = False, max_bucket: int = MAX_BUCKET) -> Iterator[str]:
+    """
+    Find clone pairs among LSH candidates.
+    :param dataset: indexed blocks.
+    :param queries: query blocks, if None - dataset is searched against itself.
+    :param threshold: similarity threshold.
+    :param bands: number of bands.
+    :param rows: hashes per band.
+    :param table_dir: directory for band tables, temporary directory if None.
+    :param seed: seed of hash functions.
+    :param report_similarity: add similarity of pairs as the 5th field.
+    :param max_bucket: buckets are cut into chunks of this many blocks, 0 or None - buckets are not cut.
+    :return: iterator of pairs `proj_id1,block_id1,proj_id2,block_id2[,similarity]` (query first).
+    """
+    blocks = concat_blocks(dataset, queries) if queries is not None else dataset
+    tmp_dir = tempfile.mkdtemp(prefix="lsh_") if table_dir is None else None
+    spill_dir = os.path.join(table_dir or tmp_dir, "candidates")
+    try:
+        tables = build_tables(blocks, bands, rows, table_dir or tmp_dir, seed)
+        spill = candidate_pairs(blocks, tables, threshold, spill_dir,
+                                len(queries.sizes) if queries is not None else None, max_bucket)
+        if spill.skipped_pairs:
+            print("{} pairs of blocks that share a bucket were not compared (counted in every band), buckets are cut "
+                  "into chunks of {} blocks".format(spill.skipped_pairs, max_bucket), file=sys.stderr)
+        n_blocks = len(blocks.sizes)
+        for partition in spill.partitions:
+            pair_keys = read_partition(partition)
+            os.remove(partition)
+            for batch_start in range(0, len(pair_keys), VERIFY_BATCH_SIZE):
+                batch = pair_keys[batch_start:batch_start + VERIFY_BATCH_SIZE]
+                query_idx, candidate_idx = batch // n_blocks, batch % n_blocks
+                overlaps = pair_overlaps(blocks, blocks, query_idx, candidate_idx)
+                clones = overlaps >= min_overlap(np.maximum(blocks.sizes[query_idx], blocks.sizes[candidate_idx]),
+                                                 threshold)
+                yield from format_pairs(blocks, blocks, query_idx[clones], candidate_idx[clones],
+                                        overlaps[clones] if report_similarity else None)
+    finally:
+        shutil.rmtree(tmp_dir if tmp_dir is not None else spill_dir, ignore_errors=True)
+
+
+def detect_clones(tokens_locs: List[str], output: str, threshold: float, min_tokens: int, max_tokens: int,
+                  query_proj_ids: Optional[Set[str]] = None, bands: int = DEFAULT_BANDS, rows: int = DEFAULT_ROWS,
+                  table_dir: Optional[str] = None, report_similarity: bool = False,
+                  max_bucket: int = MAX_BUCKET) -> int:
+    """
+    Find clone pairs in tokens files with LSH candidates and save them in the format of clone-detector results.
+    :param tokens_locs: tokens files or folders with them.
+    :param output: path to results file.
+    :param threshold: similarity threshold (0.8 means 80%).
+    :param min_tokens: blocks with fewer tokens are ignored.
+    :param max_tokens: blocks with more tokens are ignored.
+    :param query_proj_ids: projects searched against the rest (versus mode), if None - all-to-all.
+    :param bands: number of bands.
+    :param rows: hashes per band.
+    :param table_dir: directory for band tables, temporary directory if None.
+    :param report_similarity: add similarity of pairs as the 5th field.
+    :param max_bucket: buckets are cut into chunks of this many blocks, 0 or None - buckets are not cut.
+    :return: number of pairs.
+    """
+    dataset, queries = read_blocks(tokens_locs, min_tokens, max_tokens, query_proj_ids)
+    n_pairs = 0
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        for pair in lsh_search(dataset, queries, threshold, bands, rows, table_dir,
+                               report_similarity=report_similarity, max_bucket=max_bucket):
+            f.write(pair + "\n")
+            n_pairs += 1
+    return n_pairs
+
+
+def _pair_key(pair: str, self_search: bool) -> Tuple[str, str]:
+    parts = pair.split(",")
+    if self_search and int(parts[1]) < int(parts[3]):
+        return parts[3], parts[1]
+    return parts[1], parts[3]
+
+
+def measure_recall(tokens_locs: List[str], threshold: float, min_tokens: int, max_tokens: int,
+                   query_proj_ids: Optional[Set[str]] = None, bands: int = DEFAULT_BANDS, rows: int = DEFAULT_ROWS,
+                   sample: int = 1000, exact_results: Optional[str] = None, seed: int = 0,
+                   max_bucket: int = MAX_BUCKET) -> RecallReport:
+    """
+    Recall of LSH search on a sample of query blocks: the share of exact clone pairs of sampled blocks that
+    LSH search finds. Exact pairs are read from `exact_results` (e.g. clone-detector results) or found by exact
+    search of the sampled blocks.
+    :param tokens_locs: tokens files or folders with them.
+    :param threshold: similarity threshold.
+    :param min_tokens: blocks with fewer tokens are ignored.
+    :param max_tokens: blocks with more tokens are ignored.
+    :param query_proj_ids: projects searched against the rest (versus mode), if None - all-to-all.
+    :param bands: number of bands.
+    :param rows: hashes per band.
+    :param sample: number of sampled query blocks.
+    :param exact_results: file with exact results, exact search of the sample if None.
+    :param seed: random seed of the sample.
+    :param max_bucket: buckets are cut into chunks of this many blocks, 0 or None - buckets are not cut.
+    :return: recall report.
+    """
+    dataset, queries = read_blocks(tokens_locs, min_tokens, max_tokens, query_proj_ids)
+    self_search = queries is None
+    searched = dataset if self_search else queries
+    sampled_rows = np.array(sorted(random.Random(seed).sample(range(len(searched.sizes)),
+                                                              min(sample, len(searched.sizes)))), dtype=np.int64)
+    sampled = {str(block_id) for block_id in searched.block_ids[sampled_rows].tolist()}
+
+    def touches_sample(pair_key):
+        return pair_key[0] in sampled or (self_search and pair_key[1] in sampled)
+
+    started = time.time()
+    lsh_pairs = {_pair_key(pair, self_search) for pair in lsh_search(dataset, queries, threshold, bands, rows,
+                                                                  max_bucket=max_bucket)}
+    lsh_seconds = time.time() - started
+
+    started = time.time()
+    if exact_results is not None:
+        exact = {_pair_key(pair, self_search) for pair in get_line_iterator(exact_results) if pair}
+    else:
+        # sampled blocks are searched against the whole dataset, they also find themselves
+        exact = {_pair_key(pair, self_search) for pair in search(dataset, select_blocks(searched, sampled_rows),
+                                                                 threshold)}
+        exact = {pair for pair in exact if pair[0] != pair[1]}
+    exact_seconds = time.time() - started
+    exact = {pair for pair in exact if touches_sample(pair)}
+    found = {pair for pair in lsh_pairs if touches_sample(pair)} & exact
+    return RecallReport(sample=len(sampled_rows), exact_pairs=len(exact), found_pairs=len(found),
+                        recall=len(found) / len(exact) if exact else 1.0, lsh_pairs=len(lsh_pairs),
+                        lsh_seconds=lsh_seconds, exact_seconds=exact_seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["search", "recall"],
+                        help="`search` - find clone pairs, `recall` - measure recall on a sample of blocks.")
+    parser.add_argument("tokens", nargs="+", help="Tokens files or folders with them.")
+    parser.add_argument("-o", "--output", help="Results file (`search`).")
+    parser.add_argument("-t", "--threshold", type=float, default=0.8, help="Similarity threshold.")
+    parser.add_argument("--min-tokens", type=int, default=65, help="Minimum number of tokens in block.")
+    parser.add_argument("--max-tokens", type=int, default=500000, help="Maximum number of tokens in block.")
+    parser.add_argument("-q", "--query-projects", nargs="*", default=None,
+                        help="Ids of projects searched against the other projects (versus mode).")
+    parser.add_argument("-b", "--bands", type=int, default=DEFAULT_BANDS, help="Number of LSH bands.")
+    parser.add_argument("-r", "--rows", type=int, default=DEFAULT_ROWS, help="Hashes per LSH band.")
+    parser.add_argument("--max-bucket", type=int, default=MAX_BUCKET,
+                        help="Buckets with more blocks are cut into chunks of blocks of similar size, pairs from "
+                             "different chunks are not compared (their number is printed), 0 - no limit: all pairs "
+                             "of a bucket are held in memory at once.")
+    parser.add_argument("--tables", default=None, help="Directory for band tables (`search`), temporary "
+                                                       "directory by default.")
+    parser.add_argument("--report-similarity", action="store_true",
+                        help="Add similarity of pairs as the 5th field (`search`).")
+    parser.add_argument("--sample", type=int, default=1000, help="Number of sampled blocks (`recall`).")
+    parser.add_argument("--exact", default=None, help="Exact results to compare with (`recall`), exact search "
+                                                      "of the sample by default.")
+    args = parser.parse_args()
+    query_proj_ids = set(args.query_projects) if args.query_projects is not None else None
+    print("collision probability at threshold {}: {:.4f}".format(
+        args.threshold, collision_probability(jaccard_lower_bound(args.threshold), args.bands, args.rows)))
+
+    if args.command == "search":
+        if not args.output:
+            parser.error("`search` requires --output")
+        n_pairs = detect_clones(args.tokens, args.output, args.threshold, args.min_tokens, args.max_tokens,
+                                query_proj_ids, args.bands, args.rows, args.tables, args.report_similarity,
+                                args.max_bucket)
+        print("{} clone pairs saved to {}".format(n_pairs, args.output))
+    else:
+        report = measure_recall(args.tokens, args.threshold, args.min_tokens, args.max_tokens, query_proj_ids,
+                                args.bands, args.rows, args.sample, args.exact, max_bucket=args.max_bucket)
+        print("recall {:.4f}: {} of {} exact pairs of {} sampled blocks found".format(
+            report.recall, report.found_pairs, report.exact_pairs, report.sample))
+        print("LSH search: {} pairs in {:.1f} s, exact search of the sample: {:.1f} s".format(
+            report.lsh_pairs, report.lsh_seconds, report.exact_seconds))
@@ -0,0 +1,90 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import minhash_lsh
+from minhash_lsh import bucket_pairs, detect_clones, measure_recall, skipped_bucket_pairs
+from python_engine import detect_clones as detect_exact_clones
+
+
+def _write_tokens(tokens_loc, blocks):
+    with open(tokens_loc, "w") as f:
+        for proj_id, block_id, bag in blocks:
+            size = sum(bag.values())
+            tokens = ",".join("{}@@::@@{}".format(token, count) for token, count in bag.items())
+            f.write("{},{},{},{},0,hash@#@{}\n".format(proj_id, block_id, size, len(bag), tokens))
+
+
+class TestMinHashLSH(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(2)
+        base = [{"t%s" % rnd.randrange(300): rnd.randint(1, 3) for _ in range(rnd.randint(20, 60))}
+                for _ in range(20)]
+        self.blocks = []
+        for block in range(400):
+            bag = dict(base[block % len(base)])
+            for _ in range(rnd.randint(0, 4)):
+                bag["t%s" % rnd.randrange(400)] = rnd.randint(1, 3)
+            self.blocks.append((1 + block % 7, block, bag))
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tokens_loc = os.path.join(self.tmp.name, "blocks.tokens")
+        _write_tokens(self.tokens_loc, self.blocks)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _pairs(self, detect, query_proj_ids=None, **kwargs):
+        output = os.path.join(self.tmp.name, "results.pairs")
+        detect([self.tokens_loc], output, 0.8, 1, 10000, query_proj_ids, **kwargs)
+        with open(output) as f:
+            return set(f.read().split())
+
+    def test_subset_of_exact(self):
+        for query_proj_ids in [None, {"1", "2"}]:
+            exact = self._pairs(detect_exact_clones, query_proj_ids)
+            approximate = self._pairs(detect_clones, query_proj_ids, bands=32, rows=4)
+            self.assertTrue(approximate <= exact)
+            self.assertGreater(len(approximate), 0.95 * len(exact))
+
+    def test_recall(self):
+        exact_loc = os.path.join(self.tmp.name, "exact.pairs")
+        detect_exact_clones([self.tokens_loc], exact_loc, 0.8, 1, 10000)
+        computed = measure_recall([self.tokens_loc], 0.8, 1, 10000, sample=50)
+        given = measure_recall([self.tokens_loc], 0.8, 1, 10000, sample=50, exact_results=exact_loc)
+        self.assertEqual(computed.exact_pairs, given.exact_pairs)
+        self.assertEqual(computed.found_pairs, given.found_pairs)
+        self.assertGreater(computed.recall, 0.95)
+        # a single hash per band and a single band misses pairs
+        self.assertLess(measure_recall([self.tokens_loc], 0.8, 1, 10000, bands=1, rows=8, sample=50).recall,
+                        computed.recall)
+
+    def test_bucket_pairs(self):
+        keys = np.array([1, 1, 1, 2, 3, 3, 3, 3, 3], dtype=np.uint64)
+        first, second = bucket_pairs(keys, np.arange(len(keys)) + 10, max_bucket=3)
+        self.assertEqual(sorted(zip(first.tolist(), second.tolist())),
+                         [(10, 11), (10, 12), (11, 12), (14, 15), (14, 16), (15, 16), (17, 18)])
+
+        # without the limit all pairs of a bucket are compared
+        first, second = bucket_pairs(keys, np.arange(len(keys)), max_bucket=0)
+        self.assertEqual(len(first), 3 + 10)
+        # a bucket of 5 is cut into 3 + 2: 10 - 3 - 1 pairs are skipped
+        self.assertEqual(skipped_bucket_pairs(keys, max_bucket=3), 6)
+        self.assertEqual(skipped_bucket_pairs(keys, max_bucket=0), 0)
+        self.assertEqual(skipped_bucket_pairs(keys[:3], max_bucket=3), 0)
+
+    def test_spilled_partitions(self):
+        # every block shares all buckets: only chunks of 10 blocks are compared, pairs are spilled to many partitions
+        self.blocks = [(1, block, {"a": 10, "b": 10}) for block in range(100)]
+        _write_tokens(self.tokens_loc, self.blocks)
+        self.assertEqual(len(self._pairs(detect_clones, max_bucket=10)), 10 * 45)
+        for partitions in [1, 7, 200]:
+            with mock.patch.object(minhash_lsh, "SPILL_PARTITIONS", partitions):
+                self.assertEqual(len(self._pairs(detect_clones, max_bucket=0)), 100 * 99 // 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Stage-level caching for `main.py`.
+
+Every stage of the pipeline records a fingerprint of its inputs & parameters in `pipeline_state.json`.
+The fingerprint of a stage includes the fingerprint of the previous stage, so a change of archives
+invalidates tokenization and everything after it, while a change of the number of nodes only invalidates search.
+On rerun stages with matching fingerprints (and existing outputs) are skipped, the pipeline resumes from the first
+invalidated stage and all stages after it are rerun.
+Every completed stage also records its resource usage (wall & CPU time, peak RSS, bytes written), benchmarks read it.
+"""
+import datetime as dt
+import hashlib
+import json
+import os
+import resource
+import time
+from collections import namedtuple
+from typing import Callable, Dict, Iterable, List, Tuple
+
+STATE_FILE_NAME = "pipeline_state.json"
+DIGEST_CHUNK_SIZE = 1 << 20
+PROC_IO_LOC = "/proc/self/io"
+
+ResourceUsage = namedtuple("ResourceUsage", ["wall_s", "cpu_s", "max_rss_mb", "bytes_written"])
+
+
+def fingerprint(parent: str, params: Dict) -> str:
+    """
+    Fingerprint of a stage.
+    :param parent: fingerprint of the previous stage, empty for the first stage.
+    :param params: JSON-serializable inputs & parameters of the stage.
+    :return: hex digest.
+    """
+    content = json.dumps({"parent": parent, "params": params}, sort_keys=True)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """
+    SHA-1 of file content.
+    :param path: path to file.
+    :return: hex digest.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def resource_usage() -> ResourceUsage:
+    """
+    Resource usage of this process and its finished subprocesses so far.
+    `max_rss_mb` is the high-water mark of the process or of its largest subprocess, `bytes_written` is read from
+    `/proc/self/io` (None where it's not available).
+    :return: usage, wall time is a monotonic clock reading.
+    """
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    bytes_written = None
+    if os.path.isfile(PROC_IO_LOC):
+        with open(PROC_IO_LOC) as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name == "write_bytes":
+                    bytes_written = int(value)
+    # `ru_maxrss` is in KB on Linux
+    return ResourceUsage(wall_s=time.monotonic(),
+                         cpu_s=own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime,
+                         max_rss_mb=max(own.ru_maxrss, children.ru_maxrss) / 1024, bytes_written=bytes_written)
+
+
+def usage_delta(start: ResourceUsage, end: ResourceUsage) -> Dict:
+    """
+    Resource usage between two readings.
+    :param start: reading before.
+    :param end: reading after.
+    :return: JSON-serializable usage, peak RSS is the high-water mark at the end.
+    """
+    return {"wall_s": round(end.wall_s - start.wall_s, 3), "cpu_s": round(end.cpu_s - start.cpu_s, 3),
+            "max_rss_mb": round(end.max_rss_mb, 1),
+            "bytes_written": end.bytes_written - start.bytes_written if end.bytes_written is not None else None}
+
+
+class PipelineState:
+    """
+    Fingerprints of completed stages saved in the output directory.
+    """
+
+    def __init__(self, output_dir: str, reset: bool = False):
+        self.state_loc = os.path.join(output_dir, STATE_FILE_NAME)
+        self.state = {"stages": {}, "digests": {}}
+        if not reset and os.path.isfile(self.state_loc):
+            with open(self.state_loc, encoding="utf-8") as f:
+                self.state = json.load(f)
+        # once a stage is rerun all the following stages are rerun too
+        self.dirty = False
+        # True while a stage runs if its partial results from an interrupted run can't be reused
+        self.from_scratch = False
+
+    def archive_digests(self, archive_locs: Iterable[str]) -> List[Tuple[str, str]]:
+        """
+        Content digests of archives, digest is recomputed only if size or modification time of archive changed.
+        :param archive_locs: paths to archives.
+        :return: sorted list of (archive name, digest).
+        """
+        digests = self.state.setdefault("digests", {})
+        result = []
+        for path in sorted(archive_locs):
+            stat = os.stat(path)
+            key = os.path.abspath(path)
+            cached = digests.get(key)
+            if cached is None or cached["size"] != stat.st_size or cached["mtime"] != stat.st_mtime_ns:
+                cached = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha1": file_digest(path)}
+                digests[key] = cached
+            result.append((os.path.basename(path), cached["sha1"]))
+        self.save()
+        return result
+
+    def previous(self, stage: str) -> str:
+        """
+        Fingerprint recorded for stage in previous runs.
+        :param stage: stage name.
+        :return: fingerprint, None if stage was never completed.
+        """
+        return self.state["stages"].get(stage, {}).get("fingerprint")
+
+    def is_valid(self, stage: str, stage_fingerprint: str, outputs: Iterable[str] = ()) -> bool:
+        """
+        Check if stage can be skipped.
+        :param stage: stage name.
+        :param stage_fingerprint: fingerprint of current inputs & parameters.
+        :param outputs: paths that have to exist for the stage to be skipped.
+        :return: True if the stage was completed with the same fingerprint and no previous stage was rerun.
+        """
+        return not self.dirty and self.previous(stage) == stage_fingerprint and \
+            all(os.path.exists(output) for output in outputs)
+
+    def run(self, stage: str, stage_fingerprint: str, func: Callable[[], None], outputs: Iterable[str] = ()) -> bool:
+        """
+        Run stage unless it can be skipped and record its fingerprint after it succeeds.
+        :param stage: stage name.
+        :param stage_fingerprint: fingerprint of current inputs & parameters.
+        :param func: stage implementation.
+        :param outputs: paths that have to exist for the stage to be skipped.
+        :return: True if the stage was run, False if skipped.
+        """
+        if self.is_valid(stage, stage_fingerprint, outputs):
+            return False
+        self.from_scratch = self.dirty or self.previous(stage) is not None
+        self.dirty = True
+        # stage is not valid until it finishes
+        self.state["stages"].pop(stage, None)
+        self.save()
+        start = resource_usage()
+        func()
+        self.state["stages"][stage] = {"fingerprint": stage_fingerprint,
+                                       "finished": dt.datetime.now().isoformat(timespec="seconds"),
+                                       "usage": usage_delta(start, resource_usage())}
+        self.save()
+        return True
+
+    def save(self) -> None:
+        """
+        Atomically save state.
+        :return: None.
+        """
+        tmp_loc = self.state_loc + ".tmp"
+        with open(tmp_loc, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_loc, self.state_loc)
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+from pipeline_state import PipelineState, fingerprint
+
+
+class TestPipelineState(unittest.TestCase):
+    def _run_pipeline(self, output_dir, params, calls, fail_at=None):
+        state = PipelineState(output_dir)
+        stage_fingerprint = ""
+        for name in ["config", "tokenize", "search", "prettify"]:
+            stage_fingerprint = fingerprint(stage_fingerprint, params.get(name, {}))
+
+            def func(name=name):
+                if name == fail_at:
+                    raise RuntimeError(name)
+                calls.append((name, state.from_scratch))
+
+            state.run(name, stage_fingerprint, func)
+
+    def test_resume_from_invalidated_stage(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            calls = []
+            self._run_pipeline(tmp_dir, {"config": {"archives": ["a.zip"]}, "search": {"nodes": 2}}, calls)
+            self.assertEqual([name for name, _ in calls], ["config", "tokenize", "search", "prettify"])
+
+            calls = []
+            self._run_pipeline(tmp_dir, {"config": {"archives": ["a.zip"]}, "search": {"nodes": 2}}, calls)
+            self.assertEqual(calls, [])
+
+            # only search and stages after it depend on the number of nodes
+            calls = []
+            self._run_pipeline(tmp_dir, {"config": {"archives": ["a.zip"]}, "search": {"nodes": 4}}, calls)
+            self.assertEqual(calls, [("search", True), ("prettify", True)])
+
+    def test_interrupted_stage_is_resumed(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with self.assertRaises(RuntimeError):
+                self._run_pipeline(tmp_dir, {}, [], fail_at="search")
+            calls = []
+            self._run_pipeline(tmp_dir, {}, calls)
+            # partial results of the interrupted stage can be reused, the following stages start from scratch
+            self.assertEqual(calls, [("search", False), ("prettify", True)])
+
+    def test_stage_usage(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            state = PipelineState(tmp_dir)
+
+            def write():
+                with open(os.path.join(tmp_dir, "out.bin"), "wb") as f:
+                    f.write(b"x" * 100000)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            state.run("write", fingerprint("", {}), write)
+            usage = PipelineState(tmp_dir).state["stages"]["write"]["usage"]
+            self.assertEqual(sorted(usage), ["bytes_written", "cpu_s", "max_rss_mb", "wall_s"])
+            self.assertGreaterEqual(usage["wall_s"], 0)
+            self.assertGreater(usage["max_rss_mb"], 0)
+            if usage["bytes_written"] is not None:
+                self.assertGreaterEqual(usage["bytes_written"], 100000)
+
+    def test_archive_digests(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive = os.path.join(tmp_dir, "a.zip")
+            with open(archive, "wb") as f:
+                f.write(b"content")
+            state = PipelineState(tmp_dir)
+            digests = state.archive_digests([archive])
+            self.assertEqual(digests, [("a.zip", "040f06fd774092478d450774f5ba30c5da78acc8")])
+            with open(archive, "ab") as f:
+                f.write(b"!")
+            self.assertNotEqual(PipelineState(tmp_dir).archive_digests([archive]), digests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,21 +4,25 @@ import argparse
 from argparse import ArgumentParser
 from collections import defaultdict, namedtuple
 import datetime as dt
-import difflib
+import gzip
 import json
 import os
 import sys
-from typing import Callable, Dict, Iterator, Generator, List, Set, Tuple, Union
+from typing import Callable, Dict, Iterable, Iterator, Generator, List, Set, Tuple, Union
 import zipfile
 
 from tabulate import tabulate
 from tqdm import tqdm
 
+from diff_renderer import DEFAULT_LIMITS, DiffLimits, FastHtmlDiff
+
 # block information available after parsing result file from SourcererCC with pairs
 PairBlock = namedtuple("PairBlock", ["proj_id", "block_id"])
 # helper structures
 Block = namedtuple("Block", ["project", "filepath", "start_line", "end_line", "content"])
 BlockMeta = namedtuple("BlockMeta", ["project", "filepath", "start_line", "end_line"])
+# digits of similarity reported in results
+SIMILARITY_DIGITS = 4
 
 
 def convert_block2meta(block: Block) -> BlockMeta:
@@ -34,19 +38,52 @@ def convert_block2meta(block: Block) -> BlockMeta:
 def get_line_iterator(filename: str) -> Iterator[str]:
     """
     Return line (without newline) iterator for filename.
-    :param filename: path to file.
+    :param filename: path to file, gzip-compressed files (`*.gz`) are decompressed on the fly.
     :return: line iterator.
     """
-    with open(filename, encoding="utf-8") as file_descr:
+    open_f = gzip.open if filename.endswith(".gz") else open
+    with open_f(filename, "rt", encoding="utf-8") as file_descr:
         for line in file_descr:
             yield line.strip("\n")
 
 
-def get_result_pairs(results_file: str, filter_f: Callable = None) -> List[Tuple[PairBlock, PairBlock]]:
+def format_similarity(overlap: int, size: int) -> str:
+    """
+    Similarity of a pair for the optional 5th field of results (`proj_id1,block_id1,proj_id2,block_id2,similarity`).
+    The value is rounded down to SIMILARITY_DIGITS digits, so filtering at thresholds with at most SIMILARITY_DIGITS
+    digits gives the same pairs as searching at them.
+    :param overlap: overlap of bags of the pair.
+    :param size: size of the bigger block.
+    :return: similarity, e.g. `0.8125`.
+    """
+    scale = 10 ** SIMILARITY_DIGITS
+    whole, fraction = divmod(overlap * scale // size, scale)
+    return "%d.%0*d" % (whole, SIMILARITY_DIGITS, fraction)
+
+
+def filter_by_similarity(lines: Iterable[str], threshold: Union[float, None]) -> Iterator[str]:
+    """
+    Keep pairs with similarity of at least threshold, pairs without the similarity field are kept as is.
+    :param lines: lines of results file.
+    :param threshold: similarity threshold, if None - all pairs are kept.
+    :return: iterator of lines.
+    """
+    for line in lines:
+        if threshold is not None:
+            parts = line.split(",", 5)
+            if len(parts) > 4 and parts[4] and float(parts[4]) < threshold:
+                continue
+        yield line
+
+
+def get_result_pairs(results_file: Union[str, Iterable[str]], filter_f: Callable = None,
+                     threshold: Union[float, None] = None) -> List[Tuple[PairBlock, PairBlock]]:
     """
     Parse result file with pairs from SourcererCC and return (filtered) pairs.
-    :param results_file: path to file with result from SourcererCC.
+    :param results_file: path to file with result from SourcererCC or iterator of its lines
+                         (e.g. node outputs merged by `sort_pairs.iter_sorted_pairs`).
     :param filter_f: filter function - if None - no filtering.
+    :param threshold: pairs with lower similarity are skipped (if results have similarity), None - no filtering.
     :return: list of tuples where each tuple contains Block for first and second element in pair.
     """
     if filter_f is None:
@@ -54,8 +91,10 @@ def get_result_pairs(results_file: str, filter_f: Callable = None) -> List[Tuple
 
     result_pairs = []
     i = -1
-    for i, line in enumerate(get_line_iterator(results_file)):
-        proj_id1, block_id1, proj_id2, block_id2 = line.split(",")
+    lines = get_line_iterator(results_file) if isinstance(results_file, str) else results_file
+    for i, line in enumerate(filter_by_similarity(lines, threshold)):
+        # the optional 5th field is similarity
+        proj_id1, block_id1, proj_id2, block_id2 = line.split(",")[:4]
         if filter_f(proj_id1, proj_id2):
             result_pairs.append((PairBlock(proj_id=proj_id1, block_id=block_id1),
                                  PairBlock(proj_id=proj_id2, block_id=block_id2)))
@@ -214,12 +253,13 @@ def get_block_metainfo(metainfo_filepath: str, proj_block_ids: Set[PairBlock]) -
     return block2metainfo
 
 
-def generate_html(cc: Dict, html_loc: str, next_html_loc: str) -> None:
+def generate_html(cc: Dict, html_loc: str, next_html_loc: str, limits: DiffLimits = DEFAULT_LIMITS) -> None:
     """
     Generate HTML diff for connected component, put some statistics,
     :param cc: connected component.
     :param html_loc: html location.
     :param next_html_loc: next html location.
+    :param limits: caps on block size and diff time, see `diff_renderer.DiffLimits`.
     """
     # Connected component structure
     # contents: {content_id: content}
@@ -230,7 +270,7 @@ def generate_html(cc: Dict, html_loc: str, next_html_loc: str) -> None:
     content_id2 = cc["blocks"][block_id2][1]
     content1 = cc["contents"][content_id1]
     content2 = cc["contents"][content_id2]
-    diff_html = difflib.HtmlDiff().make_file(content1.splitlines(), content2.splitlines())
+    diff_html = FastHtmlDiff(limits).make_file(content1.splitlines(), content2.splitlines())
 
     # metainformation
     meta1 = cc["blocks"][block_id1][0]
@@ -246,13 +286,15 @@ def generate_html(cc: Dict, html_loc: str, next_html_loc: str) -> None:
         f.write("\n".join([next_html_link, meta_table, diff_html]))
 
 
-def dump_connected_component(output_dir: str, connected_component: Dict, cc_id: int) -> None:
+def dump_connected_component(output_dir: str, connected_component: Dict, cc_id: int,
+                             limits: DiffLimits = DEFAULT_LIMITS) -> None:
     """
     Create subdirectory, save JSON with connected component and html with statistics about connected component and
     several examples of pairs.
     :param output_dir: base directory to store results.
     :param connected_component: connected component.
     :param cc_id: id of connected component.
+    :param limits: caps on block size and diff time for HTML diff.
     :return: None.
     """
     res_dir = os.path.join(output_dir, "cc_%s" % cc_id)
@@ -265,7 +307,7 @@ def dump_connected_component(output_dir: str, connected_component: Dict, cc_id:
     next_cc_id = cc_id + 1
     next_res_dir = os.path.join("..", "cc_%s" % next_cc_id)
     next_html_loc = os.path.join(next_res_dir, "diff.html")
-    generate_html(cc=connected_component, html_loc=html_loc, next_html_loc=next_html_loc)
+    generate_html(cc=connected_component, html_loc=html_loc, next_html_loc=next_html_loc, limits=limits)
 
 
 def _get_project_ids(project_names: Set[str], bookkeeping_folder: str):
@@ -282,15 +324,17 @@ def _get_project_ids(project_names: Set[str], bookkeeping_folder: str):
     return proj_ids
 
 
-def main(results_file: str, stats_files: str, filter_repos: Union[List[str], None] = None,
-         bookkeeping_folder: str = None) \
+def main(results_file: Union[str, Iterable[str]], stats_files: str, filter_repos: Union[List[str], None] = None,
+         bookkeeping_folder: str = None, threshold: Union[float, None] = None) \
         -> Generator[Tuple[Dict, int], None, None]:
     """
     Convert SourcererCC output format to JSON.
-    :param results_file: result file with pairs from SourcererCC.
+    :param results_file: result file with pairs from SourcererCC or iterator of its lines.
     :param stats_files: meta information for blocks from SourcererCC - different ids, paths, start/end line, etc.
     :param bookkeeping_folder: meta information for blocks from SourcererCC - mapping {project_id: archive_path}.
     :param filter_repos: Repositories that should be used for filtering. If None - no filtering will be applied.
+    :param threshold: pairs with lower similarity are skipped (results searched with similarity reporting at a lower
+                      threshold), if None - all pairs are used.
     :return: generator with one JSON per row.
     """
     # parse results of SourcererCC
@@ -308,7 +352,7 @@ def main(results_file: str, stats_files: str, filter_repos: Union[List[str], Non
     else:
         def _is_good_pair(pr1, pr2): return True
 
-    pairs = get_result_pairs(results_file, filter_f=_is_good_pair)
+    pairs = get_result_pairs(results_file, filter_f=_is_good_pair, threshold=threshold)
 
     blocks_to_use = set()
     for pair in pairs:
@@ -509,13 +553,19 @@ def pipeline(args: argparse.Namespace) -> None:
     """
     start_time = dt.datetime.now()
     res = main(results_file=args.results_file, stats_files=args.stats_files, filter_repos=args.filter,
-               bookkeeping_folder=args.bookkeeping_folder)
+               bookkeeping_folder=args.bookkeeping_folder, threshold=getattr(args, "threshold", None))
     if args.output is None:
         for connected_component, _ in res:
             print(connected_component)
     else:
+        # callers such as main.py may build args without diff options
+        max_lines = getattr(args, "diff_max_lines", None)
+        timeout = getattr(args, "diff_timeout", None)
+        limits = DEFAULT_LIMITS._replace(max_lines=DEFAULT_LIMITS.max_lines if max_lines is None else max_lines,
+                                         timeout=DEFAULT_LIMITS.timeout if timeout is None else timeout)
         for i, (connected_component, cc_id) in enumerate(res):
-            dump_connected_component(output_dir=args.output, connected_component=connected_component, cc_id=i)
+            dump_connected_component(output_dir=args.output, connected_component=connected_component, cc_id=i,
+                                     limits=limits)
     print("Duration:", dt.datetime.now() - start_time)
 
 
@@ -536,6 +586,13 @@ if __name__ == "__main__":
                                                           "in case of selected mode `versus`")
     parser.add_argument("-b", "--bookkeeping-folder", default="", type=str, help="File or folder with bookkeeping files"
                                                                                  "(proj_id to archive path mapping).")
+    parser.add_argument("-t", "--threshold", default=None, type=float,
+                        help="Keep only pairs with at least this similarity, results must be searched with similarity "
+                             "reporting (`main.py --report-similarity`) at a lower threshold.")
+    parser.add_argument("--diff-max-lines", default=DEFAULT_LIMITS.max_lines, type=int,
+                        help="Blocks with more lines are shown side-by-side without diff alignment.")
+    parser.add_argument("--diff-timeout", default=DEFAULT_LIMITS.timeout, type=float,
+                        help="Time budget in seconds for the diff of one pair, after it alignment is disabled.")
 
     args = parser.parse_args()
 
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+In-process clone detection for small & medium corpora, an alternative to the Java `clone-detector`
+(`main.py --engine python`) without ant build, index files and JVM launches.
+
+Semantics are the same as in SourcererCC: blocks are bags of tokens, two blocks are clones if their overlap
+(sum of minimal counts of common tokens) is at least `ceil(threshold * max(size1, size2))`.
+* tokens are ordered by global frequency (rare first), a block can only be a clone of a block that shares
+  a token within their prefixes (`size + 1 - ceil(threshold * size)` first tokens) - prefix filtering;
+* candidates are generated for a batch of queries at once from an inverted index of prefixes with NumPy,
+  candidates with sizes outside of `[ceil(threshold * size), floor(size / threshold)]` are dropped;
+* positional filtering: at every shared prefix token the overlap is at most the overlap of the shared prefix tokens
+  before it plus the tokens left in the shorter remainder, candidates with a bound below the required overlap are
+  dropped before verification;
+* candidate pairs are verified in batches by `batch_verifier`, overlaps of all pairs are computed at once.
+Output is the same as the output of search nodes: `proj_id1,block_id1,proj_id2,block_id2` per line,
+`block_id2 < block_id1` when blocks are searched against themselves; with `--report-similarity` the similarity
+of the pair is added as the 5th field (as with `REPORT_SIMILARITY=true` of search nodes).
+"""
+import argparse
+import os
+from collections import namedtuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from batch_verifier import CSR, THRESHOLD_SCALE, min_overlap, min_overlaps, strip_token
+from prettify_results import format_similarity, get_files, get_line_iterator
+
+QUERY_BATCH_SIZE = 2048
+
+# CSR-like set of blocks: tokens & counts of block `i` are `tokens[indptr[i]:indptr[i + 1]]`, tokens are global
+# ranks (rare tokens first) sorted within every block
+Blocks = namedtuple("Blocks", ["proj_ids", "block_ids", "sizes", "indptr", "tokens", "counts"])
+
+
+class _BlocksBuilder:
+    def __init__(self):
+        self.proj_ids, self.block_ids, self.sizes, self.lengths = [], [], [], []
+        self.tokens, self.counts = [], []
+
+    def add(self, proj_id: int, block_id: int, size: int, bag: Dict[int, int]) -> None:
+        self.proj_ids.append(proj_id)
+        self.block_ids.append(block_id)
+        self.sizes.append(size)
+        self.lengths.append(len(bag))
+        self.tokens.extend(bag.keys())
+        self.counts.extend(bag.values())
+
+    def build(self, ranks: np.ndarray) -> Blocks:
+        indptr = np.zeros(len(self.lengths) + 1, dtype=np.int64)
+        np.cumsum(self.lengths, out=indptr[1:])
+        tokens = ranks[np.array(self.tokens, dtype=np.int64)] if self.tokens else np.zeros(0, dtype=np.int64)
+        counts = np.array(self.counts, dtype=np.int64)
+        owners = np.repeat(np.arange(len(self.lengths)), self.lengths)
+        order = np.lexsort((tokens, owners))
+        return Blocks(proj_ids=np.array(self.proj_ids, dtype=np.int64),
+                      block_ids=np.array(self.block_ids, dtype=np.int64), sizes=np.array(self.sizes, dtype=np.int64),
+                      indptr=indptr, tokens=tokens[order], counts=counts[order])
+
+
+def read_blocks(tokens_locs: Iterable[str], min_tokens: int, max_tokens: int,
+                query_proj_ids: Optional[Set[str]] = None) -> Tuple[Blocks, Optional[Blocks]]:
+    """
+    Read tokens files and rank tokens by global frequency.
+    :param tokens_locs: tokens files or folders with them.
+    :param min_tokens: blocks with fewer tokens are ignored.
+    :param max_tokens: blocks with more tokens are ignored.
+    :param query_proj_ids: projects searched against the rest (versus mode), if None - all blocks are searched
+                           against each other.
+    :return: indexed blocks & query blocks (None if blocks are searched against themselves).
+    """
+    dataset, queries, _ = read_ranked_blocks(tokens_locs, min_tokens, max_tokens, query_proj_ids)
+    return dataset, queries
+
+
+def read_ranked_blocks(tokens_locs: Iterable[str], min_tokens: int, max_tokens: int,
+                       query_proj_ids: Optional[Set[str]] = None) -> Tuple[Blocks, Optional[Blocks], List[str]]:
+    """
+    `read_blocks` that also returns the vocabulary.
+    :return: indexed blocks, query blocks (None if blocks are searched against themselves) & tokens in the order
+             of their ranks.
+    """
+    vocabulary = {}
+    frequencies = []
+    dataset, queries = _BlocksBuilder(), _BlocksBuilder()
+    for tokens_loc in tokens_locs:
+        for tokens_file in sorted(get_files(path=tokens_loc, extension=".tokens")):
+            for line in get_line_iterator(tokens_file):
+                header, _, body = line.partition("@#@")
+                metadata = header.split(",", 3)
+                if len(metadata) < 4 or not body:
+                    continue
+                size = int(metadata[2])
+                if size < min_tokens or size > max_tokens:
+                    continue
+                bag = {}
+                for token_count in body.split(","):
+                    token, _, count = token_count.rpartition("@@::@@")
+                    token = strip_token(token)
+                    if not token:
+                        continue
+                    token_id = vocabulary.setdefault(token, len(vocabulary))
+                    if token_id == len(frequencies):
+                        frequencies.append(0)
+                    # the same token can be listed twice (e.g. tokens that differ only in stripped quotes)
+                    bag[token_id] = bag.get(token_id, 0) + int(count)
+                    frequencies[token_id] += int(count)
+                builder = queries if query_proj_ids is not None and metadata[0] in query_proj_ids else dataset
+                builder.add(int(metadata[0]), int(metadata[1]), size, bag)
+
+    # global order of clone-detector: frequency, then token
+    words = list(vocabulary)
+    order = sorted(range(len(words)), key=lambda token_id: (frequencies[token_id], words[token_id]))
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[np.array(order, dtype=np.int64)] = np.arange(len(order))
+    return dataset.build(ranks), queries.build(ranks) if query_proj_ids is not None else None, \
+        [words[token_id] for token_id in order]
+
+
+def select_blocks(blocks: Blocks, rows: np.ndarray) -> Blocks:
+    """
+    Subset of blocks.
+    :param blocks: blocks.
+    :param rows: indices of selected blocks.
+    :return: selected blocks in the order of `rows`.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = blocks.indptr[rows]
+    lengths = blocks.indptr[rows + 1] - starts
+    positions, _ = _expand(starts, lengths)
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    return Blocks(proj_ids=blocks.proj_ids[rows], block_ids=blocks.block_ids[rows], sizes=blocks.sizes[rows],
+                  indptr=indptr, tokens=blocks.tokens[positions], counts=blocks.counts[positions])
+
+
+def concat_blocks(first: Blocks, second: Blocks) -> Blocks:
+    """ Blocks of `first` followed by blocks of `second` (tokens must be ranked together) """
+    return Blocks(proj_ids=np.concatenate([first.proj_ids, second.proj_ids]),
+                  block_ids=np.concatenate([first.block_ids, second.block_ids]),
+                  sizes=np.concatenate([first.sizes, second.sizes]),
+                  indptr=np.concatenate([first.indptr, second.indptr[1:] + first.indptr[-1]]),
+                  tokens=np.concatenate([first.tokens, second.tokens]),
+                  counts=np.concatenate([first.counts, second.counts]))
+
+
+def max_candidate_size(sizes: np.ndarray, threshold: float) -> np.ndarray:
+    """ `floor(size / threshold)` in integers """
+    scaled = int(round(threshold * THRESHOLD_SCALE))
+    return sizes * THRESHOLD_SCALE // scaled
+
+
+def _owners(blocks: Blocks) -> np.ndarray:
+    return np.repeat(np.arange(len(blocks.sizes)), np.diff(blocks.indptr))
+
+
+def tokens_before(blocks: Blocks) -> np.ndarray:
+    """ Number of tokens (with counts) before every entry of `blocks.tokens` within its block """
+    cumulative = np.cumsum(blocks.counts)
+    return cumulative - blocks.counts - np.concatenate([[0], cumulative])[blocks.indptr[:-1]][_owners(blocks)]
+
+
+def prefix_mask(blocks: Blocks, threshold: float) -> np.ndarray:
+    """
+    Tokens that belong to prefixes of their blocks.
+    :param blocks: blocks.
+    :param threshold: similarity threshold.
+    :return: boolean mask over `blocks.tokens`.
+    """
+    prefix_size = blocks.sizes + 1 - min_overlap(blocks.sizes, threshold)
+    return tokens_before(blocks) < prefix_size[_owners(blocks)]
+
+
+def _expand(starts: np.ndarray, lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ Indices `starts[i] .. starts[i] + lengths[i] - 1` for all i & the `i` of every index """
+    owners = np.repeat(np.arange(len(lengths)), lengths)
+    offsets = np.arange(len(owners)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, owners
+
+
+class PrefixIndex:
+    """
+    Inverted index of block prefixes: blocks that have a token in their prefixes.
+    """
+
+    def __init__(self, blocks: Blocks, threshold: float):
+        mask = prefix_mask(blocks, threshold)
+        tokens, owners = blocks.tokens[mask], _owners(blocks)[mask]
+        order = np.argsort(tokens, kind="stable")
+        self.postings = owners[order]
+        # position of every posting in `blocks.tokens`
+        self.entries = np.flatnonzero(mask)[order]
+        n_tokens = int(blocks.tokens.max()) + 1 if len(blocks.tokens) else 0
+        self.indptr = np.zeros(n_tokens + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tokens, minlength=n_tokens), out=self.indptr[1:])
+
+    def candidates(self, tokens: np.ndarray, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Blocks that share prefix tokens with queries.
+        :param tokens: prefix tokens of queries.
+        :param queries: query of every token.
+        :return: (query, candidate) pairs with repetitions.
+        """
+        token_idx, positions = self._lookup(tokens)
+        return queries[token_idx], self.postings[positions]
+
+    def candidate_entries(self, tokens: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Blocks that share prefix tokens with queries and positions of the shared tokens in these blocks.
+        :param tokens: prefix tokens of queries.
+        :return: index in `tokens`, candidate block & position of the token in indexed `blocks.tokens` for every
+                 (query token, candidate) pair.
+        """
+        token_idx, positions = self._lookup(tokens)
+        return token_idx, self.postings[positions], self.entries[positions]
+
+    def _lookup(self, tokens: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        known = np.flatnonzero(tokens < len(self.indptr) - 1)
+        starts = self.indptr[tokens[known]]
+        positions, owners = _expand(starts, self.indptr[tokens[known] + 1] - starts)
+        return known[owners], positions
+
+
+def pair_overlaps(queries: Blocks, dataset: Blocks, query_idx: np.ndarray, candidate_idx: np.ndarray) -> np.ndarray:
+    """
+    Overlaps of candidate pairs computed in batches.
+    :param queries: query blocks.
+    :param dataset: candidate blocks.
+    :param query_idx: query of every pair.
+    :param candidate_idx: candidate of every pair.
+    :return: overlap of every pair.
+    """
+    return min_overlaps(CSR(queries.indptr, queries.tokens, queries.counts),
+                        CSR(dataset.indptr, dataset.tokens, dataset.counts), query_idx, candidate_idx)
+
+
+def positional_filter(queries: Blocks, dataset: Blocks, query_entries: np.ndarray, candidate_entries: np.ndarray,
+                      pair_keys: np.ndarray, required: np.ndarray, query_before: np.ndarray,
+                      dataset_before: np.ndarray) -> np.ndarray:
+    """
+    Upper bounds of overlaps from positions of shared prefix tokens.
+    Prefix tokens shared by a pair are all the shared tokens up to the last of them (prefixes are the rarest tokens),
+    so at every shared prefix token the overlap is at most the overlap of the shared prefix tokens before it plus
+    the number of tokens from it to the end of the shorter remainder.
+    :param queries: query blocks.
+    :param dataset: candidate blocks.
+    :param query_entries: position of the shared token in `queries.tokens` for every (token, pair) match.
+    :param candidate_entries: position of the shared token in `dataset.tokens` for every match.
+    :param pair_keys: pair of every match, matches of a pair are contiguous and sorted by token.
+    :param required: required overlap of every match's pair.
+    :param query_before: `tokens_before(queries)`.
+    :param dataset_before: `tokens_before(dataset)`.
+    :return: mask over unique pairs (in the order of `pair_keys`): pairs that can reach the required overlap.
+    """
+    if len(pair_keys) == 0:
+        return np.zeros(0, dtype=bool)
+    starts = np.flatnonzero(np.concatenate([[True], pair_keys[1:] != pair_keys[:-1]]))
+    common = np.minimum(queries.counts[query_entries], dataset.counts[candidate_entries])
+    query_rest = queries.sizes[pair_keys // len(dataset.sizes)] - query_before[query_entries]
+    candidate_rest = dataset.sizes[pair_keys % len(dataset.sizes)] - dataset_before[candidate_entries]
+    matched = np.cumsum(common) - common
+    matched -= np.repeat(matched[starts], np.diff(np.append(starts, len(pair_keys))))
+    bounds = matched + np.minimum(query_rest, candidate_rest)
+    return np.minimum.reduceat(bounds - required, starts) >= 0
+
+
+def format_pairs(queries: Blocks, dataset: Blocks, query_idx: np.ndarray, candidate_idx: np.ndarray,
+                 overlaps: Optional[np.ndarray] = None) -> Iterator[str]:
+    """
+    Lines of results file.
+    :param queries: query blocks.
+    :param dataset: candidate blocks.
+    :param query_idx: query of every pair.
+    :param candidate_idx: candidate of every pair.
+    :param overlaps: overlap of every pair, if given - similarity is reported in the 5th field.
+    :return: iterator of pairs `proj_id1,block_id1,proj_id2,block_id2[,similarity]`.
+    """
+    sizes = np.maximum(queries.sizes[query_idx], dataset.sizes[candidate_idx]).tolist()
+    for i, (query, candidate) in enumerate(zip(query_idx.tolist(), candidate_idx.tolist())):
+        pair = "{},{},{},{}".format(queries.proj_ids[query], queries.block_ids[query], dataset.proj_ids[candidate],
+                                    dataset.block_ids[candidate])
+        yield pair if overlaps is None else pair + "," + format_similarity(int(overlaps[i]), sizes[i])
+
+
+def search(dataset: Blocks, queries: Optional[Blocks], threshold: float, batch_size: int = QUERY_BATCH_SIZE,
+           report_similarity: bool = False) -> Iterator[str]:
+    """
+    Find clone pairs.
+    :param dataset: indexed blocks.
+    :param queries: query blocks, if None - dataset is searched against itself.
+    :param threshold: similarity threshold.
+    :param batch_size: number of queries processed at once.
+    :param report_similarity: add similarity of pairs as the 5th field.
+    :return: iterator of pairs `proj_id1,block_id1,proj_id2,block_id2[,similarity]` (query first).
+    """
+    if len(dataset.sizes) == 0:
+        return
+    self_search = queries is None
+    if self_search:
+        queries = dataset
+    index = PrefixIndex(dataset, threshold)
+    query_prefix = prefix_mask(queries, threshold)
+    query_owners = _owners(queries)
+    query_before, dataset_before = tokens_before(queries), tokens_before(dataset)
+    min_sizes, max_sizes = min_overlap(queries.sizes, threshold), max_candidate_size(queries.sizes, threshold)
+    for batch_start in range(0, len(queries.sizes), batch_size):
+        batch_end = min(batch_start + batch_size, len(queries.sizes))
+        query_entries = np.arange(queries.indptr[batch_start], queries.indptr[batch_end])
+        query_entries = query_entries[query_prefix[query_entries]]
+        token_idx, candidate_idx, candidate_entries = index.candidate_entries(queries.tokens[query_entries])
+        query_entries = query_entries[token_idx]
+        query_idx = query_owners[query_entries]
+        keep = (dataset.sizes[candidate_idx] >= min_sizes[query_idx]) & \
+            (dataset.sizes[candidate_idx] <= max_sizes[query_idx])
+        if self_search:
+            # every pair is reported once, by the block with the larger id
+            keep &= dataset.block_ids[candidate_idx] < queries.block_ids[query_idx]
+        match_keys = query_idx[keep] * len(dataset.sizes) + candidate_idx[keep]
+        query_entries, candidate_entries = query_entries[keep], candidate_entries[keep]
+        order = np.lexsort((queries.tokens[query_entries], match_keys))
+        match_keys = match_keys[order]
+        required = min_overlap(np.maximum(queries.sizes[match_keys // len(dataset.sizes)],
+                                          dataset.sizes[match_keys % len(dataset.sizes)]), threshold)
+        possible = positional_filter(queries, dataset, query_entries[order], candidate_entries[order], match_keys,
+                                     required, query_before, dataset_before)
+        pair_keys = np.unique(match_keys)[possible]
+        query_idx, candidate_idx = pair_keys // len(dataset.sizes), pair_keys % len(dataset.sizes)
+        overlaps = pair_overlaps(queries, dataset, query_idx, candidate_idx)
+        clones = overlaps >= min_overlap(np.maximum(queries.sizes[query_idx], dataset.sizes[candidate_idx]),
+                                         threshold)
+        yield from format_pairs(queries, dataset, query_idx[clones], candidate_idx[clones],
+                                overlaps[clones] if report_similarity else None)
+
+
+def detect_clones(tokens_locs: List[str], output: str, threshold: float, min_tokens: int, max_tokens: int,
+                  query_proj_ids: Optional[Set[str]] = None, report_similarity: bool = False) -> int:
+    """
+    Find clone pairs in tokens files and save them in the format of clone-detector results.
+    :param tokens_locs: tokens files or folders with them.
+    :param output: path to results file.
+    :param threshold: similarity threshold (0.8 means 80%).
+    :param min_tokens: blocks with fewer tokens are ignored.
+    :param max_tokens: blocks with more tokens are ignored.
+    :param query_proj_ids: projects searched against the rest (versus mode), if None - all-to-all.
+    :param report_similarity: add similarity of pairs as the 5th field.
+    :return: number of pairs.
+    """
+    dataset, queries = read_blocks(tokens_locs, min_tokens, max_tokens, query_proj_ids)
+    n_pairs = 0
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        for pair in search(dataset, queries, threshold, report_similarity=report_similarity):
+            f.write(pair + "\n")
+            n_pairs += 1
+    return n_pairs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("tokens", nargs="+", help="Tokens files or folders with them.")
+    parser.add_argument("-o", "--output", required=True, help="Results file.")
+    parser.add_argument("-t", "--threshold", type=float, default=0.8, help="Similarity threshold.")
+    parser.add_argument("--min-tokens", type=int, default=65, help="Minimum number of tokens in block.")
+    parser.add_argument("--max-tokens", type=int, default=500000, help="Maximum number of tokens in block.")
+    parser.add_argument("-q", "--query-projects", nargs="*", default=None,
+                        help="Ids of projects searched against the other projects (versus mode).")
+    parser.add_argument("--report-similarity", action="store_true", help="Add similarity of pairs as the 5th field.")
+    args = parser.parse_args()
+    n_pairs = detect_clones(args.tokens, args.output, args.threshold, args.min_tokens, args.max_tokens,
+                            set(args.query_projects) if args.query_projects is not None else None,
+                            args.report_similarity)
+    print("{} clone pairs saved to {}".format(n_pairs, args.output))
@@ -0,0 +1,126 @@
+import math
+from fractions import Fraction
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from batch_verifier import min_overlap
+from python_engine import Blocks, detect_clones, positional_filter, read_blocks, search, tokens_before
+from prettify_results import filter_by_similarity, format_similarity, get_line_iterator
+
+
+def _write_tokens(tokens_loc, blocks):
+    with open(tokens_loc, "w") as f:
+        for proj_id, block_id, bag in blocks:
+            size = sum(bag.values())
+            tokens = ",".join("{}@@::@@{}".format(token, count) for token, count in bag.items())
+            f.write("{},{},{},{},0,hash@#@{}\n".format(proj_id, block_id, size, len(bag), tokens))
+
+
+def _brute_force(blocks, threshold, pairs_of):
+    result = set()
+    for proj1, block1, bag1 in blocks:
+        for proj2, block2, bag2 in blocks:
+            if not pairs_of(proj1, block1, proj2, block2):
+                continue
+            overlap = sum(min(count, bag2.get(token, 0)) for token, count in bag1.items())
+            if overlap >= math.ceil(threshold * max(sum(bag1.values()), sum(bag2.values())) - 1e-9):
+                result.add("{},{},{},{}".format(proj1, block1, proj2, block2))
+    return result
+
+
+class TestPythonEngine(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(1)
+        base = [{"t%s" % rnd.randrange(40): rnd.randint(1, 3) for _ in range(rnd.randint(5, 25))} for _ in range(8)]
+        self.blocks = []
+        for block in range(200):
+            # mutated copies of a few base blocks - many near-threshold pairs
+            bag = dict(base[block % len(base)])
+            for _ in range(rnd.randint(0, 6)):
+                bag["t%s" % rnd.randrange(60)] = rnd.randint(1, 3)
+            self.blocks.append((block % 5 + 1, 1000 + block, bag))
+
+    def test_all_to_all_matches_brute_force(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tokens_loc = os.path.join(tmp_dir, "files-tokens-0.tokens")
+            _write_tokens(tokens_loc, self.blocks)
+            output = os.path.join(tmp_dir, "results.pairs")
+            for threshold in [0.5, 0.7, 0.8]:
+                n_pairs = detect_clones([tmp_dir], output, threshold, min_tokens=1, max_tokens=1000)
+                pairs = set(get_line_iterator(output))
+                expected = _brute_force(self.blocks, threshold, lambda p1, b1, p2, b2: b2 < b1)
+                self.assertEqual(n_pairs, len(pairs))
+                self.assertTrue(expected)
+                self.assertEqual(pairs, expected)
+
+    def test_versus_matches_brute_force(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tokens_loc = os.path.join(tmp_dir, "files-tokens-0.tokens")
+            _write_tokens(tokens_loc, self.blocks)
+            dataset, queries = read_blocks([tokens_loc], 1, 1000, query_proj_ids={"2"})
+            pairs = set(search(dataset, queries, 0.7, batch_size=7))
+        expected = _brute_force(self.blocks, 0.7, lambda p1, b1, p2, b2: p1 == 2 and p2 != 2)
+        self.assertTrue(expected)
+        self.assertEqual(pairs, expected)
+
+    def test_similarity_filter_matches_search(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tokens_loc = os.path.join(tmp_dir, "files-tokens-0.tokens")
+            _write_tokens(tokens_loc, self.blocks)
+            dataset, queries = read_blocks([tokens_loc], 1, 1000)
+            annotated = list(search(dataset, queries, 0.5, report_similarity=True))
+        self.assertTrue(all(len(line.split(",")) == 5 for line in annotated))
+        # one search at the lowest threshold gives the pairs of every higher threshold
+        for threshold in [0.5, 0.7, 0.75, 0.8]:
+            expected = _brute_force(self.blocks, threshold, lambda p1, b1, p2, b2: b2 < b1)
+            filtered = {line.rsplit(",", 1)[0] for line in filter_by_similarity(annotated, threshold)}
+            self.assertEqual(filtered, expected)
+
+    def test_repeated_tokens(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tokens_loc = os.path.join(tmp_dir, "files-tokens-0.tokens")
+            with open(tokens_loc, "w") as f:
+                # `'a'` and `a` are the same token after stripping quotes
+                f.write("1,10,5,2,0,hash@#@a@@::@@3,'a'@@::@@2\n1,11,5,1,0,hash@#@a@@::@@5\n")
+            dataset, _ = read_blocks([tokens_loc], 1, 1000)
+            self.assertEqual(dataset.counts.tolist(), [5, 5])
+            self.assertEqual(list(search(dataset, None, 1.0)), ["1,11,1,10"])
+
+    def test_positional_filter(self):
+        # a query of 10 tokens and a candidate of 12 tokens (required overlap 10 at 0.8), token 5 is in both prefixes
+        queries = Blocks(proj_ids=np.array([1]), block_ids=np.array([1]), sizes=np.array([10]),
+                         indptr=np.array([0, 3]), tokens=np.array([0, 1, 5]), counts=np.array([1, 1, 8]))
+        dataset = Blocks(proj_ids=np.array([1]), block_ids=np.array([2]), sizes=np.array([12]),
+                         indptr=np.array([0, 2]), tokens=np.array([2, 5]), counts=np.array([1, 11]))
+        before = tokens_before(queries), tokens_before(dataset)
+        self.assertEqual(before[0].tolist(), [0, 1, 2])
+        # 2 tokens of the query precede the shared one, at most 8 tokens can overlap
+        self.assertEqual(positional_filter(queries, dataset, np.array([2]), np.array([1]), np.array([0]),
+                                           np.array([10]), *before).tolist(), [False])
+        self.assertEqual(positional_filter(queries, dataset, np.array([2]), np.array([1]), np.array([0]),
+                                           np.array([8]), *before).tolist(), [True])
+
+    def test_format_similarity(self):
+        self.assertEqual(format_similarity(4, 5), "0.8000")
+        self.assertEqual(format_similarity(2, 3), "0.6666")
+        self.assertEqual(format_similarity(7, 7), "1.0000")
+        self.assertEqual(list(filter_by_similarity(["1,2,3,4,0.6999", "1,2,3,5,0.7000", "1,2,3,6"], 0.7)),
+                         ["1,2,3,5,0.7000", "1,2,3,6"])
+
+    def test_similarity_matches_threshold(self):
+        # `Util.formatSimilarity` of clone-detector uses the same integer arithmetic: overlap * 10000 / size
+        for size in range(1, 300):
+            for overlap in range(size + 1):
+                similarity = format_similarity(overlap, size)
+                self.assertEqual(Fraction(similarity), Fraction(overlap * 10000 // size, 10000))
+                for threshold in [0.5, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 1.0]:
+                    self.assertEqual(list(filter_by_similarity(["1,2,3,4," + similarity], threshold)) != [],
+                                     overlap >= int(min_overlap(size, threshold)), (overlap, size, threshold))
+
+
+if __name__ == '__main__':
+    unittest.main()
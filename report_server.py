@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Local HTTP server to browse SourcererCC results on demand.
+
+Pages are rendered from the results index (see `results_index.py`) and the original archives,
+nothing is pre-generated: opening a result set only opens the SQLite index.
+* `/` - list of connected components (biggest first) with pagination and search by project or file;
+* `/component/<cc_id>` - pairs of one component with pagination;
+* `/diff?b1=<block_id>&b2=<block_id>` - side-by-side diff of 2 blocks.
+Rendered pages are kept in an in-memory LRU cache.
+Usage: `./report_server.py --index results.sqlite --port 8000`
+"""
+import argparse
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import html
+import os
+import socketserver
+import sqlite3
+import threading
+from typing import Dict, List, Tuple, Union
+from urllib.parse import parse_qs, urlencode, urlparse
+import zipfile
+
+from tabulate import tabulate
+
+from diff_renderer import DEFAULT_LIMITS, DiffLimits, FastHtmlDiff
+from prettify_results import BlockMeta, read_lines, split_sourcerercc_path
+from results_index import build_index, open_index
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta http-equiv="Content-Type" content="text/html; charset=utf-8" />
+<title>%(title)s</title>
+<style type="text/css">%(styles)s
+    body {font-family: sans-serif}
+    table.listing td, table.listing th {padding: 2px 8px; border-bottom: 1px solid #ddd}
+</style>
+</head>
+<body>
+<p><a href="/">components</a></p>
+<h3>%(title)s</h3>
+%(body)s
+</body>
+</html>"""
+
+
+class LRUCache:
+    """Thread-safe LRU cache for rendered pages."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Union[bytes, None]:
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+
+class ReportBackend:
+    """
+    Queries to results index and archives.
+    """
+
+    def __init__(self, index_loc: str, page_size: int = 50, limits: DiffLimits = DEFAULT_LIMITS):
+        self.conn = open_index(index_loc)
+        self.page_size = page_size
+        self.limits = limits
+        self._db_lock = threading.Lock()
+
+    def query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._db_lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def components(self, page: int, project: str = "", file: str = "") -> Tuple[List[Tuple], int]:
+        """
+        One page of components, optionally only components with blocks from matching project or file.
+        :return: rows (cc_id, n_blocks, n_pairs, n_projects) and total number of matching components.
+        """
+        offset = (page - 1) * self.page_size
+        if not project and not file:
+            total = self.query("SELECT COUNT(*) FROM clone_classes")[0][0]
+            rows = self.query("SELECT cc_id, n_blocks, n_pairs, n_projects FROM clone_classes "
+                              "ORDER BY cc_id LIMIT ? OFFSET ?", (self.page_size, offset))
+            return rows, total
+        matching = """
+            SELECT DISTINCT c.cc_id FROM components c
+            JOIN blocks b ON b.block_id = c.block_id
+            JOIN files f ON f.file_id = b.file_id
+            JOIN projects p ON p.proj_id = b.proj_id
+            WHERE p.archive LIKE ? AND f.path LIKE ?"""
+        params = ("%" + project + "%", "%" + file + "%")
+        total = self.query("SELECT COUNT(*) FROM (%s)" % matching, params)[0][0]
+        rows = self.query("SELECT cc_id, n_blocks, n_pairs, n_projects FROM clone_classes "
+                          "WHERE cc_id IN (%s) ORDER BY cc_id LIMIT ? OFFSET ?" % matching,
+                          params + (self.page_size, offset))
+        return rows, total
+
+    def component_pairs(self, cc_id: int, page: int) -> Tuple[List[Tuple], int]:
+        total = self.query("SELECT n_pairs FROM clone_classes WHERE cc_id = ?", (cc_id,))
+        rows = self.query("SELECT block_id1, block_id2 FROM pairs WHERE cc_id = ? LIMIT ? OFFSET ?",
+                          (cc_id, self.page_size, (page - 1) * self.page_size))
+        return rows, total[0][0] if total else 0
+
+    def block_meta(self, block_id: str) -> Union[BlockMeta, None]:
+        rows = self.query("SELECT f.path, b.start_line, b.end_line FROM blocks b "
+                          "JOIN files f ON f.file_id = b.file_id WHERE b.block_id = ?", (block_id,))
+        if not rows:
+            return None
+        path, start_line, end_line = rows[0]
+        archive, filepath = split_sourcerercc_path(path)
+        return BlockMeta(project=archive, filepath=filepath, start_line=start_line, end_line=end_line)
+
+    @staticmethod
+    def block_content(meta: BlockMeta) -> str:
+        try:
+            with zipfile.ZipFile(meta.project) as archive:
+                return read_lines(archive, meta.start_line, meta.end_line, meta.filepath)
+        except (OSError, KeyError, zipfile.BadZipFile) as exc:
+            return "Can't read %s from %s: %s" % (meta.filepath, meta.project, exc)
+
+
+def _pagination(path: str, params: Dict[str, str], page: int, total: int, page_size: int) -> str:
+    n_pages = max(1, (total + page_size - 1) // page_size)
+    links = []
+    for name, target in (("prev", page - 1), ("next", page + 1)):
+        if 1 <= target <= n_pages:
+            links.append('<a href="%s?%s">%s</a>' % (path, html.escape(urlencode(dict(params, page=target))), name))
+    return "<p>page %s of %s (%s items) %s</p>" % (page, n_pages, format(total, ","), " ".join(links))
+
+
+def render_components(backend: ReportBackend, params: Dict[str, str]) -> Tuple[str, str]:
+    page = max(1, int(params.get("page", 1)))
+    project = params.get("project", "")
+    file = params.get("file", "")
+    rows, total = backend.components(page, project=project, file=file)
+    search = ('<form action="/" method="get">project <input name="project" value="%s"/> '
+              'file <input name="file" value="%s"/> <input type="submit" value="search"/></form>') % (
+                  html.escape(project), html.escape(file))
+    table = [("<a href=\"/component/%s\">%s</a>" % (cc_id, cc_id), n_blocks, n_pairs, n_projects)
+             for cc_id, n_blocks, n_pairs, n_projects in rows]
+    body = "\n".join([search, _pagination("/", {"project": project, "file": file}, page, total, backend.page_size),
+                      tabulate(table, headers=["component", "blocks", "pairs", "projects"], tablefmt="unsafehtml")
+                      .replace("<table>", '<table class="listing">')])
+    return "Connected components", body
+
+
+def render_component(backend: ReportBackend, cc_id: int, params: Dict[str, str]) -> Tuple[str, str]:
+    page = max(1, int(params.get("page", 1)))
+    rows, total = backend.component_pairs(cc_id, page)
+    table = []
+    for block_id1, block_id2 in rows:
+        meta1 = backend.block_meta(block_id1)
+        meta2 = backend.block_meta(block_id2)
+        link = '<a href="/diff?%s">diff</a>' % html.escape(urlencode({"b1": block_id1, "b2": block_id2}))
+        table.append((link,
+                      html.escape("%s:%s" % (os.path.basename(meta1.project), meta1.filepath)) if meta1 else block_id1,
+                      "%s-%s" % (meta1.start_line, meta1.end_line) if meta1 else "",
+                      html.escape("%s:%s" % (os.path.basename(meta2.project), meta2.filepath)) if meta2 else block_id2,
+                      "%s-%s" % (meta2.start_line, meta2.end_line) if meta2 else ""))
+    body = "\n".join([_pagination("/component/%s" % cc_id, {}, page, total, backend.page_size),
+                      tabulate(table, headers=["", "first", "lines", "second", "lines"], tablefmt="unsafehtml")
+                      .replace("<table>", '<table class="listing">')])
+    return "Component %s" % cc_id, body
+
+
+def render_diff(backend: ReportBackend, params: Dict[str, str]) -> Tuple[str, str]:
+    meta1 = backend.block_meta(params.get("b1", ""))
+    meta2 = backend.block_meta(params.get("b2", ""))
+    if meta1 is None or meta2 is None:
+        raise KeyError("unknown block id")
+    meta_table = tabulate([(html.escape(str(row1)), html.escape(str(row2))) for row1, row2 in zip(meta1, meta2)],
+                          tablefmt="unsafehtml")
+    diff_table = FastHtmlDiff(backend.limits).make_table(backend.block_content(meta1).splitlines(),
+                                                         backend.block_content(meta2).splitlines())
+    return "Diff", "\n".join([meta_table, diff_table])
+
+
+def make_handler(backend: ReportBackend, cache: LRUCache):
+    class ReportHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            cached = cache.get(self.path)
+            if cached is not None:
+                self._send(200, cached)
+                return
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            try:
+                if url.path == "/":
+                    title, body = render_components(backend, params)
+                elif url.path.startswith("/component/"):
+                    title, body = render_component(backend, int(url.path.rsplit("/", 1)[1]), params)
+                elif url.path == "/diff":
+                    title, body = render_diff(backend, params)
+                else:
+                    self._send(404, b"Not found")
+                    return
+            except (KeyError, ValueError) as exc:
+                self._send(400, ("Bad request: %s" % exc).encode("utf-8"))
+                return
+            except sqlite3.Error as exc:
+                self._send(500, ("Index error: %s" % exc).encode("utf-8"))
+                return
+            page = (PAGE_TEMPLATE % {"title": html.escape(title), "styles": FastHtmlDiff.STYLES, "body": body})
+            page = page.encode("utf-8")
+            cache.put(self.path, page)
+            self._send(200, page)
+
+        def _send(self, code: int, content: bytes) -> None:
+            self.send_response(code)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    return ReportHandler
+
+
+class ThreadedHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """Handle each request in a separate thread."""
+    daemon_threads = True
+
+
+def serve(index_loc: str, host: str = "127.0.0.1", port: int = 8000, cache_size: int = 1000,
+          page_size: int = 50, limits: DiffLimits = DEFAULT_LIMITS) -> None:
+    """
+    Start report server and block until interrupted.
+    :param index_loc: path to results index.
+    :param host: interface to listen on.
+    :param port: port to listen on.
+    :param cache_size: number of rendered pages kept in LRU cache.
+    :param page_size: number of rows per page.
+    :param limits: caps for diff rendering.
+    :return: None.
+    """
+    backend = ReportBackend(index_loc, page_size=page_size, limits=limits)
+    server = ThreadedHTTPServer((host, port), make_handler(backend, LRUCache(cache_size)))
+    print("Serving %s at http://%s:%s/" % (index_loc, host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--index", required=True, help="Results index (SQLite file from `results_index.py`).")
+    parser.add_argument("-r", "--results-file", nargs="+", help="If given - (re)build index from results file(s).")
+    parser.add_argument("-s", "--stats-files", help="File or folder with stats files (*.stats), to build index.")
+    parser.add_argument("-b", "--bookkeeping-folder", help="File or folder with bookkeeping files, to build index.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on.")
+    parser.add_argument("-p", "--port", default=8000, type=int, help="Port to listen on.")
+    parser.add_argument("--cache-size", default=1000, type=int, help="Number of rendered pages to keep in memory.")
+    parser.add_argument("--page-size", default=50, type=int, help="Number of rows per page.")
+    parser.add_argument("--diff-max-lines", default=DEFAULT_LIMITS.max_lines, type=int,
+                        help="Blocks with more lines are shown side-by-side without diff alignment.")
+    parser.add_argument("--diff-timeout", default=DEFAULT_LIMITS.timeout, type=float,
+                        help="Time budget in seconds for the diff of one pair, after it alignment is disabled.")
+    args = parser.parse_args()
+
+    if args.results_file:
+        if not args.stats_files or not args.bookkeeping_folder:
+            raise ValueError("To build index both args `--stats-files` and `--bookkeeping-folder` required.")
+        build_index(results_file=args.results_file, stats_files=args.stats_files,
+                    bookkeeping_folder=args.bookkeeping_folder, index_loc=args.index)
+    serve(args.index, host=args.host, port=args.port, cache_size=args.cache_size, page_size=args.page_size,
+          limits=DEFAULT_LIMITS._replace(max_lines=args.diff_max_lines, timeout=args.diff_timeout))
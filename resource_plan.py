@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Resource plan for `main.py`: tokenizer processes, search nodes, JVM heap and queue threads.
+
+The plan is derived from the cores & memory available to the process (cgroup limits of a container included)
+and from the input size (number of archives and uncompressed bytes from zip central directories):
+* tokenizer processes - one per core, not more than archives, every process gets TOKENIZER_PROCESS_MB of memory;
+* heap of a node grows with the input, search nodes share USABLE_MEMORY_SHARE of memory, every node gets
+  at least CORES_PER_NODE cores and INPUT_MB_PER_NODE of input (small inputs don't pay for JVM startup & index load);
+* queue threads keep the proportions of the default properties (tuned for 8 cores): search queues get
+  SEARCH_THREADS_PER_CORE threads per core of a node, half of them validate candidates; the index is built by
+  a single node on all cores.
+"""
+import math
+import os
+import zipfile
+from collections import namedtuple
+from typing import Dict, Iterable, Optional, Tuple
+
+MB = 1 << 20
+TOKENIZER_PROCESS_MB = 512
+USABLE_MEMORY_SHARE = 0.75
+MIN_HEAP_MB = 256
+HEAP_BASE_MB = 1024
+HEAP_PER_INPUT_MB = 0.25
+# compressed object pointers are disabled for larger heaps
+MAX_HEAP_MB = 31 * 1024
+CORES_PER_NODE = 2
+INPUT_MB_PER_NODE = 256
+SEARCH_THREADS_PER_CORE = 4
+INDEX_THREADS_PER_CORE = 1.5
+MAX_PROJECTS_BATCH = 100
+
+ResourcePlan = namedtuple("ResourcePlan", ["cores", "memory_mb", "n_archives", "input_mb", "tokenizer_processes",
+                                           "projects_batch", "nodes", "heap_mb", "threads"])
+
+
+def _read_int(path: str) -> Optional[int]:
+    try:
+        with open(path) as f:
+            value = f.read().split()
+    except OSError:
+        return None
+    return int(value[0]) if value and value[0].isdigit() else None
+
+
+def available_cores() -> int:
+    """
+    Cores available to the process: CPU affinity and cgroup CPU quota.
+    :return: number of cores, at least 1.
+    """
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    try:
+        # cgroup v2: `<quota> <period>` or `max <period>`
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        # cgroup v1, quota is -1 without limit
+        quota = _read_int("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        period = _read_int("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if quota and period:
+            cores = min(cores, max(1, quota // period))
+    return max(1, cores)
+
+
+def available_memory_mb() -> int:
+    """
+    Memory available to the process: physical memory and cgroup memory limit.
+    Total memory is used instead of currently free memory, so the plan (and fingerprints of stages that depend on it)
+    doesn't change between reruns on the same machine.
+    :return: memory in MB.
+    """
+    memory = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    memory = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    if memory is None:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    for limit_loc in ["/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"]:
+        limit = _read_int(limit_loc)
+        if limit:
+            memory = min(memory, limit)
+    return memory // MB
+
+
+def input_size(archives: Iterable[str]) -> Tuple[int, int]:
+    """
+    Size of input read from zip central directories, archives are not extracted.
+    :param archives: paths to zip archives.
+    :return: number of archives & total uncompressed size in MB.
+    """
+    n_archives, total_bytes = 0, 0
+    for archive in archives:
+        n_archives += 1
+        try:
+            with zipfile.ZipFile(archive) as zip_file:
+                total_bytes += sum(info.file_size for info in zip_file.infolist())
+        except (OSError, zipfile.BadZipFile):
+            # tokenizer reports broken archives, they still cost as much as their size
+            total_bytes += os.path.getsize(archive)
+    return n_archives, math.ceil(total_bytes / MB)
+
+
+def _threads(shares: Dict[str, float], budget: float) -> Dict[str, int]:
+    return {name: max(1, int(budget * share + 1e-9)) for name, share in shares.items()}
+
+
+def plan_resources(cores: int, memory_mb: int, n_archives: int, input_mb: int, nodes: Optional[int] = None,
+                   heap_mb: Optional[int] = None, tokenizer_processes: Optional[int] = None) -> ResourcePlan:
+    """
+    Consistent settings for the machine and the input, values given explicitly are kept.
+    :param cores: available cores.
+    :param memory_mb: available memory in MB.
+    :param n_archives: number of archives.
+    :param input_mb: uncompressed size of archives in MB.
+    :param nodes: number of search nodes, chosen if None.
+    :param heap_mb: JVM heap of a node in MB, chosen if None.
+    :param tokenizer_processes: number of tokenizer processes, chosen if None.
+    :return: resource plan.
+    """
+    usable_mb = max(MIN_HEAP_MB, int(memory_mb * USABLE_MEMORY_SHARE))
+    if tokenizer_processes is None:
+        tokenizer_processes = max(1, min(cores, n_archives, usable_mb // TOKENIZER_PROCESS_MB))
+    # several batches per process even out archives of different sizes
+    projects_batch = max(1, min(MAX_PROJECTS_BATCH, n_archives // (tokenizer_processes * 4)))
+
+    if heap_mb is None:
+        heap_mb = min(MAX_HEAP_MB, int(HEAP_BASE_MB + input_mb * HEAP_PER_INPUT_MB))
+        heap_mb = max(MIN_HEAP_MB, min(heap_mb, usable_mb // (nodes or 1)))
+    if nodes is None:
+        nodes = max(1, min(cores // CORES_PER_NODE, usable_mb // heap_mb, math.ceil(input_mb / INPUT_MB_PER_NODE)))
+
+    cores_per_node = max(1, cores // nodes)
+    threads = _threads({"QLQ_THREADS": 1 / 8, "QBQ_THREADS": 1 / 8, "QCQ_THREADS": 1 / 8, "VCQ_THREADS": 1 / 2,
+                        "RCQ_THREADS": 1 / 8}, cores_per_node * SEARCH_THREADS_PER_CORE)
+    threads.update(_threads({"BTSQ_THREADS": 1 / 3, "BTIIQ_THREADS": 1 / 3, "BTFIQ_THREADS": 1 / 3},
+                            cores * INDEX_THREADS_PER_CORE))
+    return ResourcePlan(cores=cores, memory_mb=memory_mb, n_archives=n_archives, input_mb=input_mb,
+                        tokenizer_processes=tokenizer_processes, projects_batch=projects_batch, nodes=nodes,
+                        heap_mb=heap_mb, threads=threads)
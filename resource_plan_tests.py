@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+import zipfile
+
+from resource_plan import input_size, plan_resources
+
+
+class TestResourcePlan(unittest.TestCase):
+    def test_default_proportions_on_8_cores(self):
+        plan = plan_resources(cores=8, memory_mb=64 * 1024, n_archives=1000, input_mb=200)
+        # small input - a single node, threads of the default properties
+        self.assertEqual(plan.nodes, 1)
+        self.assertEqual(plan.tokenizer_processes, 8)
+        self.assertEqual(plan.projects_batch, 31)
+        self.assertEqual(plan.threads, {"QLQ_THREADS": 4, "QBQ_THREADS": 4, "QCQ_THREADS": 4, "VCQ_THREADS": 16,
+                                        "RCQ_THREADS": 4, "BTSQ_THREADS": 4, "BTIIQ_THREADS": 4, "BTFIQ_THREADS": 4})
+
+    def test_nodes_limited_by_cores_and_memory(self):
+        plan = plan_resources(cores=32, memory_mb=64 * 1024, n_archives=10000, input_mb=20 * 1024)
+        self.assertEqual(plan.heap_mb, 6144)
+        self.assertEqual(plan.nodes, 8)
+        self.assertLessEqual(plan.nodes * plan.heap_mb, 64 * 1024 * 0.75)
+        self.assertEqual(plan.threads["VCQ_THREADS"], 8)
+
+        plan = plan_resources(cores=32, memory_mb=4 * 1024, n_archives=3, input_mb=20 * 1024)
+        self.assertEqual((plan.nodes, plan.heap_mb, plan.tokenizer_processes), (1, 3072, 3))
+
+    def test_explicit_values_are_kept(self):
+        plan = plan_resources(cores=4, memory_mb=8 * 1024, n_archives=10, input_mb=100 * 1024, nodes=3,
+                              tokenizer_processes=20)
+        self.assertEqual((plan.nodes, plan.tokenizer_processes), (3, 20))
+        self.assertLessEqual(plan.nodes * plan.heap_mb, 8 * 1024 * 0.75)
+        self.assertEqual(plan.threads["QLQ_THREADS"], 1)
+
+    def test_input_size(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive = os.path.join(tmp_dir, "a.zip")
+            with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+                zip_file.writestr("A.java", "a" * (3 << 20))
+            self.assertEqual(input_size([archive]), (1, 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
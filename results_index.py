@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+On-disk index of SourcererCC results for on-demand browsing.
+
+The index is a single SQLite file that joins result pairs with block statistics and bookkeeping:
+* projects: project_id -> archive path;
+* files: file_id -> project, path inside archive;
+* blocks: block_id -> project, file, start/end line, SLOC;
+* components: block_id -> connected component (clone class) id, components are numbered by size (biggest first);
+* clone_classes: per component number of blocks, pairs and projects;
+* pairs: pairs grouped by component.
+Building the index is a single pass over stats and two streaming passes over the pairs file,
+afterwards any component, pair or block can be looked up without loading results into memory.
+"""
+import argparse
+import os
+import sqlite3
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Union
+
+from tqdm import tqdm
+
+from prettify_results import WeightedQuickUnionPathCompressionUF, _get_project_ids, filter_by_similarity, get_files, \
+    get_line_iterator
+
+BATCH_SIZE = 100000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS projects (proj_id TEXT PRIMARY KEY, archive TEXT);
+CREATE TABLE IF NOT EXISTS files (file_id TEXT PRIMARY KEY, proj_id TEXT, path TEXT);
+CREATE TABLE IF NOT EXISTS blocks (block_id TEXT PRIMARY KEY, proj_id TEXT, file_id TEXT,
+                                   start_line INTEGER, end_line INTEGER, sloc INTEGER);
+CREATE TABLE IF NOT EXISTS components (block_id TEXT PRIMARY KEY, cc_id INTEGER);
+CREATE TABLE IF NOT EXISTS clone_classes (cc_id INTEGER PRIMARY KEY, n_blocks INTEGER, n_pairs INTEGER,
+                                          n_projects INTEGER);
+CREATE TABLE IF NOT EXISTS pairs (cc_id INTEGER, block_id1 TEXT, block_id2 TEXT);
+"""
+POST_BUILD_INDEXES = """
+CREATE INDEX IF NOT EXISTS pairs_cc ON pairs (cc_id);
+CREATE INDEX IF NOT EXISTS components_cc ON components (cc_id);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+CREATE INDEX IF NOT EXISTS projects_archive ON projects (archive);
+"""
+
+
+def _batched(rows: Iterable, size: int = BATCH_SIZE) -> Iterator[List]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_bookkeeping(bookkeeping_folder: str) -> Iterator[Tuple[str, str]]:
+    """
+    Iterate over (project_id, archive path) from bookkeeping files.
+    :param bookkeeping_folder: file or folder with `*.projs` files.
+    :return: iterator of tuples.
+    """
+    for projs_file in get_files(path=bookkeeping_folder, extension=".projs"):
+        for line in get_line_iterator(projs_file):
+            if not line:
+                continue
+            proj_id, archive_path = line.split(",", 1)
+            yield proj_id, archive_path.strip('"')
+
+
+def iter_stats(stats_files: str, extension: str = ".stats") -> Iterator[Tuple[str, List[str]]]:
+    """
+    Iterate over stats lines as ("f" | "b", line parts without the leading marker).
+    :param stats_files: file or folder with stats files.
+    :param extension: extension of stats files.
+    :return: iterator of tuples.
+    """
+    for stats_file in get_files(path=stats_files, extension=extension):
+        for line in get_line_iterator(stats_file):
+            if line.startswith("f"):
+                # file path may contain commas - it's quoted and placed between id and url
+                head, path_and_tail = line.split(",\"", 1)
+                path, tail = path_and_tail.split("\",", 1)
+                yield "f", head.split(",")[1:] + [path] + tail.split(",")
+            elif line.startswith("b"):
+                yield "b", line.split(",")[1:]
+
+
+def create_index(index_loc: str) -> sqlite3.Connection:
+    """
+    Create (or open) index file and make sure the schema exists.
+    :param index_loc: path to SQLite file.
+    :return: connection.
+    """
+    conn = sqlite3.connect(index_loc)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def open_index(index_loc: str) -> sqlite3.Connection:
+    """
+    Open existing index in read-only mode.
+    :param index_loc: path to SQLite file.
+    :return: connection that can be shared between threads (reads only).
+    """
+    if not os.path.isfile(index_loc):
+        raise FileNotFoundError("Results index %s not found" % index_loc)
+    return sqlite3.connect("file:%s?mode=ro" % index_loc, uri=True, check_same_thread=False)
+
+
+def index_stats(conn: sqlite3.Connection, stats_files: str, bookkeeping_folder: str) -> None:
+    """
+    Load projects, files and blocks into index.
+    :param conn: index connection.
+    :param stats_files: file or folder with stats files.
+    :param bookkeeping_folder: file or folder with bookkeeping files.
+    :return: None.
+    """
+    for batch in _batched(iter_bookkeeping(bookkeeping_folder)):
+        conn.executemany("INSERT OR REPLACE INTO projects VALUES (?, ?)", batch)
+
+    inserts = {"f": "INSERT OR REPLACE INTO files VALUES (?, ?, ?)",
+               "b": "INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?, ?)"}
+    batches = {"f": [], "b": []}
+    for kind, parts in tqdm(iter_stats(stats_files), desc="Indexing stats", leave=False):
+        if kind == "f":
+            # project_id, file_id, path, ...
+            batches[kind].append((parts[1], parts[0], parts[2]))
+        else:
+            # project_id, block_id, hash, lines, LOC, SLOC, start_line, end_line
+            # block_id consists of 2 parts - relative_id & file_id
+            batches[kind].append((parts[1], parts[0], parts[1][5:], int(parts[6]), int(parts[7]), int(parts[5])))
+        if len(batches[kind]) >= BATCH_SIZE:
+            conn.executemany(inserts[kind], batches[kind])
+            batches[kind] = []
+    for kind, batch in batches.items():
+        if batch:
+            conn.executemany(inserts[kind], batch)
+    conn.commit()
+
+
+def iter_pairs(results_file: Union[str, List[str]], filter_f: Callable = None,
+               threshold: Union[float, None] = None) -> Iterator[Tuple[str, str, str, str]]:
+    """
+    Stream pairs from results file(s) as (proj_id1, block_id1, proj_id2, block_id2).
+    :param results_file: path or list of paths to results files.
+    :param filter_f: filter function on project ids - if None - no filtering.
+    :param threshold: pairs with lower similarity are skipped (if results have similarity), None - no filtering.
+    :return: iterator of tuples.
+    """
+    results_files = [results_file] if isinstance(results_file, str) else results_file
+    for path in results_files:
+        for line in filter_by_similarity(get_line_iterator(path), threshold):
+            if not line:
+                continue
+            proj_id1, block_id1, proj_id2, block_id2 = line.split(",")[:4]
+            if filter_f is None or filter_f(proj_id1, proj_id2):
+                yield proj_id1, block_id1, proj_id2, block_id2
+
+
+def index_pairs(conn: sqlite3.Connection, pairs: Callable[[], Iterator[Tuple[str, str, str, str]]]) -> int:
+    """
+    Find connected components and store pairs grouped by component.
+    :param conn: index connection.
+    :param pairs: function that returns a fresh iterator over pairs - pairs are read twice.
+    :return: number of connected components.
+    """
+    uf = WeightedQuickUnionPathCompressionUF()
+    block2idx = {}  # type: Dict[str, int]
+
+    def _idx(block_id):
+        if block_id not in block2idx:
+            block2idx[block_id] = uf.n_components()
+            uf.add_component()
+        return block2idx[block_id]
+
+    for _, block_id1, _, block_id2 in tqdm(pairs(), desc="Finding connected components"):
+        uf.union(_idx(block_id1), _idx(block_id2))
+
+    # number components by size: biggest first
+    root_size = {}
+    for idx in range(uf.n_components()):
+        root = uf.find(idx)
+        root_size[root] = root_size.get(root, 0) + 1
+    root2cc = {root: cc_id for cc_id, root in
+               enumerate(sorted(root_size, key=lambda root: (-root_size[root], root)))}
+
+    conn.execute("DELETE FROM components")
+    conn.execute("DELETE FROM pairs")
+    for batch in _batched((block_id, root2cc[uf.find(idx)]) for block_id, idx in block2idx.items()):
+        conn.executemany("INSERT INTO components VALUES (?, ?)", batch)
+    rows = ((root2cc[uf.find(block2idx[block_id1])], block_id1, block_id2)
+            for _, block_id1, _, block_id2 in tqdm(pairs(), desc="Indexing pairs"))
+    for batch in _batched(rows):
+        conn.executemany("INSERT INTO pairs VALUES (?, ?, ?)", batch)
+    conn.commit()
+    update_clone_classes(conn)
+    return len(root2cc)
+
+
+def update_clone_classes(conn: sqlite3.Connection) -> None:
+    """
+    (Re)compute per-component summary.
+    :param conn: index connection.
+    :return: None.
+    """
+    conn.executescript(POST_BUILD_INDEXES)
+    conn.execute("DELETE FROM clone_classes")
+    conn.execute("""
+        INSERT INTO clone_classes
+        SELECT c.cc_id, COUNT(*), (SELECT COUNT(*) FROM pairs p WHERE p.cc_id = c.cc_id), COUNT(DISTINCT b.proj_id)
+        FROM components c LEFT JOIN blocks b ON b.block_id = c.block_id
+        GROUP BY c.cc_id""")
+    conn.commit()
+
+
+def build_index(results_file: Union[str, List[str]], stats_files: str, bookkeeping_folder: str, index_loc: str,
+                filter_repos: Union[List[str], None] = None, threshold: Union[float, None] = None) -> None:
+    """
+    Build results index from scratch.
+    :param results_file: result file(s) with pairs from SourcererCC.
+    :param stats_files: meta information for blocks from SourcererCC.
+    :param bookkeeping_folder: mapping {project_id: archive_path}.
+    :param index_loc: path to SQLite file to create.
+    :param filter_repos: repositories for `versus` mode filtering. If None - no filtering will be applied.
+    :param threshold: pairs with lower similarity are skipped (results searched with similarity reporting at a lower
+                      threshold), if None - all pairs are used.
+    :return: None.
+    """
+    if os.path.exists(index_loc):
+        os.remove(index_loc)
+    filter_f = None
+    if filter_repos:
+        proj_ids = _get_project_ids(project_names=set(filter_repos), bookkeeping_folder=bookkeeping_folder)
+
+        def filter_f(pr1, pr2):
+            # only one should be in filtered repositories
+            return (pr1 in proj_ids) != (pr2 in proj_ids)
+
+    conn = create_index(index_loc)
+    try:
+        index_stats(conn, stats_files=stats_files, bookkeeping_folder=bookkeeping_folder)
+        n_components = index_pairs(conn, lambda: iter_pairs(results_file, filter_f, threshold))
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('results_file', ?)",
+                     (",".join([results_file] if isinstance(results_file, str) else results_file),))
+        conn.commit()
+    finally:
+        conn.close()
+    print("Results index %s saved: %s connected components" % (index_loc, format(n_components, ",")))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-r", "--results-file", required=True, nargs="+",
+                        help="File(s) with results of SourcererCC (results.pairs).")
+    parser.add_argument("-s", "--stats-files", required=True, help="File or folder with stats files (*.stats).")
+    parser.add_argument("-b", "--bookkeeping-folder", required=True, help="File or folder with bookkeeping files "
+                                                                          "(proj_id to archive path mapping).")
+    parser.add_argument("-o", "--output", required=True, help="Path to SQLite file with results index.")
+    parser.add_argument("-f", "--filter", nargs="*", help="List of repositories (archive names without path) "
+                                                          "for `versus` mode filtering.")
+    parser.add_argument("-t", "--threshold", type=float, default=None,
+                        help="Keep only pairs with at least this similarity, results must be searched with similarity "
+                             "reporting (`main.py --report-similarity`) at a lower threshold.")
+    args = parser.parse_args()
+    build_index(results_file=args.results_file, stats_files=args.stats_files,
+                bookkeeping_folder=args.bookkeeping_folder, index_loc=args.output, filter_repos=args.filter,
+                threshold=args.threshold)
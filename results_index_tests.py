@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+import zipfile
+
+from report_server import ReportBackend
+from results_index import build_index
+
+
+class TestResultsIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archives = {}
+        for proj_id, name in [("1", "a.zip"), ("2", "b.zip")]:
+            self.archives[proj_id] = os.path.join(self.tmp.name, name)
+            with zipfile.ZipFile(self.archives[proj_id], "w") as archive:
+                archive.writestr("src/Main.java", "\n".join("line %s" % i for i in range(1, 21)))
+        os.makedirs(os.path.join(self.tmp.name, "stats"))
+        os.makedirs(os.path.join(self.tmp.name, "bookkeeping"))
+        with open(os.path.join(self.tmp.name, "bookkeeping", "bookkeeping-0.projs"), "w") as f:
+            for proj_id, archive in sorted(self.archives.items()):
+                f.write('{},"{}"\n'.format(proj_id, archive))
+        # one file per project with blocks at lines 1-5, 6-10 & 11-15
+        with open(os.path.join(self.tmp.name, "stats", "files-stats-0.stats"), "w") as f:
+            for proj_id, file_id in [("1", "100"), ("2", "200")]:
+                f.write('f,{},{},"{}/src/Main.java","","hash",100,20,20,20\n'.format(proj_id, file_id,
+                                                                                   self.archives[proj_id]))
+                for i in range(3):
+                    f.write('b,{},{}{},"hash",5,5,5,{},{}\n'.format(proj_id, 10000 + i, file_id, 5 * i + 1, 5 * i + 5))
+        self.pairs = os.path.join(self.tmp.name, "results.pairs")
+        with open(self.pairs, "w") as f:
+            # component of 3 blocks & component of 2 blocks, one pair is below 0.9
+            f.write("1,10000100,2,10000200,0.95\n2,10001200,1,10000100,0.91\n1,10001100,2,10002200,0.85\n")
+        self.index_loc = os.path.join(self.tmp.name, "results.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _build(self, threshold=None, filter_repos=None):
+        build_index(self.pairs, os.path.join(self.tmp.name, "stats"), os.path.join(self.tmp.name, "bookkeeping"),
+                    self.index_loc, filter_repos=filter_repos, threshold=threshold)
+        conn = sqlite3.connect(self.index_loc)
+        try:
+            components = dict(conn.execute("SELECT block_id, cc_id FROM components").fetchall())
+            classes = conn.execute("SELECT cc_id, n_blocks, n_pairs, n_projects FROM clone_classes "
+                                   "ORDER BY cc_id").fetchall()
+            counts = [conn.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0]
+                      for table in ["projects", "files", "blocks"]]
+        finally:
+            conn.close()
+        return components, classes, counts
+
+    def test_build_index(self):
+        components, classes, counts = self._build()
+        self.assertEqual(counts, [2, 2, 6])
+        self.assertEqual(components, {"10000100": 0, "10000200": 0, "10001200": 0, "10001100": 1, "10002200": 1})
+        # components are numbered by size, biggest first
+        self.assertEqual(classes, [(0, 3, 2, 2), (1, 2, 1, 2)])
+
+        backend = ReportBackend(self.index_loc, page_size=1)
+        rows, total = backend.components(page=2)
+        self.assertEqual((rows, total), ([(1, 2, 1, 2)], 2))
+        meta = backend.block_meta("10001200")
+        self.assertEqual((meta.project, meta.filepath, meta.start_line, meta.end_line),
+                         (self.archives["2"], "src/Main.java", 6, 10))
+        self.assertEqual(backend.block_content(meta).split("\n"), ["line %s" % i for i in range(6, 11)])
+        self.assertIsNone(backend.block_meta("missing"))
+
+    def test_threshold(self):
+        components, classes, _ = self._build(threshold=0.9)
+        self.assertEqual(sorted(components), ["10000100", "10000200", "10001200"])
+        self.assertEqual(classes, [(0, 3, 2, 2)])
+        components, classes, _ = self._build(threshold=0.93)
+        self.assertEqual(classes, [(0, 2, 1, 2)])
+
+    def test_versus_filter(self):
+        with open(self.pairs, "a") as f:
+            f.write("1,10002100,1,10001100,0.99\n")
+        self.assertEqual(len(self._build()[0]), 6)
+        # only pairs with exactly one block from filter repositories are kept
+        components, _, _ = self._build(filter_repos=["a.zip"])
+        self.assertEqual(len(components), 5)
+        self.assertNotIn("10002100", components)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Find clones of a snippet in a reference corpus without running the pipeline, e.g. for IDE or code review checks.
+
+`SnippetIndex` keeps the blocks of tokenizer output in memory (bags of ranked tokens, prefix index of
+`python_engine` and block locations from stats files). It is built once from `main.py` output and saved, loading
+a saved index doesn't read tokens files again. `SnippetSearcher` tokenizes snippets (or whole files, split into
+functions) with the same `Tokenizer` config as the corpus and searches them in batches:
+prefix candidates are filtered by size and verified by `batch_verifier`, matches are returned with
+their similarity `overlap / max(size1, size2)` and `BlockMeta` locations.
+
+`python snippet_search.py build <tokens> <stats> -o <index>` builds an index,
+`python snippet_search.py query <index> <files>` searches functions of files and reports p50/p99 latency.
+"""
+import argparse
+import json
+import os
+import time
+from collections import namedtuple
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from batch_verifier import CSR, min_overlap, min_overlaps, strip_token
+from prettify_results import BlockMeta, get_files, get_line_iterator, split_sourcerercc_path
+from python_engine import Blocks, PrefixIndex, max_candidate_size, prefix_mask, read_ranked_blocks
+
+DEFAULT_CONFIG = os.path.join(os.path.abspath(os.path.dirname(__file__)), "tokenizers", "block_config.ini")
+BLOCKS_FILE_NAME = "blocks.npz"
+VOCABULARY_FILE_NAME = "vocabulary.txt"
+FILES_FILE_NAME = "files.txt"
+META_FILE_NAME = "meta.json"
+
+SnippetMatch = namedtuple("SnippetMatch", ["proj_id", "block_id", "similarity", "meta"])
+# latency percentiles in milliseconds
+Latency = namedtuple("Latency", ["queries", "batches", "p50_ms", "p99_ms", "max_ms", "queries_per_sec"])
+
+
+def _read_locations(stats_locs: Sequence[str], block_ids: set) -> Tuple[List[str], Dict[int, Tuple[int, int, int]]]:
+    """ Paths of files & {block_id: (file index, start line, end line)} from stats files """
+    files, file_rows, blocks = [], {}, {}
+    for stats_loc in stats_locs:
+        for stats_file in sorted(get_files(path=stats_loc, extension=".stats")):
+            for line in get_line_iterator(stats_file):
+                parts = line.split(",")
+                if line.startswith("f"):
+                    file_rows[parts[2]] = len(files)
+                    files.append(parts[3].strip('"'))
+                elif line.startswith("b") and int(parts[2]) in block_ids:
+                    # block_id consists of 2 parts - relative_id & file_id
+                    blocks[int(parts[2])] = (parts[2][5:], int(parts[-2]), int(parts[-1]))
+    return files, {block_id: (file_rows.get(file_id, -1), start_line, end_line)
+                   for block_id, (file_id, start_line, end_line) in blocks.items()}
+
+
+class SnippetIndex:
+    """
+    Memory-resident blocks of the reference corpus.
+    """
+
+    def __init__(self, blocks: Blocks, vocabulary: List[str], files: List[str], locations: np.ndarray,
+                 threshold: float):
+        """
+        :param blocks: blocks of the corpus.
+        :param vocabulary: tokens in the order of their ranks.
+        :param files: paths of files (`archive.zip/path/in/archive`).
+        :param locations: `n_blocks x 3` matrix: file index (-1 if unknown), start line, end line.
+        :param threshold: the lowest threshold of queries, prefixes are indexed for it.
+        """
+        self.blocks = blocks
+        self.vocabulary = vocabulary
+        self.ranks = {token: rank for rank, token in enumerate(vocabulary)}
+        self.files = files
+        self.locations = locations
+        self.threshold = threshold
+        self.prefix_index = PrefixIndex(blocks, threshold)
+
+    @classmethod
+    def build(cls, tokens_locs: Sequence[str], stats_locs: Sequence[str], threshold: float = 0.8,
+              min_tokens: int = 65, max_tokens: int = 500000) -> "SnippetIndex":
+        """
+        Index tokenizer output.
+        :param tokens_locs: tokens files or folders with them.
+        :param stats_locs: stats files or folders with them.
+        :param threshold: the lowest threshold of queries.
+        :param min_tokens: blocks with fewer tokens are ignored.
+        :param max_tokens: blocks with more tokens are ignored.
+        :return: index.
+        """
+        blocks, _, vocabulary = read_ranked_blocks(tokens_locs, min_tokens, max_tokens)
+        files, locations = _read_locations(stats_locs, set(blocks.block_ids.tolist()))
+        location_rows = np.array([locations.get(block_id, (-1, 0, 0)) for block_id in blocks.block_ids.tolist()],
+                                 dtype=np.int64).reshape(-1, 3)
+        return cls(blocks, vocabulary, files, location_rows, threshold)
+
+    def save(self, index_dir: str) -> None:
+        os.makedirs(index_dir, exist_ok=True)
+        np.savez(os.path.join(index_dir, BLOCKS_FILE_NAME), locations=self.locations, **self.blocks._asdict())
+        with open(os.path.join(index_dir, VOCABULARY_FILE_NAME), "w", encoding="utf-8") as f:
+            f.writelines(token + "\n" for token in self.vocabulary)
+        with open(os.path.join(index_dir, FILES_FILE_NAME), "w", encoding="utf-8") as f:
+            f.writelines(path + "\n" for path in self.files)
+        with open(os.path.join(index_dir, META_FILE_NAME), "w") as f:
+            json.dump({"threshold": self.threshold}, f)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "SnippetIndex":
+        with np.load(os.path.join(index_dir, BLOCKS_FILE_NAME)) as arrays:
+            blocks = Blocks(**{field: arrays[field] for field in Blocks._fields})
+            locations = arrays["locations"]
+        with open(os.path.join(index_dir, VOCABULARY_FILE_NAME), encoding="utf-8") as f:
+            vocabulary = [line.rstrip("\n") for line in f]
+        with open(os.path.join(index_dir, FILES_FILE_NAME), encoding="utf-8") as f:
+            files = [line.rstrip("\n") for line in f]
+        with open(os.path.join(index_dir, META_FILE_NAME)) as f:
+            threshold = json.load(f)["threshold"]
+        return cls(blocks, vocabulary, files, locations, threshold)
+
+    def block_meta(self, row: int) -> Optional[BlockMeta]:
+        file_row, start_line, end_line = self.locations[row].tolist()
+        if file_row < 0:
+            return None
+        archive, filepath = split_sourcerercc_path(self.files[file_row])
+        return BlockMeta(project=archive, filepath=filepath, start_line=start_line, end_line=end_line)
+
+    def _query_blocks(self, bags: Sequence[Dict[str, int]]) -> Blocks:
+        """ Bags ranked like the corpus, unknown tokens are the rarest and match nothing """
+        tokens, counts, lengths, sizes = [], [], [], []
+        for bag in bags:
+            unknown, row = {}, {}
+            for token, count in bag.items():
+                token = strip_token(token)
+                if not token:
+                    continue
+                rank = self.ranks.get(token)
+                if rank is None:
+                    rank = unknown.setdefault(token, len(self.vocabulary) + len(unknown))
+                row.setdefault(rank, count)
+            tokens.extend(sorted(row))
+            counts.extend(row[rank] for rank in sorted(row))
+            lengths.append(len(row))
+            sizes.append(sum(row.values()))
+        indptr = np.zeros(len(bags) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        empty = np.zeros(len(bags), dtype=np.int64)
+        return Blocks(proj_ids=empty, block_ids=empty, sizes=np.array(sizes, dtype=np.int64).reshape(-1),
+                      indptr=indptr, tokens=np.array(tokens, dtype=np.int64), counts=np.array(counts, dtype=np.int64))
+
+    def search_bags(self, bags: Sequence[Dict[str, int]], threshold: Optional[float] = None) \
+            -> List[List[SnippetMatch]]:
+        """
+        Find clones of bags of tokens.
+        :param bags: {token: count} of every query.
+        :param threshold: similarity threshold, not lower than the threshold of the index; index threshold if None.
+        :return: matches of every query, the most similar first.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        if threshold < self.threshold:
+            raise ValueError("threshold {} is lower than the threshold of the index {}".format(threshold,
+                                                                                              self.threshold))
+        queries = self._query_blocks(bags)
+        mask = prefix_mask(queries, threshold)
+        owners = np.repeat(np.arange(len(bags)), np.diff(queries.indptr))
+        query_idx, candidate_idx = self.prefix_index.candidates(queries.tokens[mask], owners[mask])
+        sizes = self.blocks.sizes[candidate_idx]
+        keep = (sizes >= min_overlap(queries.sizes, threshold)[query_idx]) & \
+            (sizes <= max_candidate_size(queries.sizes, threshold)[query_idx])
+        pair_keys = np.unique(query_idx[keep] * len(self.blocks.sizes) + candidate_idx[keep])
+        query_idx, candidate_idx = pair_keys // len(self.blocks.sizes), pair_keys % len(self.blocks.sizes)
+        overlaps = min_overlaps(CSR(queries.indptr, queries.tokens, queries.counts),
+                                CSR(self.blocks.indptr, self.blocks.tokens, self.blocks.counts),
+                                query_idx, candidate_idx)
+        max_sizes = np.maximum(queries.sizes[query_idx], self.blocks.sizes[candidate_idx])
+        clones = overlaps >= min_overlap(max_sizes, threshold)
+
+        matches = [[] for _ in bags]
+        for query, candidate, overlap, size in zip(query_idx[clones].tolist(), candidate_idx[clones].tolist(),
+                                                   overlaps[clones].tolist(), max_sizes[clones].tolist()):
+            matches[query].append(SnippetMatch(proj_id=int(self.blocks.proj_ids[candidate]),
+                                               block_id=int(self.blocks.block_ids[candidate]),
+                                               similarity=overlap / size, meta=self.block_meta(candidate)))
+        for query_matches in matches:
+            query_matches.sort(key=lambda match: (-match.similarity, match.block_id))
+        return matches
+
+
+def parse_tokens(tokens: str) -> Dict[str, int]:
+    """ Bag of tokens from the tokenizer format `token@@::@@count,...` """
+    bag = {}
+    for token_count in tokens.split(","):
+        token, _, count = token_count.rpartition("@@::@@")
+        if token:
+            bag[token] = bag.get(token, 0) + int(count)
+    return bag
+
+
+class SnippetSearcher:
+    """
+    Tokenizes snippets like the corpus and searches them in a warm index.
+    """
+
+    def __init__(self, index: SnippetIndex, config_loc: str = DEFAULT_CONFIG):
+        """
+        :param index: loaded index.
+        :param config_loc: tokenizer config of the corpus.
+        """
+        # the tokenizer needs tree-sitter parsers, `SnippetIndex.search_bags` alone doesn't
+        from tokenizers.block_tokenizer import Tokenizer  # pylint: disable=import-outside-toplevel
+        self.index = index
+        self.tokenizer = Tokenizer(config_loc)
+
+    def tokenize(self, snippet: str) -> Dict[str, int]:
+        """ Bag of tokens of a snippet (a whole block, e.g. a method) """
+        _, (_, _, _, tokens), _ = self.tokenizer.process_tokenizer(snippet)
+        return parse_tokens(tokens)
+
+    def find_clones(self, snippets: Sequence[str], threshold: Optional[float] = None) -> List[List[SnippetMatch]]:
+        """
+        Find clones of a batch of snippets.
+        :param snippets: source code of blocks.
+        :param threshold: similarity threshold, index threshold if None.
+        :return: matches of every snippet, the most similar first.
+        """
+        return self.index.search_bags([self.tokenize(snippet) for snippet in snippets], threshold)
+
+    def find_clones_in_file(self, content: str, path: str = "", threshold: Optional[float] = None) \
+            -> List[Tuple[int, int, List[SnippetMatch]]]:
+        """
+        Find clones of functions of a file.
+        :param content: source code of the file.
+        :param path: path of the file, used in messages.
+        :param threshold: similarity threshold, index threshold if None.
+        :return: start line, end line & matches of every function.
+        """
+        _, blocks_data, _ = self.tokenizer.tokenize_blocks(content, path)
+        if not blocks_data:
+            return []
+        bags = [parse_tokens(block_tokens[3]) for block_tokens, _, _ in blocks_data]
+        matches = self.index.search_bags(bags, threshold)
+        return [(start_line, end_line, block_matches)
+                for (_, (_, start_line, end_line), _), block_matches in zip(blocks_data, matches)]
+
+
+def measure_latency(search, queries: Sequence, batch_size: int = 1) -> Latency:
+    """
+    Latency of batched queries.
+    :param search: function that answers a batch of queries, e.g. `SnippetSearcher.find_clones`.
+    :param queries: queries.
+    :param batch_size: queries per batch.
+    :return: latency percentiles of batches.
+    """
+    latencies = []
+    started = time.perf_counter()
+    for batch_start in range(0, len(queries), batch_size):
+        batch_started = time.perf_counter()
+        search(queries[batch_start:batch_start + batch_size])
+        latencies.append((time.perf_counter() - batch_started) * 1000)
+    total = time.perf_counter() - started
+    latencies = np.array(latencies or [0.0])
+    return Latency(queries=len(queries), batches=len(latencies), p50_ms=float(np.percentile(latencies, 50)),
+                   p99_ms=float(np.percentile(latencies, 99)), max_ms=float(latencies.max()),
+                   queries_per_sec=len(queries) / total if total else 0.0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command")
+    build_parser = subparsers.add_parser("build", help="Build index of tokenizer output.")
+    build_parser.add_argument("tokens", help="Tokens files folder (`tokenizer_output/blocks_tokens`).")
+    build_parser.add_argument("stats", help="Stats files folder (`tokenizer_output/blocks_stats`).")
+    build_parser.add_argument("-o", "--output", required=True, help="Index directory.")
+    build_parser.add_argument("-t", "--threshold", type=float, default=0.8, help="The lowest query threshold.")
+    build_parser.add_argument("--min-tokens", type=int, default=65, help="Minimum number of tokens in block.")
+    build_parser.add_argument("--max-tokens", type=int, default=500000, help="Maximum number of tokens in block.")
+    query_parser = subparsers.add_parser("query", help="Find clones of functions of source files.")
+    query_parser.add_argument("index", help="Index directory.")
+    query_parser.add_argument("files", nargs="+", help="Source files.")
+    query_parser.add_argument("-t", "--threshold", type=float, default=None, help="Similarity threshold, "
+                                                                                  "index threshold by default.")
+    query_parser.add_argument("-c", "--config", default=DEFAULT_CONFIG, help="Tokenizer config of the corpus.")
+    query_parser.add_argument("-b", "--batch-size", type=int, default=1, help="Functions per query batch.")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.time()
+        SnippetIndex.build([args.tokens], [args.stats], args.threshold, args.min_tokens, args.max_tokens) \
+            .save(args.output)
+        print("index saved to {} in {:.1f} s".format(args.output, time.time() - started))
+    elif args.command == "query":
+        started = time.time()
+        searcher = SnippetSearcher(SnippetIndex.load(args.index), args.config)
+        print("index loaded in {:.1f} s".format(time.time() - started))
+        names, snippets = [], []
+        for path in args.files:
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                block_linenos, blocks, _ = searcher.tokenizer.parse_blocks(f.read())
+            for (start_line, end_line), block in zip(block_linenos or [], blocks or []):
+                names.append("{}:{}-{}".format(path, start_line, end_line))
+                snippets.append(block)
+        for name, matches in zip(names, searcher.find_clones(snippets, args.threshold)):
+            for match in matches:
+                location = "{}/{}:{}-{}".format(*match.meta) if match.meta else "unknown location"
+                print("{} -> {},{} ({:.3f}) {}".format(name, match.proj_id, match.block_id, match.similarity,
+                                                      location))
+        # latency includes tokenization
+        latency = measure_latency(lambda batch: searcher.find_clones(batch, args.threshold), snippets,
+                                  args.batch_size)
+        print("{} functions in {} batches: p50 {:.2f} ms, p99 {:.2f} ms, max {:.2f} ms, {:.0f} functions/s".format(
+            latency.queries, latency.batches, latency.p50_ms, latency.p99_ms, latency.max_ms,
+            latency.queries_per_sec))
+    else:
+        parser.print_help()
@@ -0,0 +1,80 @@
+import os
+import random
+import tempfile
+import unittest
+
+from snippet_search import SnippetIndex, measure_latency, parse_tokens
+
+
+class TestSnippetSearch(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(5)
+        base = [{"t%s" % rnd.randrange(80): rnd.randint(1, 3) for _ in range(rnd.randint(10, 30))} for _ in range(6)]
+        self.tmp = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp.name, "tokens"))
+        os.makedirs(os.path.join(self.tmp.name, "stats"))
+        self.bags = {}
+        with open(os.path.join(self.tmp.name, "tokens", "files-tokens-0.tokens"), "w") as tokens_file, \
+                open(os.path.join(self.tmp.name, "stats", "files-stats-0.stats"), "w") as stats_file:
+            stats_file.write('f,1,3000000,"repo.zip/src/A.java","","hash",100,10,10,10\n')
+            for block in range(60):
+                bag = dict(base[block % len(base)])
+                for _ in range(rnd.randint(0, 5)):
+                    bag["t%s" % rnd.randrange(100)] = rnd.randint(1, 3)
+                block_id = 10000 + block
+                self.bags[int("{}3000000".format(block_id))] = bag
+                tokens = ",".join("{}@@::@@{}".format(token, count) for token, count in bag.items())
+                tokens_file.write("1,{}3000000,{},{},0,hash@#@{}\n".format(block_id, sum(bag.values()), len(bag),
+                                                                          tokens))
+                stats_file.write('b,1,{}3000000,"hash",5,5,5,{},{}\n'.format(block_id, block, block + 4))
+        self.index = SnippetIndex.build([os.path.join(self.tmp.name, "tokens")],
+                                        [os.path.join(self.tmp.name, "stats")], threshold=0.7, min_tokens=1)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _expected(self, query, threshold):
+        expected = []
+        for block_id, bag in self.bags.items():
+            overlap = sum(min(count, bag.get(token, 0)) for token, count in query.items())
+            size = max(sum(query.values()), sum(bag.values()))
+            if overlap * 1000 >= round(threshold * 1000) * size:
+                expected.append((block_id, overlap / size))
+        return sorted(expected)
+
+    def test_search(self):
+        rnd = random.Random(6)
+        queries = []
+        for bag in list(self.bags.values())[:10]:
+            query = dict(bag)
+            query["unknown%s" % rnd.randrange(3)] = 1
+            queries.append(query)
+        for threshold in [0.7, 0.9]:
+            results = self.index.search_bags(queries, threshold)
+            for query, matches in zip(queries, results):
+                self.assertEqual(sorted((match.block_id, match.similarity) for match in matches),
+                                 self._expected(query, threshold))
+                self.assertEqual([match.similarity for match in matches],
+                                 sorted((match.similarity for match in matches), reverse=True))
+        with self.assertRaises(ValueError):
+            self.index.search_bags(queries, 0.5)
+
+    def test_save_load(self):
+        index_dir = os.path.join(self.tmp.name, "index")
+        self.index.save(index_dir)
+        loaded = SnippetIndex.load(index_dir)
+        query = parse_tokens(",".join("{}@@::@@{}".format(token, count)
+                                      for token, count in self.bags[100053000000].items()))
+        matches = loaded.search_bags([query])[0]
+        self.assertEqual(matches, self.index.search_bags([query])[0])
+        self.assertEqual(matches[0].similarity, 1.0)
+        self.assertEqual(tuple(matches[0].meta), ("repo.zip", "src/A.java", 5, 9))
+
+    def test_latency(self):
+        latency = measure_latency(self.index.search_bags, list(self.bags.values()), batch_size=8)
+        self.assertEqual((latency.queries, latency.batches), (60, 8))
+        self.assertLessEqual(latency.p50_ms, latency.p99_ms)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Out-of-core normalization, sorting and deduplication of SourcererCC result pairs.
+
+Node outputs (`NODE_*/output*/query_*`) may contain both (a, b) and (b, a) and duplicates from resumed runs.
+Pairs are normalized so that the block with the smaller id comes first, sorted in bounded memory
+(sorted runs are spilled to disk as gzip files and combined with a k-way merge) and deduplicated.
+The result is a sorted gzip-compressed pair file in the usual `proj_id1,block_id1,proj_id2,block_id2` format
+that `prettify_results.py` and `results_index.py` can stream directly.
+"""
+import argparse
+import glob
+import gzip
+import heapq
+import os
+import shutil
+import tempfile
+from typing import IO, Iterable, Iterator, List, Tuple
+
+from prettify_results import get_line_iterator
+
+# key used for sorting & deduplication: (smaller block id, bigger block id)
+PairKey = Tuple[int, int]
+
+
+def normalize_pair(line: str) -> Tuple[PairKey, str]:
+    """
+    Orient pair so that the smaller block id comes first.
+    Fields after the 4 ids (if any) are kept as is.
+    :param line: line from results file.
+    :return: sorting key and normalized line.
+    """
+    parts = line.split(",")
+    block_id1, block_id2 = int(parts[1]), int(parts[3])
+    if block_id1 > block_id2:
+        parts[0], parts[1], parts[2], parts[3] = parts[2], parts[3], parts[0], parts[1]
+        return (block_id2, block_id1), ",".join(parts)
+    return (block_id1, block_id2), line
+
+
+def expand_inputs(inputs: Iterable[str]) -> List[str]:
+    """
+    Expand glob patterns into list of paths.
+    :param inputs: paths or glob patterns of results files.
+    :return: list of paths.
+    """
+    paths = []
+    for pattern in inputs:
+        paths.extend(sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern])
+    return paths
+
+
+def iter_input_pairs(inputs: Iterable[str]) -> Iterator[str]:
+    """
+    Iterate over non-empty lines of all input files.
+    :param inputs: paths or glob patterns of results files.
+    :return: iterator of lines.
+    """
+    for path in expand_inputs(inputs):
+        for line in get_line_iterator(path):
+            if line:
+                yield line
+
+
+def open_output(path: str) -> IO[str]:
+    """
+    Open pairs file for writing, gzip-compressed if path ends with `.gz`.
+    :param path: output path.
+    :return: text file object.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8", compresslevel=3)
+    return open(path, "w", encoding="utf-8")
+
+
+def _write_run(pairs: List[Tuple[PairKey, str]], tmp_dir: str, run_id: int) -> str:
+    pairs.sort(key=lambda pair: pair[0])
+    run_loc = os.path.join(tmp_dir, "run_%s.pairs.gz" % run_id)
+    with open_output(run_loc) as f:
+        prev_key = None
+        for key, line in pairs:
+            if key != prev_key:
+                f.write(line)
+                f.write("\n")
+                prev_key = key
+    return run_loc
+
+
+def _iter_run(run_loc: str) -> Iterator[Tuple[PairKey, str]]:
+    for line in get_line_iterator(run_loc):
+        yield normalize_pair(line)
+
+
+def _iter_merged(runs: List[Iterator[Tuple[PairKey, str]]]) -> Iterator[str]:
+    prev_key = None
+    for key, line in heapq.merge(*runs, key=lambda pair: pair[0]):
+        if key != prev_key:
+            yield line
+            prev_key = key
+
+
+def merge_runs(run_locs: List[str], output: str) -> int:
+    """
+    K-way merge of sorted runs with deduplication.
+    :param run_locs: sorted pair files.
+    :param output: path to store merged pairs.
+    :return: number of unique pairs written.
+    """
+    n_pairs = 0
+    with open_output(output) as f:
+        for line in _iter_merged([_iter_run(run_loc) for run_loc in run_locs]):
+            f.write(line)
+            f.write("\n")
+            n_pairs += 1
+    return n_pairs
+
+
+def iter_sorted_pairs(inputs: Iterable[str], max_pairs_in_memory: int = 2000000, max_open_runs: int = 128,
+                      tmp_dir: str = None) -> Iterator[str]:
+    """
+    Normalize, sort and deduplicate pairs with bounded memory and stream them without writing the result to disk.
+    Node outputs are read in place, if all pairs fit in memory nothing is written at all.
+    :param inputs: paths or glob patterns of results files (node outputs).
+    :param max_pairs_in_memory: number of pairs sorted in memory before spilling a run to disk.
+    :param max_open_runs: maximum number of runs merged at once, more runs are merged in several passes.
+    :param tmp_dir: directory for temporary runs. If None - system temporary directory is used.
+    :return: iterator of unique normalized lines sorted by block ids.
+    """
+    return _sort_lines(iter_input_pairs(inputs), max_pairs_in_memory, max_open_runs, tmp_dir)
+
+
+def iter_sorted_lines(lines: Iterable[str], max_pairs_in_memory: int = 2000000, max_open_runs: int = 128,
+                      tmp_dir: str = None) -> Iterator[str]:
+    """
+    `iter_sorted_pairs` over lines instead of files, e.g. pairs that are produced on the fly.
+    :param lines: lines of results, empty lines are skipped.
+    :param max_pairs_in_memory: number of pairs sorted in memory before spilling a run to disk.
+    :param max_open_runs: maximum number of runs merged at once, more runs are merged in several passes.
+    :param tmp_dir: directory for temporary runs. If None - system temporary directory is used.
+    :return: iterator of unique normalized lines sorted by block ids.
+    """
+    return _sort_lines((line for line in lines if line), max_pairs_in_memory, max_open_runs, tmp_dir)
+
+
+def _sort_lines(lines: Iterable[str], max_pairs_in_memory: int, max_open_runs: int, tmp_dir: str) -> Iterator[str]:
+    max_open_runs = max(max_open_runs, 2)
+    work_dir = None
+    try:
+        runs = []
+        chunk = []
+        for line in lines:
+            chunk.append(normalize_pair(line))
+            if len(chunk) >= max_pairs_in_memory:
+                if work_dir is None:
+                    work_dir = tempfile.mkdtemp(prefix="sort_pairs_", dir=tmp_dir)
+                runs.append(_write_run(chunk, work_dir, len(runs)))
+                chunk = []
+        chunk.sort(key=lambda pair: pair[0])
+
+        # reduce number of runs until they can be merged at once (together with the last chunk in memory)
+        next_run_id = len(runs)
+        while len(runs) >= max_open_runs:
+            merged = []
+            for start in range(0, len(runs), max_open_runs):
+                group = runs[start:start + max_open_runs]
+                run_loc = os.path.join(work_dir, "run_%s.pairs.gz" % next_run_id)
+                next_run_id += 1
+                merge_runs(group, run_loc)
+                for old_run in group:
+                    os.remove(old_run)
+                merged.append(run_loc)
+            runs = merged
+        yield from _iter_merged([_iter_run(run_loc) for run_loc in runs] + [iter(chunk)])
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def sort_pairs(inputs: Iterable[str], output: str, max_pairs_in_memory: int = 2000000, max_open_runs: int = 128,
+               tmp_dir: str = None) -> Tuple[int, int]:
+    """
+    Normalize, sort and deduplicate pairs with bounded memory.
+    :param inputs: paths or glob patterns of results files (node outputs).
+    :param output: path to store sorted pairs - gzip-compressed if it ends with `.gz`.
+    :param max_pairs_in_memory: number of pairs sorted in memory before spilling a run to disk.
+    :param max_open_runs: maximum number of runs merged at once, more runs are merged in several passes.
+    :param tmp_dir: directory for temporary runs. If None - directory of output is used.
+    :return: number of input pairs and number of unique pairs.
+    """
+    n_input = 0
+    n_unique = 0
+
+    def _count_input():
+        nonlocal n_input
+        for line in iter_input_pairs(inputs):
+            n_input += 1
+            yield line
+
+    with open_output(output) as f:
+        for line in _sort_lines(_count_input(), max_pairs_in_memory, max_open_runs,
+                                tmp_dir or os.path.dirname(os.path.abspath(output))):
+            f.write(line)
+            f.write("\n")
+            n_unique += 1
+    print("Sorted pairs saved to %s: %s input pairs, %s unique pairs" % (output, format(n_input, ","),
+                                                                          format(n_unique, ",")))
+    return n_input, n_unique
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", required=True, nargs="+",
+                        help="Results files or glob patterns, e.g. 'clone-detector/NODE_*/output*/query_*'.")
+    parser.add_argument("-o", "--output", required=True, help="Output file, gzip-compressed if it ends with `.gz`.")
+    parser.add_argument("-m", "--max-pairs-in-memory", default=2000000, type=int,
+                        help="Number of pairs sorted in memory before spilling to disk.")
+    parser.add_argument("--tmp-dir", default=None, help="Directory for temporary sorted runs.")
+    args = parser.parse_args()
+    sort_pairs(args.input, args.output, max_pairs_in_memory=args.max_pairs_in_memory, tmp_dir=args.tmp_dir)
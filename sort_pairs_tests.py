@@ -0,0 +1,68 @@
+import os
+import random
+import tempfile
+import unittest
+
+from prettify_results import get_line_iterator
+from duplicate_groups import expand_pairs
+from sort_pairs import iter_sorted_lines, iter_sorted_pairs, normalize_pair, sort_pairs
+
+
+class TestSortPairs(unittest.TestCase):
+    def test_normalize_pair(self):
+        self.assertEqual(normalize_pair("12,100023000002,11,100013000001"),
+                         ((100013000001, 100023000002), "11,100013000001,12,100023000002"))
+        self.assertEqual(normalize_pair("11,5,12,7"), ((5, 7), "11,5,12,7"))
+
+    def test_sort_and_dedupe_with_spills(self):
+        rnd = random.Random(0)
+        pairs = set()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            inputs = []
+            for node in range(3):
+                node_output = os.path.join(tmp_dir, "query_%s" % node)
+                inputs.append(node_output)
+                with open(node_output, "w") as f:
+                    for _ in range(500):
+                        block1, block2 = rnd.sample(range(1, 60), 2)
+                        pairs.add((min(block1, block2), max(block1, block2)))
+                        # same pair in both orientations and repeated
+                        f.write("1,%s,2,%s\n" % (block1, block2))
+                        f.write("2,%s,1,%s\n" % (block2, block1))
+            output = os.path.join(tmp_dir, "result.pairs.gz")
+            n_input, n_unique = sort_pairs(inputs, output, max_pairs_in_memory=100, max_open_runs=4)
+            lines = list(get_line_iterator(output))
+
+        self.assertEqual(n_input, 3000)
+        self.assertEqual(n_unique, len(pairs))
+        keys = [(int(line.split(",")[1]), int(line.split(",")[3])) for line in lines]
+        self.assertEqual(keys, sorted(pairs))
+
+    def test_iter_sorted_pairs_cleans_runs(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            node_output = os.path.join(tmp_dir, "query_1")
+            with open(node_output, "w") as f:
+                for block in range(50, 0, -1):
+                    f.write("1,%s,2,%s\n2,%s,1,%s\n" % (block + 100, block, block, block + 100))
+            runs_dir = os.path.join(tmp_dir, "runs")
+            os.makedirs(runs_dir)
+            lines = list(iter_sorted_pairs([os.path.join(tmp_dir, "query_*")], max_pairs_in_memory=7,
+                                           max_open_runs=3, tmp_dir=runs_dir))
+            self.assertEqual(os.listdir(runs_dir), [])
+
+        self.assertEqual(lines, ["2,%s,1,%s" % (block, block + 100) for block in range(1, 51)])
+
+    def test_sorted_expanded_pairs(self):
+        # groups of identical blocks: 1 represents 1, 5 & 9, 2 represents 2 & 4
+        groups = {"1": [("1", "1"), ("1", "5"), ("2", "9")], "2": [("1", "2"), ("1", "4")]}
+        expanded = list(expand_pairs(["1,2,1,1,0.9000", "1,3,1,2,0.8000"], groups))
+        self.assertNotEqual(expanded, sorted(expanded))
+        lines = list(iter_sorted_lines(expanded + ["", expanded[0]], max_pairs_in_memory=4, max_open_runs=2))
+        keys = [normalize_pair(line)[0] for line in lines]
+        self.assertEqual(keys, sorted(set(keys)))
+        self.assertEqual(len(lines), 6 + 2 + 3 + 1)
+        self.assertIn("1,4,2,9,0.9000", lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+On-disk inverted index of tokenizer output: which blocks contain a token.
+
+Layout of the index directory:
+* `meta.json` - shard boundaries, number of tokens, blocks & postings of every shard;
+* `vocabulary.txt` - tokens (one per line) in the order of their ids, `frequencies.npy` - their global frequencies;
+  ids are ranks in the global order of clone-detector (rare tokens first, ties broken by token);
+* `shard_<i>/` - blocks with sizes in `(boundaries[i - 1], boundaries[i]]` like SHARD_MAX_NUM_TOKENS shards of
+  clone-detector (the last shard also gets larger blocks): `proj_ids.npy`, `block_ids.npy`, `sizes.npy` of blocks
+  sorted by size, `postings.bin` - posting lists of all tokens, `offsets.npy` - start of the posting list of every
+  token in `postings.bin`. A posting list holds rows of blocks in increasing order (i.e. blocks sorted by size),
+  the first row and the differences between neighbours are stored as varints (7 bits per byte, the high bit is set
+  in all bytes but the last).
+Files are read memory-mapped, so processes that open the same index share its pages in the OS page cache.
+
+The build is parallel: every tokens file is parsed by a worker into a partial run with local token ids, then
+shards are merged in parallel - partial runs are remapped to global ids and posting lists are encoded.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+from collections import namedtuple
+from multiprocessing import Pool
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from batch_verifier import strip_token
+from prettify_results import get_files, get_line_iterator
+
+CURR_DIR = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_DIR, "clone-detector"))
+from shard_planner import DEFAULT_BOUNDARIES  # noqa: E402 pylint: disable=wrong-import-position
+
+META_FILE_NAME = "meta.json"
+VOCABULARY_FILE_NAME = "vocabulary.txt"
+FREQUENCIES_FILE_NAME = "frequencies.npy"
+PARTS_DIR_NAME = "parts"
+
+# blocks containing a token: arrays of the same length, sorted by size
+Postings = namedtuple("Postings", ["proj_ids", "block_ids", "sizes"])
+
+
+def encode_varints(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Varint encoding of non-negative integers.
+    :param values: integers.
+    :return: bytes & number of bytes of every value.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        n_bytes += rest > 0
+        rest >>= np.uint64(7)
+    owners = np.repeat(np.arange(len(values)), n_bytes)
+    shifts = np.arange(len(owners)) - np.repeat(np.cumsum(n_bytes) - n_bytes, n_bytes)
+    data = (values[owners] >> (np.uint64(7) * shifts.astype(np.uint64))) & np.uint64(0x7F)
+    data |= np.where(shifts < n_bytes[owners] - 1, np.uint64(0x80), np.uint64(0))
+    return data.astype(np.uint8), n_bytes
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """
+    Decode varints.
+    :param data: bytes of whole varints.
+    :return: uint64 integers.
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    shifts = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7F).astype(np.uint64) << (np.uint64(7) * shifts.astype(np.uint64))
+    return np.add.reduceat(parts, starts)
+
+
+def shard_of(sizes: np.ndarray, boundaries: List[int]) -> np.ndarray:
+    """ Shard of every block size, blocks larger than the last boundary belong to the last shard """
+    return np.minimum(np.searchsorted(np.array(boundaries), sizes, side="left"), len(boundaries) - 1)
+
+
+def _parse_file(job: Tuple[str, str, int, int]) -> str:
+    """ Parse a tokens file into a partial run with local token ids """
+    tokens_file, part_loc, min_tokens, max_tokens = job
+    vocabulary, frequencies = {}, []
+    proj_ids, block_ids, sizes, lengths, tokens = [], [], [], [], []
+    for line in get_line_iterator(tokens_file):
+        header, _, body = line.partition("@#@")
+        metadata = header.split(",", 3)
+        if len(metadata) < 4 or not body:
+            continue
+        size = int(metadata[2])
+        if size < min_tokens or size > max_tokens:
+            continue
+        bag = set()
+        for token_count in body.split(","):
+            token, _, count = token_count.rpartition("@@::@@")
+            token = strip_token(token)
+            if not token:
+                continue
+            token_id = vocabulary.setdefault(token, len(vocabulary))
+            if token_id == len(frequencies):
+                frequencies.append(0)
+            if token_id not in bag:
+                bag.add(token_id)
+                frequencies[token_id] += int(count)
+        proj_ids.append(int(metadata[0]))
+        block_ids.append(int(metadata[1]))
+        sizes.append(size)
+        lengths.append(len(bag))
+        tokens.extend(bag)
+    np.savez(part_loc, proj_ids=np.array(proj_ids, dtype=np.int64), block_ids=np.array(block_ids, dtype=np.int64),
+             sizes=np.array(sizes, dtype=np.int64), lengths=np.array(lengths, dtype=np.int64),
+             tokens=np.array(tokens, dtype=np.int64), words=np.array(list(vocabulary), dtype=str),
+             frequencies=np.array(frequencies, dtype=np.int64))
+    return part_loc
+
+
+def _merge_shard(job: Tuple[List[str], str, List[int], int, str]) -> Dict[str, int]:
+    """ Collect blocks of a shard from partial runs and write their posting lists """
+    part_locs, mapping_dir, boundaries, shard, shard_dir = job
+    proj_ids, block_ids, sizes, tokens, owners = [], [], [], [], []
+    n_blocks = 0
+    for i, part_loc in enumerate(part_locs):
+        with np.load(part_loc) as part:
+            mapping = np.load(os.path.join(mapping_dir, "{}.npy".format(i)))
+            part_owners = np.repeat(np.arange(len(part["lengths"])), part["lengths"])
+            selected = shard_of(part["sizes"], boundaries) == shard
+            rows = np.cumsum(selected) - 1 + n_blocks
+            entries = selected[part_owners]
+            proj_ids.append(part["proj_ids"][selected])
+            block_ids.append(part["block_ids"][selected])
+            sizes.append(part["sizes"][selected])
+            tokens.append(mapping[part["tokens"][entries]])
+            owners.append(rows[part_owners[entries]])
+            n_blocks += int(selected.sum())
+    proj_ids, block_ids, sizes = np.concatenate(proj_ids), np.concatenate(block_ids), np.concatenate(sizes)
+    tokens, owners = np.concatenate(tokens), np.concatenate(owners)
+    n_tokens = int(np.load(os.path.join(mapping_dir, "n_tokens.npy")))
+
+    # rows are renumbered in the order of sizes, so posting lists sorted by row are sorted by size
+    order = np.lexsort((block_ids, sizes))
+    new_rows = np.empty(n_blocks, dtype=np.int64)
+    new_rows[order] = np.arange(n_blocks)
+    owners = new_rows[owners]
+    entries = np.lexsort((owners, tokens))
+    tokens, owners = tokens[entries], owners[entries]
+    first = np.ones(len(tokens), dtype=bool)
+    first[1:] = tokens[1:] != tokens[:-1]
+    deltas = np.where(first, owners, owners - np.concatenate([[0], owners[:-1]]))
+    data, n_bytes = encode_varints(deltas)
+    offsets = np.zeros(n_tokens + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tokens, weights=n_bytes, minlength=n_tokens).astype(np.int64), out=offsets[1:])
+
+    os.makedirs(shard_dir, exist_ok=True)
+    np.save(os.path.join(shard_dir, "proj_ids.npy"), proj_ids[order])
+    np.save(os.path.join(shard_dir, "block_ids.npy"), block_ids[order])
+    np.save(os.path.join(shard_dir, "sizes.npy"), sizes[order])
+    np.save(os.path.join(shard_dir, "offsets.npy"), offsets)
+    data.tofile(os.path.join(shard_dir, "postings.bin"))
+    return {"n_blocks": n_blocks, "n_postings": len(tokens), "n_bytes": len(data)}
+
+
+def build_index(tokens_locs: Iterable[str], index_dir: str, boundaries: Optional[List[int]] = None,
+                processes: int = 1, min_tokens: int = 0, max_tokens: int = 500000) -> Dict:
+    """
+    Build inverted index of tokens files.
+    :param tokens_locs: tokens files or folders with them.
+    :param index_dir: index directory, an existing index is replaced.
+    :param boundaries: shard boundaries (SHARD_MAX_NUM_TOKENS), SourcererCC defaults if None.
+    :param processes: number of worker processes.
+    :param min_tokens: blocks with fewer tokens are ignored.
+    :param max_tokens: blocks with more tokens are ignored.
+    :return: index metadata.
+    """
+    boundaries = sorted(boundaries or DEFAULT_BOUNDARIES)
+    tokens_files = [tokens_file for tokens_loc in tokens_locs
+                    for tokens_file in sorted(get_files(path=tokens_loc, extension=".tokens"))]
+    if os.path.exists(index_dir):
+        shutil.rmtree(index_dir)
+    parts_dir = os.path.join(index_dir, PARTS_DIR_NAME)
+    os.makedirs(parts_dir)
+    with Pool(max(1, processes)) as pool:
+        part_locs = pool.map(_parse_file, [(tokens_file, os.path.join(parts_dir, "{}.npz".format(i)), min_tokens,
+                                            max_tokens) for i, tokens_file in enumerate(tokens_files)])
+
+        # global vocabulary & the order of clone-detector: frequency, then token
+        vocabulary, frequencies, local_ids = {}, [], []
+        for part_loc in part_locs:
+            with np.load(part_loc) as part:
+                ids = []
+                for word, frequency in zip(part["words"].tolist(), part["frequencies"].tolist()):
+                    token_id = vocabulary.setdefault(word, len(vocabulary))
+                    if token_id == len(frequencies):
+                        frequencies.append(0)
+                    frequencies[token_id] += frequency
+                    ids.append(token_id)
+                local_ids.append(np.array(ids, dtype=np.int64))
+        words = list(vocabulary)
+        order = sorted(range(len(words)), key=lambda token_id: (frequencies[token_id], words[token_id]))
+        ranks = np.empty(len(order), dtype=np.int64)
+        ranks[np.array(order, dtype=np.int64)] = np.arange(len(order))
+        for i, ids in enumerate(local_ids):
+            np.save(os.path.join(parts_dir, "{}.npy".format(i)), ranks[ids])
+        np.save(os.path.join(parts_dir, "n_tokens.npy"), np.array(len(words)))
+
+        shards = pool.map(_merge_shard, [(part_locs, parts_dir, boundaries, shard,
+                                          os.path.join(index_dir, "shard_{}".format(shard)))
+                                         for shard in range(len(boundaries))])
+
+    with open(os.path.join(index_dir, VOCABULARY_FILE_NAME), "w", encoding="utf-8") as f:
+        for token_id in order:
+            f.write(words[token_id] + "\n")
+    np.save(os.path.join(index_dir, FREQUENCIES_FILE_NAME), np.array(frequencies, dtype=np.int64)[order])
+    meta = {"boundaries": boundaries, "n_tokens": len(words), "shards": shards}
+    with open(os.path.join(index_dir, META_FILE_NAME), "w") as f:
+        json.dump(meta, f, indent=2)
+    shutil.rmtree(parts_dir)
+    return meta
+
+
+class _Shard:
+    def __init__(self, shard_dir: str):
+        self.proj_ids = np.load(os.path.join(shard_dir, "proj_ids.npy"), mmap_mode="r")
+        self.block_ids = np.load(os.path.join(shard_dir, "block_ids.npy"), mmap_mode="r")
+        self.sizes = np.load(os.path.join(shard_dir, "sizes.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(shard_dir, "offsets.npy"), mmap_mode="r")
+        postings_loc = os.path.join(shard_dir, "postings.bin")
+        # np.memmap can't map empty files
+        self.postings = np.memmap(postings_loc, dtype=np.uint8, mode="r") if os.path.getsize(postings_loc) \
+            else np.zeros(0, dtype=np.uint8)
+
+    def rows(self, token_id: int) -> np.ndarray:
+        data = self.postings[self.offsets[token_id]:self.offsets[token_id + 1]]
+        return np.cumsum(decode_varints(data)).astype(np.int64)
+
+
+class TokenIndex:
+    """
+    Read access to an index built by `build_index`.
+    """
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, META_FILE_NAME)) as f:
+            self.meta = json.load(f)
+        self.boundaries = self.meta["boundaries"]
+        self.frequencies = np.load(os.path.join(index_dir, FREQUENCIES_FILE_NAME), mmap_mode="r")
+        self.shards = [_Shard(os.path.join(index_dir, "shard_{}".format(shard)))
+                       for shard in range(len(self.boundaries))]
+        self.vocabulary_loc = os.path.join(index_dir, VOCABULARY_FILE_NAME)
+        self._vocabulary = None
+
+    @property
+    def vocabulary(self) -> Dict[str, int]:
+        """ Token ids, read on first use """
+        if self._vocabulary is None:
+            with open(self.vocabulary_loc, encoding="utf-8") as f:
+                self._vocabulary = {line.rstrip("\n"): token_id for token_id, line in enumerate(f)}
+        return self._vocabulary
+
+    def token_id(self, token: str) -> Optional[int]:
+        """ Id of a token (normalized like clone-detector tokens), None if no block contains it """
+        return self.vocabulary.get(strip_token(token))
+
+    def postings(self, token: Union[str, int], min_size: int = 0, max_size: Optional[int] = None) -> Postings:
+        """
+        Blocks that contain a token.
+        :param token: token or its id.
+        :param min_size: only blocks with at least this many tokens.
+        :param max_size: only blocks with at most this many tokens, no limit if None.
+        :return: blocks sorted by size.
+        """
+        token_id = self.token_id(token) if isinstance(token, str) else token
+        empty = np.zeros(0, dtype=np.int64)
+        if token_id is None or not 0 <= token_id < self.meta["n_tokens"]:
+            return Postings(proj_ids=empty, block_ids=empty, sizes=empty)
+        proj_ids, block_ids, sizes = [], [], []
+        first_shard = int(shard_of(np.array([min_size]), self.boundaries)[0])
+        last_shard = len(self.shards) - 1 if max_size is None else int(shard_of(np.array([max_size]),
+                                                                                self.boundaries)[0])
+        for shard in self.shards[first_shard:last_shard + 1]:
+            rows = shard.rows(token_id)
+            rows_sizes = shard.sizes[rows]
+            # rows are sorted by size
+            start = int(np.searchsorted(rows_sizes, min_size, side="left"))
+            end = len(rows) if max_size is None else int(np.searchsorted(rows_sizes, max_size, side="right"))
+            rows = rows[start:end]
+            proj_ids.append(shard.proj_ids[rows])
+            block_ids.append(shard.block_ids[rows])
+            sizes.append(shard.sizes[rows])
+        return Postings(proj_ids=np.concatenate(proj_ids + [empty]), block_ids=np.concatenate(block_ids + [empty]),
+                        sizes=np.concatenate(sizes + [empty]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command")
+    build_parser = subparsers.add_parser("build", help="Build index of tokens files.")
+    build_parser.add_argument("tokens", nargs="+", help="Tokens files or folders with them.")
+    build_parser.add_argument("-o", "--output", required=True, help="Index directory.")
+    build_parser.add_argument("--boundaries", type=lambda value: [int(part) for part in value.split(",")],
+                              default=None, help="Shard boundaries like SHARD_MAX_NUM_TOKENS (`65,100,300,500000`).")
+    build_parser.add_argument("-p", "--processes", type=int, default=os.cpu_count(), help="Worker processes.")
+    build_parser.add_argument("--min-tokens", type=int, default=0, help="Minimum number of tokens in block.")
+    build_parser.add_argument("--max-tokens", type=int, default=500000, help="Maximum number of tokens in block.")
+    query_parser = subparsers.add_parser("query", help="Print blocks that contain tokens.")
+    query_parser.add_argument("index", help="Index directory.")
+    query_parser.add_argument("tokens", nargs="+", help="Tokens.")
+    query_parser.add_argument("--min-size", type=int, default=0, help="Minimum block size.")
+    query_parser.add_argument("--max-size", type=int, default=None, help="Maximum block size.")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        meta = build_index(args.tokens, args.output, args.boundaries, args.processes, args.min_tokens,
+                           args.max_tokens)
+        print("{} tokens, {} blocks, {} postings in {} bytes".format(
+            meta["n_tokens"], sum(shard["n_blocks"] for shard in meta["shards"]),
+            sum(shard["n_postings"] for shard in meta["shards"]), sum(shard["n_bytes"] for shard in meta["shards"])))
+    elif args.command == "query":
+        index = TokenIndex(args.index)
+        for token in args.tokens:
+            postings = index.postings(token, args.min_size, args.max_size)
+            for proj_id, block_id, size in zip(postings.proj_ids.tolist(), postings.block_ids.tolist(),
+                                               postings.sizes.tolist()):
+                print("{},{},{},{}".format(token, proj_id, block_id, size))
+    else:
+        parser.print_help()
+        sys.exit(1)
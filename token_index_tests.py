@@ -0,0 +1,61 @@
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+from token_index import TokenIndex, build_index, decode_varints, encode_varints
+
+
+class TestTokenIndex(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(4)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.blocks = []
+        for part in range(3):
+            with open(os.path.join(self.tmp.name, "part{}.tokens".format(part)), "w") as f:
+                for block in range(100):
+                    bag = {"t%s" % rnd.randrange(50): rnd.randint(1, 40) for _ in range(rnd.randint(1, 20))}
+                    block_id, size = part * 1000 + block, sum(bag.values())
+                    self.blocks.append((part + 1, block_id, size, bag))
+                    tokens = ",".join("{}@@::@@{}".format(token, count) for token, count in bag.items())
+                    f.write("{},{},{},{},0,hash@#@{}\n".format(part + 1, block_id, size, len(bag), tokens))
+        self.index_dir = os.path.join(self.tmp.name, "index")
+        self.meta = build_index([self.tmp.name], self.index_dir, boundaries=[20, 60, 150, 500000], processes=2)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_varints(self):
+        values = np.array([0, 1, 127, 128, 300, 16383, 16384, 2 ** 40, 2 ** 63], dtype=np.uint64)
+        data, n_bytes = encode_varints(values)
+        self.assertEqual(n_bytes.tolist(), [1, 1, 1, 2, 2, 2, 3, 6, 10])
+        self.assertEqual(decode_varints(data).tolist(), values.tolist())
+
+    def test_postings(self):
+        index = TokenIndex(self.index_dir)
+        self.assertEqual(sum(shard["n_blocks"] for shard in self.meta["shards"]), len(self.blocks))
+        for token in ["t0", "t7", "t49"]:
+            for min_size, max_size in [(0, None), (30, 100), (61, 61)]:
+                postings = index.postings(token, min_size, max_size)
+                expected = sorted((size, block_id) for _, block_id, size, bag in self.blocks if token in bag and
+                                  min_size <= size and (max_size is None or size <= max_size))
+                self.assertEqual(sorted(zip(postings.sizes.tolist(), postings.block_ids.tolist())), expected)
+                self.assertEqual(postings.sizes.tolist(), sorted(postings.sizes.tolist()))
+        self.assertEqual(len(index.postings("missing").block_ids), 0)
+
+    def test_token_ids(self):
+        index = TokenIndex(self.index_dir)
+        frequencies = {}
+        for _, _, _, bag in self.blocks:
+            for token, count in bag.items():
+                frequencies[token] = frequencies.get(token, 0) + count
+        # ids follow the global order of clone-detector: rare tokens first
+        expected = sorted(frequencies, key=lambda token: (frequencies[token], token))
+        self.assertEqual([index.token_id(token) for token in expected], list(range(len(expected))))
+        self.assertEqual(index.frequencies.tolist(), [frequencies[token] for token in expected])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -83,7 +83,8 @@ if __name__ == '__main__':
     proj_paths = []
     with open(inner_config["FILE_projects_list"], "r", encoding="utf-8") as f:
         proj_paths = f.read().split("\n")
-    proj_paths = list(enumerate(proj_paths, start=1))
+    # ids continue after projects tokenized before (incremental runs)
+    proj_paths = list(enumerate(proj_paths, start=inner_config["init_proj_id"]))
     # it will diverge the process flow on process_file()
 
     if any(map(lambda x: os.path.exists(dirs_config[x]), ["stats_folder", "bookkeeping_folder", "tokens_folder"])):
@@ -35,7 +35,7 @@ def read_inner_config(config):
     result["init_file_id"] = config.getint('Config', 'init_file_id')
     result["init_proj_id"] = config.getint('Config', 'init_proj_id')
     # flag before proj_id
-    result["proj_id_flag"] = config.getint('Config', 'init_proj_id')
+    result["proj_id_flag"] = config.getint('Config', 'proj_id_flag')
     return result
 
 
@@ -1,6 +1,7 @@
 """Generate config for given parameters."""
 import argparse
 import os
+import re
 
 TEMPLATE_LOC = os.path.join(os.path.abspath(os.path.dirname(__file__)), "config_template.ini")
 
@@ -23,6 +24,14 @@ def main(args: argparse.Namespace) -> None:
     }
     for replace in replacements.items():
         template = template.replace(replace[0], replace[1])
+    # ids of projects & files continue after a previous tokenization (incremental runs),
+    # number of processes & batch size are chosen for the machine (resource plan of `main.py`)
+    for key, attr in [("init_file_id", "init_file_id"), ("init_proj_id", "init_proj_id"),
+                      ("N_PROCESSES", "n_processes"), ("PROJECTS_BATCH", "projects_batch")]:
+        value = getattr(args, attr, None)
+        if value is not None:
+            template = re.sub(r"^{key} = .*$".format(key=key), "{key} = {value}".format(key=key, value=value),
+                              template, flags=re.MULTILINE)
     with open(args.output, "w") as f:
         f.write(template)
 
@@ -35,5 +44,10 @@ if __name__ == "__main__":
     parser.add_argument("-b", "--bookkeeping-loc", required=True, help="PATH_bookkeeping_folder.")
     parser.add_argument("-t", "--tokens-loc", required=True, help="PATH_tokens_folder.")
     parser.add_argument("-e", "--extensions", required=True, nargs="+", help="File extensions to use.")
+    parser.add_argument("--init-file-id", type=int, default=None, help="First file id, 3000000 by default.")
+    parser.add_argument("--init-proj-id", type=int, default=None, help="First project id, 1 by default.")
+    parser.add_argument("--n-processes", type=int, default=None, help="Number of tokenizer processes, 100 by default.")
+    parser.add_argument("--projects-batch", type=int, default=None,
+                        help="Number of projects a process takes at a time, 100 by default.")
     args = parser.parse_args()
     main(args)